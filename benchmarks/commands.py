@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+"""Measures wall time, subprocess count and bytes written of secbootctl commands and compares them with a baseline.
+
+usage: python3 benchmarks/commands.py [--kernels N] [--kernel-size MIB] [--initramfs-size MIB] [--repeat N]
+                                      [--config OPTION=VALUE ...] [--baseline FILE] [--save-baseline] [--check]
+
+The commands run one after another (like on a real system) as separate processes in a sandbox (see "sandbox.py")
+with fake objcopy, sbsign, sbverify, bootctl and pacman executables (see "faketools.py"). Wall time is the time until
+the command has exited, startup included. Subprocesses are the ones spawned by secbootctl itself, bytes written are
+the bytes passed to write calls by secbootctl and all its subprocesses (wchar of "/proc/<pid>/io", output included).
+Requires openssl for the throwaway keys.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import sandbox  # puts the repository on the module search path
+from secbootctl.helpers.cli import CliPrintHelper
+
+BASELINE_FILE_PATH: Path = Path(__file__).resolve().parent / 'baseline.json'
+KERNEL_NAMES: list = ['linux', 'linux-lts', 'linux-zen', 'linux-hardened']
+# tolerated increase before a result is marked as regression (subprocess counts have to match exactly)
+WALL_TIME_TOLERANCE: float = 0.25
+BYTES_WRITTEN_TOLERANCE: float = 0.05
+# command name, secbootctl arguments, STDIN and preparation of the sandbox, in the order they are run
+SCENARIOS: list = [
+    ('config:list', ['config:list'], None, None),
+    ('bootloader:install', ['bootloader:install'], None, None),
+    ('kernel:install --all', ['kernel:install', '--all'], None, None),
+    ('kernel:install --all (up to date)', ['kernel:install', '--all'], None, None),
+    ('bootloader:update-menu', ['bootloader:update-menu'], None, None),
+    ('file:list', ['file:list'], None, None),
+    ('file:list (cached)', ['file:list'], None, None),
+    ('pmi:hook-callback update (microcode, systemd)', ['pmi:hook-callback', 'update'], b'intel-ucode\nsystemd\n',
+     sandbox.update_microcode),
+]
+
+
+def get_bytes_written() -> Optional[int]:
+    """Returns the bytes written by this process and its terminated subprocesses so far (None if not supported)."""
+    try:
+        with open('/proc/self/io', 'rt') as io_file:
+            return next(int(line.split()[1]) for line in io_file if line.startswith('wchar:'))
+    except OSError:
+        return None
+
+
+def run_scenarios(root_path: Path) -> dict:
+    """Runs all scenarios in given sandbox and returns their results by command name."""
+    results: dict = {}
+
+    for command_name, args, stdin_data, prepare in SCENARIOS:
+        if prepare is not None:
+            prepare(root_path)
+
+        bytes_written: Optional[int] = get_bytes_written()
+        start_time: float = time.perf_counter()
+        process_result = subprocess.run([sys.executable, sandbox.__file__, str(root_path), *args], input=stdin_data,
+                                        capture_output=True)
+        wall_time: float = time.perf_counter() - start_time
+
+        if process_result.returncode != 0:
+            sys.exit(f'"{command_name}" failed:\n{process_result.stdout.decode()}{process_result.stderr.decode()}')
+
+        results[command_name] = {
+            'wall_time': wall_time,
+            'subprocesses': len(json.loads((root_path / sandbox.SUBPROCESSES_FILE_NAME).read_text())),
+            'bytes_written': None if bytes_written is None else get_bytes_written() - bytes_written
+        }
+
+    return results
+
+
+def merge_results(runs: list) -> dict:
+    """Returns the median of every value of the given results (one dict per run)."""
+    return {
+        command_name: {
+            key: None if None in values else statistics.median(values)
+            for key, values in ((key, [run[command_name][key] for run in runs]) for key in runs[0][command_name])
+        }
+        for command_name in runs[0]
+    }
+
+
+def format_change(value: Optional[float], baseline_value: Optional[float], tolerance: float) -> tuple:
+    """Returns the relative change as string and whether it exceeds given tolerance."""
+    if value is None or baseline_value is None:
+        return '-', False
+
+    if baseline_value == 0:
+        return ('0%' if value == 0 else 'new'), value > 0
+
+    change: float = value / baseline_value - 1
+
+    return f'{change:+.0%}', change > tolerance
+
+
+def print_results(results: dict, baseline: Optional[dict]) -> bool:
+    """Prints the results next to their changes compared with the baseline and returns whether any regressed."""
+    regressed: bool = False
+    print(f'{"command":<48}{"wall time":>11}{"subprocs":>10}{"written":>12}' + (
+        f'{"vs. baseline":>26}' if baseline else ''))
+
+    for command_name, result in results.items():
+        bytes_written: str = '-' if result['bytes_written'] is None else CliPrintHelper.format_size(
+            int(result['bytes_written']))
+        line: str = (f'{command_name:<48}{result["wall_time"] * 1000:>8.0f} ms{result["subprocesses"]:>10.0f}'
+                     f'{bytes_written:>12}')
+        baseline_result: Optional[dict] = (baseline or {}).get('results', {}).get(command_name)
+
+        if baseline_result is not None:
+            changes: list = [
+                format_change(result['wall_time'], baseline_result['wall_time'], WALL_TIME_TOLERANCE),
+                format_change(result['subprocesses'], baseline_result['subprocesses'], 0),
+                format_change(result['bytes_written'], baseline_result['bytes_written'], BYTES_WRITTEN_TOLERANCE)
+            ]
+            line += '  ' + ''.join(f'{change + ("!" if exceeded else ""):>8}' for change, exceeded in changes)
+            regressed = regressed or any(exceeded for _, exceeded in changes)
+
+        print(line)
+
+    return regressed
+
+
+def main() -> None:
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--kernels', type=int, default=2, choices=range(1, len(KERNEL_NAMES) + 1),
+                            metavar='N', help='number of kernels in the boot path (default: 2)')
+    cli_parser.add_argument('--kernel-size', type=int, default=12, metavar='MIB', help='size of a kernel image')
+    cli_parser.add_argument('--initramfs-size', type=int, default=24, metavar='MIB',
+                            help='size of an initramfs image')
+    cli_parser.add_argument('--repeat', type=int, default=3,
+                            help='number of runs in a new sandbox each, the median is reported')
+    cli_parser.add_argument('--config', action='append', default=[], metavar='OPTION=VALUE',
+                            help='config option of the sandbox, e.g. "unified_kernel_image_builder=objcopy"')
+    cli_parser.add_argument('--baseline', type=Path, default=BASELINE_FILE_PATH, metavar='FILE',
+                            help='baseline to compare with (default: benchmarks/baseline.json)')
+    cli_parser.add_argument('--save-baseline', action='store_true', help='save the results as baseline')
+    cli_parser.add_argument('--check', action='store_true', help='exit with code 1 if any result regressed')
+    cli_args = cli_parser.parse_args()
+
+    settings: dict = {
+        'kernels': cli_args.kernels, 'kernel_size': cli_args.kernel_size, 'initramfs_size': cli_args.initramfs_size,
+        'config': dict(option.split('=', 1) for option in cli_args.config)
+    }
+    runs: list = []
+
+    for _ in range(cli_args.repeat):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sandbox.create(Path(temp_dir), KERNEL_NAMES[:cli_args.kernels], cli_args.kernel_size * sandbox.MIB,
+                           cli_args.initramfs_size * sandbox.MIB, settings['config'])
+            runs.append(run_scenarios(Path(temp_dir)))
+
+    results: dict = merge_results(runs)
+    baseline: Optional[dict] = None
+
+    if cli_args.baseline.is_file():
+        baseline = json.loads(cli_args.baseline.read_text())
+
+        if baseline['settings'] != settings:
+            print(f'baseline "{cli_args.baseline}" was recorded with other settings, not compared: '
+                  f'{baseline["settings"]}\n')
+            baseline = None
+
+    regressed: bool = print_results(results, baseline)
+
+    if cli_args.save_baseline:
+        cli_args.baseline.write_text(json.dumps({
+            'settings': settings, 'python': '.'.join(map(str, sys.version_info[:3])), 'results': results
+        }, indent=4) + '\n')
+        print(f'\nsaved baseline: {cli_args.baseline}')
+
+    if cli_args.check and regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+"""Stand-ins for objcopy, sbsign, sbverify, bootctl and pacman used by "benchmarks/commands.py".
+
+They do the real I/O of the tools they replace: objcopy and sbsign write valid PE images (built and signed with the
+PE and Authenticode code of secbootctl, the raw signature is created by "openssl pkeyutl"), sbverify really verifies
+and bootctl copies the boot loader files. Every tool is an executable in the "bin" directory of the sandbox (see
+"install()") that calls "main()".
+"""
+
+from __future__ import annotations
+
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import secbootctl.core  # noqa: E402,F401 (has to be imported before the helpers)
+from secbootctl.helpers.authenticode import AuthenticodeHelper  # noqa: E402
+from secbootctl.helpers.pe import PeHelper  # noqa: E402
+
+TOOL_NAMES: list = ['objcopy', 'sbsign', 'sbverify', 'bootctl', 'pacman']
+# source of the boot loader files installed by bootctl (relative to the sandbox root)
+SYSTEMD_BOOT_FILE_SUBPATH: str = 'usr/lib/systemd/boot/efi/systemd-bootx64.efi'
+KERNEL_VERSION: str = '6.1.0.arch1-1'
+
+
+def install(root_path: Path) -> Path:
+    """Creates the executables of all tools in "<root_path>/bin" and returns that path (to be put first on PATH)."""
+    bin_path: Path = root_path / 'bin'
+    bin_path.mkdir(exist_ok=True)
+
+    for tool_name in TOOL_NAMES:
+        tool_file_path: Path = bin_path / tool_name
+        tool_file_path.write_text(
+            f'#!{sys.executable}\n'
+            f'import sys\n'
+            f'sys.path.insert(0, {str(Path(__file__).resolve().parent)!r})\n'
+            f'import faketools\n'
+            f'sys.exit(faketools.main({tool_name!r}, {str(root_path)!r}, sys.argv[1:]))\n'
+        )
+        tool_file_path.chmod(0o755)
+
+    return bin_path
+
+
+def main(tool_name: str, root_path: str, args: list) -> int:
+    return globals()['run_' + tool_name](Path(root_path), args)
+
+
+def run_objcopy(root_path: Path, args: list) -> int:
+    """Supports the arguments used by "KernelOsHelper": --add-section, --change-section-vma, stub and output."""
+    pe_helper: PeHelper = PeHelper()
+    stub_file_path, output_file_path = [arg for arg in args if not arg.startswith('--')]
+    image_base: int = pe_helper.read_header(Path(stub_file_path))['image_base']
+    sections: dict = {}
+
+    for arg in args:
+        match = re.fullmatch(r'--(add-section|change-section-vma)=([^=]+)=(.+)', arg)
+
+        if match and match[1] == 'add-section':
+            sections.setdefault(match[2], {'name': match[2]})['file_paths'] = [match[3]]
+        elif match:
+            sections.setdefault(match[2], {'name': match[2]})['virtual_address'] = int(match[3], 0) - image_base
+
+    pe_helper.add_sections(Path(stub_file_path), list(sections.values()), Path(output_file_path))
+
+    return 0
+
+
+def run_sbsign(root_path: Path, args: list) -> int:
+    options: dict = dict(arg[2:].split('=', 1) for arg in args if arg.startswith('--'))
+    input_file_path: Path = Path([arg for arg in args if not arg.startswith('--')][0])
+    output_file_path: Path = Path(options['output'])
+    pe_helper: PeHelper = PeHelper()
+
+    if output_file_path != input_file_path:
+        shutil.copyfile(input_file_path, output_file_path)
+
+    def sign_digest(digest: bytes) -> bytes:
+        return subprocess.run(['openssl', 'pkeyutl', '-sign', '-inkey', options['key'], '-pkeyopt', 'digest:sha256'],
+                              input=digest, capture_output=True, check=True).stdout
+
+    pe_helper.remove_certificates(output_file_path)
+    pe_helper.add_certificate(output_file_path, AuthenticodeHelper().create_signature(
+        output_file_path, Path(options['cert']), sign_digest
+    ))
+
+    return 0
+
+
+def run_sbverify(root_path: Path, args: list) -> int:
+    cert_file_path: str = [arg for arg in args if arg.startswith('--cert=')][0].split('=', 1)[1]
+    file_path: str = [arg for arg in args if not arg.startswith('--')][0]
+
+    return 0 if AuthenticodeHelper().verify_file(Path(file_path), Path(cert_file_path)) else 1
+
+
+def run_bootctl(root_path: Path, args: list) -> int:
+    command: str = args[0]
+    esp_path: Path = Path([arg for arg in args if arg.startswith('--esp-path=')][0].split('=', 1)[1])
+    boot_file_paths: list = [esp_path / 'EFI/systemd/systemd-bootx64.efi', esp_path / 'EFI/BOOT/BOOTX64.EFI']
+
+    if command in ('install', 'update'):
+        for directory_subpath in ['EFI/Linux', 'loader/entries']:
+            (esp_path / directory_subpath).mkdir(parents=True, exist_ok=True)
+
+        for boot_file_path in boot_file_paths:
+            boot_file_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(root_path / SYSTEMD_BOOT_FILE_SUBPATH, boot_file_path)
+    elif command == 'remove':
+        for boot_file_path in boot_file_paths:
+            boot_file_path.unlink(missing_ok=True)
+    else:
+        print(f'System:\n  Secure Boot: enabled\n\nESP: {esp_path}')
+
+    return 0
+
+
+def run_pacman(root_path: Path, args: list) -> int:
+    """Supports "pacman -Q <package>" only, every package starting with "linux" is installed."""
+    if args[0] != '-Q' or not args[1].startswith('linux'):
+        print(f'error: package \'{args[-1]}\' was not found', file=sys.stderr)
+
+        return 1
+
+    print(f'{args[1]} {KERNEL_VERSION}')
+
+    return 0
@@ -0,0 +1,139 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+"""Synthetic system secbootctl can run on without root permissions, UEFI or real keys (see "benchmarks/commands.py").
+
+"create()" builds the sandbox in a directory: boot path with kernels, initramfs and microcode images, an empty ESP,
+EFI stub and systemd-boot images, throwaway keys (created by openssl), the config file and the fake tools (see
+"faketools.py"). Running this module calls secbootctl within the sandbox:
+
+    python3 benchmarks/sandbox.py ROOT [secbootctl arguments ...]
+
+All paths of "Env" are moved into ROOT, the requirements check (root permissions, UEFI boot mode) is skipped and the
+names of all spawned subprocesses are written to "ROOT/subprocesses.json".
+"""
+
+from __future__ import annotations
+
+import configparser
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+REPOSITORY_PATH: Path = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY_PATH))
+
+import faketools  # noqa: E402
+from secbootctl.env import Env  # noqa: E402
+
+MIB: int = 1024 * 1024
+MACHINE_ID: str = '0123456789abcdef0123456789abcdef'
+SUBPROCESSES_FILE_NAME: str = 'subprocesses.json'
+
+
+def create(root_path: Path, kernel_names: list, kernel_size: int, initramfs_size: int,
+           config_options: dict) -> None:
+    """Creates the sandbox in given directory, the sizes are given in bytes.
+
+    The config is the default config file with boot path, ESP and keys in the sandbox and given options.
+    """
+    boot_path: Path = root_path / 'boot'
+    app_path: Path = _rebase(root_path, Env.APP_CONFIG_FILE_PATH).parent
+
+    for directory_path in [boot_path, root_path / 'efi', app_path / 'keys', root_path / 'etc/kernel',
+                           root_path / 'usr/lib/systemd/boot/efi']:
+        directory_path.mkdir(parents=True)
+
+    for kernel_name in kernel_names:
+        (boot_path / f'vmlinuz-{kernel_name}').write_bytes(os.urandom(kernel_size))
+        (boot_path / f'initramfs-{kernel_name}.img').write_bytes(os.urandom(initramfs_size))
+
+    update_microcode(root_path)
+    (root_path / 'etc/machine-id').write_text(MACHINE_ID + '\n')
+    (root_path / 'etc/os-release').write_text('NAME="Arch Linux"\nPRETTY_NAME="Arch Linux"\nID=arch\n')
+    (root_path / 'etc/kernel/cmdline').write_text('root=/dev/vda2 rw quiet\n')
+    _rebase(root_path, Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH).write_bytes(create_pe_image(96 * 1024))
+    (root_path / faketools.SYSTEMD_BOOT_FILE_SUBPATH).write_bytes(create_pe_image(128 * 1024))
+    shutil.copytree(REPOSITORY_PATH / 'hooks', _rebase(root_path, Env.APP_HOOK_PATH))
+
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-sha256', '-days', '1',
+                    '-subj', '/CN=secbootctl benchmark db', '-keyout', f'{Env.SB_KEY_NAME_DB}.key',
+                    '-out', f'{Env.SB_KEY_NAME_DB}.crt'], cwd=app_path / 'keys', capture_output=True, check=True)
+
+    config_parser: configparser.ConfigParser = configparser.ConfigParser()
+    config_parser.read(REPOSITORY_PATH / 'secbootctl.conf')
+    config_parser['DEFAULT'].update({
+        'boot_path': str(boot_path), 'esp_path': str(root_path / 'efi'), 'sb_keys_path': str(app_path / 'keys'),
+        'default_kernel': kernel_names[0], **config_options
+    })
+
+    with open(_rebase(root_path, Env.APP_CONFIG_FILE_PATH), 'w') as config_file:
+        config_parser.write(config_file)
+
+    faketools.install(root_path)
+
+
+def update_microcode(root_path: Path) -> None:
+    """Writes a new microcode image, as a microcode package update would."""
+    (root_path / 'boot/intel-ucode.img').write_bytes(os.urandom(4 * MIB))
+
+
+def create_pe_image(code_size: int) -> bytes:
+    """Returns a PE32+ image with a single ".text" section of given size and room for more section headers."""
+    size_of_headers: int = 0x400
+    size_of_raw_data: int = -(-code_size // 0x200) * 0x200
+    image: bytearray = bytearray(size_of_headers)
+    image[0:2] = b'MZ'
+    struct.pack_into('<I', image, 0x3c, 0x40)
+    image[0x40:0x44] = b'PE\0\0'
+    struct.pack_into('<HHIIIHH', image, 0x44, 0x8664, 1, 0, 0, 0, 240, 0x0206)
+    struct.pack_into('<H', image, 0x58, 0x20b)
+    struct.pack_into('<II', image, 0x58 + 32, 0x1000, 0x200)
+    struct.pack_into('<II', image, 0x58 + 56, 0x1000 + -(-code_size // 0x1000) * 0x1000, size_of_headers)
+    struct.pack_into('<I', image, 0x58 + 108, 16)
+    struct.pack_into('<8sIIII', image, 0x40 + 24 + 240, b'.text', code_size, 0x1000, size_of_raw_data,
+                     size_of_headers)
+    struct.pack_into('<I', image, 0x40 + 24 + 240 + 36, 0x60000020)
+
+    return bytes(image) + os.urandom(size_of_raw_data)
+
+
+def _rebase(root_path: Path, path: Path) -> Path:
+    return root_path / path.relative_to('/')
+
+
+def run(root_path: Path, args: list) -> int:
+    """Runs secbootctl with given arguments within the sandbox and returns its exit code."""
+    subprocess_names: list = []
+
+    def audit(event: str, event_args: tuple) -> None:
+        if event == 'subprocess.Popen':
+            subprocess_names.append(os.path.basename(str(event_args[0] or event_args[1][0])))
+
+    for name, value in list(vars(Env).items()):
+        if isinstance(value, Path):
+            setattr(Env, name, _rebase(root_path, value))
+
+    Env.load = lambda: setattr(Env, 'MACHINE_ID', (root_path / 'etc/machine-id').read_text().rstrip())
+
+    from secbootctl.main import main
+    from secbootctl.helpers.kernelos import KernelOsHelper
+
+    KernelOsHelper.check_requirements = lambda self: None
+    os.environ['PATH'] = f'{root_path / "bin"}{os.pathsep}{os.environ["PATH"]}'
+    sys.argv = [Env.APP_NAME] + args
+    sys.addaudithook(audit)
+
+    try:
+        return main()
+    finally:
+        (root_path / SUBPROCESSES_FILE_NAME).write_text(json.dumps(subprocess_names))
+
+
+if __name__ == '__main__':
+    sys.exit(run(Path(sys.argv[1]), sys.argv[2:]))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+"""Compares the ESP walker used by "file:list" with the former double glob on a synthetic ESP.
+
+usage: python3 benchmarks/walk_esp.py [--entries N] [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from secbootctl.helpers.filewalker import FileWalkerHelper  # noqa: E402
+
+
+def create_esp(esp_path: Path, number_of_entries: int) -> None:
+    """Creates a synthetic ESP: vendor directories with nested subdirectories, mixed case EFI and other files."""
+    number_of_files: int = 0
+    vendor_number: int = 0
+
+    while number_of_files < number_of_entries:
+        for subdir_number in range(10):
+            dir_path: Path = esp_path / 'EFI' / f'vendor{vendor_number:04d}' / f'sub{subdir_number}'
+            dir_path.mkdir(parents=True)
+
+            for file_number in range(20):
+                extension: str = ['.efi', '.EFI', '.conf', '.bin'][file_number % 4]
+                (dir_path / f'file{file_number:02d}{extension}').write_bytes(b'')
+
+            number_of_files += 21
+
+        vendor_number += 1
+
+
+def list_with_glob(esp_path: Path) -> list:
+    file_paths: list = glob.glob(str(esp_path / '**' / '*.efi'), recursive=True)
+    file_paths = list({*file_paths, *glob.glob(str(esp_path / '**' / '*.EFI'), recursive=True)})
+    file_paths.sort()
+
+    return [Path(file_path) for file_path in file_paths if not Path(file_path).is_dir()]
+
+
+def list_with_walker(esp_path: Path) -> list:
+    return list(FileWalkerHelper(esp_path).walk(['.efi']))
+
+
+def measure(function: Callable[[Path], list], esp_path: Path, repeat: int) -> tuple:
+    durations: list = []
+
+    for _ in range(repeat):
+        start_time: float = time.perf_counter()
+        result: list = function(esp_path)
+        durations.append(time.perf_counter() - start_time)
+
+    return min(durations), result
+
+
+def main() -> None:
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--entries', type=int, default=50000, help='number of entries on the synthetic ESP')
+    cli_parser.add_argument('--repeat', type=int, default=5, help='number of runs, the best one is reported')
+    cli_args = cli_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        esp_path: Path = Path(temp_dir)
+        create_esp(esp_path, cli_args.entries)
+        print(f'synthetic ESP: {sum(len(dirs) + len(files) for _, dirs, files in os.walk(esp_path))} entries')
+
+        glob_duration, glob_result = measure(list_with_glob, esp_path, cli_args.repeat)
+        walker_duration, walker_result = measure(list_with_walker, esp_path, cli_args.repeat)
+
+        if glob_result != walker_result:
+            sys.exit('results differ')
+
+        print(f'{len(walker_result)} EFI files found')
+        print(f'glob (2 passes): {glob_duration * 1000:8.1f} ms')
+        print(f'walker:          {walker_duration * 1000:8.1f} ms ({glob_duration / walker_duration:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
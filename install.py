@@ -6,43 +6,147 @@
 
 from __future__ import annotations
 
+import argparse
+import importlib.util
+import marshal
 import os
 import shutil
-import zipapp
+import statistics
+import subprocess
+import sys
+import time
+import zipfile
 from pathlib import Path
 
+ETC_APP_PATH: Path = Path('/etc/secbootctl')
+ETC_APP_CONFIG_FILE_PATH: Path = ETC_APP_PATH / 'secbootctl.conf'
+USR_FILE_PATH: Path = Path('/usr/local/bin/secbootctl')
+SOURCE_PATH: Path = Path(__file__).resolve().parent
+BUNDLE_SHEBANG: bytes = b'#!/usr/bin/env python3\n'
+# fixed timestamp of all zip entries (earliest date a zip file can hold), so the bundle is reproducible
+BUNDLE_DATE_TIME: tuple = (1980, 1, 1, 0, 0, 0)
+START_TIME_RUNS: int = 5
+
+
+def build_bundle(bundle_path: Path) -> int:
+    """Builds the executable zip file (see zipapp) and returns the number of bundled modules.
+
+    Only "__main__.py" and the "secbootctl" package are bundled, each module as source and as bytecode compiled
+    with docstrings and asserts stripped (-OO). The bytecode is stored as unchecked hash-based pyc next to the source,
+    where zipimport looks for it first, so nothing is compiled at runtime. It only matches the Python version the
+    bundle was built with, other versions ignore it and fall back to compiling the sources.
+
+    The entries are sorted and have a fixed timestamp, so the same sources and Python version give the same bundle.
+    """
+    module_paths: list = [SOURCE_PATH / '__main__.py'] + sorted(
+        (SOURCE_PATH / 'secbootctl').rglob('*.py'), key=lambda module_path: module_path.relative_to(SOURCE_PATH).parts
+    )
+
+    with open(bundle_path, 'wb') as bundle_file:
+        bundle_file.write(BUNDLE_SHEBANG)
+
+        with zipfile.ZipFile(bundle_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as bundle_zip_file:
+            for module_path in module_paths:
+                archive_name: str = module_path.relative_to(SOURCE_PATH).as_posix()
+                source: bytes = module_path.read_bytes()
+                code = compile(source, archive_name, 'exec', dont_inherit=True, optimize=2)
+                pyc_data: bytes = (
+                    importlib.util.MAGIC_NUMBER + (0b01).to_bytes(4, 'little') + importlib.util.source_hash(source)
+                    + marshal.dumps(code)
+                )
+
+                _write_bundle_entry(bundle_zip_file, archive_name, source)
+                _write_bundle_entry(bundle_zip_file, archive_name + 'c', pyc_data)
+
+    return len(module_paths)
+
+
+def _write_bundle_entry(bundle_zip_file: zipfile.ZipFile, archive_name: str, data: bytes) -> None:
+    zip_info: zipfile.ZipInfo = zipfile.ZipInfo(archive_name, BUNDLE_DATE_TIME)
+    zip_info.compress_type = zipfile.ZIP_DEFLATED
+    zip_info.external_attr = 0o644 << 16
+    bundle_zip_file.writestr(zip_info, data, compresslevel=9)
+
+
+def measure_start_time(bundle_path: Path) -> tuple:
+    """Returns the seconds of the first run of "<bundle> --version" and the median of the following runs.
+
+    For the first run the bundle is dropped from the page cache (as far as the kernel allows it), the other runs
+    start warm. Without config file the bundle stops with an error before parsing the command line, but after
+    the same imports.
+    """
+    with open(bundle_path, 'rb') as bundle_file:
+        os.fsync(bundle_file.fileno())
+        os.posix_fadvise(bundle_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+    start_times: list = []
+
+    for _ in range(START_TIME_RUNS + 1):
+        start_time: float = time.perf_counter()
+        subprocess.run([sys.executable, str(bundle_path), '--version'], stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        start_times.append(time.perf_counter() - start_time)
+
+    return start_times[0], statistics.median(start_times[1:])
+
+
+def print_bundle_report(bundle_path: Path, number_of_modules: int) -> None:
+    cold_start_time, warm_start_time = measure_start_time(bundle_path)
+
+    print(f'bundle: {bundle_path} ({bundle_path.stat().st_size / 1024:.1f} KiB, {number_of_modules} modules, '
+          f'python {sys.version_info.major}.{sys.version_info.minor})')
+    print(f'start time (--version): {cold_start_time * 1000:.0f} ms cold, {warm_start_time * 1000:.0f} ms warm '
+          f'(median of {START_TIME_RUNS} runs)')
+
+
+def install() -> None:
+    if os.getuid() != 0:
+        raise RuntimeError('root permissions required')
+
+    # build bundle next to its target and move it into place, so a running package manager hook never sees a partial
+    # bundle
+    tmp_file_path: Path = USR_FILE_PATH.with_name(f'.{USR_FILE_PATH.name}.tmp')
+    number_of_modules: int = build_bundle(tmp_file_path)
+    shutil.chown(tmp_file_path, 'root', 'root')
+    tmp_file_path.chmod(0o755)
+    tmp_file_path.replace(USR_FILE_PATH)
+
+    # create /etc/secbootctl directory structure and just because of a bit of paranoia sets permissions explicitly
+    os.mkdir(ETC_APP_PATH, 0o755)
+    os.mkdir(ETC_APP_PATH / 'keys', 0o700)
+    shutil.copyfile(SOURCE_PATH / 'secbootctl.conf', ETC_APP_CONFIG_FILE_PATH)
+
+    shutil.chown(ETC_APP_CONFIG_FILE_PATH, 'root', 'root')
+    ETC_APP_CONFIG_FILE_PATH.chmod(0o644)
+
+    shutil.copytree(SOURCE_PATH / 'hooks', ETC_APP_PATH / 'hooks')
+    for directory_path, directory_names, file_names in os.walk(ETC_APP_PATH / 'hooks'):
+        directory_path: Path = Path(directory_path)
+        shutil.chown(directory_path, 'root', 'root')
+        directory_path.chmod(0o755)
+
+        for file_name in file_names:
+            file_path: Path = directory_path / file_name
+            shutil.chown(file_path, 'root', 'root')
+            file_path.chmod(0o600)
+
+    print_bundle_report(USR_FILE_PATH, number_of_modules)
+
+
 if __name__ == '__main__':
-    ETC_APP_PATH: Path = Path('/etc/secbootctl')
-    ETC_APP_CONFIG_FILE_PATH: Path = ETC_APP_PATH / 'secbootctl.conf'
-    USR_FILE_PATH: Path = Path('/usr/local/bin/secbootctl')
+    cli_parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description=f'Installs secbootctl to "{USR_FILE_PATH}" and "{ETC_APP_PATH}".'
+    )
+    cli_parser.add_argument('--bundle', type=Path, metavar='PATH',
+                            help='only build the executable zip file to given path (no root permissions required)')
+    cli_args: argparse.Namespace = cli_parser.parse_args()
 
     try:
-        if os.getuid() != 0:
-            raise RuntimeError('root permissions required')
-
-        # zip project directory content and copy it as executable to /usr/local/bin/secbootctl
-        # (actually it would be enough to zip only '__main.py__' and 'secbootctl' subdirectory)
-        zipapp.create_archive('.', USR_FILE_PATH, '/usr/bin/env python3')
-        shutil.chown(USR_FILE_PATH, 'root', 'root')
-        USR_FILE_PATH.chmod(0o755)
-
-        # create /etc/secbootctl directory structure and just because of a bit of paranoia sets permissions explicitly
-        os.mkdir(ETC_APP_PATH, 0o755)
-        os.mkdir(ETC_APP_PATH / 'keys', 0o700)
-        shutil.copyfile('secbootctl.conf', ETC_APP_CONFIG_FILE_PATH)
-
-        shutil.chown(ETC_APP_CONFIG_FILE_PATH, 'root', 'root')
-        ETC_APP_CONFIG_FILE_PATH.chmod(0o644)
-
-        shutil.copytree('hooks', ETC_APP_PATH / 'hooks')
-        for directory_path, directory_names, file_names in os.walk(ETC_APP_PATH / 'hooks'):
-            directory_path: Path = Path(directory_path)
-            shutil.chown(directory_path, 'root', 'root')
-            directory_path.chmod(0o755)
-
-            for file_name in file_names:
-                file_path: Path = directory_path / file_name
-                shutil.chown(file_path, 'root', 'root')
-                file_path.chmod(0o600)
+        if cli_args.bundle is None:
+            install()
+        else:
+            number_of_modules: int = build_bundle(cli_args.bundle)
+            cli_args.bundle.chmod(0o755)
+            print_bundle_report(cli_args.bundle, number_of_modules)
     except Exception as error:
         print(f'an error occurred: {error}')
@@ -6,19 +6,25 @@ from __future__ import annotations
 
 import argparse
 import configparser
+import contextlib
 import importlib
+import sys
 import textwrap
 from pathlib import Path
-from pkgutil import iter_modules
 from types import ModuleType
 from typing import Any
+from typing import Callable
+from typing import Iterator
 from typing import Optional
 
 import secbootctl.features
 from secbootctl.env import Env
+from secbootctl.helpers.buildcache import BuildCacheHelper
 from secbootctl.helpers.cli import CliPrintHelper, CliCmdUsageHelpFormatter
 from secbootctl.helpers.kernelos import KernelOsHelper
+from secbootctl.helpers.lock import LockHelper
 from secbootctl.helpers.secureboot import SecureBootHelper
+from secbootctl.helpers.transaction import FileTransactionHelper
 
 
 class App:
@@ -32,10 +38,10 @@ class App:
         Env.load()
         self._config.load(Env.APP_CONFIG_FILE_PATH)
         self._cli_cmd_manager.init_commands(self._config.esp_path)
+        cli_request_data: dict = self._cli_cmd_manager.parse_request()
+        CliPrintHelper.set_output_format(cli_request_data.pop('output', 'text'))
         self._dispatcher.dispatch(
-            self._router.match(
-                self._cli_cmd_manager.parse_request()
-            )
+            self._router.match(cli_request_data)
         )
 
 
@@ -55,6 +61,10 @@ class AppError(Exception):
         return self._code
 
 
+class UnsupportedPeImageError(AppError):
+    """Error raised if a PE image can't be handled by "PeHelper" (e.g. no room for additional section headers)."""
+
+
 class Config:
     def __init__(self, config_parser: configparser.ConfigParser):
         self._config_parser: configparser.ConfigParser = config_parser
@@ -105,6 +115,32 @@ class Config:
     def microcode_image_name(self) -> str:
         return self._get('microcode_image_name')
 
+    @property
+    def unified_kernel_image_builder(self) -> str:
+        return self._get('unified_kernel_image_builder', 'native')
+
+    @property
+    def unified_kernel_image_layout(self) -> str:
+        return self._get('unified_kernel_image_layout', 'computed')
+
+    @property
+    def initramfs_compression(self) -> str:
+        return self._get('initramfs_compression', 'none')
+
+    @property
+    def initramfs_compression_level(self) -> Optional[int]:
+        level: Optional[str] = self._get('initramfs_compression_level')
+
+        return int(level) if level else None
+
+    @property
+    def initramfs_compression_workers(self) -> int:
+        return int(self._get('initramfs_compression_workers', 0))
+
+    @property
+    def signature_verifier(self) -> str:
+        return self._get('signature_verifier', 'native')
+
     @property
     def bootloader_menu_editor(self) -> str:
         return self._get('bootloader_menu_editor')
@@ -117,6 +153,16 @@ class Config:
     def package_manager_name(self) -> str:
         return self._get('package_manager')
 
+    @property
+    def package_manager_hook_mode(self) -> str:
+        return self._get('package_manager_hook_mode', 'sync')
+
+    @property
+    def lock_timeout(self) -> Optional[int]:
+        timeout: Optional[str] = self._get('lock_timeout')
+
+        return int(timeout) if timeout else None
+
     @property
     def use_security_token(self) -> bool:
         return True if self._get('use_security_token') == 'yes' else False
@@ -125,6 +171,18 @@ class Config:
     def security_token_name(self) -> str:
         return self._get('security_token')
 
+    @property
+    def security_token_signer(self) -> str:
+        return self._get('security_token_signer', 'sbsign')
+
+    @property
+    def security_token_pkcs11_uri(self) -> str:
+        return self._get('security_token_pkcs11_uri', Env.SECURITY_TOKEN_PKCS11_URI)
+
+    @property
+    def security_token_pkcs11_module(self) -> str:
+        return self._get('security_token_pkcs11_module', Env.SECURITY_TOKEN_PKCS11_MODULE)
+
     def _get(self, key: str, fallback_value: Any = None) -> Any:
         return self._config_data.get(key, fallback_value)
 
@@ -157,18 +215,77 @@ class Dispatcher:
         controller: AppController = self._controller_factory.create(
             route_data['module_name'], route_data['controller_name'], self
         )
-        getattr(controller, route_data['action_name'])(**route_data['params'])
+
+        with controller.lock(route_data['action_name']):
+            getattr(controller, route_data['action_name'])(**route_data['params'])
 
 
 class CliCmdManager:
-    def __init__(self, cli_parser: argparse.ArgumentParser):
+    def __init__(self, cli_parser: argparse.ArgumentParser, cli_args: Optional[list] = None):
         self._cli_parser: argparse.ArgumentParser = cli_parser
+        self._cli_args: list = sys.argv[1:] if cli_args is None else cli_args
 
     def init_commands(self, esp_path: Path) -> None:
+        """Adds the options and commands to the cli parser.
+
+        Only the feature module of the given command is imported (see "secbootctl.features.COMMANDS"). The command
+        list and the main help text are only built if they are needed: if no or an unknown command is given or the
+        main help is requested.
+        """
         self._cli_parser.formatter_class = CliCmdUsageHelpFormatter
         self._cli_parser._positionals.title = 'Commands'
         self._cli_parser._optionals.title = 'Options'
-        self._cli_parser.epilog = textwrap.dedent(f'''
+        # given explicitly, since the usage would be wrapped because of the long prefix (see CliCmdUsageHelpFormatter)
+        self._cli_parser.usage = '%(prog)s [-h] [-V] [--output FORMAT] [command] ...'
+
+        self._cli_parser.add_argument('-h', '--help', action='help', help='show this help')
+        self._cli_parser.add_argument('-V', '--version', action='version', version=Env.APP_TITLE, help='show version')
+        self._cli_parser.add_argument('--output', choices=Env.SUPPORTED_OUTPUT_FORMATS, default='text',
+                                      metavar='FORMAT', help='output as "text" or "jsonl" (default: text)')
+
+        cli_subparsers = self._cli_parser.add_subparsers(dest='command_name', metavar='[command]')
+        command_name: Optional[str] = self._get_command_name()
+
+        if command_name is None:
+            self._cli_parser.epilog = self._get_epilog()
+
+            # the commands are only listed, so they don't need any arguments
+            for registered_command_name, (_, help_message) in secbootctl.features.COMMANDS.items():
+                cli_subparsers.add_parser(registered_command_name, help=help_message, add_help=False)
+
+            return
+
+        feature_name: str = secbootctl.features.COMMANDS[command_name][0]
+        feature_module: ModuleType = importlib.import_module('secbootctl.features.' + feature_name)
+        feature_subcommand_creator: BaseSubcmdCreator = getattr(
+            feature_module, feature_name.capitalize() + 'SubcmdCreator'
+        )(esp_path)
+        feature_subcommand_creator.create(cli_subparsers)
+
+    def parse_request(self) -> dict:
+        cli_args = self._cli_parser.parse_args(self._cli_args)
+
+        if cli_args.command_name is None:
+            self._cli_parser.parse_args(['--help'])
+
+        return vars(cli_args)
+
+    def _get_command_name(self) -> Optional[str]:
+        """Returns the name of the given command, None if it is unknown, missing or the main help is requested."""
+        cli_args: Iterator[str] = iter(self._cli_args)
+
+        for cli_arg in cli_args:
+            if cli_arg in ('-h', '--help'):
+                return None
+            elif cli_arg == '--output':
+                next(cli_args, None)
+            elif not cli_arg.startswith('-'):
+                return cli_arg if cli_arg in secbootctl.features.COMMANDS else None
+
+        return None
+
+    def _get_epilog(self) -> str:
+        return textwrap.dedent(f'''
             Use "{Env.APP_NAME} [command] --help" for more information about a command.
 
             Configuration:
@@ -194,27 +311,6 @@ class CliCmdManager:
               {', '.join(Env.SUPPORTED_SECURITY_TOKENS)}
         ''')
 
-        self._cli_parser.add_argument('-h', '--help', action='help', help='show this help')
-        self._cli_parser.add_argument('-V', '--version', action='version', version=Env.APP_TITLE, help='show version')
-
-        cli_subparsers = self._cli_parser.add_subparsers(dest='command_name', metavar='[command]')
-
-        # loop through all modules in the feature directory and call BaseSubcmdCreator:create
-        for submodule in iter_modules(secbootctl.features.__path__):
-            feature_module: ModuleType = importlib.import_module('secbootctl.features.' + submodule.name)
-            feature_subcommand_creator: BaseSubcmdCreator = getattr(
-                feature_module, submodule.name.capitalize() + 'SubcmdCreator'
-            )(esp_path)
-            feature_subcommand_creator.create(cli_subparsers)
-
-    def parse_request(self) -> dict:
-        cli_args = self._cli_parser.parse_args()
-
-        if cli_args.command_name is None:
-            self._cli_parser.parse_args(['--help'])
-
-        return vars(cli_args)
-
 
 class BaseSubcmdCreator:
     def __init__(self, esp_path: Path):
@@ -237,30 +333,109 @@ class BaseSubcmdCreator:
         cli_parser.add_argument('-h', '--help', action='help', help='show this help')
 
 
-class ControllerFactory:
+class ServiceContainer:
+    """Holds the controllers and helpers of one invocation.
+
+    Every service is created on first use only and then shared, e.g. by all controllers an action forwards to (see
+    "AppController._forward()"). The requirements of the invocation are checked once as well.
+    """
     def __init__(self, config: Config):
         self._config: Config = config
+        self._services: dict = {}
+        self.requirements_checked: bool = False
+
+    def get(self, service_name: str, create_service: Callable[[], Any]) -> Any:
+        """Returns the service with given name, it is created by calling given function if it doesn't exist yet."""
+        if service_name not in self._services:
+            self._services[service_name] = create_service()
+
+        return self._services[service_name]
+
+    @property
+    def cli_print_helper(self) -> CliPrintHelper:
+        return self.get('cli_print_helper', CliPrintHelper)
+
+    @property
+    def kernel_os_helper(self) -> KernelOsHelper:
+        return self.get('kernel_os_helper', lambda: KernelOsHelper(self._config))
+
+    @property
+    def sb_helper(self) -> SecureBootHelper:
+        return self.get('sb_helper', lambda: SecureBootHelper(
+            self._config.sb_keys_path, self._config.signature_verifier, self._config.security_token_signer,
+            self._config.security_token_pkcs11_uri, self._config.security_token_pkcs11_module
+        ))
+
+    @property
+    def build_cache_helper(self) -> BuildCacheHelper:
+        return self.get('build_cache_helper', lambda: BuildCacheHelper(Env.BUILD_MANIFEST_FILE_PATH))
+
+    @property
+    def file_transaction_helper(self) -> FileTransactionHelper:
+        return self.get('file_transaction_helper', FileTransactionHelper)
+
+
+class ControllerFactory:
+    def __init__(self, config: Config, services: ServiceContainer):
+        self._config: Config = config
+        self._services: ServiceContainer = services
 
     def create(self, module_name: str, controller_name: str, dispatcher: Dispatcher) -> AppController:
-        feature_module: ModuleType = importlib.import_module(module_name)
+        """Returns the controller with given name, only the first call instantiates it (see "ServiceContainer")."""
+        def create_controller() -> AppController:
+            feature_module: ModuleType = importlib.import_module(module_name)
 
-        return getattr(feature_module, controller_name)(self._config, dispatcher)
+            return getattr(feature_module, controller_name)(self._config, dispatcher, self._services)
+
+        return self._services.get(f'{module_name}.{controller_name}', create_controller)
 
 
 class AppController:
     """Base controller class."""
-    def __init__(self, config: Config, dispatcher: Dispatcher):
+    # lock modes of actions that don't lock exclusively: "shared" (read-only actions) or "none" (see "lock()")
+    LOCK_MODES: dict = {}
+
+    def __init__(self, config: Config, dispatcher: Dispatcher, services: Optional[ServiceContainer] = None):
         self._config: Config = config
         self._dispatcher: Dispatcher = dispatcher
-        self._cli_print_helper: CliPrintHelper = CliPrintHelper()
-        self._kernel_os_helper: KernelOsHelper = KernelOsHelper(config)
-        self._sb_helper: SecureBootHelper = SecureBootHelper(config.sb_keys_path)
+        self._services: ServiceContainer = ServiceContainer(config) if services is None else services
+        self._cli_print_helper: CliPrintHelper = self._services.cli_print_helper
+        self._kernel_os_helper: KernelOsHelper = self._services.kernel_os_helper
+        self._sb_helper: SecureBootHelper = self._services.sb_helper
+        self._build_cache_helper: BuildCacheHelper = self._services.build_cache_helper
+        self._file_transaction_helper: FileTransactionHelper = self._services.file_transaction_helper
+
+        # controllers an action forwards to share the services, so the requirements are already checked
+        if not self._services.requirements_checked:
+            self._kernel_os_helper.check_requirements()
+            self._check_config()
+            self._services.requirements_checked = True
+
+    def lock(self, action_name: str) -> contextlib.AbstractContextManager:
+        """Returns the global lock given action has to hold while running (see "LockHelper").
+
+        Actions lock exclusively unless "LOCK_MODES" says otherwise, long running actions that only wait or
+        forward (e.g. "sign-agent" or "queue:run") don't lock at all.
+        """
+        lock_mode: str = self.LOCK_MODES.get(action_name, 'exclusive')
 
-        self._kernel_os_helper.check_requirements()
-        self._check_config()
+        if lock_mode == 'none':
+            return contextlib.nullcontext()
+
+        return LockHelper(Env.LOCK_FILE_PATH).lock(lock_mode == 'exclusive', self._config.lock_timeout,
+                                                   self._print_lock_holders)
+
+    def _print_lock_holders(self, holders: list) -> None:
+        holder_names: str = ', '.join(f'PID {holder["pid"]} ({holder["command"]})' for holder in holders)
+        self._print_status(f'waiting for lock held by: {holder_names or "unknown"}')
 
     def _check_config(self):
         self._check_security_token()
+        self._check_unified_kernel_image_builder()
+        self._check_unified_kernel_image_layout()
+        self._check_initramfs_compression()
+        self._check_signature_verifier()
+        self._check_package_manager_hook_mode()
 
     def _check_security_token(self) -> None:
         security_token_name: str = self._config.security_token_name
@@ -268,6 +443,41 @@ class AppController:
         if self._config.use_security_token and security_token_name not in Env.SUPPORTED_SECURITY_TOKENS:
             raise AppError(f'configured security token "{security_token_name}" is not supported')
 
+        security_token_signer: str = self._config.security_token_signer
+
+        if self._config.use_security_token and security_token_signer not in Env.SUPPORTED_SECURITY_TOKEN_SIGNERS:
+            raise AppError(f'configured security token signer "{security_token_signer}" is not supported')
+
+    def _check_unified_kernel_image_builder(self) -> None:
+        builder_name: str = self._config.unified_kernel_image_builder
+
+        if builder_name not in Env.SUPPORTED_UNIFIED_KERNEL_IMAGE_BUILDERS:
+            raise AppError(f'configured unified kernel image builder "{builder_name}" is not supported')
+
+    def _check_unified_kernel_image_layout(self) -> None:
+        layout_name: str = self._config.unified_kernel_image_layout
+
+        if layout_name not in Env.SUPPORTED_UNIFIED_KERNEL_IMAGE_LAYOUTS:
+            raise AppError(f'configured unified kernel image layout "{layout_name}" is not supported')
+
+    def _check_initramfs_compression(self) -> None:
+        compression_name: str = self._config.initramfs_compression
+
+        if compression_name not in Env.SUPPORTED_INITRAMFS_COMPRESSIONS:
+            raise AppError(f'configured initramfs compression "{compression_name}" is not supported')
+
+    def _check_signature_verifier(self) -> None:
+        verifier_name: str = self._config.signature_verifier
+
+        if verifier_name not in Env.SUPPORTED_SIGNATURE_VERIFIERS:
+            raise AppError(f'configured signature verifier "{verifier_name}" is not supported')
+
+    def _check_package_manager_hook_mode(self) -> None:
+        hook_mode: str = self._config.package_manager_hook_mode
+
+        if hook_mode not in Env.SUPPORTED_PACKAGE_MANAGER_HOOK_MODES:
+            raise AppError(f'configured package manager hook mode "{hook_mode}" is not supported')
+
     def _forward(self, feature_name: str, action_name: str, params: Optional[dict] = None):
         """Invokes controller action for given feature, controller and action name."""
         if params is None:
@@ -283,18 +493,122 @@ class AppController:
     def _print_status(self, message: str, status: CliPrintHelper.Status = CliPrintHelper.Status.PENDING) -> None:
         self._cli_print_helper.print_status(message, status)
 
-    def _sign_file(self, file_path: Path) -> None:
+    def _get_error_message(self, error: BaseException) -> str:
+        """Returns the message of given error, also of unexpected ones (e.g. OSError) that aren't AppErrors."""
+        if isinstance(error, AppError):
+            return error.message
+
+        return str(error) or type(error).__name__
+
+    def _get_kernel_names(self, kernel_names: Optional[list] = None, all_kernels: bool = False) -> list:
+        """Returns given kernel names without duplicates, all kernel names or the default kernel name."""
+        if all_kernels:
+            kernel_names = self._kernel_os_helper.get_kernel_names()
+        elif not kernel_names:
+            kernel_names = [self._kernel_os_helper.get_default_kernel_name()]
+
+        # dict.fromkeys() removes duplicates but keeps the order
+        return list(dict.fromkeys(kernel_names))
+
+    def _plan_kernel_installs(self, kernel_names: list, force: bool = False) -> list:
+        """Returns an install plan for every given kernel before anything is built.
+
+        A plan is a dict with the keys "kernel_name", "unified_kernel_image_path", "input_file_paths", "input_records"
+        (taken now, so they describe the inputs the image is built from, see "BuildCacheHelper.get_input_records()"),
+        "options", "changes" (see "BuildCacheHelper.get_changes()"), "rebuild", "image_size" (predicted size of the
+        new signed image, None if it is up to date or its size can't be predicted, e.g. an input is missing) and
+        "current_image_size" (size of the installed image that will be replaced, 0 if none).
+        """
+        install_plans: list = []
+
+        for kernel_name in kernel_names:
+            unified_kernel_image_path: Path = self._kernel_os_helper.get_unified_kernel_image_path(kernel_name)
+            input_file_paths: dict = {
+                **self._kernel_os_helper.get_unified_kernel_image_input_paths(kernel_name),
+                'cert': self._sb_helper.db_cert_file_path
+            }
+            input_records: dict = self._build_cache_helper.get_input_records(
+                unified_kernel_image_path, input_file_paths
+            )
+            options: dict = self._kernel_os_helper.get_unified_kernel_image_options()
+            changes: list = [] if force else self._build_cache_helper.get_changes(
+                unified_kernel_image_path, input_records, options
+            )
+            install_plan: dict = {
+                'kernel_name': kernel_name,
+                'unified_kernel_image_path': unified_kernel_image_path,
+                'input_file_paths': input_file_paths,
+                'input_records': input_records,
+                'options': options,
+                'changes': changes,
+                'rebuild': force or bool(changes),
+                'image_size': None,
+                'current_image_size': 0
+            }
+
+            try:
+                install_plan['current_image_size'] = unified_kernel_image_path.stat().st_size
+            except FileNotFoundError:
+                pass
+
+            if install_plan['rebuild']:
+                try:
+                    install_plan['image_size'] = self._kernel_os_helper.predict_unified_kernel_image_size(kernel_name)
+                except (AppError, OSError):
+                    pass
+
+            install_plans.append(install_plan)
+
+        return install_plans
+
+    def _get_esp_capacity(self, install_plans: list, concurrent: bool) -> dict:
+        """Returns the space on the ESP required for the given install plans and whether it is available.
+
+        New images are staged next to the images they replace and the replaced images are only removed on commit.
+        If installed concurrently all new images may be staged at the same time, so the sum of their sizes is
+        required. Otherwise the space of every replaced image is available again for the following images. Sizes
+        are rounded up to the block size of the ESP. Returns a dict with the keys "required", "available" (free
+        space) and "fits".
+        """
+        esp_usage: dict = self._kernel_os_helper.get_esp_usage()
+        block_size: int = esp_usage['block_size']
+        required_space: int = 0
+        released_space: int = 0
+
+        for install_plan in install_plans:
+            if install_plan['image_size'] is None:
+                continue
+
+            image_size: int = -(-install_plan['image_size'] // block_size) * block_size
+            current_image_size: int = -(-install_plan['current_image_size'] // block_size) * block_size
+
+            if concurrent:
+                required_space += image_size
+            else:
+                required_space = max(required_space, image_size - released_space)
+                released_space += current_image_size - image_size
+
+        return {'required': required_space, 'available': esp_usage['free'],
+                'fits': required_space <= esp_usage['free']}
+
+    def _sign_file(self, file_path: Path, staged_file_path: Optional[Path] = None) -> None:
+        """Signs given file or, if given, its staged (not yet committed) version in place."""
         self._print_status(f'signing: {file_path}')
 
-        if not self._sb_helper.sign_file(file_path, self._config.use_security_token):
+        if not self._sb_helper.sign_file(staged_file_path or file_path, self._config.use_security_token):
             raise AppError(f'failed to sign: {file_path}')
 
         self._print_status(f'signed: {file_path}', CliPrintHelper.Status.SUCCESS)
 
-    def _verify_file(self, file_path: Path) -> None:
+    def _verify_file(self, file_path: Path, staged_file_path: Optional[Path] = None) -> bool:
+        """Verifies signature of given file or, if given, of its staged (not yet committed) version."""
         self._print_status(f'verifying signature: {file_path}')
 
-        if self._sb_helper.verify_file(file_path):
+        if self._sb_helper.verify_file(staged_file_path or file_path):
             self._print_status(f'valid signature: {file_path}', CliPrintHelper.Status.SUCCESS)
-        else:
-            self._print_status(f'invalid signature: {file_path}', CliPrintHelper.Status.ERROR)
+
+            return True
+
+        self._print_status(f'invalid signature: {file_path}', CliPrintHelper.Status.ERROR)
+
+        return False
@@ -13,6 +13,14 @@ class Env:
     APP_TITLE: str = f'{APP_NAME} v{APP_VERSION} - Secure Boot Helper'
     APP_CONFIG_FILE_PATH: Path = Path(f'/etc/{APP_NAME}/{APP_NAME}.conf')
     APP_HOOK_PATH: Path = Path(f'/etc/{APP_NAME}/hooks')
+    BUILD_QUEUE_FILE_PATH: Path = Path(f'/var/lib/{APP_NAME}/build-queue.json')
+    BUILD_QUEUE_LOG_FILE_PATH: Path = Path(f'/var/log/{APP_NAME}.log')
+    BUILD_MANIFEST_FILE_PATH: Path = Path(f'/var/lib/{APP_NAME}/build-manifest.json')
+    SIGNATURE_CACHE_FILE_PATH: Path = Path(f'/var/lib/{APP_NAME}/signature-cache.bin')
+    ESP_MANIFEST_FILE_PATH: Path = Path(f'/var/lib/{APP_NAME}/esp-manifest.sha256')
+    LOCK_FILE_PATH: Path = Path(f'/run/{APP_NAME}/{APP_NAME}.lock')
+    SIGN_AGENT_SOCKET_PATH: Path = Path(f'/run/{APP_NAME}/sign-agent.sock')
+    INITRAMFS_CACHE_PATH: Path = Path(f'/var/lib/{APP_NAME}/initramfs-cache')
     BOOTLOADER_DEFAULT_BOOT_FILE_SUBPATH: str = 'EFI/BOOT/BOOTX64.EFI'
     BOOTLOADER_SYSTEMD_BOOT_BOOT_FILE_SUBPATH: str = 'EFI/systemd/systemd-bootx64.efi'
     BOOTLOADER_CONFIG_FILE_SUBPATH: str = 'loader/loader.conf'
@@ -25,8 +33,17 @@ class Env:
     MACHINE_ID: str = ''
     OS_RELEASE_FILE_PATH: Path = Path('/etc/os-release')
     SB_KEY_NAME_DB: str = 'db'
+    SECURITY_TOKEN_PKCS11_MODULE: str = 'opensc-pkcs11.so'
+    SECURITY_TOKEN_PKCS11_URI: str = 'pkcs11:manufacturer=piv_II;id=%02'
+    SUPPORTED_INITRAMFS_COMPRESSIONS: list = ['none', 'zstd', 'xz', 'gzip']
+    SUPPORTED_OUTPUT_FORMATS: list = ['text', 'jsonl']
     SUPPORTED_PACKAGE_MANAGERS: list = ['pacman', 'apt']
+    SUPPORTED_PACKAGE_MANAGER_HOOK_MODES: list = ['sync', 'deferred']
+    SUPPORTED_SECURITY_TOKEN_SIGNERS: list = ['sbsign', 'pkcs11']
     SUPPORTED_SECURITY_TOKENS: list = ['yubikey']
+    SUPPORTED_SIGNATURE_VERIFIERS: list = ['native', 'sbverify']
+    SUPPORTED_UNIFIED_KERNEL_IMAGE_BUILDERS: list = ['native', 'objcopy']
+    SUPPORTED_UNIFIED_KERNEL_IMAGE_LAYOUTS: list = ['computed', 'fixed']
     UNIFIED_IMAGE_SUBPATH: str = 'EFI/Linux'
 
     @staticmethod
@@ -0,0 +1,30 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+# Registry of all commands: command name -> (feature module, help message), in the order of the command list.
+# The CLI imports only the feature module of the requested command, its SubcmdCreator adds the arguments. So a new
+# command has to be registered here as well (checked by the SubcmdCreator tests).
+COMMANDS: dict = {
+    'bootloader:install': ('bootloader', 'install bootloader (systemd-boot)'),
+    'bootloader:update': ('bootloader', 'update bootloader (systemd-boot)'),
+    'bootloader:remove': ('bootloader', 'remove bootloader (systemd-boot)'),
+    'bootloader:status': ('bootloader', 'show bootloader status (systemd-boot)'),
+    'bootloader:update-menu': ('bootloader', 'update bootloader menu'),
+    'config:list': ('config', 'list current config'),
+    'esp:plan': ('esp', 'check if unified kernel images fit on ESP'),
+    'file:list': ('file', 'list files on ESP with signing status'),
+    'file:baseline': ('file', 'record integrity baseline of ESP'),
+    'file:audit': ('file', 'compare ESP with integrity baseline'),
+    'file:sign': ('file', 'sign given file'),
+    'file:verify': ('file', 'verify signature of given file'),
+    'kernel:install': ('kernel', 'install given, all or default kernel'),
+    'kernel:remove': ('kernel', 'remove given or default kernel'),
+    'sign-agent': ('misc', 'run agent holding the signing key'),
+    'pmi:install': ('pmi', 'install package manager hook files'),
+    'pmi:remove': ('pmi', 'remove package manager hook files'),
+    'pmi:hook-callback': ('pmi', 'package manager hook callback'),
+    'queue:status': ('queue', 'show build queue'),
+    'queue:wait': ('queue', 'wait until build queue is empty'),
+    'queue:run': ('queue', 'build queued jobs'),
+}
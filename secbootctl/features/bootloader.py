@@ -14,6 +14,8 @@ from secbootctl.helpers.cli import CliPrintHelper
 
 
 class BootloaderController(AppController):
+    LOCK_MODES: dict = {'status': 'shared'}
+
     def install(self) -> None:
         self._install_systemd_boot()
         self._sign_systemd_boot_files()
@@ -54,8 +56,8 @@ class BootloaderController(AppController):
             linux {default_unified_kernel_image_subpath}
         ''')
 
-        with open(default_entry_file_path, 'w') as file:
-            file.write(entry_content)
+        with self._file_transaction_helper.begin() as transaction:
+            transaction.write_text(default_entry_file_path, entry_content)
 
         self._print_status(f'updated default bootloader entry: {default_entry_file_path}',
                            CliPrintHelper.Status.SUCCESS)
@@ -106,10 +108,22 @@ class BootloaderController(AppController):
         default_boot_file_path: Path = esp_path / Env.BOOTLOADER_DEFAULT_BOOT_FILE_SUBPATH
         systemd_boot_file_path: Path = esp_path / Env.BOOTLOADER_SYSTEMD_BOOT_BOOT_FILE_SUBPATH
 
-        self._sign_file(default_boot_file_path)
-        self._sign_file(systemd_boot_file_path)
-        self._verify_file(default_boot_file_path)
-        self._verify_file(systemd_boot_file_path)
+        boot_file_paths: list = [default_boot_file_path, systemd_boot_file_path]
+
+        # boot files are signed as staged copies and only replaced if all signatures are valid
+        with self._file_transaction_helper.begin() as transaction:
+            staged_file_paths: list = [transaction.stage(file_path, True) for file_path in boot_file_paths]
+
+            for file_path, staged_file_path in zip(boot_file_paths, staged_file_paths):
+                self._sign_file(file_path, staged_file_path)
+
+            verified: list = [
+                self._verify_file(file_path, staged_file_path)
+                for file_path, staged_file_path in zip(boot_file_paths, staged_file_paths)
+            ]
+
+            if not all(verified):
+                raise AppError('signed bootloader files have invalid signatures, bootloader files left unchanged')
 
     def _init_bootloader_config(self) -> None:
         """Initializes "<esp_path>/loader/loader.conf" by setting default entry file name, timeout, etc.
@@ -125,8 +139,8 @@ class BootloaderController(AppController):
 
         self._print_status(f'initializing bootloader config file: {config_file_path}')
 
-        with open(config_file_path, 'w') as file:
-            file.write(config_content)
+        with self._file_transaction_helper.begin() as transaction:
+            transaction.write_text(config_file_path, config_content)
 
         self._print_status(f'initialized bootloader config file: {config_file_path}', CliPrintHelper.Status.SUCCESS)
 
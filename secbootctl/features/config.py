@@ -11,14 +11,20 @@ from secbootctl.env import Env
 
 
 class ConfigController(AppController):
+    LOCK_MODES: dict = {'list': 'shared'}
+
     def list(self) -> None:
         """Lists configuration values configured in configuration file."""
-        print(f'{"Config-Name":35} Config-Value\n{"---":35} ---')
+        self._cli_print_helper.print_text(f'{"Config-Name":35} Config-Value\n{"---":35} ---')
 
         for config_key, config_value in self._config.config_data.items():
-            print(f'{config_key:35} {config_value}')
+            self._cli_print_helper.print_record(
+                'config', {'step': 'config', 'target': str(Env.APP_CONFIG_FILE_PATH), 'name': config_key,
+                           'value': config_value},
+                f'{config_key:35} {config_value}'
+            )
 
-        print(f'\nConfiguration file: "{Env.APP_CONFIG_FILE_PATH}"')
+        self._cli_print_helper.print_text(f'\nConfiguration file: "{Env.APP_CONFIG_FILE_PATH}"')
 
 
 class ConfigSubcmdCreator(BaseSubcmdCreator):
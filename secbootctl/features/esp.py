@@ -0,0 +1,87 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import textwrap
+from typing import Optional
+
+from secbootctl.core import AppController, AppError, BaseSubcmdCreator
+from secbootctl.helpers.cli import CliPrintHelper
+
+
+class EspController(AppController):
+    LOCK_MODES: dict = {'plan': 'shared'}
+
+    def plan(self, kernel_names: Optional[list] = None, jobs: Optional[int] = None, force: bool = False) -> None:
+        """Lists the predicted sizes of the unified kernel images of given or all kernels and checks if they fit.
+
+        Nothing is built. The check is the same "kernel:install" does before building: images that are up to date
+        are skipped, images that will be replaced are taken into account.
+        """
+        if jobs is not None and jobs < 1:
+            raise AppError(f'invalid number of jobs: {jobs}')
+
+        kernel_names = self._get_kernel_names(kernel_names, not kernel_names)
+        install_plans: list = self._plan_kernel_installs(kernel_names, force)
+        esp_capacity: dict = self._get_esp_capacity(install_plans, len(kernel_names) > 1 and jobs != 1)
+        esp_usage: dict = self._kernel_os_helper.get_esp_usage()
+        format_size = CliPrintHelper.format_size
+
+        self._cli_print_helper.print_text(f'{"Kernel-Name":35} {"Status":12} {"Installed":>12} {"Predicted":>12}\n'
+                                          f'{"---":35} {"---":12} {"---":>12} {"---":>12}')
+
+        for install_plan in install_plans:
+            if not install_plan['rebuild']:
+                status, image_size = 'up to date', '-'
+            elif install_plan['image_size'] is None:
+                status, image_size = 'rebuild', 'unknown'
+            else:
+                status, image_size = 'rebuild', format_size(install_plan['image_size'])
+
+            self._cli_print_helper.print_record(
+                'kernel_plan', {'step': 'plan', 'target': str(install_plan['unified_kernel_image_path']),
+                                'kernel_name': install_plan['kernel_name'], 'rebuild': install_plan['rebuild'],
+                                'current_image_size': install_plan['current_image_size'],
+                                'image_size': install_plan['image_size']},
+                f'{install_plan["kernel_name"]:35} {status:12} '
+                f'{format_size(install_plan["current_image_size"]):>12} {image_size:>12}'
+            )
+
+        self._cli_print_helper.print_record(
+            'esp_capacity', {'step': 'plan', 'target': str(self._config.esp_path), 'total': esp_usage['total'],
+                             **esp_capacity},
+            f'\nESP "{self._config.esp_path}": {format_size(esp_usage["total"])} total, '
+            f'{format_size(esp_capacity["available"])} free, {format_size(esp_capacity["required"])} required'
+        )
+
+        if not esp_capacity['fits']:
+            raise AppError(f'not enough space on ESP "{self._config.esp_path}": '
+                           f'{format_size(esp_capacity["required"])} required, '
+                           f'{format_size(esp_capacity["available"])} available')
+
+
+class EspSubcmdCreator(BaseSubcmdCreator):
+    def create(self, cli_subparsers):
+        ep_cli_subparser = self._add(cli_subparsers, 'esp:plan', 'check if unified kernel images fit on ESP',
+                                     textwrap.dedent(f'''
+            Predict the sizes of the signed unified kernel images of the given or all
+            kernels and check them against the free space of the ESP
+            "{self._esp_path}". Nothing is built.
+
+            Images that are up to date (see "kernel:install") are not counted. Installed
+            images that will be replaced are taken into account: they are removed only
+            after the new image has been written. If kernels are installed concurrently
+            all new images may be written at the same time.
+
+            "kernel:install" performs the same check before building and stops early if
+            the new images don't fit. The predicted sizes include a reserve for the
+            signature.
+        '''))
+        ep_cli_subparser.add_argument('kernel_names', nargs='*', metavar='kernel_name',
+                                      help='e.g. "linux-lts", "5.4.0-91-generic", etc. (default: all kernels)')
+        ep_cli_subparser.add_argument('--jobs', type=int, metavar='N',
+                                      help='number of kernels installed concurrently (default: automatic)')
+        ep_cli_subparser.add_argument('--force', action='store_true',
+                                      help='count all images as rebuilt even if they are up to date')
@@ -4,48 +4,155 @@
 
 from __future__ import annotations
 
-import glob
+import collections
+import concurrent.futures
+import os
 import textwrap
+import time
 from pathlib import Path
+from typing import Callable, Iterator, Optional
 
-from secbootctl.core import AppController, BaseSubcmdCreator
+from secbootctl.core import AppController, AppError, BaseSubcmdCreator
+from secbootctl.env import Env
+from secbootctl.helpers.cli import CliPrintHelper
+from secbootctl.helpers.filewalker import FileWalkerHelper
+from secbootctl.helpers.manifest import FileManifestHelper
+from secbootctl.helpers.signaturecache import SignatureCacheHelper
 
 
 class FileController(AppController):
-    def list(self, all: bool) -> None:
-        """Lists EFI or optionally all files on EFI System Partition (ESP) with their signing status."""
-        file_extension: str = '.efi' if not all else ''
-        file_paths: list = glob.glob(str(self._config.esp_path / '**' / ('*' + file_extension)), recursive=True)
-
-        # If glob works case sensitive or insensitive seems to depend on the underlying filesystem. Thus next to
-        # search for ".efi" we search for ".EFI" too and merge both results.
-        if not all:
-            file_paths2: list = glob.glob(
-                str(self._config.esp_path / '**' / ('*' + file_extension.upper())), recursive=True
+    LOCK_MODES: dict = {'list': 'shared', 'audit': 'shared', 'verify': 'shared'}
+    VERIFY_QUEUE_SIZE: int = 4
+
+    def list(self, all: bool, no_cache: bool = False, jobs: Optional[int] = None) -> None:
+        """Lists EFI or optionally all files on EFI System Partition (ESP) with their signing status.
+
+        The files are found in a single pass over the ESP (see "FileWalkerHelper"), ".efi" is matched
+        case-insensitively. The signing status of unchanged files is taken from the signature cache (see
+        "SignatureCacheHelper") unless "no_cache" is given.
+
+        Files are verified concurrently by up to "jobs" worker threads (default: one per CPU), the results are
+        printed in sorted order as soon as all preceding files have been verified.
+        """
+        if jobs is not None and jobs < 1:
+            raise AppError(f'invalid number of jobs: {jobs}')
+
+        file_paths: Iterator[Path] = FileWalkerHelper(self._config.esp_path).walk(None if all else ['.efi'])
+        signature_cache_helper: Optional[SignatureCacheHelper] = None
+
+        if not no_cache:
+            signature_cache_helper = SignatureCacheHelper(Env.SIGNATURE_CACHE_FILE_PATH,
+                                                          self._sb_helper.db_cert_file_path)
+
+        def verify_file(file_path: Path) -> tuple:
+            start_time: float = time.monotonic()
+
+            if signature_cache_helper is None:
+                is_signed: bool = self._sb_helper.verify_file(file_path)
+            else:
+                is_signed: bool = signature_cache_helper.verify_file(file_path, self._sb_helper.verify_file)
+
+            return is_signed, time.monotonic() - start_time
+
+        for file_path, (is_signed, duration) in self._verify_files(file_paths, verify_file,
+                                                                   jobs or os.cpu_count() or 1):
+            signed_message: str = '\u2714 signed' if is_signed else '\u2717 not signed'
+
+            self._cli_print_helper.print_record(
+                'file', {'step': 'verifying signature', 'target': str(file_path), 'duration': duration,
+                         'signed': is_signed},
+                f'{file_path}\n{"Status":>10} {signed_message}'
+            )
+
+        if signature_cache_helper is not None:
+            signature_cache_helper.save(all)
+            self._cli_print_helper.print_record(
+                'signature_cache', {'step': 'signature cache', 'target': str(Env.SIGNATURE_CACHE_FILE_PATH),
+                                    'hits': signature_cache_helper.hits, 'misses': signature_cache_helper.misses},
+                f'\nSignature cache: {signature_cache_helper.hits} hits, {signature_cache_helper.misses} misses'
             )
-            file_paths = list({*file_paths, *file_paths2})
 
-        file_paths.sort()
+    def baseline(self, manifest_file: Optional[str] = None, jobs: Optional[int] = None) -> None:
+        """Records the digests of all files on the ESP as integrity baseline (see "FileManifestHelper")."""
+        manifest_file_path: Path = Path(manifest_file) if manifest_file else Env.ESP_MANIFEST_FILE_PATH
+
+        if jobs is not None and jobs < 1:
+            raise AppError(f'invalid number of jobs: {jobs}')
 
-        for file_path in file_paths:
-            file_path: Path = Path(file_path)
+        self._print_status(f'recording ESP baseline: {manifest_file_path}')
 
-            if file_path.is_dir():
-                continue
+        file_manifest_helper: FileManifestHelper = FileManifestHelper()
+        manifest: dict = file_manifest_helper.create(self._config.esp_path, jobs)
+        file_manifest_helper.save(manifest, manifest_file_path)
 
-            signed_message: str = '\u2717 not signed'
+        self._print_status(f'recorded ESP baseline: {manifest_file_path} ({len(manifest)} files)',
+                           CliPrintHelper.Status.SUCCESS)
 
-            if self._sb_helper.verify_file(file_path):
-                signed_message = '\u2714 signed'
+    def audit(self, manifest_file: Optional[str] = None, jobs: Optional[int] = None) -> None:
+        """Compares the files on the ESP with the integrity baseline and lists added, removed and modified files.
 
-            print(f'{file_path}\n{"Status":>10} {signed_message}')
+        An error is raised if the ESP differs from the baseline.
+        """
+        manifest_file_path: Path = Path(manifest_file) if manifest_file else Env.ESP_MANIFEST_FILE_PATH
+
+        if jobs is not None and jobs < 1:
+            raise AppError(f'invalid number of jobs: {jobs}')
+
+        file_manifest_helper: FileManifestHelper = FileManifestHelper()
+        baseline_manifest: dict = file_manifest_helper.load(manifest_file_path)
+        changes: list = file_manifest_helper.compare(
+            baseline_manifest, file_manifest_helper.create(self._config.esp_path, jobs)
+        )
+
+        for relative_path, change in changes:
+            file_path: Path = self._config.esp_path / relative_path
+
+            self._cli_print_helper.print_record(
+                'audit', {'step': 'audit', 'target': str(file_path), 'change': change}, f'{change:10} {file_path}'
+            )
+
+        if changes:
+            change_counts: dict = collections.Counter(change for _, change in changes)
+
+            raise AppError(f'ESP differs from baseline "{manifest_file_path}": {change_counts["added"]} added, '
+                           f'{change_counts["removed"]} removed, {change_counts["modified"]} modified')
+
+        self._print_status(f'ESP matches baseline: {manifest_file_path} ({len(baseline_manifest)} files)',
+                           CliPrintHelper.Status.SUCCESS)
 
     def sign(self, file_path: str) -> None:
-        self._sign_file(Path(file_path))
+        file_path: Path = Path(file_path)
+
+        with self._file_transaction_helper.begin() as transaction:
+            self._sign_file(file_path, transaction.stage(file_path, True))
 
     def verify(self, file_path: str) -> None:
         self._verify_file(Path(file_path))
 
+    def _verify_files(self, file_paths: Iterator[Path], verify_file: Callable[[Path], tuple],
+                      jobs: int) -> Iterator[tuple]:
+        """Verifies given files concurrently and yields (file path, result of "verify_file") in the given order.
+
+        Files are taken from the (lazy) iterator only while less than "VERIFY_QUEUE_SIZE" per worker are pending,
+        results are yielded as soon as the verification of all preceding files has finished.
+        """
+        pending: collections.deque = collections.deque()
+        executor: concurrent.futures.ThreadPoolExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+
+        try:
+            for file_path in file_paths:
+                pending.append((file_path, executor.submit(verify_file, file_path)))
+
+                while pending and (pending[0][1].done() or len(pending) > jobs * self.VERIFY_QUEUE_SIZE):
+                    file_path, future = pending.popleft()
+                    yield file_path, future.result()
+
+            while pending:
+                file_path, future = pending.popleft()
+                yield file_path, future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
 
 class FileSubcmdCreator(BaseSubcmdCreator):
     def create(self, cli_subparsers):
@@ -54,8 +161,50 @@ class FileSubcmdCreator(BaseSubcmdCreator):
             Lists all EFI files (files with ".efi" file extension) found on the
             EFI System Partition (ESP) and their signing status. Optionally to list all
             files instead of only the EFI files use the "--all" option.
+
+            The signing status of files that haven't changed since the last listing is
+            taken from a cache, files with identical content are verified only once.
+            The cache is invalidated if the db certificate changes. Use "--no-cache" to
+            verify all files.
+
+            Files are verified concurrently (see "--jobs"), they are listed in sorted
+            order as soon as all preceding files have been verified.
         '''))
         fl_cli_subparser.add_argument('--all', action='store_true', help='list all files on the ESP')
+        fl_cli_subparser.add_argument('--no-cache', action='store_true',
+                                      help='verify all files instead of using the signature cache')
+        fl_cli_subparser.add_argument('--jobs', type=int, metavar='N',
+                                      help='number of files verified concurrently (default: number of CPUs)')
+        fb_cli_subparser = self._add(cli_subparsers, 'file:baseline', 'record integrity baseline of ESP',
+                                     textwrap.dedent(f'''
+            Record the sha256 digests of all files on the EFI System Partition (ESP)
+            as integrity baseline in "{Env.ESP_MANIFEST_FILE_PATH}" or the
+            given manifest file. Use "file:audit" to detect added, removed or modified
+            files later on.
+
+            The manifest has the format of "sha256sum" with paths relative to the ESP,
+            so manifests of different hosts can be compared without copying any files
+            and checked with "sha256sum -c" from within the ESP.
+
+            Record a new baseline after installing kernels or the bootloader.
+        '''))
+        fb_cli_subparser.add_argument('--manifest-file', metavar='PATH',
+                                      help=f'manifest file to write (default: {Env.ESP_MANIFEST_FILE_PATH})')
+        fb_cli_subparser.add_argument('--jobs', type=int, metavar='N',
+                                      help='number of files hashed concurrently (default: number of CPUs)')
+        fa_cli_subparser = self._add(cli_subparsers, 'file:audit', 'compare ESP with integrity baseline',
+                                     textwrap.dedent('''
+            Compare all files on the EFI System Partition (ESP) with the integrity
+            baseline recorded by "file:baseline" (or the given manifest file, e.g. the
+            one of another host) and list the files that have been added, removed or
+            modified. Fails if the ESP differs from the baseline.
+
+            Only digests are compared, no signature is verified (see "file:list").
+        '''))
+        fa_cli_subparser.add_argument('--manifest-file', metavar='PATH',
+                                      help=f'manifest file to compare with (default: {Env.ESP_MANIFEST_FILE_PATH})')
+        fa_cli_subparser.add_argument('--jobs', type=int, metavar='N',
+                                      help='number of files hashed concurrently (default: number of CPUs)')
         fs_cli_subparser = self._add(cli_subparsers, 'file:sign', 'sign given file', textwrap.dedent('''
             Sign the given file.
         '''))
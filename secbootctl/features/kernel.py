@@ -4,32 +4,69 @@
 
 from __future__ import annotations
 
+import concurrent.futures
+import contextlib
+import os
 import textwrap
+import threading
 from pathlib import Path
 from typing import Optional
 
-from secbootctl.core import AppController, BaseSubcmdCreator
+from secbootctl.core import AppController, AppError, BaseSubcmdCreator
 from secbootctl.env import Env
 from secbootctl.helpers.cli import CliPrintHelper
 
 
 class KernelController(AppController):
-    def install(self, kernel_name: Optional[str] = None) -> None:
-        """Installs given kernel or default kernel (see configuration file) when no argument given.
+    INITRD_INPUT_NAMES: tuple = ('initramfs', 'microcode')
 
-        Install steps:
+    def install(self, kernel_names: Optional[list] = None, all_kernels: bool = False, jobs: Optional[int] = None,
+                force: bool = False, explain: bool = False) -> None:
+        """Installs given kernels, all kernels or default kernel (see configuration file) when no argument given.
+
+        Install steps (per kernel):
             1. Builds unified kernel image that consists of kernel, initramfs and microcode image.
             2. Signs unified kernel image.
             3. Verifies signature of unified kernel image.
+
+        All steps are skipped if the build manifest shows that a signed unified kernel image built from the current
+        inputs already exists, unless "force" is given.
+
+        Before anything is built the sizes of the new images are predicted and checked against the free space of
+        the ESP. If they don't fit no kernel is installed and the required space per kernel is printed.
+
+        Multiple kernels are installed concurrently by up to "jobs" worker threads (default: one per kernel, limited
+        by the number of CPUs). Signing is serialized if a security token is used, as a token can only handle one
+        signing operation at a time. The output is grouped per kernel and an error is raised after all kernels have
+        been processed if any of them failed.
         """
-        if kernel_name is None:
-            kernel_name = self._kernel_os_helper.get_default_kernel_name()
+        kernel_names = self._get_kernel_names(kernel_names, all_kernels)
 
-        unified_kernel_image_path: Path = self._kernel_os_helper.get_unified_kernel_image_path(kernel_name)
+        if jobs is not None and jobs < 1:
+            raise AppError(f'invalid number of jobs: {jobs}')
+
+        install_plans: list = self._plan_kernel_installs(kernel_names, force)
+        self._check_esp_capacity(install_plans, len(kernel_names) > 1 and jobs != 1)
+        sign_lock = threading.Lock() if self._config.use_security_token else contextlib.nullcontext()
+
+        if len(kernel_names) == 1:
+            self._install_kernel(install_plans[0], sign_lock, explain)
+
+            return
+
+        if jobs is None:
+            jobs = min(len(kernel_names), os.cpu_count() or 1)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            failed_kernel_names: list = [
+                kernel_name for kernel_name, succeeded in zip(kernel_names, executor.map(
+                    lambda install_plan: self._install_kernel_grouped(install_plan, sign_lock, explain),
+                    install_plans
+                )) if not succeeded
+            ]
 
-        self._build_unified_kernel_image(kernel_name, unified_kernel_image_path)
-        self._sign_file(unified_kernel_image_path)
-        self._verify_file(unified_kernel_image_path)
+        if failed_kernel_names:
+            raise AppError(f'failed to install kernels: {", ".join(failed_kernel_names)}')
 
     def remove(self, kernel_name: Optional[str] = None) -> None:
         """Removes given kernel or default kernel (see configuration file) when no argument given."""
@@ -41,22 +78,140 @@ class KernelController(AppController):
         self._print_status(f'removing unified kernel image: {unified_kernel_image_path}')
 
         unified_kernel_image_path.unlink(missing_ok=True)
+        self._build_cache_helper.remove(unified_kernel_image_path)
 
         self._print_status(f'removed unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS)
 
-    def _build_unified_kernel_image(self, kernel_name: str, unified_kernel_image_path: Path) -> None:
+    def _check_esp_capacity(self, install_plans: list, concurrent: bool) -> None:
+        """Raises an error with a space breakdown per kernel if the new unified kernel images don't fit on the ESP."""
+        esp_capacity: dict = self._get_esp_capacity(install_plans, concurrent)
+
+        if esp_capacity['fits']:
+            return
+
+        for install_plan in install_plans:
+            if install_plan['image_size'] is not None:
+                self._print_status(
+                    f'{install_plan["kernel_name"]}: {CliPrintHelper.format_size(install_plan["image_size"])} '
+                    f'required, replaces {CliPrintHelper.format_size(install_plan["current_image_size"])}',
+                    CliPrintHelper.Status.ERROR
+                )
+
+        raise AppError(f'not enough space on ESP "{self._config.esp_path}": '
+                       f'{CliPrintHelper.format_size(esp_capacity["required"])} required, '
+                       f'{CliPrintHelper.format_size(esp_capacity["available"])} available')
+
+    def _install_kernel_grouped(self, install_plan: dict, sign_lock, explain: bool) -> bool:
+        """Installs planned kernel with its output printed as one group and returns whether installation succeeded.
+
+        Any error (e.g. also an OSError while staging or signing) only fails the installation of this kernel, so the
+        other kernels are still installed and all failed kernels are reported together.
+        """
+        with self._cli_print_helper.group(f'kernel: {install_plan["kernel_name"]}'):
+            try:
+                self._install_kernel(install_plan, sign_lock, explain)
+            except Exception as error:
+                self._print_status(self._get_error_message(error), CliPrintHelper.Status.ERROR)
+
+                return False
+
+        return True
+
+    def _install_kernel(self, install_plan: dict, sign_lock, explain: bool) -> None:
+        kernel_name: str = install_plan['kernel_name']
+        unified_kernel_image_path: Path = install_plan['unified_kernel_image_path']
+        changes: list = install_plan['changes']
+
+        if not install_plan['rebuild']:
+            self._print_status(f'unified kernel image is up to date: {unified_kernel_image_path}',
+                               CliPrintHelper.Status.SUCCESS)
+
+            return
+
+        if explain:
+            for change in changes:
+                self._print_status(f'rebuild required, {change["message"]}')
+
+        # the unified kernel image is built, signed and verified as staged file and only replaces the installed
+        # one if its signature is valid
+        with self._file_transaction_helper.begin() as transaction:
+            staged_file_path: Path = transaction.stage(unified_kernel_image_path)
+
+            if not self._is_initrd_change_only(changes) or not self._patch_unified_kernel_image_initrd(
+                    kernel_name, unified_kernel_image_path, staged_file_path):
+                self._build_unified_kernel_image(kernel_name, unified_kernel_image_path, staged_file_path)
+
+            with sign_lock:
+                self._sign_file(unified_kernel_image_path, staged_file_path)
+
+            if not self._verify_file(unified_kernel_image_path, staged_file_path):
+                raise AppError(f'unified kernel image has an invalid signature and was not installed: '
+                               f'{unified_kernel_image_path}')
+
+        self._build_cache_helper.update(unified_kernel_image_path, install_plan['input_records'],
+                                        install_plan['options'])
+
+    def _is_initrd_change_only(self, changes: list) -> bool:
+        """Returns whether only the inputs of the ".initrd" section (initramfs and microcode image) have changed."""
+        return bool(changes) and all(
+            change['subject'] == 'input' and change['name'] in self.INITRD_INPUT_NAMES for change in changes
+        )
+
+    def _build_unified_kernel_image(self, kernel_name: str, unified_kernel_image_path: Path,
+                                    staged_file_path: Path) -> None:
         self._print_status(f'building unified kernel image: {unified_kernel_image_path}')
 
-        self._kernel_os_helper.build_unified_kernel_image(kernel_name, unified_kernel_image_path)
+        build_stats: dict = self._kernel_os_helper.build_unified_kernel_image(kernel_name, staged_file_path)
+
+        self._print_status(
+            f'built unified kernel image: {unified_kernel_image_path} ({self._format_build_stats(build_stats)})',
+            CliPrintHelper.Status.SUCCESS
+        )
+
+    def _patch_unified_kernel_image_initrd(self, kernel_name: str, unified_kernel_image_path: Path,
+                                           staged_file_path: Path) -> bool:
+        """Replaces only the ".initrd" section of the installed unified kernel image.
+
+        Returns False if the installed image can't be patched and has to be built from scratch instead.
+        """
+        self._print_status(f'updating initrd of unified kernel image: {unified_kernel_image_path}')
 
-        self._print_status(f'built unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS)
+        build_stats: Optional[dict] = self._kernel_os_helper.patch_unified_kernel_image_initrd(
+            kernel_name, unified_kernel_image_path, staged_file_path
+        )
+
+        if build_stats is None:
+            self._print_status(f'initrd of unified kernel image can not be updated, rebuilding: '
+                               f'{unified_kernel_image_path}')
+
+            return False
+
+        self._print_status(
+            f'updated initrd of unified kernel image: {unified_kernel_image_path} '
+            f'({self._format_build_stats(build_stats)})',
+            CliPrintHelper.Status.SUCCESS
+        )
+
+        return True
+
+    def _format_build_stats(self, build_stats: dict) -> str:
+        formatted_build_stats: list = []
+
+        if 'layout' in build_stats:
+            formatted_build_stats.append(f'{build_stats["layout"]} layout, image size '
+                                         f'{CliPrintHelper.format_size(build_stats["image_size"])}')
+
+        formatted_build_stats.append(f'{build_stats["duration"]:.2f} s, '
+                                     f'{CliPrintHelper.format_size(build_stats["bytes_written"])} written')
+
+        return ', '.join(formatted_build_stats)
 
 
 class KernelSubcmdCreator(BaseSubcmdCreator):
     def create(self, cli_subparsers):
-        ki_cli_subparser = self._add(cli_subparsers, 'kernel:install', 'install given or default kernel',
+        ki_cli_subparser = self._add(cli_subparsers, 'kernel:install', 'install given, all or default kernel',
                                      textwrap.dedent(f'''
-            Install the given or default configured kernel as signed unified kernel image.
+            Install the given, all or the default configured kernel as signed unified kernel image.
 
             The following steps will be performed:
                 - building unified kernel image for given or default configured kernel
@@ -65,8 +220,29 @@ class KernelSubcmdCreator(BaseSubcmdCreator):
                     - will be moved to "{self._esp_path}/{Env.UNIFIED_IMAGE_SUBPATH}"
                 - signing unified kernel image
                 - verifying signature of unified kernel image
+
+            All steps are skipped if a signed unified kernel image exists that has been
+            built from the current inputs (kernel, initramfs, microcode image, cmdline,
+            os-release, EFI stub and certificate). The digests of the inputs are recorded
+            in the build manifest "{Env.BUILD_MANIFEST_FILE_PATH}". If only the initramfs
+            or microcode image changed, just the initrd section of the installed unified
+            kernel image is replaced instead of building it from scratch.
+
+            Multiple kernels are installed concurrently. Signing is serialized if a
+            security token is used.
+
+            Before anything is built the sizes of the new unified kernel images are
+            predicted and checked against the free space of the ESP (see "esp:plan").
         '''))
-        ki_cli_subparser.add_argument('kernel_name', nargs='?', help='e.g. "linux-lts", "5.4.0-91-generic", etc.')
+        ki_cli_subparser.add_argument('kernel_names', nargs='*', metavar='kernel_name',
+                                      help='e.g. "linux-lts", "5.4.0-91-generic", etc.')
+        ki_cli_subparser.add_argument('--all', action='store_true', dest='all_kernels',
+                                      help='install all kernels found in boot path')
+        ki_cli_subparser.add_argument('--jobs', type=int, metavar='N',
+                                      help='number of kernels to install concurrently (default: automatic)')
+        ki_cli_subparser.add_argument('--force', action='store_true',
+                                      help='rebuild even if unified kernel image is up to date')
+        ki_cli_subparser.add_argument('--explain', action='store_true', help='print why a rebuild is required')
         kr_cli_subparser = self._add(cli_subparsers, 'kernel:remove', 'remove given or default kernel',
                                      textwrap.dedent('''
             Remove the given or default configured kernel.
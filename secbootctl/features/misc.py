@@ -0,0 +1,48 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import textwrap
+from typing import Optional
+
+from secbootctl.core import AppController, AppError, BaseSubcmdCreator
+from secbootctl.env import Env
+from secbootctl.helpers.cli import CliPrintHelper
+from secbootctl.helpers.signagent import SignAgentHelper
+
+
+class MiscController(AppController):
+    LOCK_MODES: dict = {'sign_agent': 'none'}
+
+    def sign_agent(self, idle_timeout: Optional[int] = None) -> None:
+        """Runs the sign agent until it is stopped (SIGTERM, SIGINT) or has been idle for given seconds."""
+        if idle_timeout is not None and idle_timeout < 1:
+            raise AppError(f'invalid idle timeout: {idle_timeout}')
+
+        sign_digest = self._sb_helper.get_digest_signer(self._config.use_security_token)
+        self._print_status(f'sign agent listening on: {Env.SIGN_AGENT_SOCKET_PATH}')
+        SignAgentHelper(Env.SIGN_AGENT_SOCKET_PATH).serve(sign_digest, idle_timeout)
+        self._print_status('sign agent stopped', CliPrintHelper.Status.SUCCESS)
+
+
+class MiscSubcmdCreator(BaseSubcmdCreator):
+    def create(self, cli_subparsers):
+        sa_cli_subparser = self._add(cli_subparsers, 'sign-agent', 'run agent holding the signing key',
+                                     textwrap.dedent(f'''
+            Load the Secure Boot key (Database Key) once - or open the session of the
+            security token and enter its PIN once - and sign on behalf of other
+            {Env.APP_NAME} calls, e.g. the package manager hooks.
+
+            The agent listens on "{Env.SIGN_AGENT_SOCKET_PATH}", only root can connect.
+            While it is running all files are signed through the agent, otherwise
+            they are signed directly as usual. Concurrent signing requests are
+            queued and signed in batches.
+
+            The agent runs in the foreground until it receives SIGTERM or SIGINT or
+            has been idle for the given time. Signing with key files requires the
+            Python module "cryptography".
+        '''))
+        sa_cli_subparser.add_argument('--idle-timeout', type=int, metavar='SECONDS',
+                                      help='stop after given seconds without signing request (default: never)')
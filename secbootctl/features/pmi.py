@@ -6,19 +6,26 @@ from __future__ import annotations
 
 import glob
 import os
+import re
 import shutil
 import sys
 import textwrap
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Optional
 
 from secbootctl.core import AppController, BaseSubcmdCreator, AppError
 from secbootctl.env import Env
+from secbootctl.helpers.buildqueue import BuildQueueHelper
 from secbootctl.helpers.cli import CliPrintHelper
 
 
 class PmiController(AppController):
+    # the hooks lock while building (forwarded actions), not while waiting or queueing
+    LOCK_MODES: dict = {'hook_callback': 'none'}
     PACMAN_HOOK_PATH: Path = Path('/etc/pacman.d/hooks')
+    PACMAN_KERNEL_TARGET_PATTERN: re.Pattern = re.compile(r'usr/lib/modules/[^/]+/vmlinuz')
+    APT_CONFIG_PATH: Path = Path('/etc/apt/apt.conf.d')
+    APT_BUILD_DELAY: float = 2.0
 
     def install(self):
         """Copies the hook files for the configured package manager into the corresponding hook directories."""
@@ -77,30 +84,84 @@ class PmiController(AppController):
             target_hook_file_path.unlink(missing_ok=True)
 
     def _pacman_update_callback(self):
-        boot_path: Path = self._config.boot_path
-        kernel_image_paths: list = glob.glob(str(boot_path / (self._config.kernel_image_name_prefix + '-*')))
+        """Rebuilds only the kernels and bootloader affected by the targets pacman passes on STDIN.
 
-        # Just for the sake of simplicity, as it is tolerable under Arch Linux and its kernel package handling,
-        # kernel:install will be invoked for all existing kernels. But actually it would be sufficient to just
-        # do it for the kernels listed in STDIN.
-        for kernel_image_path in kernel_image_paths:
-            kernel_name: str = kernel_image_path.replace(str(boot_path), '').split('-', 1)[1]
+        In deferred mode they are only queued and built by a worker in the background (see "queue:run").
 
-            self._forward('kernel', 'install', {'kernel_name': kernel_name})
+        see "_get_pacman_changes()"
+        """
+        changes: dict = self._get_pacman_changes(sys.stdin)
 
-        for stdin_line in sys.stdin:
-            if stdin_line.rstrip() == 'systemd':
-                self._forward('bootloader', 'update')
+        if self._config.package_manager_hook_mode == 'deferred':
+            if changes['all_kernels'] or changes['kernel_names'] or changes['bootloader']:
+                BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH).add(
+                    changes['kernel_names'], changes['all_kernels'], changes['bootloader']
+                )
+                self._forward('queue', 'run', {'background': True})
+
+            return
+
+        if changes['all_kernels']:
+            self._forward('kernel', 'install', {'all_kernels': True})
+        elif changes['kernel_names']:
+            self._forward('kernel', 'install', {'kernel_names': changes['kernel_names']})
+
+        if changes['bootloader']:
+            self._forward('bootloader', 'update')
 
     def _pacman_remove_callback(self):
-        # pacman outputs '/usr/lib/modules/<kernel_name>/vmlinuz' paths on STDIN for every removed kernel package.
-        # The 'real' kernel_name as we need it can be found in /usr/lib/modules/<kernel_name>/pkgbase.
+        # pacman outputs 'usr/lib/modules/<kernel_version>/vmlinuz' paths on STDIN for every removed kernel package
         for stdin_line in sys.stdin:
-            kernel_pkgbase_file_path: Path = Path(stdin_line.rstrip()).parent / 'pkgbase'
-            kernel_name: str = kernel_pkgbase_file_path.read_text().rstrip()
+            kernel_name: str = self._get_pacman_kernel_name(stdin_line.rstrip())
+
+            if self._config.package_manager_hook_mode == 'deferred':
+                BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH).discard(kernel_name)
 
             self._forward('kernel', 'remove', {'kernel_name': kernel_name})
 
+    def _get_pacman_changes(self, targets: Iterable[str]) -> dict:
+        """Returns what has to be rebuilt for given targets of the update hook (see "hooks/pacman").
+
+        - "usr/lib/modules/<kernel_version>/vmlinuz": the kernel of this package (all kernels if its "pkgbase" file
+          can't be read)
+        - "usr/lib/initcpio/*" (mkinitcpio) or a microcode package: all kernels
+        - "systemd": the bootloader
+        - anything else: all kernels, to be on the safe side
+
+        Returns a dict with the keys "kernel_names", "all_kernels" and "bootloader".
+        """
+        changes: dict = {'kernel_names': [], 'all_kernels': False, 'bootloader': False}
+
+        for target in targets:
+            target = target.strip().lstrip('/')
+
+            if not target:
+                continue
+
+            if self.PACMAN_KERNEL_TARGET_PATTERN.fullmatch(target):
+                try:
+                    kernel_name: str = self._get_pacman_kernel_name(target)
+                except OSError:
+                    changes['all_kernels'] = True
+
+                    continue
+
+                if kernel_name not in changes['kernel_names']:
+                    changes['kernel_names'].append(kernel_name)
+            elif target == 'systemd':
+                changes['bootloader'] = True
+            else:
+                # "usr/lib/initcpio/*", "intel-ucode", "amd-ucode" and unknown targets
+                changes['all_kernels'] = True
+
+        return changes
+
+    def _get_pacman_kernel_name(self, kernel_target: str) -> str:
+        # The 'real' kernel_name as we need it can be found in /usr/lib/modules/<kernel_version>/pkgbase.
+        kernel_pkgbase_file_path: Path = (Path('/') / kernel_target).parent / 'pkgbase'
+
+        return kernel_pkgbase_file_path.read_text().rstrip()
+
     def _apt_install(self):
         pm_name: str = self._config.package_manager_name
         hook_path: Path = Env.APP_HOOK_PATH / pm_name
@@ -108,27 +169,64 @@ class PmiController(AppController):
         self._copy_hook_file(hook_path / 'initramfs' / 'yy-secbootctl-update', Path('/etc/initramfs/post-update.d'))
         self._copy_hook_file(hook_path / 'kernel' / 'yy-secbootctl-update', Path('/etc/kernel/postinst.d'))
         self._copy_hook_file(hook_path / 'kernel' / 'yy-secbootctl-remove', Path('/etc/kernel/postrm.d'))
+        # apt reads its configuration as unprivileged user too (e.g. "apt list")
+        self._copy_hook_file(hook_path / 'apt.conf.d' / '99secbootctl', self.APT_CONFIG_PATH, 0o644)
 
     def _apt_remove(self):
         Path('/etc/initramfs/post-update.d/yy-secbootctl-update').unlink(missing_ok=True)
         Path('/etc/kernel/postinst.d/yy-secbootctl-update').unlink(missing_ok=True)
         Path('/etc/kernel/postrm.d/yy-secbootctl-remove').unlink(missing_ok=True)
+        Path(f'{self.APT_CONFIG_PATH}/99secbootctl').unlink(missing_ok=True)
 
     def _apt_update_callback(self, kernel_name: str):
+        """Queues given kernel instead of building it right away, so it is built only once per transaction.
+
+        Within an apt transaction the queued kernels are built by the "DPkg::Post-Invoke" hook after dpkg has
+        finished (see "_apt_flush_callback()"). Otherwise (e.g. "dpkg -i" or "update-initramfs -u -k all") the queue
+        is built right away in sync mode, the hook only returns once the kernel has been built. Waiting for further
+        kernels would only delay the build, the hooks of these calls run one after another. In deferred mode a worker
+        builds them in the background as soon as no kernel has been queued for "APT_BUILD_DELAY" seconds.
+
+        A worker is started whenever none is running, not only if the queue has been empty: jobs of a failed build
+        or of an aborted apt transaction stay queued and would never be built otherwise.
+        """
         # @todo what to do with systemd-boot updates?
-        self._forward('kernel', 'install', {'kernel_name': kernel_name})
+        build_queue_helper: BuildQueueHelper = BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH)
+        build_queue_helper.add([kernel_name])
+
+        # apt sets DPKG_FRONTEND_LOCKED for the dpkg calls of a transaction
+        if os.environ.get('DPKG_FRONTEND_LOCKED') and (self.APT_CONFIG_PATH / '99secbootctl').is_file():
+            self._print_status(f'queued kernel: {kernel_name} (built at end of apt transaction)',
+                               CliPrintHelper.Status.SUCCESS)
+
+            return
+
+        self._print_status(f'queued kernel: {kernel_name}', CliPrintHelper.Status.SUCCESS)
+
+        if self._config.package_manager_hook_mode != 'deferred':
+            self._forward('queue', 'run', {'background': False})
+        elif build_queue_helper.get_worker_pid() is None:
+            self._forward('queue', 'run', {'delay': self.APT_BUILD_DELAY, 'background': True})
 
     def _apt_remove_callback(self, kernel_name: str):
+        BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH).discard(kernel_name)
         self._forward('kernel', 'remove', {'kernel_name': kernel_name})
 
-    def _copy_hook_file(self, hook_file_path: Path, target_hook_path: Path):
+    def _apt_flush_callback(self, kernel_name: Optional[str] = None):
+        """Builds all queued kernels at once (invoked by apt at the end of a transaction).
+
+        In deferred mode they are built by a worker in the background.
+        """
+        self._forward('queue', 'run', {'background': self._config.package_manager_hook_mode == 'deferred'})
+
+    def _copy_hook_file(self, hook_file_path: Path, target_hook_path: Path, mode: int = 0o700):
         if not target_hook_path.is_dir():
             os.makedirs(target_hook_path, 0o755, True)
 
         shutil.copy(hook_file_path, target_hook_path)
         copied_hook_file_path: Path = target_hook_path / hook_file_path.name
         shutil.chown(copied_hook_file_path, 'root', 'root')
-        os.chmod(copied_hook_file_path, 0o700)
+        os.chmod(copied_hook_file_path, mode)
 
 
 class PmiSubcmdCreator(BaseSubcmdCreator):
@@ -147,5 +245,5 @@ class PmiSubcmdCreator(BaseSubcmdCreator):
                                       textwrap.dedent('''
             Callback for package manager hook. Gets invoked by the package manager hook itself.
         '''))
-        pmc_cli_subparser.add_argument('mode', help='e.g. "update", "remove", etc.')
+        pmc_cli_subparser.add_argument('mode', help='e.g. "update", "remove", "flush", etc.')
         pmc_cli_subparser.add_argument('kernel_name', nargs='?', help='e.g. "5.4.0-91-generic", etc.')
@@ -0,0 +1,155 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+import time
+from pathlib import Path
+from typing import Optional
+
+from secbootctl.core import AppController, AppError, BaseSubcmdCreator
+from secbootctl.env import Env
+from secbootctl.helpers.buildqueue import BuildQueueHelper
+from secbootctl.helpers.cli import CliPrintHelper
+
+
+class QueueController(AppController):
+    LOCK_MODES: dict = {'status': 'shared', 'wait': 'none', 'run': 'none'}
+    SYSTEMD_RUNTIME_PATH: Path = Path('/run/systemd/system')
+
+    def status(self) -> None:
+        """Prints the queued jobs, whether a worker is running and the error of the last failed build."""
+        build_queue_helper: BuildQueueHelper = BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH)
+        build_queue: dict = build_queue_helper.get()
+        worker_pid: Optional[int] = build_queue_helper.get_worker_pid()
+        kernels: str = 'all' if build_queue['all_kernels'] else ', '.join(build_queue['kernel_names']) or '-'
+
+        self._cli_print_helper.print_record('build_queue', {
+            'kernel_names': build_queue['kernel_names'], 'all_kernels': build_queue['all_kernels'],
+            'bootloader': build_queue['bootloader'], 'worker_pid': worker_pid, 'error': build_queue['error']
+        }, textwrap.dedent(f'''\
+            queued kernels:    {kernels}
+            queued bootloader: {'yes' if build_queue['bootloader'] else 'no'}
+            worker:            {'not running' if worker_pid is None else f'running (PID {worker_pid or "?"})'}
+            last error:        {build_queue['error'] or '-'}'''))
+
+    def wait(self, timeout: Optional[int] = None) -> None:
+        """Waits until the queue has been drained, jobs no worker is running for are built right away.
+
+        Meant as barrier before rebooting: if it returns without error, all queued unified kernel images and the
+        bootloader are installed.
+        """
+        if timeout is not None and timeout < 0:
+            raise AppError(f'invalid timeout: {timeout}')
+
+        build_queue_helper: BuildQueueHelper = BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH)
+
+        self._print_status('waiting for build queue')
+
+        if not build_queue_helper.wait_for_worker(timeout):
+            raise AppError(f'build queue worker still running after {timeout} seconds')
+
+        # jobs left by a failed build or queued within a running apt transaction
+        self.run()
+
+        self._print_status('build queue is empty', CliPrintHelper.Status.SUCCESS)
+
+    def run(self, delay: float = 0.0, background: bool = False) -> None:
+        """Builds all queued jobs as soon as no job has been queued for "delay" seconds.
+
+        Jobs queued while building are built afterwards. If the build fails for any reason (also if it is interrupted)
+        the jobs are put back into the queue.
+        With "background" a detached worker is started instead, via "systemd-run" if systemd is running (output in
+        the journal) otherwise as plain detached process (output in the log file).
+        """
+        if delay < 0:
+            raise AppError(f'invalid delay: {delay}')
+
+        if background:
+            self._start_worker(delay)
+
+            return
+
+        build_queue_helper: BuildQueueHelper = BuildQueueHelper(Env.BUILD_QUEUE_FILE_PATH)
+
+        with build_queue_helper.lock_worker():
+            while True:
+                jobs, wait_time = build_queue_helper.pop(delay)
+
+                if wait_time > 0:
+                    time.sleep(wait_time)
+                elif jobs is None:
+                    break
+                else:
+                    try:
+                        self._build(jobs)
+                    except BaseException as error:
+                        build_queue_helper.fail(jobs, self._get_error_message(error))
+                        raise
+
+    def _build(self, jobs: dict) -> None:
+        if jobs['all_kernels']:
+            self._forward('kernel', 'install', {'all_kernels': True})
+        elif jobs['kernel_names']:
+            self._forward('kernel', 'install', {'kernel_names': jobs['kernel_names']})
+
+        if jobs['bootloader']:
+            self._forward('bootloader', 'update')
+
+    def _start_worker(self, delay: float) -> None:
+        command_args: list = [sys.executable, os.path.abspath(sys.argv[0]), 'queue:run', '--delay', str(delay)]
+
+        if self.SYSTEMD_RUNTIME_PATH.is_dir() and shutil.which('systemd-run'):
+            process_result = subprocess.run([
+                'systemd-run', '--quiet', '--collect', '--no-block', f'--description={Env.APP_NAME} build queue',
+                *command_args
+            ], capture_output=True)
+
+            if process_result.returncode != 0:
+                raise AppError(f'starting build queue worker failed: {process_result.stderr.decode().strip()}')
+
+            self._print_status('started build queue worker (see journal)', CliPrintHelper.Status.SUCCESS)
+
+            return
+
+        os.makedirs(Env.BUILD_QUEUE_LOG_FILE_PATH.parent, 0o755, True)
+
+        with open(Env.BUILD_QUEUE_LOG_FILE_PATH, 'a') as log_file:
+            subprocess.Popen(command_args, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+
+        self._print_status(f'started build queue worker (see {Env.BUILD_QUEUE_LOG_FILE_PATH})',
+                           CliPrintHelper.Status.SUCCESS)
+
+
+class QueueSubcmdCreator(BaseSubcmdCreator):
+    def create(self, cli_subparsers):
+        self._add(cli_subparsers, 'queue:status', 'show build queue', textwrap.dedent('''
+            Show the jobs queued by the package manager hooks, whether a worker is
+            building them and the error of the last failed build.
+        '''))
+        qw_cli_subparser = self._add(cli_subparsers, 'queue:wait', 'wait until build queue is empty',
+                                     textwrap.dedent('''
+            Wait until the running worker has finished and build the jobs still
+            queued right away. Use it before rebooting: if it succeeds, all queued
+            unified kernel images and the bootloader are installed.
+        '''))
+        qw_cli_subparser.add_argument('--timeout', type=int, metavar='SECONDS',
+                                      help='fail if worker still running after given seconds (default: never)')
+        qr_cli_subparser = self._add(cli_subparsers, 'queue:run', 'build queued jobs', textwrap.dedent(f'''
+            Build the jobs queued by the package manager hooks, jobs queued while
+            building are built afterwards. If the build fails the jobs stay queued.
+
+            With --background a detached worker is started, via systemd-run if
+            systemd is running (output in the journal), otherwise as detached
+            process (output in "{Env.BUILD_QUEUE_LOG_FILE_PATH}").
+        '''))
+        qr_cli_subparser.add_argument('--delay', type=float, default=0.0, metavar='SECONDS',
+                                      help='wait until no job has been queued for given seconds')
+        qr_cli_subparser.add_argument('--background', action='store_true', help='build in detached worker')
@@ -0,0 +1,440 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import secbootctl.core
+from secbootctl.helpers.pe import PeHelper
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+    from cryptography.hazmat.primitives.serialization import load_der_public_key
+except ImportError:
+    load_der_public_key = None
+
+
+class AuthenticodeHelper:
+    """Verifies Authenticode signatures of PE images in-process, like "sbverify --cert=<cert_file>" does.
+
+    It also creates signatures like sbsign does (see "create_signature()"), with the private key operation left to
+    the caller.
+
+    A signature is valid if the Authenticode digest of the image matches the signed digest and the signer
+    certificate is the given certificate or has been issued by it (directly or via intermediate certificates
+    embedded in the signature). Like the UEFI firmware the validity periods of the certificates are not checked.
+
+    Public key operations are done with the "cryptography" module if it is installed. Otherwise only RSA (PKCS#1
+    v1.5) signatures are supported, which are verified in pure Python. If a signature uses an unsupported algorithm
+    the result is undetermined (None), so the caller can fall back to sbverify.
+
+    see https://download.microsoft.com/download/9/c/5/9c5b2167-8017-4bae-9fde-d599bac8184a/Authenticode_PE.docx
+    """
+    OID_SIGNED_DATA: str = '1.2.840.113549.1.7.2'
+    OID_SPC_INDIRECT_DATA: str = '1.3.6.1.4.1.311.2.1.4'
+    OID_SPC_PE_IMAGE_DATA: str = '1.3.6.1.4.1.311.2.1.15'
+    OID_CONTENT_TYPE: str = '1.2.840.113549.1.9.3'
+    OID_MESSAGE_DIGEST: str = '1.2.840.113549.1.9.4'
+    OID_RSA_ENCRYPTION: str = '1.2.840.113549.1.1.1'
+    OID_EC_PUBLIC_KEY: str = '1.2.840.10045.2.1'
+    HASH_ALGORITHMS: dict = {
+        '1.3.14.3.2.26': 'sha1', '2.16.840.1.101.3.4.2.1': 'sha256', '2.16.840.1.101.3.4.2.2': 'sha384',
+        '2.16.840.1.101.3.4.2.3': 'sha512'
+    }
+    # signature algorithms of certificates: hash and public key algorithm
+    SIGNATURE_ALGORITHMS: dict = {
+        '1.2.840.113549.1.1.5': ('sha1', OID_RSA_ENCRYPTION),
+        '1.2.840.113549.1.1.11': ('sha256', OID_RSA_ENCRYPTION),
+        '1.2.840.113549.1.1.12': ('sha384', OID_RSA_ENCRYPTION),
+        '1.2.840.113549.1.1.13': ('sha512', OID_RSA_ENCRYPTION),
+        '1.2.840.10045.4.3.2': ('sha256', OID_EC_PUBLIC_KEY),
+        '1.2.840.10045.4.3.3': ('sha384', OID_EC_PUBLIC_KEY),
+        '1.2.840.10045.4.3.4': ('sha512', OID_EC_PUBLIC_KEY)
+    }
+    # DER encoded DigestInfo prefixes used by PKCS#1 v1.5 signatures (see RFC 8017, section 9.2)
+    DIGEST_INFO_PREFIXES: dict = {
+        'sha1': bytes.fromhex('3021300906052b0e03021a05000414'),
+        'sha256': bytes.fromhex('3031300d060960864801650304020105000420'),
+        'sha384': bytes.fromhex('3041300d060960864801650304020205000430'),
+        'sha512': bytes.fromhex('3051300d060960864801650304020305000440')
+    }
+    # signature algorithms of signer infos by public key algorithm and hash
+    SIGNER_SIGNATURE_ALGORITHMS: dict = {
+        (OID_RSA_ENCRYPTION, 'sha256'): OID_RSA_ENCRYPTION,
+        (OID_EC_PUBLIC_KEY, 'sha256'): '1.2.840.10045.4.3.2'
+    }
+    MAX_CERTIFICATE_CHAIN_LENGTH: int = 8
+
+    def __init__(self):
+        self._pe_helper: PeHelper = PeHelper()
+        self._trusted_certificates: dict = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def verify_file(self, file_path: Path, cert_file_path: Path) -> Optional[bool]:
+        """Returns whether given PE image has a valid signature of the given (PEM or DER encoded) certificate.
+
+        Returns None if the signature can't be verified in-process (e.g. unsupported public key algorithm or BER
+        encoded data the DER parser can't read). False is only returned if there is no signature or a digest or
+        signature check failed.
+        """
+        try:
+            signatures: list = self._pe_helper.get_certificates(file_path)
+        except (secbootctl.core.AppError, OSError):
+            return False
+
+        try:
+            trusted_certificate: dict = self._load_trusted_certificate(cert_file_path)
+        except OSError:
+            return False
+        except (ValueError, IndexError):
+            return None
+
+        results: list = []
+
+        for signature in signatures:
+            try:
+                result: Optional[bool] = self._verify_signature(file_path, signature, trusted_certificate)
+            except (ValueError, IndexError):
+                result = None
+
+            if result:
+                return True
+
+            results.append(result)
+
+        return None if None in results else False
+
+    def create_signature(self, file_path: Path, cert_file_path: Path, sign_digest: Callable[[bytes], bytes]) -> bytes:
+        """Returns a PKCS#7 signature (DER encoded SignedData) of given PE image like sbsign creates it.
+
+        The Authenticode digest of the image and the digest of the authenticated attributes are computed here, only
+        the latter is passed to "sign_digest" (e.g. the raw signature operation of a security token). It has to
+        return the signature as expected in a SignerInfo: the raw signature for RSA (PKCS#1 v1.5), a DER encoded
+        Ecdsa-Sig-Value for ECDSA. The signer certificate is embedded into the signature.
+        """
+        hash_name: str = 'sha256'
+        certificate: dict = self._load_trusted_certificate(cert_file_path)
+        signature_algorithm: Optional[str] = self.SIGNER_SIGNATURE_ALGORITHMS.get(
+            (certificate['public_key_algorithm'], hash_name)
+        )
+
+        if signature_algorithm is None:
+            raise secbootctl.core.AppError(f'public key algorithm of "{cert_file_path}" is not supported for signing')
+
+        hash_algorithm: bytes = self._encode(0x30, self._encode_oid(self._get_hash_oid(hash_name)), b'\x05\x00')
+        # SpcIndirectDataContent: SpcPeImageData (empty file link) and DigestInfo with the Authenticode digest
+        spc_indirect_data: bytes = self._encode(
+            0x30,
+            self._encode(0x30, self._encode_oid(self.OID_SPC_PE_IMAGE_DATA), self._encode(
+                0x30, b'\x03\x01\x00', self._encode(0xa0, self._encode(0xa2, b'\x80\x00'))
+            )),
+            self._encode(0x30, hash_algorithm,
+                         self._encode(0x04, self._pe_helper.get_authenticode_digest(file_path, hash_name)))
+        )
+        attributes: bytes = self._encode(
+            0x30, self._encode_oid(self.OID_CONTENT_TYPE),
+            self._encode(0x31, self._encode_oid(self.OID_SPC_INDIRECT_DATA))
+        ) + self._encode(
+            0x30, self._encode_oid(self.OID_MESSAGE_DIGEST),
+            # the content digest covers the value of the SpcIndirectDataContent sequence only
+            self._encode(0x31, self._encode(0x04, hashlib.new(hash_name, self._decode(spc_indirect_data)[0][1])
+                                            .digest()))
+        )
+        signature: bytes = sign_digest(hashlib.new(hash_name, self._encode(0x31, attributes)).digest())
+        signer_info: bytes = self._encode(
+            0x30, b'\x02\x01\x01',
+            self._encode(0x30, certificate['issuer'], self._encode(0x02, certificate['serial_number'])),
+            hash_algorithm, self._encode(0xa0, attributes),
+            self._encode(0x30, self._encode_oid(signature_algorithm),
+                         b'\x05\x00' if signature_algorithm == self.OID_RSA_ENCRYPTION else b''),
+            self._encode(0x04, signature)
+        )
+
+        return self._encode(0x30, self._encode_oid(self.OID_SIGNED_DATA), self._encode(0xa0, self._encode(
+            0x30, b'\x02\x01\x01', self._encode(0x31, hash_algorithm),
+            self._encode(0x30, self._encode_oid(self.OID_SPC_INDIRECT_DATA), self._encode(0xa0, spc_indirect_data)),
+            self._encode(0xa0, certificate['der']),
+            self._encode(0x31, signer_info)
+        )))
+
+    def _load_trusted_certificate(self, cert_file_path: Path) -> dict:
+        """Returns the parsed certificate of given file, certificates are only read and parsed once per process."""
+        with self._lock:
+            if cert_file_path not in self._trusted_certificates:
+                cert_data: bytes = cert_file_path.read_bytes()
+                pem_match: Optional[re.Match] = re.search(
+                    rb'-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----', cert_data, re.DOTALL
+                )
+
+                if pem_match is not None:
+                    cert_data = base64.b64decode(pem_match.group(1))
+
+                self._trusted_certificates[cert_file_path] = self._parse_certificate(cert_data)
+
+            return self._trusted_certificates[cert_file_path]
+
+    def _verify_signature(self, file_path: Path, signature: bytes, trusted_certificate: dict) -> Optional[bool]:
+        """Verifies one PKCS#7 SignedData structure of the certificate table of given image."""
+        content_type, content = self._decode(self._decode(signature)[0][1])
+
+        if self._decode_oid(content_type[1]) != self.OID_SIGNED_DATA:
+            return False
+
+        signed_data_fields: list = self._decode(self._decode(content[1])[0][1])
+        content_info_fields: list = self._decode(signed_data_fields[2][1])
+
+        if self._decode_oid(content_info_fields[0][1]) != self.OID_SPC_INDIRECT_DATA:
+            return False
+
+        # SpcIndirectDataContent: data (SpcAttributeTypeAndOptionalValue) and messageDigest (DigestInfo)
+        spc_indirect_data: tuple = self._decode(content_info_fields[1][1])[0]
+        digest_algorithm, digest = self._decode(self._decode(spc_indirect_data[1])[1][1])
+        hash_name: Optional[str] = self.HASH_ALGORITHMS.get(self._decode_oid(self._decode(digest_algorithm[1])[0][1]))
+
+        if hash_name is None:
+            return None
+
+        if not hmac.compare_digest(digest[1], self._pe_helper.get_authenticode_digest(file_path, hash_name)):
+            return False
+
+        certificates: list = [
+            self._parse_certificate(certificate[2]) for field in signed_data_fields[3:] if field[0] == 0xa0
+            for certificate in self._decode(field[1])
+        ]
+        results: list = [
+            self._verify_signer_info(signer_info[1], spc_indirect_data[1], certificates, trusted_certificate)
+            for signer_info in self._decode(signed_data_fields[-1][1])
+        ]
+
+        if True in results:
+            return True
+
+        return None if None in results else False
+
+    def _verify_signer_info(self, signer_info: bytes, content: bytes, certificates: list,
+                            trusted_certificate: dict) -> Optional[bool]:
+        fields: list = self._decode(signer_info)
+        issuer, serial_number = self._decode(fields[1][1])[:2]
+        hash_name: Optional[str] = self.HASH_ALGORITHMS.get(self._decode_oid(self._decode(fields[2][1])[0][1]))
+
+        if hash_name is None:
+            return None
+
+        signed_data: bytes = hashlib.new(hash_name, content).digest()
+        signature: bytes = fields[-1][1] if fields[-1][0] == 0x04 else fields[-2][1]
+
+        # with authenticated attributes the signature covers them (as SET) and they contain the content digest
+        if fields[3][0] == 0xa0:
+            attributes: dict = {
+                self._decode_oid(attribute_type[1]): attribute_values[1]
+                for attribute_type, attribute_values in (self._decode(attribute[1]) for attribute in
+                                                         self._decode(fields[3][1]))
+            }
+            message_digest: Optional[bytes] = attributes.get(self.OID_MESSAGE_DIGEST)
+
+            if message_digest is None or not hmac.compare_digest(self._decode(message_digest)[0][1], signed_data):
+                return False
+
+            signed_data = hashlib.new(hash_name, b'\x31' + fields[3][2][1:]).digest()
+
+        signer_certificate: Optional[dict] = next((
+            certificate for certificate in certificates + [trusted_certificate]
+            if certificate['issuer'] == issuer[2] and certificate['serial_number'] == serial_number[1]
+        ), None)
+
+        if signer_certificate is None:
+            return False
+
+        result: Optional[bool] = self._verify_digest(signer_certificate, hash_name, signed_data, signature)
+
+        if not result:
+            return result
+
+        return self._is_trusted(signer_certificate, certificates, trusted_certificate,
+                                self.MAX_CERTIFICATE_CHAIN_LENGTH)
+
+    def _is_trusted(self, certificate: dict, certificates: list, trusted_certificate: dict,
+                    max_chain_length: int) -> Optional[bool]:
+        """Returns whether given certificate is the trusted certificate or has been issued by it."""
+        if certificate['der'] == trusted_certificate['der'] or (
+                certificate['subject'] == trusted_certificate['subject'] and
+                certificate['public_key'] == trusted_certificate['public_key']):
+            return True
+
+        if max_chain_length == 0:
+            return False
+
+        results: list = []
+
+        for issuer_certificate in [trusted_certificate] + certificates:
+            if issuer_certificate['subject'] != certificate['issuer'] or issuer_certificate is certificate:
+                continue
+
+            signature_algorithm: Optional[tuple] = self.SIGNATURE_ALGORITHMS.get(certificate['signature_algorithm'])
+
+            if signature_algorithm is None:
+                results.append(None)
+
+                continue
+
+            result: Optional[bool] = self._verify_digest(
+                issuer_certificate, signature_algorithm[0],
+                hashlib.new(signature_algorithm[0], certificate['tbs']).digest(), certificate['signature']
+            )
+
+            if result:
+                result = self._is_trusted(issuer_certificate, certificates, trusted_certificate, max_chain_length - 1)
+
+            if result:
+                return True
+
+            results.append(result)
+
+        return None if None in results else False
+
+    def _verify_digest(self, certificate: dict, hash_name: str, digest: bytes, signature: bytes) -> Optional[bool]:
+        """Verifies the signature of given digest with the public key of given certificate."""
+        if load_der_public_key is not None:
+            return self._verify_digest_with_cryptography(certificate, hash_name, digest, signature)
+
+        if certificate['public_key_algorithm'] != self.OID_RSA_ENCRYPTION:
+            return None
+
+        modulus, public_exponent = (int.from_bytes(field[1], 'big') for field in self._decode(
+            self._decode(certificate['public_key'][1:])[0][1]))
+        key_size: int = (modulus.bit_length() + 7) // 8
+
+        if len(signature) != key_size:
+            return False
+
+        digest_info: bytes = self.DIGEST_INFO_PREFIXES[hash_name] + digest
+        expected_message: bytes = b'\x00\x01' + b'\xff' * (key_size - len(digest_info) - 3) + b'\x00' + digest_info
+        message: bytes = pow(int.from_bytes(signature, 'big'), public_exponent, modulus).to_bytes(key_size, 'big')
+
+        return hmac.compare_digest(message, expected_message)
+
+    def _verify_digest_with_cryptography(self, certificate: dict, hash_name: str, digest: bytes,
+                                         signature: bytes) -> Optional[bool]:
+        public_key = load_der_public_key(certificate['public_key_info'])
+        hash_algorithm = Prehashed(getattr(hashes, hash_name.upper())())
+
+        try:
+            if isinstance(public_key, rsa.RSAPublicKey):
+                public_key.verify(signature, digest, padding.PKCS1v15(), hash_algorithm)
+            elif isinstance(public_key, ec.EllipticCurvePublicKey):
+                public_key.verify(signature, digest, ec.ECDSA(hash_algorithm))
+            else:
+                return None
+        except InvalidSignature:
+            return False
+
+        return True
+
+    def _parse_certificate(self, der: bytes) -> dict:
+        """Returns the fields of given DER encoded X.509 certificate that are needed for verification."""
+        tbs, signature_algorithm, signature = self._decode(self._decode(der)[0][1])
+        tbs_fields: list = self._decode(tbs[1])
+
+        # skip optional version ([0] EXPLICIT)
+        if tbs_fields[0][0] == 0xa0:
+            tbs_fields = tbs_fields[1:]
+
+        public_key_info: tuple = tbs_fields[5]
+        public_key_algorithm, public_key = self._decode(public_key_info[1])
+
+        return {
+            'der': der,
+            'tbs': tbs[2],
+            'serial_number': tbs_fields[0][1],
+            'issuer': tbs_fields[2][2],
+            'subject': tbs_fields[4][2],
+            'public_key_info': public_key_info[2],
+            'public_key_algorithm': self._decode_oid(self._decode(public_key_algorithm[1])[0][1]),
+            # BIT STRING with leading "unused bits" byte
+            'public_key': public_key[1],
+            'signature_algorithm': self._decode_oid(self._decode(signature_algorithm[1])[0][1]),
+            'signature': signature[1][1:]
+        }
+
+    def _decode(self, data: bytes) -> list:
+        """Returns the DER encoded elements in given data as list of (tag, value, encoding) tuples."""
+        elements: list = []
+        offset: int = 0
+
+        while offset < len(data):
+            tag: int = data[offset]
+            length: int = data[offset + 1]
+            value_offset: int = offset + 2
+
+            if length & 0x80:
+                length_size: int = length & 0x7f
+
+                if length_size == 0 or length_size > 4:
+                    raise ValueError('unsupported DER length')
+
+                length = int.from_bytes(data[value_offset:value_offset + length_size], 'big')
+                value_offset += length_size
+
+            if value_offset + length > len(data):
+                raise ValueError('truncated DER element')
+
+            elements.append((tag, data[value_offset:value_offset + length], data[offset:value_offset + length]))
+            offset = value_offset + length
+
+        return elements
+
+    def _encode(self, tag: int, *contents: bytes) -> bytes:
+        """Returns the DER encoding of an element with given tag and contents."""
+        content: bytes = b''.join(contents)
+
+        if len(content) < 0x80:
+            return bytes([tag, len(content)]) + content
+
+        length: bytes = len(content).to_bytes((len(content).bit_length() + 7) // 8, 'big')
+
+        return bytes([tag, 0x80 | len(length)]) + length + content
+
+    def _encode_oid(self, oid: str) -> bytes:
+        components: list = [int(component) for component in oid.split('.')]
+        encoded: bytearray = bytearray()
+
+        for component in [components[0] * 40 + components[1]] + components[2:]:
+            encoded_component: bytearray = bytearray([component & 0x7f])
+
+            while component > 0x7f:
+                component >>= 7
+                encoded_component.insert(0, 0x80 | (component & 0x7f))
+
+            encoded += encoded_component
+
+        return self._encode(0x06, bytes(encoded))
+
+    def _get_hash_oid(self, hash_name: str) -> str:
+        return next(oid for oid, name in self.HASH_ALGORITHMS.items() if name == hash_name)
+
+    def _decode_oid(self, data: bytes) -> str:
+        components: list = []
+        value: int = 0
+
+        for byte in data:
+            value = (value << 7) | (byte & 0x7f)
+
+            if not byte & 0x80:
+                components.append(value)
+                value = 0
+
+        first_component: int = min(components[0] // 40, 2)
+
+        return '.'.join(str(component) for component in
+                        [first_component, components[0] - 40 * first_component] + components[1:])
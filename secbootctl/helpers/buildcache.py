@@ -0,0 +1,158 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+class BuildCacheHelper:
+    """Keeps track of the inputs every signed unified kernel image has been built from (build manifest).
+
+    For every input file its path, digest and stat data (size, mtime, inode) is recorded. As long as the stat data
+    of a file is unchanged the recorded digest is reused, so unchanged inputs don't have to be hashed again.
+    """
+    DIGEST_BUFFER_SIZE: int = 1024 * 1024
+
+    def __init__(self, manifest_file_path: Path):
+        self._manifest_file_path: Path = manifest_file_path
+        self._manifest: Optional[dict] = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def get_input_records(self, image_path: Path, input_file_paths: dict) -> dict:
+        """Returns the current records (path, stat data and digest) of the given input files by input name.
+
+        The records have to be taken before the unified kernel image is built and later be passed to "update()", so
+        an input that changes during the build is detected as changed on the next run. The digest of a missing input
+        file is None.
+        """
+        with self._lock:
+            entry: dict = self._load().get(str(image_path), {'inputs': {}})
+
+        return {
+            input_name: self._get_file_record(Path(input_file_path), entry['inputs'].get(input_name))
+            for input_name, input_file_path in input_file_paths.items()
+        }
+
+    def get_changes(self, image_path: Path, input_records: dict, options: dict) -> list:
+        """Returns the changes why given unified kernel image has to be (re-)built.
+
+        Every change is a dict with the keys "subject" ("manifest", "input", "option" or "output"), "name" (name of
+        the input or option) and "message". An empty list is returned if a signed unified kernel image exists that
+        has been built from the given inputs (see "get_input_records()") and options.
+        """
+        with self._lock:
+            entry: Optional[dict] = self._load().get(str(image_path))
+
+        if entry is None:
+            return [self._get_change('manifest', None, f'no build manifest entry found for: {image_path}')]
+
+        changes: list = []
+
+        for input_name, input_record in input_records.items():
+            recorded_input_record: Optional[dict] = entry['inputs'].get(input_name)
+
+            if recorded_input_record is None or recorded_input_record['path'] != input_record['path'] or \
+                    recorded_input_record['digest'] != input_record['digest']:
+                changes.append(self._get_change('input', input_name,
+                                                f'input "{input_name}" changed: {input_record["path"]}'))
+
+        for input_name in entry['inputs'].keys() - input_records.keys():
+            changes.append(self._get_change('input', input_name,
+                                            f'input "{input_name}" removed: {entry["inputs"][input_name]["path"]}'))
+
+        for option_name in sorted(entry['options'].keys() | options.keys()):
+            if entry['options'].get(option_name) != options.get(option_name):
+                changes.append(self._get_change('option', option_name,
+                                                f'option "{option_name}" changed: {options.get(option_name)}'))
+
+        if self._get_file_digest(image_path, entry['output']) != entry['output']['digest']:
+            changes.append(self._get_change('output', None, f'unified kernel image changed or missing: {image_path}'))
+
+        return changes
+
+    def update(self, image_path: Path, input_records: dict, options: dict) -> None:
+        """Records the given input records and options as build inputs of the given (signed) unified kernel image.
+
+        The input records are stored as given (see "get_input_records()"), the input files are not read again.
+        """
+        entry: dict = {
+            'inputs': input_records,
+            'options': options,
+            'output': self._get_file_record(image_path)
+        }
+
+        with self._lock:
+            self._load()[str(image_path)] = entry
+            self._save()
+
+    def remove(self, image_path: Path) -> None:
+        """Removes the build manifest entry of the given unified kernel image."""
+        with self._lock:
+            if self._load().pop(str(image_path), None) is not None:
+                self._save()
+
+    def _get_change(self, subject: str, name: Optional[str], message: str) -> dict:
+        return {'subject': subject, 'name': name, 'message': message}
+
+    def _load(self) -> dict:
+        if self._manifest is None:
+            try:
+                self._manifest = json.loads(self._manifest_file_path.read_text())
+            except (OSError, ValueError):
+                self._manifest = {}
+
+        return self._manifest
+
+    def _save(self) -> None:
+        """Saves the build manifest atomically, so a crash never leaves a truncated manifest behind."""
+        os.makedirs(self._manifest_file_path.parent, 0o700, True)
+        temp_file_path: Path = self._manifest_file_path.with_name(self._manifest_file_path.name + '.tmp')
+        temp_file_path.write_text(json.dumps(self._manifest, indent=2, sort_keys=True))
+        os.replace(temp_file_path, self._manifest_file_path)
+
+    def _get_file_record(self, file_path: Path, previous_record: Optional[dict] = None) -> dict:
+        try:
+            stat_result: os.stat_result = file_path.stat()
+        except FileNotFoundError:
+            return {'path': str(file_path), 'size': None, 'mtime_ns': None, 'inode': None, 'digest': None}
+
+        return {
+            'path': str(file_path),
+            'size': stat_result.st_size,
+            'mtime_ns': stat_result.st_mtime_ns,
+            'inode': stat_result.st_ino,
+            'digest': self._get_file_digest(file_path, previous_record, stat_result)
+        }
+
+    def _get_file_digest(self, file_path: Path, record: Optional[dict],
+                         stat_result: Optional[os.stat_result] = None) -> Optional[str]:
+        """Returns sha256 digest of given file or None if file does not exist.
+
+        The recorded digest is returned without reading the file if its stat data is unchanged. Files reporting a
+        size of 0 (e.g. "/proc/cmdline") are always hashed.
+        """
+        try:
+            if stat_result is None:
+                stat_result = file_path.stat()
+
+            if record is not None and stat_result.st_size > 0 and record['path'] == str(file_path) and \
+                    (record['size'], record['mtime_ns'], record['inode']) == \
+                    (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino):
+                return record['digest']
+
+            digest = hashlib.sha256()
+
+            with open(file_path, 'rb') as file:
+                while buffer := file.read(self.DIGEST_BUFFER_SIZE):
+                    digest.update(buffer)
+        except FileNotFoundError:
+            return None
+
+        return digest.hexdigest()
@@ -0,0 +1,186 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+class BuildQueueHelper:
+    """Collects what the package manager hooks want to be (re-)built, so it is built once (and maybe later on).
+
+    apt runs the kernel and initramfs hooks for every kernel package and every "update-initramfs" call, often several
+    times for the same kernel within one transaction. Instead of building on every call the hooks add the kernel to
+    the queue (duplicates are merged) and the queued jobs are built together later on, either by the hook at the end
+    of the transaction or by a worker in the background ("queue:run").
+
+    The queue is stored as JSON file, every change is serialized by an exclusive "flock()" on it, so concurrent hook
+    calls never lose an entry. Reading only (e.g. "queue:status") takes a shared lock and never writes the file. An
+    empty queue is an empty file, so hooks can check for queued jobs cheaply ("test -s"). Workers hold a lock on a
+    separate lock file while draining the queue, so only one worker builds at a time and others can wait for it.
+    """
+    POLL_INTERVAL: float = 0.5
+
+    def __init__(self, queue_file_path: Path):
+        self._queue_file_path: Path = queue_file_path
+        self._lock_file_path: Path = queue_file_path.with_suffix('.lock')
+
+    def add(self, kernel_names: Optional[list] = None, all_kernels: bool = False, bootloader: bool = False) -> bool:
+        """Adds given jobs to the queue and returns whether the queue has been empty before."""
+        with self._open() as build_queue:
+            was_empty: bool = not self._has_jobs(build_queue)
+            self._add_jobs(build_queue, kernel_names or [], all_kernels, bootloader)
+
+        return was_empty
+
+    def discard(self, kernel_name: str) -> None:
+        """Removes given kernel from the queue (e.g. if it has been removed before it has been built)."""
+        with self._open() as build_queue:
+            if kernel_name in build_queue['kernel_names']:
+                build_queue['kernel_names'].remove(kernel_name)
+
+    def get(self) -> dict:
+        """Returns the queue.
+
+        The queue is a dict with the keys "kernel_names", "all_kernels", "bootloader", "updated" (time the last job
+        has been added) and "error" (error message of the last failed build, if any).
+        """
+        return self._read()
+
+    def pop(self, delay: float = 0.0) -> tuple:
+        """Returns and clears the queued jobs if no job has been added for "delay" seconds.
+
+        Returns a tuple of the jobs (dict with the keys "kernel_names", "all_kernels" and "bootloader", None if the
+        queue is empty or has been updated too recently) and the number of seconds to wait before the queue can be
+        popped (0 if the queue is empty or has been popped). The error of the last failed build is cleared.
+        """
+        with self._open() as build_queue:
+            wait_time: float = build_queue['updated'] + delay - time.time()
+
+            if not self._has_jobs(build_queue):
+                return None, 0.0
+
+            if wait_time > 0:
+                return None, wait_time
+
+            jobs: dict = {name: build_queue[name] for name in ['kernel_names', 'all_kernels', 'bootloader']}
+            build_queue.update(self._create_queue())
+
+        return jobs, 0.0
+
+    def fail(self, jobs: dict, error_message: str) -> None:
+        """Puts given (popped) jobs back into the queue and records the error their build failed with."""
+        with self._open() as build_queue:
+            self._add_jobs(build_queue, jobs['kernel_names'], jobs['all_kernels'], jobs['bootloader'])
+            build_queue['error'] = error_message
+
+    @contextlib.contextmanager
+    def lock_worker(self) -> Iterator[None]:
+        """Locks the queue for a worker, waits while another worker holds the lock."""
+        os.makedirs(self._lock_file_path.parent, 0o700, True)
+
+        with open(self._lock_file_path, 'a+') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            lock_file.truncate(0)
+            lock_file.write(f'{os.getpid()}\n')
+            lock_file.flush()
+
+            yield
+
+            lock_file.truncate(0)
+
+    def get_worker_pid(self) -> Optional[int]:
+        """Returns the PID of the running worker or None if no worker is running."""
+        try:
+            with open(self._lock_file_path, 'r') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # 0 if the worker hasn't written its PID yet
+                    return int(lock_file.read().strip() or 0)
+
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except (OSError, ValueError):
+            pass
+
+        return None
+
+    def wait_for_worker(self, timeout: Optional[float] = None) -> bool:
+        """Waits until no worker is running and returns whether it has stopped within "timeout" seconds."""
+        deadline: Optional[float] = None if timeout is None else time.monotonic() + timeout
+
+        while self.get_worker_pid() is not None:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+            time.sleep(self.POLL_INTERVAL)
+
+        return True
+
+    def _add_jobs(self, build_queue: dict, kernel_names: list, all_kernels: bool, bootloader: bool) -> None:
+        for kernel_name in kernel_names:
+            if kernel_name not in build_queue['kernel_names']:
+                build_queue['kernel_names'].append(kernel_name)
+
+        build_queue['all_kernels'] = build_queue['all_kernels'] or all_kernels
+        build_queue['bootloader'] = build_queue['bootloader'] or bootloader
+        build_queue['updated'] = time.time()
+
+    def _has_jobs(self, build_queue: dict) -> bool:
+        return bool(build_queue['kernel_names'] or build_queue['all_kernels'] or build_queue['bootloader'])
+
+    def _create_queue(self) -> dict:
+        return {'kernel_names': [], 'all_kernels': False, 'bootloader': False, 'updated': 0.0, 'error': None}
+
+    def _parse(self, content: str) -> dict:
+        """Returns the queue stored as given content, an empty queue if the content is empty or invalid."""
+        build_queue: dict = self._create_queue()
+
+        try:
+            stored_queue: dict = json.loads(content) if content else {}
+            build_queue.update({
+                'kernel_names': list(stored_queue.get('kernel_names', [])),
+                'all_kernels': bool(stored_queue.get('all_kernels', False)),
+                'bootloader': bool(stored_queue.get('bootloader', False)),
+                'updated': float(stored_queue.get('updated', 0.0)),
+                'error': stored_queue.get('error')
+            })
+        except (AttributeError, TypeError, ValueError):
+            pass
+
+        return build_queue
+
+    def _read(self) -> dict:
+        """Returns the queue read under a shared lock, the queue file is neither created nor written."""
+        try:
+            with open(self._queue_file_path, 'r') as queue_file:
+                fcntl.flock(queue_file, fcntl.LOCK_SH)
+
+                return self._parse(queue_file.read())
+        except FileNotFoundError:
+            return self._create_queue()
+
+    @contextlib.contextmanager
+    def _open(self) -> Iterator[dict]:
+        """Locks the queue file exclusively and yields its content, changes are saved when the context is left."""
+        os.makedirs(self._queue_file_path.parent, 0o700, True)
+
+        with open(self._queue_file_path, 'a+') as queue_file:
+            fcntl.flock(queue_file, fcntl.LOCK_EX)
+            queue_file.seek(0)
+            build_queue: dict = self._parse(queue_file.read())
+
+            yield build_queue
+
+            queue_file.seek(0)
+            queue_file.truncate()
+
+            if self._has_jobs(build_queue) or build_queue['error']:
+                queue_file.write(json.dumps(build_queue, sort_keys=True))
@@ -5,30 +5,152 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import json
+import re
+import threading
+import time
 from enum import Enum
+from typing import Iterator
 from typing import Optional
 
 from secbootctl.env import Env
 
 
 class CliPrintHelper:
+    """Prints the output of the commands, either as text or as JSON Lines (global option "--output").
+
+    With JSON Lines output every status, list entry (e.g. file, config) and error is printed as one JSON object with
+    the keys "type", "step", "target", "ts" (monotonic timestamp in seconds) and "duration" (seconds a completed step
+    took, otherwise null) plus its own data. Step and target of a status are taken from its message
+    ("<step>: <target> (<details>)"), a completed status is paired with the pending status of the same target and
+    reported with its step, e.g. "signed: /efi/test.efi" as step "signing".
+    """
     class Status(Enum):
         PENDING = 'pending'
         SUCCESS = 'success'
         ERROR = 'error'
 
+    STATUS_MESSAGE_PATTERN: re.Pattern = re.compile(r'(?P<step>[^:]+): (?P<target>.+?)(?: \((?P<details>[^()]*)\))?')
+    output_format: str = 'text'
+
+    def __init__(self):
+        self._thread_data: threading.local = threading.local()
+        self._print_lock: threading.Lock = threading.Lock()
+        self._pending_steps: dict = {}
+
+    @staticmethod
+    def set_output_format(output_format: str) -> None:
+        """Sets the output format of all instances ("text" or "jsonl")."""
+        CliPrintHelper.output_format = output_format
+
     def print_status(self, message: str, status: Optional[Status] = Status.PENDING) -> None:
+        if self.output_format == 'jsonl':
+            self._print_status_record(message, status)
+
+            return
+
         status_symbols: dict = {
             CliPrintHelper.Status.PENDING: ' ',
             CliPrintHelper.Status.SUCCESS: '\u2713 done:',
             CliPrintHelper.Status.ERROR: '\u2717 failed:'
         }
 
-        print(f'{status_symbols[status]} {message}')
+        self._print(f'{status_symbols[status]} {message}')
+
+    def print_record(self, record_type: str, record: dict, text: str) -> None:
+        """Prints given text or, with JSON Lines output, the record (see class description).
+
+        The record should contain at least "step" and "target", "duration" is only set for completed steps.
+        """
+        if self.output_format == 'jsonl':
+            self._print_json({'type': record_type, 'step': None, 'target': None, 'ts': time.monotonic(),
+                              'duration': None, **record})
+        else:
+            self._print(text)
+
+    def print_text(self, text: str) -> None:
+        """Prints given text (e.g. table headers), nothing is printed with JSON Lines output."""
+        if self.output_format != 'jsonl':
+            self._print(text)
+
+    @contextlib.contextmanager
+    def group(self, title: str) -> Iterator[None]:
+        """Collects all output of the current thread and prints it as one block when leaving the context.
+
+        Used to keep the output of concurrently running tasks (e.g. installing multiple kernels) readable. With JSON
+        Lines output the records are printed right away and carry the title as "group".
+        """
+        self._thread_data.group_title = title
+        self._thread_data.lines = [f'[{title}]'] if self.output_format != 'jsonl' else None
+
+        try:
+            yield
+        finally:
+            lines: Optional[list] = self._thread_data.lines
+            self._thread_data.lines = None
+            self._thread_data.group_title = None
+
+            if lines is not None:
+                with self._print_lock:
+                    print('\n'.join(lines))
+
+    def _print(self, line: str) -> None:
+        lines: Optional[list] = getattr(self._thread_data, 'lines', None)
+
+        if lines is None:
+            with self._print_lock:
+                print(line)
+        else:
+            lines.append(line)
+
+    def _print_status_record(self, message: str, status: Status) -> None:
+        timestamp: float = time.monotonic()
+        message_match: Optional[re.Match] = self.STATUS_MESSAGE_PATTERN.fullmatch(message)
+        step: str = message_match['step'] if message_match else message
+        target: Optional[str] = message_match['target'] if message_match else None
+        duration: Optional[float] = None
+
+        with self._print_lock:
+            if status == CliPrintHelper.Status.PENDING:
+                self._pending_steps[target] = (step, timestamp)
+            elif target in self._pending_steps:
+                step, start_timestamp = self._pending_steps.pop(target)
+                duration = timestamp - start_timestamp
+
+        self._print_json({
+            'type': 'status', 'step': step, 'target': target, 'ts': timestamp, 'duration': duration,
+            'status': status.value, 'message': message, 'details': message_match['details'] if message_match else None
+        })
+
+    def _print_json(self, record: dict) -> None:
+        group_title: Optional[str] = getattr(self._thread_data, 'group_title', None)
+
+        if group_title is not None:
+            record['group'] = group_title
+
+        self._print(json.dumps(record, default=str))
 
     def print_error(self, message: str, code: int = 1) -> None:
+        if self.output_format == 'jsonl':
+            self._print_json({'type': 'error', 'step': 'error', 'target': None, 'ts': time.monotonic(),
+                              'duration': None, 'message': message, 'code': code})
+
+            return
+
         print(f'\u2717 ERROR: {message} (Code: {code})\n\nUse "{Env.APP_NAME} --help" for more information.')
 
+    @staticmethod
+    def format_size(size: int) -> str:
+        """Returns given size in bytes as human readable string (e.g. "12.3 MiB")."""
+        for unit in ['B', 'KiB', 'MiB']:
+            if abs(size) < 1024:
+                return f'{size:.1f} {unit}' if unit != 'B' else f'{size} {unit}'
+
+            size /= 1024
+
+        return f'{size:.1f} GiB'
+
 
 class CliCmdUsageHelpFormatter(argparse.HelpFormatter):
     """Custom usage formatter that does some dirty stuff with the internal structure of argparse.
@@ -0,0 +1,226 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import hashlib
+import lzma
+import os
+import zlib
+from pathlib import Path
+from typing import BinaryIO
+from typing import Iterator
+from typing import Optional
+
+import secbootctl.core
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class InitramfsCompressionHelper:
+    """Recompresses initramfs images before they are added to the ".initrd" section of unified kernel images.
+
+    An initramfs image may start with uncompressed cpio archives (e.g. early microcode) followed by the compressed
+    main archive. The uncompressed archives are kept as they are, the main archive is decompressed and compressed
+    again with the configured algorithm while streaming, so the image is never loaded into memory at once. Fully
+    uncompressed images are compressed as a whole.
+
+    Compressed images are cached by the digest of their input, so unchanged initramfs images are not compressed
+    again on every package manager hook run.
+    """
+    CHUNK_SIZE: int = 1024 * 1024
+    CPIO_HEADER_SIZE: int = 110
+    CPIO_MAGIC_NUMBERS: tuple = (b'070701', b'070702')
+    CPIO_TRAILER_NAME: bytes = b'TRAILER!!!'
+    DEFAULT_LEVELS: dict = {'zstd': 19, 'xz': 6, 'gzip': 9}
+    LEVEL_RANGES: dict = {'zstd': range(1, 20), 'xz': range(0, 10), 'gzip': range(1, 10)}
+    MAGIC_NUMBERS: dict = {'zstd': b'\x28\xb5\x2f\xfd', 'xz': b'\xfd7zXZ\x00', 'gzip': b'\x1f\x8b'}
+
+    def __init__(self, cache_path: Path):
+        self._cache_path: Path = cache_path
+
+    def compress(self, file_path: Path, algorithm: str, level: Optional[int] = None, workers: int = 0) -> Path:
+        """Returns the path of the given initramfs image compressed with the given algorithm and level.
+
+        The cached image is returned if the input has been compressed before. The given image itself is returned if
+        its main archive already is compressed with the given algorithm or with an algorithm that is not supported
+        for decompression (e.g. lz4). "workers" is the number of compression threads (0: number of CPUs), only
+        zstd compresses multi-threaded.
+        """
+        level = self.DEFAULT_LEVELS[algorithm] if level is None else level
+        self._check_algorithm(algorithm, level)
+
+        cache_file_path: Path = self._get_cache_file_path(file_path, algorithm, level)
+        cache_dir_path: Path = cache_file_path.parent
+
+        if cache_file_path.is_file():
+            return cache_file_path
+
+        with open(file_path, 'rb') as file:
+            prefix_size: int = self._get_uncompressed_prefix_size(file)
+            file.seek(prefix_size)
+            main_algorithm: Optional[str] = self._detect_algorithm(file.read(8))
+
+            if prefix_size == os.fstat(file.fileno()).st_size:
+                prefix_size, main_algorithm = 0, 'none'
+            elif main_algorithm is None or main_algorithm == algorithm or \
+                    (main_algorithm == 'zstd' and zstandard is None):
+                return file_path
+
+            os.makedirs(cache_dir_path, 0o700, True)
+            temp_file_path: Path = cache_file_path.with_name(cache_file_path.name + '.tmp')
+
+            try:
+                with open(temp_file_path, 'wb') as temp_file:
+                    file.seek(0)
+                    temp_file.write(file.read(prefix_size))
+                    compressor = self._create_compressor(algorithm, level, workers)
+
+                    for chunk in self._decompress(file, main_algorithm, file_path):
+                        temp_file.write(compressor.compress(chunk))
+
+                    temp_file.write(compressor.flush())
+
+                os.replace(temp_file_path, cache_file_path)
+            finally:
+                temp_file_path.unlink(missing_ok=True)
+
+        self._remove_stale_cache_files(cache_dir_path, cache_file_path)
+
+        return cache_file_path
+
+    def get_cached(self, file_path: Path, algorithm: str, level: Optional[int] = None) -> Optional[Path]:
+        """Returns the path of the cached compressed image of the given initramfs image, None if there is none.
+
+        Unlike "compress()" nothing is compressed or written, e.g. for predicting the size of an image.
+        """
+        level = self.DEFAULT_LEVELS[algorithm] if level is None else level
+        cache_file_path: Path = self._get_cache_file_path(file_path, algorithm, level)
+
+        return cache_file_path if cache_file_path.is_file() else None
+
+    def _get_cache_file_path(self, file_path: Path, algorithm: str, level: int) -> Path:
+        return self._cache_path / file_path.name / f'{self._get_file_digest(file_path)}-{algorithm}-{level}.img'
+
+    def _check_algorithm(self, algorithm: str, level: int) -> None:
+        if algorithm == 'zstd' and zstandard is None:
+            raise secbootctl.core.AppError('initramfs compression "zstd" requires the Python module "zstandard"')
+        elif level not in self.LEVEL_RANGES[algorithm]:
+            raise secbootctl.core.AppError(f'invalid initramfs compression level for "{algorithm}": {level}')
+
+    def _get_file_digest(self, file_path: Path) -> str:
+        digest = hashlib.sha256()
+
+        with open(file_path, 'rb') as file:
+            while buffer := file.read(self.CHUNK_SIZE):
+                digest.update(buffer)
+
+        return digest.hexdigest()
+
+    def _get_uncompressed_prefix_size(self, file: BinaryIO) -> int:
+        """Returns the size of the uncompressed cpio archives (incl. zero padding) at the start of the given file."""
+        offset: int = 0
+
+        while True:
+            file.seek(offset)
+            header: bytes = file.read(self.CPIO_HEADER_SIZE)
+
+            if len(header) < self.CPIO_HEADER_SIZE or header[:6] not in self.CPIO_MAGIC_NUMBERS:
+                return offset
+
+            file_size: int = int(header[54:62], 16)
+            name_size: int = int(header[94:102], 16)
+            name: bytes = file.read(name_size).rstrip(b'\0')
+            offset = self._align(self._align(offset + self.CPIO_HEADER_SIZE + name_size) + file_size)
+
+            if name == self.CPIO_TRAILER_NAME:
+                offset += self._get_zero_padding_size(file, offset)
+
+    def _get_zero_padding_size(self, file: BinaryIO, offset: int) -> int:
+        padding_size: int = 0
+        file.seek(offset)
+
+        while buffer := file.read(self.CHUNK_SIZE):
+            stripped_buffer: bytes = buffer.lstrip(b'\0')
+            padding_size += len(buffer) - len(stripped_buffer)
+
+            if stripped_buffer:
+                break
+
+        return padding_size
+
+    def _detect_algorithm(self, data: bytes) -> Optional[str]:
+        for algorithm, magic_number in self.MAGIC_NUMBERS.items():
+            if data.startswith(magic_number):
+                return algorithm
+
+        return None
+
+    def _create_compressor(self, algorithm: str, level: int, workers: int):
+        if algorithm == 'zstd':
+            return zstandard.ZstdCompressor(level=level, threads=workers or -1).compressobj()
+        elif algorithm == 'xz':
+            # the kernel's xz decoder only supports CRC32 integrity checks
+            return lzma.LZMACompressor(lzma.FORMAT_XZ, lzma.CHECK_CRC32, level)
+
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _create_decompressor(self, algorithm: str):
+        if algorithm == 'zstd':
+            return zstandard.ZstdDecompressor().decompressobj()
+        elif algorithm == 'xz':
+            return lzma.LZMADecompressor(lzma.FORMAT_XZ)
+
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _decompress(self, file: BinaryIO, algorithm: str, file_path: Path) -> Iterator[bytes]:
+        """Yields the decompressed content of the given file from its current position on.
+
+        Concatenated streams (e.g. multiple gzip members) and zero padding between them are supported.
+        """
+        if algorithm == 'none':
+            yield from self._read(file)
+
+            return
+
+        decompressor = None
+
+        try:
+            while chunk := file.read(self.CHUNK_SIZE):
+                while chunk:
+                    if decompressor is None:
+                        chunk = chunk.lstrip(b'\0')
+
+                        if not chunk:
+                            break
+
+                        decompressor = self._create_decompressor(algorithm)
+
+                    yield decompressor.decompress(chunk)
+                    chunk = b''
+
+                    if decompressor.eof:
+                        chunk = decompressor.unused_data
+                        decompressor = None
+        except (lzma.LZMAError, zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as error:
+            raise secbootctl.core.AppError(f'decompressing initramfs image "{file_path}" failed: {error}')
+
+        if decompressor is not None:
+            raise secbootctl.core.AppError(f'decompressing initramfs image "{file_path}" failed: truncated data')
+
+    def _read(self, file: BinaryIO) -> Iterator[bytes]:
+        while chunk := file.read(self.CHUNK_SIZE):
+            yield chunk
+
+    def _remove_stale_cache_files(self, cache_dir_path: Path, cache_file_path: Path) -> None:
+        """Removes the cached images of previous versions of the same initramfs image."""
+        for stale_file_path in cache_dir_path.iterdir():
+            if stale_file_path != cache_file_path:
+                stale_file_path.unlink(missing_ok=True)
+
+    def _align(self, value: int) -> int:
+        return (value + 3) & ~3
@@ -0,0 +1,60 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+class FileWalkerHelper:
+    """Walks a directory tree (e.g. ESP or boot directory) in a single pass with "os.scandir()".
+
+    The type information of the directory entries is used, so no file is stat'ed. Files are yielded lazily in the
+    same order as sorting all paths would give (entries of each directory are sorted, directories as if their name
+    had a trailing slash). As with "glob" hidden files and directories are skipped unless requested and symlinks to
+    directories are not followed (no loops on bind mounts or odd symlinks).
+    """
+    def __init__(self, root_path: Path):
+        self._root_path: Path = root_path
+
+    def walk(self, extensions: Optional[list] = None, subpaths: Optional[list] = None,
+             excluded_subpaths: Optional[list] = None, include_hidden: bool = False) -> Iterator[Path]:
+        """Yields the paths of all files below the root directory.
+
+        "extensions" (e.g. [".efi"]) are matched case-insensitively, since FAT file systems don't preserve case
+        reliably. "subpaths" limits the walk to the given directories, "excluded_subpaths" skips the given
+        directories (both relative to the root directory, e.g. "EFI/Linux").
+        """
+        suffixes: Optional[tuple] = tuple(extension.lower() for extension in extensions) if extensions else None
+        excluded_paths: set = {os.path.normpath(self._root_path / subpath) for subpath in excluded_subpaths or []}
+        start_paths: list = sorted({
+            os.path.normpath(self._root_path / subpath) for subpath in subpaths
+        }, key=lambda path: path + '/') if subpaths else [os.path.normpath(self._root_path)]
+
+        for start_path in start_paths:
+            if start_path not in excluded_paths:
+                yield from self._walk(start_path, suffixes, excluded_paths, include_hidden)
+
+    def _walk(self, directory_path: str, suffixes: Optional[tuple], excluded_paths: set,
+              include_hidden: bool) -> Iterator[Path]:
+        try:
+            with os.scandir(directory_path) as directory_iterator:
+                entries: list = [
+                    (entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name, entry)
+                    for entry in directory_iterator if include_hidden or not entry.name.startswith('.')
+                ]
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            return
+
+        entries.sort(key=lambda sort_entry: sort_entry[0])
+
+        for sort_name, entry in entries:
+            if sort_name[-1] == '/':
+                if entry.path not in excluded_paths:
+                    yield from self._walk(entry.path, suffixes, excluded_paths, include_hidden)
+            elif (suffixes is None or entry.name.lower().endswith(suffixes)) and \
+                    (not entry.is_symlink() or entry.is_file()):
+                yield Path(entry.path)
@@ -7,17 +7,31 @@ from __future__ import annotations
 import glob
 import os
 import re
-import shutil
 import subprocess
+import time
 from pathlib import Path
+from typing import Optional
 
 import secbootctl.core
 from secbootctl.env import Env
+from secbootctl.helpers.compression import InitramfsCompressionHelper
+from secbootctl.helpers.pe import PeHelper
 
 
 class KernelOsHelper:
+    CONCAT_CHUNK_SIZE: int = 16 * 1024 * 1024
+    # space reserved for the signature (certificate table) appended when signing a unified kernel image
+    SIGNATURE_SIZE_RESERVE: int = 16 * 1024
+    # relative virtual addresses used by the "fixed" layout
+    # see https://wiki.archlinux.org/title/systemd-boot#Preparing_a_unified_kernel_image
+    FIXED_SECTION_VIRTUAL_ADDRESSES: dict = {
+        '.osrel': 0x20000, '.cmdline': 0x30000, '.linux': 0x2000000, '.initrd': 0x3000000
+    }
+
     def __init__(self, config: secbootctl.core.Config):
         self._config: secbootctl.core.Config = config
+        self._pe_helper: PeHelper = PeHelper()
+        self._compression_helper: InitramfsCompressionHelper = InitramfsCompressionHelper(Env.INITRAMFS_CACHE_PATH)
 
     def check_requirements(self) -> None:
         """Checks that script is called with root permissions and that OS is booted via UEFI."""
@@ -26,55 +40,230 @@ class KernelOsHelper:
         elif not Path(Env.EFI_BOOT_MODE_CHECK_PATH).is_dir():
             raise secbootctl.core.AppError('UEFI boot mode required')
 
-    def build_unified_kernel_image(self, kernel_name: str, unified_kernel_image_path: Path) -> None:
+    def build_unified_kernel_image(self, kernel_name: str, unified_kernel_image_path: Path) -> dict:
         """Builds unified kernel image for given kernel name and copies it to "<efi_path>/EFI/Linux".
 
         Unified kernel image contains kernel cmdline, os-release, kernel, initramfs and if configured
-        (see configuration file) microcode image.
+        (see configuration file) microcode image. Microcode and initramfs image are concatenated on the fly,
+        no temporary file is written to the boot partition. If configured the initramfs image is recompressed
+        first (see "InitramfsCompressionHelper").
+
+        The sections are either packed behind the sections of the EFI stub ("computed" layout) or placed at the
+        fixed addresses of the Arch Wiki ("fixed" layout), see configuration file.
+
+        Returns build statistics ("duration" in seconds, "bytes_written", "layout" and "image_size", the virtual
+        size of the image).
 
         see https://wiki.archlinux.org/title/systemd-boot#Preparing_a_unified_kernel_image
         """
+        start_time: float = time.monotonic()
+        layout_name: str = self._config.unified_kernel_image_layout
+        layout: dict = self._pe_helper.layout_sections(
+            Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH, self._get_sections(kernel_name)
+        )
+        bytes_written: Optional[int] = self._build_unified_kernel_image_natively(
+            layout['sections'], unified_kernel_image_path
+        )
+
+        if bytes_written is None:
+            bytes_written = self._build_unified_kernel_image_with_objcopy(
+                layout['sections'], layout['image_base'], unified_kernel_image_path
+            )
+
+        return {
+            'duration': time.monotonic() - start_time,
+            'bytes_written': bytes_written,
+            'layout': layout_name,
+            'image_size': layout['size_of_image']
+        }
+
+    def predict_unified_kernel_image_size(self, kernel_name: str) -> int:
+        """Returns the predicted file size of the signed unified kernel image for given kernel name.
+
+        The size is computed from the headers of the EFI stub and the sizes of the inputs without building the image
+        and includes a reserve for the signature. Nothing is written: if the initramfs image is recompressed the
+        cached compressed image is used and, if there is none, the size of the uncompressed image as upper bound.
+        """
+        return self._pe_helper.get_image_file_size(
+            Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH, self._get_sections(kernel_name, True)
+        ) + self.SIGNATURE_SIZE_RESERVE
+
+    def get_esp_usage(self) -> dict:
+        """Returns total and free space (for unprivileged users, in bytes) and block size of the ESP."""
+        statvfs_result: os.statvfs_result = os.statvfs(self._config.esp_path)
+
+        return {
+            'total': statvfs_result.f_blocks * statvfs_result.f_frsize,
+            'free': statvfs_result.f_bavail * statvfs_result.f_frsize,
+            'block_size': statvfs_result.f_frsize
+        }
+
+    def patch_unified_kernel_image_initrd(self, kernel_name: str, unified_kernel_image_path: Path,
+                                          output_file_path: Path) -> Optional[dict]:
+        """Writes a copy of the existing unified kernel image with only its ".initrd" section replaced.
+
+        Kernel, os-release and cmdline payloads of the existing image are reused as they are, only the current
+        microcode and initramfs image are written. Returns build statistics like "build_unified_kernel_image()" or
+        None if the existing image can't be patched (e.g. ".initrd" is not its last section), so it has to be
+        built from scratch.
+        """
+        start_time: float = time.monotonic()
+        initrd_file_paths: list = self._get_initrd_file_paths(self.get_unified_kernel_image_input_paths(kernel_name))
+
+        try:
+            bytes_written: int = self._pe_helper.replace_last_section(
+                unified_kernel_image_path, '.initrd', initrd_file_paths, output_file_path
+            )
+        except (secbootctl.core.AppError, OSError):
+            return None
+
+        return {'duration': time.monotonic() - start_time, 'bytes_written': bytes_written}
+
+    def get_unified_kernel_image_input_paths(self, kernel_name: str) -> dict:
+        """Returns the paths of all files the unified kernel image for given kernel name is built from."""
         boot_path: Path = self._config.boot_path
-        kernel_image_path: Path = boot_path / (self._config.kernel_image_name_prefix + '-' + kernel_name)
-        initramfs_image_path: Path = boot_path / self._config.initramfs_image_name_template.replace(
-            '__kernel-name__', kernel_name)
-        microcode_image_path: Path = boot_path / self._config.microcode_image_name
-        microcode_initramfs_unified_image_path: Path = boot_path / 'tmp-microcode-initramfs-unified.img'
-        objcopy_initrd_image_path: Path = initramfs_image_path
         kernel_cmdline_file_path: Path = Env.KERNEL_CMDLINE_ETC_FILE_PATH
 
         if not kernel_cmdline_file_path.is_file():
             kernel_cmdline_file_path = Env.KERNEL_CMDLINE_PROC_FILE_PATH
 
+        input_file_paths: dict = {
+            'kernel': boot_path / (self._config.kernel_image_name_prefix + '-' + kernel_name),
+            'initramfs': boot_path / self._config.initramfs_image_name_template.replace(
+                '__kernel-name__', kernel_name),
+            'cmdline': kernel_cmdline_file_path,
+            'os-release': Env.OS_RELEASE_FILE_PATH,
+            'stub': Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH
+        }
+
         if self._config.include_microcode:
-            with open(microcode_initramfs_unified_image_path, 'wb') as combined_image:
-                with open(microcode_image_path, 'rb') as microcode_image:
-                    shutil.copyfileobj(microcode_image, combined_image)
-
-                with open(initramfs_image_path, 'rb') as initramfs_image:
-                    shutil.copyfileobj(initramfs_image, combined_image)
-
-            objcopy_initrd_image_path = microcode_initramfs_unified_image_path
-
-        process_result = subprocess.run([
-            'objcopy',
-            f'--add-section=.osrel={Env.OS_RELEASE_FILE_PATH}',
-            '--change-section-vma=.osrel=0x20000',
-            f'--add-section=.cmdline={kernel_cmdline_file_path}',
-            '--change-section-vma=.cmdline=0x30000',
-            f'--add-section=.linux={kernel_image_path}',
-            '--change-section-vma=.linux=0x2000000',
-            f'--add-section=.initrd={objcopy_initrd_image_path}',
-            '--change-section-vma=.initrd=0x3000000',
-            Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
-            unified_kernel_image_path
-        ], capture_output=True)
-
-        microcode_initramfs_unified_image_path.unlink(missing_ok=True)
+            input_file_paths['microcode'] = boot_path / self._config.microcode_image_name
+
+        return input_file_paths
+
+    def get_unified_kernel_image_options(self) -> dict:
+        """Returns the configuration options that affect how unified kernel images are built."""
+        return {
+            'unified_kernel_image_builder': self._config.unified_kernel_image_builder,
+            'unified_kernel_image_layout': self._config.unified_kernel_image_layout,
+            'initramfs_compression': self._config.initramfs_compression,
+            'initramfs_compression_level': self._config.initramfs_compression_level
+        }
+
+    def _get_sections(self, kernel_name: str, predict: bool = False) -> list:
+        """Returns the sections that are added to the EFI stub, with virtual addresses if layout is "fixed".
+
+        If "predict" is given the initramfs image is not recompressed (see "_get_initrd_file_paths()").
+        """
+        input_file_paths: dict = self.get_unified_kernel_image_input_paths(kernel_name)
+        sections: list = [
+            {'name': '.osrel', 'file_paths': [input_file_paths['os-release']]},
+            {'name': '.cmdline', 'file_paths': [input_file_paths['cmdline']]},
+            {'name': '.linux', 'file_paths': [input_file_paths['kernel']]},
+            {'name': '.initrd', 'file_paths': self._get_initrd_file_paths(input_file_paths, predict)}
+        ]
+
+        if self._config.unified_kernel_image_layout == 'fixed':
+            for section in sections:
+                section['virtual_address'] = self.FIXED_SECTION_VIRTUAL_ADDRESSES[section['name']]
+
+        return sections
+
+    def _get_initrd_file_paths(self, input_file_paths: dict, predict: bool = False) -> list:
+        """Returns the files the ".initrd" section consists of (microcode image has to be first).
+
+        The microcode image is never recompressed, the kernel expects it as uncompressed cpio archive. If "predict"
+        is given the initramfs image is not recompressed, the cached compressed image or the given image is returned.
+        """
+        initramfs_file_path: Path = input_file_paths['initramfs']
+
+        if self._config.initramfs_compression != 'none' and predict:
+            initramfs_file_path = self._compression_helper.get_cached(
+                initramfs_file_path, self._config.initramfs_compression, self._config.initramfs_compression_level
+            ) or initramfs_file_path
+        elif self._config.initramfs_compression != 'none':
+            initramfs_file_path = self._compression_helper.compress(
+                initramfs_file_path, self._config.initramfs_compression, self._config.initramfs_compression_level,
+                self._config.initramfs_compression_workers
+            )
+
+        if 'microcode' in input_file_paths:
+            return [input_file_paths['microcode'], initramfs_file_path]
+
+        return [initramfs_file_path]
+
+    def _build_unified_kernel_image_natively(self, sections: list, unified_kernel_image_path: Path) -> Optional[int]:
+        """Builds unified kernel image with the native PE writer if configured as builder.
+
+        Returns the number of bytes written or None if the image has not been built, so objcopy has to be used as
+        fallback. That's the case if objcopy is configured as builder or the stub could not be handled by the native
+        PE writer. Any other error (e.g. an input that can't be read or no space left) fails the build.
+        """
+        if self._config.unified_kernel_image_builder != 'native':
+            return None
+
+        try:
+            return self._pe_helper.add_sections(
+                Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH, sections, unified_kernel_image_path
+            )
+        except secbootctl.core.UnsupportedPeImageError:
+            return None
+        except OSError as error:
+            raise secbootctl.core.AppError(
+                f'building unified kernel image "{unified_kernel_image_path}" failed: '
+                f'{error.strerror or error}: {error.filename or unified_kernel_image_path}'
+            )
+
+    def _build_unified_kernel_image_with_objcopy(self, sections: list, image_base: int,
+                                                 unified_kernel_image_path: Path) -> int:
+        """Builds unified kernel image with objcopy and returns the number of bytes written.
+
+        Sections consisting of multiple files are concatenated into an anonymous in-memory file (memfd) that is
+        passed to objcopy as "/proc/self/fd/<fd>", so nothing but the unified kernel image is written to disk.
+        """
+        objcopy_cmd_args: list = ['objcopy']
+        pass_fds: list = []
+
+        try:
+            for section in sections:
+                section_file_path = section['file_paths'][0]
+
+                if len(section['file_paths']) > 1:
+                    pass_fds.append(self._concat_files_in_memory(section['name'], section['file_paths']))
+                    section_file_path = f'/proc/self/fd/{pass_fds[-1]}'
+
+                objcopy_cmd_args.extend([
+                    f'--add-section={section["name"]}={section_file_path}',
+                    f'--change-section-vma={section["name"]}={image_base + section["virtual_address"]:#x}'
+                ])
+
+            objcopy_cmd_args.extend([Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH, unified_kernel_image_path])
+            process_result = subprocess.run(objcopy_cmd_args, capture_output=True, pass_fds=pass_fds)
+        finally:
+            for fd in pass_fds:
+                os.close(fd)
 
         if process_result.returncode != 0:
             raise secbootctl.core.AppError(f'building unified kernel image "{unified_kernel_image_path}" failed')
 
+        return os.stat(unified_kernel_image_path).st_size
+
+    def _concat_files_in_memory(self, name: str, file_paths: list) -> int:
+        """Concatenates given files into an anonymous in-memory file and returns its file descriptor."""
+        memory_fd: int = os.memfd_create(f'{Env.APP_NAME}{name}')
+
+        try:
+            for file_path in file_paths:
+                with open(file_path, 'rb') as file:
+                    while os.sendfile(memory_fd, file.fileno(), None, self.CONCAT_CHUNK_SIZE) > 0:
+                        pass
+        except BaseException:
+            os.close(memory_fd)
+
+            raise
+
+        return memory_fd
+
     def get_default_kernel_name(self) -> str:
         """Returns default configured kernel name.
 
@@ -92,6 +281,15 @@ class KernelOsHelper:
 
         return default_kernel_name
 
+    def get_kernel_names(self) -> list:
+        """Returns the names of all kernels found in boot path ("<boot_path>/vmlinuz-<kernel_name>") sorted by name."""
+        boot_path: Path = self._config.boot_path
+        kernel_image_paths: list = glob.glob(str(boot_path / (self._config.kernel_image_name_prefix + '-*')))
+
+        return sorted(
+            kernel_image_path.replace(str(boot_path), '').split('-', 1)[1] for kernel_image_path in kernel_image_paths
+        )
+
     def get_unified_kernel_image_path(self, kernel_name: str) -> Path:
         """Returns unified kernel image path for given kernel name.
 
@@ -0,0 +1,151 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import secbootctl.core
+
+
+class LockHelper:
+    """Global lock that serializes concurrent secbootctl calls ("flock()" on a lock file).
+
+    Calls that change anything (e.g. "kernel:install" or a package manager hook) lock exclusively, read-only calls
+    (e.g. "file:list") shared, so they may run concurrently with each other but never with a writer. Waiting calls
+    are queued by the kernel, with a timeout they poll for the lock until the timeout has expired.
+
+    The lock is held per process: nested locks (e.g. of forwarded actions) are no-ops and keep the mode of the
+    outer lock. Every holder records its PID, lock mode and command in a file of the holder directory next to the
+    lock file, so waiting calls can tell whom they are waiting for. The kernel releases the lock of a terminated
+    process, its stale holder file is removed by the next call looking at the holders.
+    """
+    POLL_INTERVAL: float = 0.1
+    _held_locks: dict = {}
+    _held_locks_lock: threading.RLock = threading.RLock()
+
+    def __init__(self, lock_file_path: Path):
+        self._lock_file_path: Path = lock_file_path
+        self._holders_path: Path = lock_file_path.with_name(lock_file_path.name + '.d')
+
+    @contextlib.contextmanager
+    def lock(self, exclusive: bool = True, timeout: Optional[float] = None,
+             on_wait: Optional[Callable[[list], None]] = None) -> Iterator[None]:
+        """Holds the lock while the context is active, waits up to "timeout" seconds (None: forever) for it.
+
+        "on_wait" is called with the current holders (see "get_holders()") if the lock is held by another process.
+        """
+        with self._held_locks_lock:
+            lock_key: str = str(self._lock_file_path)
+
+            if lock_key in self._held_locks:
+                self._held_locks[lock_key] += 1
+            else:
+                lock_file = self._acquire(exclusive, timeout, on_wait)
+                self._held_locks[lock_key] = 1
+
+        try:
+            yield
+        finally:
+            with self._held_locks_lock:
+                self._held_locks[lock_key] -= 1
+
+                if not self._held_locks[lock_key]:
+                    del self._held_locks[lock_key]
+                    self._release(lock_file)
+
+    def get_holders(self) -> list:
+        """Returns the holders of the lock as dicts with the keys "pid", "mode" and "command", sorted by PID.
+
+        Holder files of terminated processes are removed.
+        """
+        holders: list = []
+
+        try:
+            holder_file_paths: list = list(self._holders_path.iterdir())
+        except FileNotFoundError:
+            return holders
+
+        for holder_file_path in holder_file_paths:
+            try:
+                pid: int = int(holder_file_path.name)
+                mode, _, command = holder_file_path.read_text().rstrip('\n').partition(' ')
+            except (OSError, ValueError):
+                continue
+
+            if not self._is_running(pid):
+                holder_file_path.unlink(missing_ok=True)
+
+                continue
+
+            holders.append({'pid': pid, 'mode': mode, 'command': command})
+
+        return sorted(holders, key=lambda holder: holder['pid'])
+
+    def _acquire(self, exclusive: bool, timeout: Optional[float], on_wait: Optional[Callable[[list], None]]):
+        os.makedirs(self._holders_path, 0o700, True)
+        lock_file = open(self._lock_file_path, 'a')
+        operation: int = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+        try:
+            try:
+                fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if on_wait is not None:
+                    on_wait(self.get_holders())
+
+                self._wait(lock_file, operation, timeout)
+
+            (self._holders_path / str(os.getpid())).write_text(
+                f'{"exclusive" if exclusive else "shared"} {" ".join(sys.argv[1:])}\n'
+            )
+        except BaseException:
+            lock_file.close()
+            raise
+
+        return lock_file
+
+    def _wait(self, lock_file, operation: int, timeout: Optional[float]) -> None:
+        if timeout is None:
+            fcntl.flock(lock_file, operation)
+
+            return
+
+        deadline: float = time.monotonic() + timeout
+
+        while True:
+            try:
+                fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    holders: str = ', '.join(f'PID {holder["pid"]}' for holder in self.get_holders()) or 'unknown'
+
+                    raise secbootctl.core.AppError(
+                        f'lock "{self._lock_file_path}" still held after {timeout} seconds by: {holders}'
+                    )
+
+                time.sleep(self.POLL_INTERVAL)
+
+    def _release(self, lock_file) -> None:
+        (self._holders_path / str(os.getpid())).unlink(missing_ok=True)
+        lock_file.close()
+
+    def _is_running(self, pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
@@ -0,0 +1,110 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import mmap
+import os
+from pathlib import Path
+from typing import Optional
+
+import secbootctl.core
+from secbootctl.helpers.filewalker import FileWalkerHelper
+
+
+class FileManifestHelper:
+    """Creates, stores and compares digest manifests of directory trees (e.g. the ESP integrity baseline).
+
+    A manifest maps the paths of all files (relative to the root directory, hidden files included) to their sha256
+    digest. Files are hashed concurrently via mmap, hashlib releases the GIL while hashing.
+
+    Manifests are stored in the format of "sha256sum" sorted by path, so they are compact, can be compared across
+    hosts (paths are relative) and checked with "sha256sum -c" from within the root directory.
+    """
+    def create(self, root_path: Path, jobs: Optional[int] = None) -> dict:
+        """Returns the manifest of all files below given directory, hashed by up to "jobs" threads."""
+        relative_paths: list = [
+            file_path.relative_to(root_path).as_posix()
+            for file_path in FileWalkerHelper(root_path).walk(include_hidden=True)
+        ]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+            digests: list = list(executor.map(
+                lambda relative_path: self.get_file_digest(root_path / relative_path), relative_paths
+            ))
+
+        return dict(zip(relative_paths, digests))
+
+    def get_file_digest(self, file_path: Path) -> str:
+        """Returns the hex encoded sha256 digest of given file, hashed via mmap."""
+        try:
+            with open(file_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return hashlib.sha256().hexdigest()
+
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                    return hashlib.sha256(mapped_file).hexdigest()
+        except OSError as error:
+            raise secbootctl.core.AppError(f'can not hash file "{file_path}": {error.strerror}')
+
+    def save(self, manifest: dict, manifest_file_path: Path) -> None:
+        """Saves given manifest atomically."""
+        lines: list = []
+
+        for relative_path, digest in sorted(manifest.items()):
+            # escaped like sha256sum does for file names containing backslashes or newlines
+            if '\\' in relative_path or '\n' in relative_path:
+                escaped_path: str = relative_path.replace('\\', '\\\\').replace('\n', '\\n')
+                lines.append(f'\\{digest}  {escaped_path}')
+            else:
+                lines.append(f'{digest}  {relative_path}')
+
+        os.makedirs(manifest_file_path.parent, 0o700, True)
+        temp_file_path: Path = manifest_file_path.with_name(manifest_file_path.name + '.tmp')
+        # file names are not necessarily valid UTF-8
+        temp_file_path.write_text(''.join(line + '\n' for line in lines), 'utf-8', 'surrogateescape')
+        os.replace(temp_file_path, manifest_file_path)
+
+    def load(self, manifest_file_path: Path) -> dict:
+        """Returns the manifest stored in given file (see "save()")."""
+        manifest: dict = {}
+
+        try:
+            lines: list = manifest_file_path.read_text('utf-8', 'surrogateescape').split('\n')
+        except OSError as error:
+            raise secbootctl.core.AppError(f'can not read manifest "{manifest_file_path}": {error.strerror}')
+
+        for line_number, line in enumerate(lines, 1):
+            if not line:
+                continue
+
+            escaped: bool = line.startswith('\\')
+            digest, separator, relative_path = line[escaped:].partition('  ')
+
+            if len(digest) != 64 or not separator or not relative_path:
+                raise secbootctl.core.AppError(f'invalid manifest "{manifest_file_path}" (line {line_number})')
+
+            if escaped:
+                relative_path = relative_path.replace('\\\\', '\0').replace('\\n', '\n').replace('\0', '\\')
+
+            manifest[relative_path] = digest
+
+        return manifest
+
+    def compare(self, baseline_manifest: dict, manifest: dict) -> list:
+        """Returns the differences of given manifest to the baseline as sorted list of (path, change) tuples.
+
+        The change is "added", "removed" or "modified".
+        """
+        changes: list = [
+            (relative_path, 'added' if relative_path not in baseline_manifest else 'modified')
+            for relative_path, digest in manifest.items() if baseline_manifest.get(relative_path) != digest
+        ]
+        changes.extend(
+            (relative_path, 'removed') for relative_path in baseline_manifest if relative_path not in manifest
+        )
+
+        return sorted(changes)
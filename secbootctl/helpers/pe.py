@@ -0,0 +1,483 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO
+
+import secbootctl.core
+
+
+class PeHelper:
+    """Reads and writes PE/COFF images (EFI executables) without relying on external tools like objcopy.
+
+    see https://docs.microsoft.com/en-us/windows/win32/debug/pe-format
+    """
+    COPY_BUFFER_SIZE: int = 1024 * 1024
+    DATA_DIRECTORY_CERTIFICATE_TABLE: int = 4
+    OPTIONAL_HEADER_CHECKSUM_OFFSET: int = 64
+    SECTION_HEADER_SIZE: int = 40
+    # IMAGE_SCN_CNT_INITIALIZED_DATA | IMAGE_SCN_MEM_READ (same flags objcopy uses for added sections)
+    SECTION_CHARACTERISTICS_DATA: int = 0x40000040
+    WIN_CERT_REVISION_2_0: int = 0x0200
+    WIN_CERT_TYPE_PKCS_SIGNED_DATA: int = 0x0002
+
+    def read_header(self, file_path: Path) -> dict:
+        """Returns the parsed headers and section table of given PE image."""
+        with open(file_path, 'rb') as file:
+            return self._read_header(file, file_path)
+
+    def layout_sections(self, stub_file_path: Path, sections: list) -> dict:
+        """Assigns a virtual address to every given section that doesn't have one yet.
+
+        Sections without virtual address are packed tightly behind the last section of the stub, each starting at
+        the next SectionAlignment boundary after the payload of the previous one (payload size = sum of the sizes of
+        its files). Returns a dict with the keys "sections" (copies of the given sections, all with virtual address),
+        "image_base" and "size_of_image" (resulting virtual size of the image).
+        """
+        header: dict = self.read_header(stub_file_path)
+        section_alignment: int = header['section_alignment']
+        virtual_address: int = self._align(max(
+            [header['size_of_headers']] + [section['virtual_address'] + section['virtual_size']
+                                           for section in header['sections']]), section_alignment)
+        size_of_image: int = header['size_of_image']
+        layouted_sections: list = []
+        virtual_ranges: list = list(header['sections'])
+
+        for section in sections:
+            payload_size: int = sum(Path(file_path).stat().st_size for file_path in section['file_paths'])
+            layouted_section: dict = {'virtual_address': virtual_address, **section}
+
+            if 'virtual_address' not in section:
+                virtual_address = self._align(virtual_address + payload_size, section_alignment)
+
+            size_of_image = max(size_of_image, self._align(layouted_section['virtual_address'] + payload_size,
+                                                           section_alignment))
+            layouted_sections.append(layouted_section)
+            virtual_ranges.append({**layouted_section, 'virtual_size': payload_size})
+
+        # fixed virtual addresses may be too close for big payloads (e.g. a kernel image > 16 MiB)
+        self._check_virtual_addresses(virtual_ranges)
+
+        return {'sections': layouted_sections, 'image_base': header['image_base'], 'size_of_image': size_of_image}
+
+    def get_image_file_size(self, stub_file_path: Path, sections: list) -> int:
+        """Returns the file size of the image "add_sections()" would write for the given stub and sections."""
+        header: dict = self.read_header(stub_file_path)
+        last_section: dict = self._layout_file_offsets(header, sections)[-1]
+
+        return last_section['pointer_to_raw_data'] + last_section['size_of_raw_data']
+
+    def add_sections(self, stub_file_path: Path, sections: list, output_file_path: Path) -> int:
+        """Writes a copy of given stub with the given sections appended to "output_file_path".
+
+        Every section is a dict with the keys "name", "file_paths" and "virtual_address" (relative virtual
+        address). The payload of a section is the concatenation of all its files (e.g. microcode and initramfs
+        image) and is streamed into the output exactly once. An existing certificate table (signature) of the
+        stub is dropped as it would be invalid anyway.
+
+        Returns the number of bytes written. Raises "UnsupportedPeImageError" if the stub can't be handled.
+        """
+        with open(stub_file_path, 'rb') as stub_file:
+            header: dict = self._read_header(stub_file, stub_file_path)
+            section_table_end: int = header['section_table_offset'] + self.SECTION_HEADER_SIZE * (
+                len(header['sections']) + len(sections))
+
+            if section_table_end > header['first_raw_data_offset']:
+                raise secbootctl.core.UnsupportedPeImageError(
+                    f'not enough space for additional section headers in "{stub_file_path}"'
+                )
+
+            new_sections: list = self._layout_file_offsets(header, sections)
+            self._check_virtual_addresses(header['sections'] + new_sections)
+
+            with open(output_file_path, 'wb') as output_file:
+                output_file.write(self._build_header(header, new_sections))
+                stub_file.seek(header['size_of_headers'])
+                self._copy(stub_file, output_file, header['raw_data_end'] - header['size_of_headers'])
+
+                for new_section in new_sections:
+                    self._pad(output_file, new_section['pointer_to_raw_data'])
+
+                    for file_path, payload_size in zip(new_section['file_paths'], new_section['payload_sizes']):
+                        with open(file_path, 'rb') as payload_file:
+                            self._copy(payload_file, output_file, payload_size)
+
+                self._pad(output_file, new_sections[-1]['pointer_to_raw_data'] + new_sections[-1]['size_of_raw_data'])
+
+                return output_file.tell()
+
+    def get_certificates(self, file_path: Path) -> list:
+        """Returns the PKCS#7 signatures (DER encoded SignedData) found in the certificate table of given image."""
+        with open(file_path, 'rb') as file:
+            header: dict = self._read_header(file, file_path)
+            certificate_table_offset, certificate_table_size = self._get_certificate_table(header)
+            file.seek(certificate_table_offset)
+            certificate_table: bytes = file.read(certificate_table_size)
+
+        certificates: list = []
+        offset: int = 0
+
+        # every entry (WIN_CERTIFICATE) consists of length, revision, type and the certificate, aligned to 8 bytes
+        while offset + 8 <= len(certificate_table):
+            length, _, certificate_type = struct.unpack_from('<IHH', certificate_table, offset)
+
+            if length < 8:
+                break
+
+            if certificate_type == self.WIN_CERT_TYPE_PKCS_SIGNED_DATA:
+                certificates.append(certificate_table[offset + 8:offset + length])
+
+            offset += self._align(length, 8)
+
+        return certificates
+
+    def remove_certificates(self, file_path: Path) -> None:
+        """Removes the certificate table (all signatures) of given image in place and prepares it for signing.
+
+        The image is padded with zeros to a multiple of 8 bytes, so a certificate table can be appended. Like
+        sbsign does, the padding is part of the image and thus covered by the Authenticode digest.
+        """
+        with open(file_path, 'r+b') as file:
+            header: dict = self._read_header(file, file_path)
+            certificate_table_offset, certificate_table_size = self._get_certificate_table(header)
+
+            if certificate_table_size:
+                self._set_certificate_table(file, header, 0, 0)
+                file.truncate(certificate_table_offset)
+
+            file_size: int = file.seek(0, os.SEEK_END)
+            file.write(b'\0' * (self._align(file_size, 8) - file_size))
+
+    def add_certificate(self, file_path: Path, certificate: bytes) -> None:
+        """Appends given PKCS#7 signature (DER encoded SignedData) to the certificate table of given image in place.
+
+        The certificate table has to be at the end of the image (see "remove_certificates()").
+        """
+        with open(file_path, 'r+b') as file:
+            header: dict = self._read_header(file, file_path)
+            certificate_table_offset, certificate_table_size = self._get_certificate_table(header)
+            file_size: int = file.seek(0, os.SEEK_END)
+
+            if header['number_of_rva_and_sizes'] <= self.DATA_DIRECTORY_CERTIFICATE_TABLE or file_size % 8 or \
+                    (certificate_table_size and certificate_table_offset + certificate_table_size != file_size):
+                raise secbootctl.core.AppError(f'can not add certificate to "{file_path}"')
+
+            win_certificate: bytes = struct.pack('<IHH', 8 + len(certificate), self.WIN_CERT_REVISION_2_0,
+                                                 self.WIN_CERT_TYPE_PKCS_SIGNED_DATA) + certificate
+            win_certificate += b'\0' * (self._align(len(win_certificate), 8) - len(win_certificate))
+            file.write(win_certificate)
+            self._set_certificate_table(file, header, certificate_table_offset or file_size,
+                                        certificate_table_size + len(win_certificate))
+
+    def get_authenticode_digest(self, file_path: Path, hash_name: str = 'sha256') -> bytes:
+        """Returns the Authenticode digest of given image.
+
+        The digest covers the headers (without checksum and certificate table entry), the raw data of all sections
+        in file order and any data behind the last section up to the certificate table. The image is mapped into
+        memory and hashed without copying.
+
+        see https://download.microsoft.com/download/9/c/5/9c5b2167-8017-4bae-9fde-d599bac8184a/Authenticode_PE.docx
+        """
+        with open(file_path, 'rb') as file:
+            header: dict = self._read_header(file, file_path)
+            certificate_table_offset, certificate_table_size = self._get_certificate_table(header)
+            checksum_offset: int = header['optional_header_offset'] + self.OPTIONAL_HEADER_CHECKSUM_OFFSET
+            regions: list = [(0, checksum_offset)]
+
+            if header['number_of_rva_and_sizes'] > self.DATA_DIRECTORY_CERTIFICATE_TABLE:
+                certificate_table_entry_offset: int = header['data_directory_offset'] + \
+                    8 * self.DATA_DIRECTORY_CERTIFICATE_TABLE
+                regions.extend([(checksum_offset + 4, certificate_table_entry_offset),
+                                (certificate_table_entry_offset + 8, header['size_of_headers'])])
+            else:
+                regions.append((checksum_offset + 4, header['size_of_headers']))
+
+            data_offset: int = header['size_of_headers']
+
+            for section in sorted(header['sections'], key=lambda section: section['pointer_to_raw_data']):
+                if section['size_of_raw_data'] > 0:
+                    data_offset = section['pointer_to_raw_data'] + section['size_of_raw_data']
+                    regions.append((section['pointer_to_raw_data'], data_offset))
+
+            data_end: int = certificate_table_offset if certificate_table_size else os.fstat(file.fileno()).st_size
+
+            if data_end > data_offset:
+                regions.append((data_offset, data_end))
+
+            digest = hashlib.new(hash_name)
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as image:
+                image_view: memoryview = memoryview(image)
+
+                for region_start, region_end in regions:
+                    digest.update(image_view[region_start:region_end])
+
+                image_view.release()
+
+        return digest.digest()
+
+    def replace_last_section(self, image_file_path: Path, name: str, file_paths: list, output_file_path: Path) -> int:
+        """Writes a copy of given image with the payload of its last section replaced to "output_file_path".
+
+        Everything in front of the last section (headers and payloads of all other sections) is copied unchanged
+        (in-kernel with copy_file_range() if possible), only the payload of the last section is rewritten from the
+        given files and the headers following from its new size are updated. The last section must be the given one,
+        both by file offset and by virtual address, so it can grow without overlapping another section. An existing
+        certificate table (signature) is dropped.
+
+        Returns the number of bytes written.
+        """
+        with open(image_file_path, 'rb') as image_file:
+            header: dict = self._read_header(image_file, image_file_path)
+            raw_sections: list = [section for section in header['sections'] if section['size_of_raw_data'] > 0]
+            last_section: dict = header['sections'][-1]
+
+            if not raw_sections or last_section['name'] != name or \
+                    last_section is not max(raw_sections, key=lambda section: section['pointer_to_raw_data']) or \
+                    last_section is not max(header['sections'], key=lambda section: section['virtual_address']):
+                raise secbootctl.core.AppError(f'section "{name}" is not the last section of "{image_file_path}"')
+
+            payload_sizes: list = [Path(file_path).stat().st_size for file_path in file_paths]
+            new_section: dict = {
+                **last_section,
+                'virtual_size': sum(payload_sizes),
+                'size_of_raw_data': self._align(sum(payload_sizes), header['file_alignment'])
+            }
+            remaining_sections: list = header['sections'][:-1]
+            headers: bytes = self._build_header({
+                **header,
+                'sections': remaining_sections,
+                'size_of_image': max([header['size_of_headers']] + [
+                    self._align(section['virtual_address'] + section['virtual_size'], header['section_alignment'])
+                    for section in remaining_sections
+                ]),
+                'raw_data_end': last_section['pointer_to_raw_data']
+            }, [new_section], last_section['size_of_raw_data'])
+
+            with open(output_file_path, 'wb') as output_file:
+                output_file.write(headers)
+                self._copy_range(image_file, header['size_of_headers'], output_file,
+                                 last_section['pointer_to_raw_data'] - header['size_of_headers'])
+
+                for file_path, payload_size in zip(file_paths, payload_sizes):
+                    with open(file_path, 'rb') as payload_file:
+                        self._copy(payload_file, output_file, payload_size)
+
+                self._pad(output_file, new_section['pointer_to_raw_data'] + new_section['size_of_raw_data'])
+
+                return output_file.tell()
+
+    def _read_header(self, file: BinaryIO, file_path: Path) -> dict:
+        dos_header: bytes = file.read(64)
+
+        if len(dos_header) < 64 or dos_header[:2] != b'MZ':
+            raise secbootctl.core.UnsupportedPeImageError(f'"{file_path}" is not a PE image')
+
+        pe_offset: int = struct.unpack_from('<I', dos_header, 0x3c)[0]
+        file.seek(pe_offset)
+        coff_header: bytes = file.read(24)
+
+        if len(coff_header) < 24 or coff_header[:4] != b'PE\0\0':
+            raise secbootctl.core.UnsupportedPeImageError(f'"{file_path}" is not a PE image')
+
+        number_of_sections, _, pointer_to_symbol_table, _, size_of_optional_header = struct.unpack_from(
+            '<HIIIH', coff_header, 6)
+        optional_header_offset: int = pe_offset + 24
+        optional_header: bytes = file.read(size_of_optional_header)
+        magic: int = struct.unpack_from('<H', optional_header, 0)[0]
+
+        if magic == 0x20b:
+            image_base: int = struct.unpack_from('<Q', optional_header, 24)[0]
+            data_directory_offset: int = 112
+        elif magic == 0x10b:
+            image_base = struct.unpack_from('<I', optional_header, 28)[0]
+            data_directory_offset = 96
+        else:
+            raise secbootctl.core.UnsupportedPeImageError(f'"{file_path}" has an unsupported optional header')
+
+        section_alignment, file_alignment = struct.unpack_from('<II', optional_header, 32)
+        size_of_image, size_of_headers = struct.unpack_from('<II', optional_header, 56)
+        number_of_rva_and_sizes: int = struct.unpack_from('<I', optional_header, data_directory_offset - 4)[0]
+        section_table_offset: int = optional_header_offset + size_of_optional_header
+        file.seek(section_table_offset)
+        section_table: bytes = file.read(self.SECTION_HEADER_SIZE * number_of_sections)
+        sections: list = []
+
+        for index in range(number_of_sections):
+            name, virtual_size, virtual_address, size_of_raw_data, pointer_to_raw_data = struct.unpack_from(
+                '<8sIIII', section_table, index * self.SECTION_HEADER_SIZE)
+            sections.append({
+                'name': name.rstrip(b'\0').decode(errors='replace'),
+                'virtual_size': virtual_size,
+                'virtual_address': virtual_address,
+                'size_of_raw_data': size_of_raw_data,
+                'pointer_to_raw_data': pointer_to_raw_data,
+                'characteristics': struct.unpack_from(
+                    '<I', section_table, index * self.SECTION_HEADER_SIZE + 36)[0]
+            })
+
+        raw_sections: list = [section for section in sections if section['size_of_raw_data'] > 0]
+        file.seek(0)
+
+        return {
+            'headers': file.read(size_of_headers),
+            'pe_offset': pe_offset,
+            'optional_header_offset': optional_header_offset,
+            'data_directory_offset': optional_header_offset + data_directory_offset,
+            'number_of_rva_and_sizes': number_of_rva_and_sizes,
+            'section_table_offset': section_table_offset,
+            'pointer_to_symbol_table': pointer_to_symbol_table,
+            'image_base': image_base,
+            'section_alignment': section_alignment,
+            'file_alignment': file_alignment,
+            'size_of_image': size_of_image,
+            'size_of_headers': size_of_headers,
+            'sections': sections,
+            'first_raw_data_offset': min(
+                [size_of_headers] + [section['pointer_to_raw_data'] for section in raw_sections]),
+            'raw_data_end': max(
+                [size_of_headers] + [section['pointer_to_raw_data'] + section['size_of_raw_data']
+                                     for section in raw_sections])
+        }
+
+    def _get_certificate_table(self, header: dict) -> tuple:
+        """Returns file offset and size of the certificate table (both 0 if the image is not signed)."""
+        if header['number_of_rva_and_sizes'] <= self.DATA_DIRECTORY_CERTIFICATE_TABLE:
+            return 0, 0
+
+        return struct.unpack_from(
+            '<II', header['headers'], header['data_directory_offset'] + 8 * self.DATA_DIRECTORY_CERTIFICATE_TABLE
+        )
+
+    def _set_certificate_table(self, file: BinaryIO, header: dict, offset: int, size: int) -> None:
+        file.seek(header['data_directory_offset'] + 8 * self.DATA_DIRECTORY_CERTIFICATE_TABLE)
+        file.write(struct.pack('<II', offset, size))
+
+    def _layout_file_offsets(self, header: dict, sections: list) -> list:
+        """Assigns file offsets and sizes to the given sections that are going to be appended to the stub."""
+        file_alignment: int = header['file_alignment']
+        file_offset: int = self._align(header['raw_data_end'], file_alignment)
+        new_sections: list = []
+
+        for section in sections:
+            payload_sizes: list = [Path(file_path).stat().st_size for file_path in section['file_paths']]
+            payload_size: int = sum(payload_sizes)
+            new_section: dict = {
+                'name': section['name'],
+                'file_paths': section['file_paths'],
+                'payload_sizes': payload_sizes,
+                'virtual_size': payload_size,
+                'virtual_address': section.get('virtual_address'),
+                'size_of_raw_data': self._align(payload_size, file_alignment),
+                'pointer_to_raw_data': file_offset,
+                'characteristics': self.SECTION_CHARACTERISTICS_DATA
+            }
+            file_offset += new_section['size_of_raw_data']
+            new_sections.append(new_section)
+
+        return new_sections
+
+    def _check_virtual_addresses(self, sections: list) -> None:
+        sorted_sections: list = sorted(sections, key=lambda section: section['virtual_address'])
+
+        for previous_section, section in zip(sorted_sections, sorted_sections[1:]):
+            if previous_section['virtual_address'] + previous_section['virtual_size'] > section['virtual_address']:
+                raise secbootctl.core.AppError(
+                    f'section "{previous_section["name"]}" overlaps section "{section["name"]}"'
+                )
+
+    def _build_header(self, header: dict, new_sections: list, removed_initialized_data_size: int = 0) -> bytes:
+        """Returns the headers of given image with the given sections appended to its section table.
+
+        "removed_initialized_data_size" is the raw size of sections that have been removed from "header" (e.g. a
+        section that gets replaced).
+        """
+        headers: bytearray = bytearray(header['headers'])
+        sections: list = header['sections'] + new_sections
+        coff_header_offset: int = header['pe_offset'] + 4
+        optional_header_offset: int = header['optional_header_offset']
+        section_alignment: int = header['section_alignment']
+        size_of_image: int = max(
+            [header['size_of_image']] + [self._align(section['virtual_address'] + section['virtual_size'],
+                                                     section_alignment) for section in new_sections])
+        size_of_initialized_data: int = struct.unpack_from('<I', headers, optional_header_offset + 8)[0] + sum(
+            section['size_of_raw_data'] for section in new_sections) - removed_initialized_data_size
+
+        struct.pack_into('<H', headers, coff_header_offset + 2, len(sections))
+
+        # symbol table (deprecated for images) is not copied and thus must not be referenced anymore
+        if header['pointer_to_symbol_table'] >= header['raw_data_end']:
+            struct.pack_into('<II', headers, coff_header_offset + 8, 0, 0)
+
+        struct.pack_into('<I', headers, optional_header_offset + 8, size_of_initialized_data & 0xffffffff)
+        struct.pack_into('<I', headers, optional_header_offset + 56, size_of_image)
+        # checksum is not verified by UEFI firmware, so it is just reset instead of recalculated
+        struct.pack_into('<I', headers, optional_header_offset + 64, 0)
+
+        if header['number_of_rva_and_sizes'] > self.DATA_DIRECTORY_CERTIFICATE_TABLE:
+            certificate_table_offset: int = header['data_directory_offset'] + 8 * self.DATA_DIRECTORY_CERTIFICATE_TABLE
+            struct.pack_into('<II', headers, certificate_table_offset, 0, 0)
+
+        for index, section in enumerate(new_sections, len(header['sections'])):
+            struct.pack_into(
+                '<8sIIIIIIHHI', headers, header['section_table_offset'] + index * self.SECTION_HEADER_SIZE,
+                section['name'].encode(), section['virtual_size'], section['virtual_address'],
+                section['size_of_raw_data'], section['pointer_to_raw_data'], 0, 0, 0, 0, section['characteristics']
+            )
+
+        return bytes(headers)
+
+    def _copy(self, source_file: BinaryIO, target_file: BinaryIO, size: int) -> None:
+        """Copies exactly "size" bytes from source to target file."""
+        remaining_size: int = size
+
+        while remaining_size > 0:
+            buffer: bytes = source_file.read(min(self.COPY_BUFFER_SIZE, remaining_size))
+
+            if not buffer:
+                raise secbootctl.core.AppError(f'unexpected end of file "{source_file.name}"')
+
+            target_file.write(buffer)
+            remaining_size -= len(buffer)
+
+    def _copy_range(self, source_file: BinaryIO, source_offset: int, target_file: BinaryIO, size: int) -> None:
+        """Copies exactly "size" bytes starting at given source offset to the current position of the target file.
+
+        The data doesn't go through user space if the filesystem supports it (copy_file_range), otherwise a buffered
+        copy is done.
+        """
+        target_file.flush()
+        target_offset: int = target_file.tell()
+        copied_size: int = 0
+
+        try:
+            while copied_size < size:
+                chunk_size: int = os.copy_file_range(source_file.fileno(), target_file.fileno(),
+                                                     size - copied_size, source_offset + copied_size,
+                                                     target_offset + copied_size)
+
+                if chunk_size == 0:
+                    raise secbootctl.core.AppError(f'unexpected end of file "{source_file.name}"')
+
+                copied_size += chunk_size
+        except (AttributeError, OSError):
+            # copy_file_range is not available (non-Linux) or not supported by the filesystem
+            pass
+
+        source_file.seek(source_offset + copied_size)
+        target_file.seek(target_offset + copied_size)
+        self._copy(source_file, target_file, size - copied_size)
+
+    def _pad(self, file: BinaryIO, file_offset: int) -> None:
+        """Pads given file with zeros up to given file offset."""
+        file.write(b'\0' * (file_offset - file.tell()))
+
+    def _align(self, value: int, alignment: int) -> int:
+        return (value + alignment - 1) // alignment * alignment if alignment else value
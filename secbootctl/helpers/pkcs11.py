@@ -0,0 +1,212 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import atexit
+import getpass
+import threading
+import urllib.parse
+from pathlib import Path
+from typing import Optional
+
+import secbootctl.core
+
+try:
+    import PyKCS11
+except ImportError:
+    PyKCS11 = None
+
+
+class Pkcs11Helper:
+    """Signs digests with a private key stored on a security token via the PKCS#11-API.
+
+    The key is selected by a PKCS#11 URI (see RFC 7512), e.g. "pkcs11:manufacturer=piv_II;id=%02" (YubiKey, slot
+    9c). Supported are the path attributes "token", "manufacturer", "serial", "model", "slot-id", "object" and "id"
+    and the query attributes "pin-value", "pin-source" and "module-path".
+
+    Only one session per module and URI is opened per process, it is shared by all instances and closed on exit.
+    The PIN is asked for once, so signing a batch of files needs a single PIN entry even if the key requires a login
+    before every signature (e.g. YubiKey, slot 9c). Only the raw signature operation is done by the token, the
+    digests are computed by the caller.
+
+    The Python module "PyKCS11" is required.
+    """
+    # DER encoded DigestInfo prefixes used by PKCS#1 v1.5 signatures (see RFC 8017, section 9.2)
+    DIGEST_INFO_PREFIXES: dict = {
+        'sha256': bytes.fromhex('3031300d060960864801650304020105000420'),
+        'sha384': bytes.fromhex('3041300d060960864801650304020205000430'),
+        'sha512': bytes.fromhex('3051300d060960864801650304020305000440')
+    }
+    TOKEN_ATTRIBUTES: dict = {
+        'token': 'label', 'manufacturer': 'manufacturerID', 'serial': 'serialNumber', 'model': 'model'
+    }
+    _sessions: dict = {}
+    _sessions_lock: threading.Lock = threading.Lock()
+
+    def __init__(self, module_path: str, uri: str):
+        self._module_path: str = module_path
+        self._uri: str = uri
+
+    def open_session(self) -> None:
+        """Opens the session (and logs in) right away instead of on first signature."""
+        self._get_session()
+
+    def sign_digest(self, digest: bytes, hash_name: str = 'sha256') -> bytes:
+        """Returns the signature of given digest as expected in a PKCS#7 SignerInfo.
+
+        RSA keys sign a DigestInfo with PKCS#1 v1.5 padding (CKM_RSA_PKCS), EC keys sign the digest itself
+        (CKM_ECDSA) and the signature is returned as DER encoded Ecdsa-Sig-Value.
+        """
+        session: dict = self._get_session()
+
+        with session['lock']:
+            try:
+                if session['always_authenticate']:
+                    session['session'].login(session['pin'], PyKCS11.CKU_CONTEXT_SPECIFIC)
+
+                if session['key_type'] == PyKCS11.CKK_EC:
+                    signature: bytes = bytes(session['session'].sign(
+                        session['key'], digest, PyKCS11.Mechanism(PyKCS11.CKM_ECDSA, None)
+                    ))
+
+                    return self._encode_ecdsa_signature(signature)
+
+                return bytes(session['session'].sign(
+                    session['key'], self.DIGEST_INFO_PREFIXES[hash_name] + digest,
+                    PyKCS11.Mechanism(PyKCS11.CKM_RSA_PKCS, None)
+                ))
+            except PyKCS11.PyKCS11Error as error:
+                raise secbootctl.core.AppError(f'signing with security token failed: {error}')
+
+    def _get_session(self) -> dict:
+        """Returns the session of module and URI, it is opened (and logged in) on first use."""
+        if PyKCS11 is None:
+            raise secbootctl.core.AppError('security token signer "pkcs11" requires the Python module "PyKCS11"')
+
+        with self._sessions_lock:
+            session_key: tuple = (self._module_path, self._uri)
+
+            if session_key not in self._sessions:
+                try:
+                    self._sessions[session_key] = self._open_session()
+                except PyKCS11.PyKCS11Error as error:
+                    raise secbootctl.core.AppError(f'opening security token session failed: {error}')
+
+                if len(self._sessions) == 1:
+                    atexit.register(Pkcs11Helper._close_sessions)
+
+            return self._sessions[session_key]
+
+    def _open_session(self) -> dict:
+        path_attributes, query_attributes = self._parse_uri(self._uri)
+        library = PyKCS11.PyKCS11Lib()
+        library.load(query_attributes.get('module-path', self._module_path))
+
+        for slot in library.getSlotList(tokenPresent=True):
+            token_info = library.getTokenInfo(slot)
+
+            if 'slot-id' in path_attributes and path_attributes['slot-id'] != str(slot):
+                continue
+
+            if any(path_attributes[name] != getattr(token_info, attribute_name).strip()
+                   for name, attribute_name in self.TOKEN_ATTRIBUTES.items() if name in path_attributes):
+                continue
+
+            session = library.openSession(slot, PyKCS11.CKF_SERIAL_SESSION)
+            pin: Optional[str] = None
+
+            if token_info.flags & PyKCS11.CKF_LOGIN_REQUIRED:
+                if not token_info.flags & PyKCS11.CKF_PROTECTED_AUTHENTICATION_PATH:
+                    pin = self._get_pin(query_attributes, token_info.label.strip())
+
+                session.login(pin)
+
+            key_template: list = [(PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY)]
+
+            if 'object' in path_attributes:
+                key_template.append((PyKCS11.CKA_LABEL, path_attributes['object']))
+
+            if 'id' in path_attributes:
+                key_template.append((PyKCS11.CKA_ID, tuple(path_attributes['id'].encode('latin-1'))))
+
+            keys: list = session.findObjects(key_template)
+
+            if not keys:
+                session.closeSession()
+
+                continue
+
+            key_type, always_authenticate = session.getAttributeValue(
+                keys[0], [PyKCS11.CKA_KEY_TYPE, PyKCS11.CKA_ALWAYS_AUTHENTICATE]
+            )
+
+            if key_type not in [PyKCS11.CKK_RSA, PyKCS11.CKK_EC]:
+                session.closeSession()
+
+                raise secbootctl.core.AppError(f'key type of security token key "{self._uri}" is not supported')
+
+            return {
+                'library': library, 'session': session, 'key': keys[0], 'key_type': key_type, 'pin': pin,
+                'always_authenticate': bool(always_authenticate), 'lock': threading.Lock()
+            }
+
+        raise secbootctl.core.AppError(f'no security token key found for: {self._uri}')
+
+    def _get_pin(self, query_attributes: dict, token_label: str) -> str:
+        if 'pin-value' in query_attributes:
+            return query_attributes['pin-value']
+
+        if 'pin-source' in query_attributes:
+            pin_source: str = query_attributes['pin-source']
+
+            return Path(pin_source[5:] if pin_source.startswith('file:') else pin_source).read_text().rstrip('\n')
+
+        return getpass.getpass(f'PIN for security token "{token_label}": ')
+
+    def _parse_uri(self, uri: str) -> tuple:
+        """Returns the path and query attributes of given PKCS#11 URI (percent-decoded)."""
+        if not uri.startswith('pkcs11:'):
+            raise secbootctl.core.AppError(f'invalid PKCS#11 URI: {uri}')
+
+        path, _, query = uri[7:].partition('?')
+        attributes: list = []
+
+        for attribute_string, separator in [(path, ';'), (query, '&')]:
+            attributes.append({
+                name: urllib.parse.unquote(value, 'latin-1' if name == 'id' else 'utf-8')
+                for name, _, value in (attribute.partition('=') for attribute in attribute_string.split(separator)
+                                       if attribute)
+            })
+
+        return tuple(attributes)
+
+    def _encode_ecdsa_signature(self, signature: bytes) -> bytes:
+        """Returns the DER encoded Ecdsa-Sig-Value of given raw ECDSA signature (r and s concatenated)."""
+        integers: bytes = b''
+
+        for value in [signature[:len(signature) // 2], signature[len(signature) // 2:]]:
+            value = value.lstrip(b'\0') or b'\0'
+
+            if value[0] & 0x80:
+                value = b'\0' + value
+
+            integers += bytes([0x02, len(value)]) + value
+
+        if len(integers) < 0x80:
+            return bytes([0x30, len(integers)]) + integers
+
+        return bytes([0x30, 0x81, len(integers)]) + integers
+
+    @staticmethod
+    def _close_sessions() -> None:
+        with Pkcs11Helper._sessions_lock:
+            for session in Pkcs11Helper._sessions.values():
+                try:
+                    session['session'].logout()
+                    session['session'].closeSession()
+                except PyKCS11.PyKCS11Error:
+                    pass
+
+            Pkcs11Helper._sessions.clear()
@@ -4,30 +4,65 @@
 
 from __future__ import annotations
 
+import getpass
 import subprocess
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
+import secbootctl.core
 from secbootctl.env import Env
+from secbootctl.helpers.authenticode import AuthenticodeHelper
+from secbootctl.helpers.pe import PeHelper
+from secbootctl.helpers.pkcs11 import Pkcs11Helper
+from secbootctl.helpers.signagent import SignAgentHelper
+
+try:
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+except ImportError:
+    load_pem_private_key = None
 
 
 class SecureBootHelper:
-    def __init__(self, key_path: Path):
+    def __init__(self, key_path: Path, signature_verifier: str = 'native', security_token_signer: str = 'sbsign',
+                 pkcs11_uri: str = Env.SECURITY_TOKEN_PKCS11_URI,
+                 pkcs11_module_path: str = Env.SECURITY_TOKEN_PKCS11_MODULE):
         self._db_key_file_path: Path = key_path / (Env.SB_KEY_NAME_DB + '.key')
         self._db_cert_file_path: Path = key_path / (Env.SB_KEY_NAME_DB + '.crt')
+        self._signature_verifier: str = signature_verifier
+        self._security_token_signer: str = security_token_signer
+        self._pkcs11_uri: str = pkcs11_uri
+        self._authenticode_helper: AuthenticodeHelper = AuthenticodeHelper()
+        self._pe_helper: PeHelper = PeHelper()
+        self._pkcs11_helper: Pkcs11Helper = Pkcs11Helper(pkcs11_module_path, pkcs11_uri)
+        self._sign_agent_helper: SignAgentHelper = SignAgentHelper(Env.SIGN_AGENT_SOCKET_PATH)
+
+    @property
+    def db_cert_file_path(self) -> Path:
+        return self._db_cert_file_path
 
     def sign_file(self, file_path: Path, use_security_token: Optional[bool] = False) -> bool:
         """Signs given file.
 
+        If a sign agent is running the file is signed in-process with the key held by the agent. Otherwise, with a
+        security token and the "pkcs11" signer, the file is signed in-process with the key on the token, else sbsign
+        is used (see "_sign_file_in_process()").
+
         see https://wiki.archlinux.org/title/Unified_Extensible_Firmware_Interface/Secure_Boot#Signing_EFI_binaries
         """
+        if self._sign_agent_helper.is_running():
+            return self._sign_file_in_process(file_path, self._sign_agent_helper.sign_digest)
+
+        if use_security_token and self._security_token_signer == 'pkcs11':
+            return self._sign_file_in_process(file_path, self._pkcs11_helper.sign_digest)
 
         db_key_file_path: str = str(self._db_key_file_path)
         sb_sign_cmd_args: list = ['sbsign']
 
         if use_security_token:
-            # @todo PKCS11-URI should be configurable - at the moment it is hardcoded for use with YubiKey and slot 9c
-            db_key_file_path = 'pkcs11:manufacturer=piv_II;id=%02'
+            db_key_file_path = self._pkcs11_uri
             sb_sign_cmd_args.append('--engine=pkcs11')
 
         sb_sign_cmd_args.extend([
@@ -41,9 +76,80 @@ class SecureBootHelper:
 
         return process_result.returncode == 0
 
+    def get_digest_signer(self, use_security_token: Optional[bool] = False) -> Callable[[bytes, str], bytes]:
+        """Returns a function signing digests with the key on the security token or the key file (for the sign agent).
+
+        The token session is opened or the key file is loaded (asking for its passphrase if encrypted) right away.
+        Key files require the Python module "cryptography".
+        """
+        if use_security_token:
+            self._pkcs11_helper.open_session()
+
+            return self._pkcs11_helper.sign_digest
+
+        if load_pem_private_key is None:
+            raise secbootctl.core.AppError('signing with key files requires the Python module "cryptography"')
+
+        key_data: bytes = self._db_key_file_path.read_bytes()
+
+        try:
+            private_key = load_pem_private_key(key_data, None)
+        except TypeError:
+            private_key = load_pem_private_key(
+                key_data, getpass.getpass(f'Passphrase for "{self._db_key_file_path}": ').encode()
+            )
+        except ValueError as error:
+            raise secbootctl.core.AppError(f'loading key file "{self._db_key_file_path}" failed: {error}')
+
+        def sign_digest(digest: bytes, hash_name: str = 'sha256') -> bytes:
+            hash_algorithm = Prehashed(getattr(hashes, hash_name.upper())())
+
+            if isinstance(private_key, rsa.RSAPrivateKey):
+                return private_key.sign(digest, padding.PKCS1v15(), hash_algorithm)
+
+            if isinstance(private_key, ec.EllipticCurvePrivateKey):
+                return private_key.sign(digest, ec.ECDSA(hash_algorithm))
+
+            raise secbootctl.core.AppError(f'key type of "{self._db_key_file_path}" is not supported')
+
+        return sign_digest
+
+    def _sign_file_in_process(self, file_path: Path, sign_digest: Callable[[bytes], bytes]) -> bool:
+        """Signs given file in place, only the digest of the signed attributes is signed by given function.
+
+        The Authenticode digest and the PKCS#7 signature are created in-process, so only the raw signature operation
+        is done by the security token (the token session is opened once and reused for all files, see
+        "Pkcs11Helper") or the sign agent.
+        """
+        try:
+            self._pe_helper.remove_certificates(file_path)
+            signature: bytes = self._authenticode_helper.create_signature(
+                file_path, self._db_cert_file_path, sign_digest
+            )
+            self._pe_helper.add_certificate(file_path, signature)
+        except (OSError, ValueError, IndexError):
+            return False
+
+        return True
+
     def verify_file(self, file_path: Path) -> bool:
         """Verifies signature of given file.
 
+        With the "native" signature verifier the signature is verified in-process (see "AuthenticodeHelper").
+        sbverify is only called if "sbverify" is configured as verifier or the signature can't be verified
+        in-process (e.g. unsupported signature algorithm).
+        """
+        if self._signature_verifier == 'native':
+            is_valid: Optional[bool] = self._authenticode_helper.verify_file(file_path, self._db_cert_file_path)
+
+            if is_valid is not None:
+                return is_valid
+
+        return self._verify_file_with_sbverify(file_path)
+
+    def _verify_file_with_sbverify(self, file_path: Path) -> bool:
+        """Verifies signature of given file with sbverify.
+
         see https://wiki.archlinux.org/title/Unified_Extensible_Firmware_Interface/Secure_Boot#Signing_EFI_binaries
         """
         process_result = subprocess.run([
@@ -0,0 +1,197 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+import secbootctl.core
+
+
+class SignAgentHelper:
+    """Client and server of the signing agent ("sign-agent" command).
+
+    The agent holds the signing key (key file or security token session) and signs digests on behalf of other
+    secbootctl calls, e.g. the package manager hooks, so the key is loaded (and the PIN entered) only once. It
+    listens on a Unix socket that is only accessible by root (the user running the agent).
+
+    The protocol is line based JSON: a request contains the hash algorithm and a list of hex encoded digests
+    ({"hash": "sha256", "digests": [...]}), the response the signatures ({"signatures": [...]}) or an error message
+    ({"error": "..."}). Requests of concurrent clients are queued and signed one batch after another by a single
+    thread, so the key (token) is never used concurrently.
+    """
+    CONNECT_TIMEOUT: float = 1.0
+    SIGN_TIMEOUT: float = 60.0
+    POLL_INTERVAL: float = 0.5
+
+    def __init__(self, socket_path: Path):
+        self._socket_path: Path = socket_path
+        self._stopped: threading.Event = threading.Event()
+
+    def is_running(self) -> bool:
+        """Returns whether an agent is listening on the socket (owned by the current user)."""
+        try:
+            if self._socket_path.lstat().st_uid != os.getuid():
+                return False
+
+            with self._connect(self.CONNECT_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    def sign_digest(self, digest: bytes, hash_name: str = 'sha256') -> bytes:
+        """Returns the signature of given digest created by the agent (see "Pkcs11Helper.sign_digest()")."""
+        return self.sign_digests([digest], hash_name)[0]
+
+    def sign_digests(self, digests: list, hash_name: str = 'sha256') -> list:
+        """Returns the signatures of given digests created by the agent with one request."""
+        try:
+            with self._connect(self.SIGN_TIMEOUT) as client_socket:
+                client_socket.sendall(json.dumps({
+                    'hash': hash_name, 'digests': [digest.hex() for digest in digests]
+                }).encode() + b'\n')
+
+                with client_socket.makefile('rb') as response_file:
+                    response: dict = json.loads(response_file.readline() or b'{}')
+        except (OSError, ValueError) as error:
+            raise secbootctl.core.AppError(f'connection to sign agent "{self._socket_path}" failed: {error}')
+
+        if 'error' in response or 'signatures' not in response:
+            raise secbootctl.core.AppError(f'sign agent failed: {response.get("error", "invalid response")}')
+
+        return [bytes.fromhex(signature) for signature in response['signatures']]
+
+    def serve(self, sign_digest: Callable[[bytes, str], bytes], idle_timeout: Optional[float] = None) -> None:
+        """Listens on the socket and signs requested digests with given function until stopped.
+
+        The agent stops on SIGTERM or SIGINT, or if no request has been received for "idle_timeout" seconds.
+        """
+        if self.is_running():
+            raise secbootctl.core.AppError(f'sign agent is already running: {self._socket_path}')
+
+        os.makedirs(self._socket_path.parent, 0o700, True)
+        self._socket_path.unlink(missing_ok=True)
+        requests: queue.Queue = queue.Queue()
+        old_umask: int = os.umask(0o177)
+
+        try:
+            server: SignAgentServer = SignAgentServer(str(self._socket_path), SignAgentRequestHandler)
+        finally:
+            os.umask(old_umask)
+
+        server.timeout = self.POLL_INTERVAL
+        server.requests = requests
+        server.last_request_time = time.monotonic()
+        signer_thread: threading.Thread = threading.Thread(target=self._sign_requests, args=(requests, sign_digest),
+                                                           daemon=True)
+        signer_thread.start()
+        old_signal_handlers: dict = {}
+
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in [signal.SIGTERM, signal.SIGINT]:
+                old_signal_handlers[signal_number] = signal.signal(signal_number, lambda *args: self.stop())
+
+        try:
+            while not self._stopped.is_set() and (
+                    idle_timeout is None or time.monotonic() - server.last_request_time < idle_timeout):
+                server.handle_request()
+        finally:
+            for signal_number, old_signal_handler in old_signal_handlers.items():
+                signal.signal(signal_number, old_signal_handler)
+
+            self._socket_path.unlink(missing_ok=True)
+            server.server_close()
+            requests.put(None)
+            signer_thread.join()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _sign_requests(self, requests: queue.Queue, sign_digest: Callable[[bytes, str], bytes]) -> None:
+        """Signs the queued requests, all requests queued at the same time are handled as one batch."""
+        stopped: bool = False
+
+        while not stopped:
+            batch: list = [requests.get()]
+
+            while True:
+                try:
+                    batch.append(requests.get_nowait())
+                except queue.Empty:
+                    break
+
+            for request in batch:
+                if request is None:
+                    stopped = True
+
+                    continue
+
+                try:
+                    request['response'] = {'signatures': [
+                        sign_digest(bytes.fromhex(digest), request['hash']).hex() for digest in request['digests']
+                    ]}
+                except secbootctl.core.AppError as error:
+                    request['response'] = {'error': error.message}
+                except (KeyError, TypeError, ValueError) as error:
+                    request['response'] = {'error': f'invalid request: {error}'}
+
+                request['done'].set()
+
+    def _connect(self, timeout: float) -> socket.socket:
+        client_socket: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.settimeout(timeout)
+
+        try:
+            client_socket.connect(str(self._socket_path))
+        except OSError:
+            client_socket.close()
+            raise
+
+        return client_socket
+
+
+class SignAgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads: bool = True
+
+    def verify_request(self, request, client_address) -> bool:
+        """Accepts only clients of the same user (root) as the agent."""
+        credentials: bytes = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+
+        return uid == os.getuid()
+
+
+class SignAgentRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line: bytes = self.rfile.readline()
+
+        # connections without request are used to check whether the agent is running
+        if not line:
+            return
+
+        self.server.last_request_time = time.monotonic()
+        response: dict
+
+        try:
+            request: dict = json.loads(line)
+            request = {'hash': str(request['hash']), 'digests': list(request['digests'])}
+        except (KeyError, TypeError, ValueError) as error:
+            response = {'error': f'invalid request: {error}'}
+        else:
+            request['done'] = threading.Event()
+            self.server.requests.put(request)
+            request['done'].wait()
+            response = request['response']
+
+        self.wfile.write(json.dumps(response).encode() + b'\n')
@@ -0,0 +1,137 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import hashlib
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+
+class SignatureCacheHelper:
+    """Caches the signing status of files, so unchanged files don't have to be verified again (signature cache).
+
+    Every file is hashed and its signing status is looked up by its digest, so unchanged files and files with
+    identical content are verified only once. Stat data can't prove a file is unchanged (e.g. on FAT file systems
+    content can be replaced and the mtime restored), so it is only recorded (device, inode, size, mtime) to prune
+    the records of files that are gone. The signing statuses are only valid for the db certificate whose
+    fingerprint (sha256 digest) is stored in the header, the whole cache is invalidated if it changes.
+
+    The cache is stored in a compact binary format: a header (magic, certificate fingerprint, time of saving)
+    followed by fixed-size records. Files may be verified concurrently, hashing and verifying is done outside of the
+    lock.
+    """
+    MAGIC: bytes = b'SBCSIG\x00\x01'
+    HEADER_STRUCT: struct.Struct = struct.Struct('<8s32sq')
+    RECORD_STRUCT: struct.Struct = struct.Struct('<QQQq32s?')
+    DIGEST_BUFFER_SIZE: int = 1024 * 1024
+
+    def __init__(self, cache_file_path: Path, cert_file_path: Path):
+        self._cache_file_path: Path = cache_file_path
+        self._cert_fingerprint: bytes = self._get_cert_fingerprint(cert_file_path)
+        self._records: Optional[dict] = None
+        self._statuses: dict = {}
+        self._seen_file_ids: set = set()
+        self._hits: int = 0
+        self._misses: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def hits(self) -> int:
+        """Number of files whose signing status has been taken from the cache."""
+        return self._hits
+
+    @property
+    def misses(self) -> int:
+        """Number of files that had to be verified."""
+        return self._misses
+
+    def verify_file(self, file_path: Path, verify_file: Callable[[Path], bool]) -> bool:
+        """Returns the signing status of given file from the cache or verifies it with given function."""
+        stat_result: os.stat_result = file_path.stat()
+        file_id: tuple = (stat_result.st_dev, stat_result.st_ino)
+
+        with self._lock:
+            self._load()
+            self._seen_file_ids.add(file_id)
+
+        digest: bytes = self._get_file_digest(file_path)
+        is_signed: Optional[bool] = self._statuses.get(digest)
+
+        if is_signed is None:
+            is_signed = verify_file(file_path)
+
+        with self._lock:
+            if digest in self._statuses:
+                self._hits += 1
+            else:
+                self._statuses[digest] = is_signed
+                self._misses += 1
+
+            self._records[file_id] = (stat_result.st_size, stat_result.st_mtime_ns, digest, is_signed)
+
+        return is_signed
+
+    def save(self, prune: bool = False) -> None:
+        """Saves the cache atomically, optionally without the records of files that haven't been verified.
+
+        Pruning must only be used if all files the cache has been used for have been verified (e.g. all files on
+        the ESP), otherwise still valid records get lost.
+        """
+        if self._records is None:
+            return
+
+        data: bytearray = bytearray(self.HEADER_STRUCT.pack(self.MAGIC, self._cert_fingerprint, time.time_ns()))
+
+        for file_id, record in self._records.items():
+            if not prune or file_id in self._seen_file_ids:
+                data += self.RECORD_STRUCT.pack(*file_id, *record)
+
+        os.makedirs(self._cache_file_path.parent, 0o700, True)
+        # "file:list" only holds the global lock shared, so concurrent calls must not share the temporary file
+        temp_file_path: Path = self._cache_file_path.with_name(f'{self._cache_file_path.name}.{os.getpid()}.tmp')
+        temp_file_path.write_bytes(data)
+        os.replace(temp_file_path, self._cache_file_path)
+
+    def _load(self) -> dict:
+        if self._records is not None:
+            return self._records
+
+        self._records = {}
+
+        try:
+            data: bytes = self._cache_file_path.read_bytes()
+            magic, cert_fingerprint, _ = self.HEADER_STRUCT.unpack_from(data)
+        except (OSError, struct.error):
+            return self._records
+
+        if magic != self.MAGIC or cert_fingerprint != self._cert_fingerprint or \
+                (len(data) - self.HEADER_STRUCT.size) % self.RECORD_STRUCT.size:
+            return self._records
+
+        for device, inode, size, mtime_ns, digest, is_signed in self.RECORD_STRUCT.iter_unpack(
+                memoryview(data)[self.HEADER_STRUCT.size:]):
+            self._records[(device, inode)] = (size, mtime_ns, digest, is_signed)
+            self._statuses[digest] = is_signed
+
+        return self._records
+
+    def _get_cert_fingerprint(self, cert_file_path: Path) -> bytes:
+        try:
+            return hashlib.sha256(cert_file_path.read_bytes()).digest()
+        except OSError:
+            return bytes(32)
+
+    def _get_file_digest(self, file_path: Path) -> bytes:
+        digest = hashlib.sha256()
+
+        with open(file_path, 'rb') as file:
+            while buffer := file.read(self.DIGEST_BUFFER_SIZE):
+                digest.update(buffer)
+
+        return digest.digest()
@@ -0,0 +1,101 @@
+# secbootctl - Secure Boot Helper
+#
+# @license https://github.com/keaparrot/secbootctl/blob/master/LICENSE.md
+
+from __future__ import annotations
+
+import ctypes
+import os
+import shutil
+from pathlib import Path
+from typing import Callable
+from typing import Optional
+
+import secbootctl.core
+from secbootctl.env import Env
+
+
+class FileTransactionHelper:
+    def begin(self) -> FileTransaction:
+        """Returns a new file transaction (to be used as context manager)."""
+        return FileTransaction()
+
+
+class FileTransaction:
+    """Writes files (e.g. on the ESP) atomically.
+
+    Files are written to temporary files next to their target (same filesystem) first. On commit the data of all
+    staged files is flushed with one sync per filesystem and afterwards every staged file is renamed to its target.
+    Thus after a crash or power cut a target either has its old or its new complete content, never a truncated one.
+    If the transaction is rolled back (e.g. an error occurred inside the "with" block) the staged files are removed
+    and the targets stay untouched.
+    """
+    def __init__(self):
+        self._staged_file_paths: dict = {}
+
+    def __enter__(self) -> FileTransaction:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def stage(self, file_path: Path, copy: bool = False) -> Path:
+        """Returns the path of the temporary file the new content of given file has to be written to.
+
+        If "copy" is True the current content of the given file is copied to the temporary file first, so it can be
+        modified in place (e.g. for signing).
+        """
+        staged_file_path: Path = file_path.parent / f'.{file_path.name}.{Env.APP_NAME}.tmp'
+        self._staged_file_paths[file_path] = staged_file_path
+
+        if copy:
+            shutil.copyfile(file_path, staged_file_path)
+
+        return staged_file_path
+
+    def write_text(self, file_path: Path, content: str) -> None:
+        self.stage(file_path).write_text(content)
+
+    def commit(self) -> None:
+        try:
+            self._sync_file_systems()
+
+            for file_path, staged_file_path in list(self._staged_file_paths.items()):
+                os.replace(staged_file_path, file_path)
+                del self._staged_file_paths[file_path]
+        except OSError as error:
+            self.rollback()
+
+            raise secbootctl.core.AppError(f'committing file changes failed: {error}')
+
+    def rollback(self) -> None:
+        for staged_file_path in self._staged_file_paths.values():
+            staged_file_path.unlink(missing_ok=True)
+
+        self._staged_file_paths.clear()
+
+    def _sync_file_systems(self) -> None:
+        """Flushes the staged files with one syncfs() call per filesystem instead of one fsync() per file."""
+        directory_paths: dict = {}
+
+        for staged_file_path in self._staged_file_paths.values():
+            directory_paths.setdefault(os.stat(staged_file_path.parent).st_dev, staged_file_path.parent)
+
+        syncfs: Optional[Callable] = getattr(ctypes.CDLL(None, use_errno=True), 'syncfs', None)
+
+        for directory_path in directory_paths.values():
+            if syncfs is None:
+                os.sync()
+
+                return
+
+            directory_fd: int = os.open(directory_path, os.O_RDONLY)
+
+            try:
+                if syncfs(directory_fd) != 0:
+                    raise OSError(ctypes.get_errno(), f'syncing "{directory_path}" failed')
+            finally:
+                os.close(directory_fd)
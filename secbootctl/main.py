@@ -8,6 +8,7 @@ import argparse
 import configparser
 
 from secbootctl.core import App, AppError, CliCmdManager, Config, ControllerFactory, Dispatcher, Router
+from secbootctl.core import ServiceContainer
 from secbootctl.helpers.cli import CliPrintHelper
 
 
@@ -21,7 +22,7 @@ def main() -> int:
             config,
             CliCmdManager(argparse.ArgumentParser(add_help=False)),
             Router(),
-            Dispatcher(ControllerFactory(config))
+            Dispatcher(ControllerFactory(config, ServiceContainer(config)))
         ).run()
     except AppError as app_error:
         cli_print_helper: CliPrintHelper = CliPrintHelper()
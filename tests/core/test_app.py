@@ -6,6 +6,7 @@ from unittest.mock import patch
 
 from secbootctl.core import App
 from secbootctl.env import Env
+from secbootctl.helpers.cli import CliPrintHelper
 
 
 class TestApp(unittest.TestCase):
@@ -14,10 +15,14 @@ class TestApp(unittest.TestCase):
         self._cli_cmd_manager: Mock = Mock()
         self._router_mock: Mock = Mock()
         self._dispatcher_mock: Mock = Mock()
+        self._cli_cmd_manager.parse_request.return_value = {'command_name': 'config:list', 'output': 'text'}
         self._app: App = App(
             self._config_mock, self._cli_cmd_manager, self._router_mock, self._dispatcher_mock
         )
 
+    def tearDown(self) -> None:
+        CliPrintHelper.set_output_format('text')
+
     def test_init_it_assigns_given_dependencies(self):
         self.assertIs(
             self._config_mock,
@@ -78,6 +83,15 @@ class TestApp(unittest.TestCase):
             route_data
         )
 
+    def test_run_it_sets_output_format(self):
+        self._cli_cmd_manager.parse_request.return_value = {'command_name': 'file:list', 'all': False,
+                                                            'output': 'jsonl'}
+
+        self._app.run()
+
+        self.assertEqual('jsonl', CliPrintHelper.output_format)
+        self._router_mock.match.assert_called_once_with({'command_name': 'file:list', 'all': False})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,11 +1,52 @@
+import contextlib
 import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
+from secbootctl.env import Env
+from secbootctl.helpers.cli import CliPrintHelper
 from tests import unittest_helper
 
 
 class TestAppController(unittest_helper.ControllerTestCase):
     FEATURE_NAME = 'app'
 
+    @patch('secbootctl.core.LockHelper')
+    def test_lock_if_lock_mode_not_given_it_locks_exclusively(self, lock_helper_patch_mock: MagicMock):
+        self._config_mock.configure_mock(lock_timeout=30)
+
+        self.assertIs(lock_helper_patch_mock.return_value.lock.return_value, self._controller.lock('install'))
+
+        lock_helper_patch_mock.assert_called_once_with(Env.LOCK_FILE_PATH)
+        lock_helper_patch_mock.return_value.lock.assert_called_once_with(
+            True, 30, self._controller._print_lock_holders
+        )
+
+    @patch('secbootctl.core.LockHelper')
+    def test_lock_if_lock_mode_shared_it_locks_shared(self, lock_helper_patch_mock: MagicMock):
+        self._config_mock.configure_mock(lock_timeout=None)
+
+        with patch.object(self._controller, 'LOCK_MODES', {'list': 'shared'}):
+            self._controller.lock('list')
+
+        lock_helper_patch_mock.return_value.lock.assert_called_once_with(
+            False, None, self._controller._print_lock_holders
+        )
+
+    @patch('secbootctl.core.LockHelper')
+    def test_lock_if_lock_mode_none_it_does_not_lock(self, lock_helper_patch_mock: MagicMock):
+        with patch.object(self._controller, 'LOCK_MODES', {'wait': 'none'}):
+            self.assertIsInstance(self._controller.lock('wait'), contextlib.nullcontext)
+
+        lock_helper_patch_mock.assert_not_called()
+
+    def test_print_lock_holders_it_prints_waiting_status(self):
+        self._controller._print_lock_holders([{'pid': 42, 'mode': 'exclusive', 'command': 'kernel:install'}])
+
+        self._cli_print_helper_mock.print_status.assert_called_once_with(
+            'waiting for lock held by: PID 42 (kernel:install)', CliPrintHelper.Status.PENDING
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
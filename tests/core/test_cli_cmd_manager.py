@@ -0,0 +1,60 @@
+import argparse
+import importlib
+import re
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import secbootctl.features
+from secbootctl.core import CliCmdManager
+
+
+class TestCliCmdManager(unittest.TestCase):
+    def _create_cli_cmd_manager(self, cli_args: list) -> CliCmdManager:
+        return CliCmdManager(argparse.ArgumentParser(prog='secbootctl', add_help=False), cli_args)
+
+    def test_parse_request_it_returns_request_data_of_given_command(self):
+        cli_cmd_manager: CliCmdManager = self._create_cli_cmd_manager(['--output', 'jsonl', 'kernel:install', 'linux'])
+        cli_cmd_manager.init_commands(Path('/tmp/efi'))
+
+        self.assertEqual({
+            'output': 'jsonl', 'command_name': 'kernel:install', 'kernel_names': ['linux'], 'all_kernels': False,
+            'jobs': None, 'force': False, 'explain': False
+        }, cli_cmd_manager.parse_request())
+
+    @patch('secbootctl.core.importlib')
+    def test_init_commands_it_imports_feature_module_of_given_command_only(self, importlib_patch_mock: MagicMock):
+        importlib_patch_mock.import_module.side_effect = importlib.import_module
+
+        self._create_cli_cmd_manager(['--output', 'jsonl', 'pmi:hook-callback', 'update']).init_commands(
+            Path('/tmp/efi')
+        )
+
+        importlib_patch_mock.import_module.assert_called_once_with('secbootctl.features.pmi')
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.core.importlib')
+    def test_parse_request_if_help_requested_it_lists_registered_commands_without_importing_feature_modules(
+            self, importlib_patch_mock: MagicMock, stdout_mock: StringIO):
+        for cli_args in [[], ['--help'], ['-h', 'kernel:install']]:
+            with self.subTest(cli_args=cli_args):
+                cli_cmd_manager: CliCmdManager = self._create_cli_cmd_manager(cli_args)
+                cli_cmd_manager.init_commands(Path('/tmp/efi'))
+
+                with self.assertRaises(SystemExit):
+                    cli_cmd_manager.parse_request()
+
+                for command_name, (_, help_message) in secbootctl.features.COMMANDS.items():
+                    self.assertRegex(
+                        stdout_mock.getvalue(), rf'\n  {re.escape(command_name)} +{re.escape(help_message)}\n'
+                    )
+
+                self.assertIn('Use "secbootctl [command] --help" for more information', stdout_mock.getvalue())
+
+        importlib_patch_mock.import_module.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
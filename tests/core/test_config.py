@@ -19,11 +19,22 @@ class TestConfig(unittest.TestCase):
             'kernel_image_name_prefix': 'vmlinuz123',
             'initramfs_image_name_template': 'initramfs123',
             'microcode_image_name': 'micorocode123',
+            'unified_kernel_image_builder': 'objcopy',
+            'unified_kernel_image_layout': 'fixed',
+            'initramfs_compression': 'xz',
+            'initramfs_compression_level': '9',
+            'initramfs_compression_workers': '4',
+            'signature_verifier': 'sbverify',
             'bootloader_menu_editor': 'yes',
             'bootloader_menu_timeout': 5,
             'package_manager': 'pacman123',
+            'package_manager_hook_mode': 'deferred',
+            'lock_timeout': '30',
             'use_security_token': 'yes',
-            'security_token': 'token'
+            'security_token': 'token',
+            'security_token_signer': 'pkcs11',
+            'security_token_pkcs11_uri': 'pkcs11:token=test;object=db',
+            'security_token_pkcs11_module': '/usr/lib/softhsm/libsofthsm2.so'
         }
         self._config._config_data = self._config_data
 
@@ -130,6 +141,108 @@ class TestConfig(unittest.TestCase):
             self._config.microcode_image_name
         )
 
+    def test_unified_kernel_image_builder_it_returns_unified_kernel_image_builder(self):
+        self.assertEqual(
+            self._config_data['unified_kernel_image_builder'],
+            self._config.unified_kernel_image_builder
+        )
+
+    def test_unified_kernel_image_builder_if_not_configured_it_returns_native(self):
+        del self._config._config_data['unified_kernel_image_builder']
+
+        self.assertEqual(
+            'native',
+            self._config.unified_kernel_image_builder
+        )
+
+    def test_unified_kernel_image_layout_it_returns_unified_kernel_image_layout(self):
+        self.assertEqual(
+            self._config_data['unified_kernel_image_layout'],
+            self._config.unified_kernel_image_layout
+        )
+
+    def test_unified_kernel_image_layout_if_not_configured_it_returns_computed(self):
+        del self._config._config_data['unified_kernel_image_layout']
+
+        self.assertEqual(
+            'computed',
+            self._config.unified_kernel_image_layout
+        )
+
+    def test_initramfs_compression_it_returns_initramfs_compression(self):
+        self.assertEqual(
+            self._config_data['initramfs_compression'],
+            self._config.initramfs_compression
+        )
+
+    def test_initramfs_compression_if_not_configured_it_returns_none(self):
+        del self._config._config_data['initramfs_compression']
+
+        self.assertEqual(
+            'none',
+            self._config.initramfs_compression
+        )
+
+    def test_initramfs_compression_level_it_returns_level_as_int(self):
+        self.assertEqual(
+            9,
+            self._config.initramfs_compression_level
+        )
+
+    def test_initramfs_compression_level_if_not_configured_it_returns_none(self):
+        del self._config._config_data['initramfs_compression_level']
+
+        self.assertIsNone(
+            self._config.initramfs_compression_level
+        )
+
+    def test_initramfs_compression_workers_it_returns_workers_as_int(self):
+        self.assertEqual(
+            4,
+            self._config.initramfs_compression_workers
+        )
+
+    def test_signature_verifier_it_returns_signature_verifier(self):
+        self.assertEqual(
+            self._config_data['signature_verifier'],
+            self._config.signature_verifier
+        )
+
+    def test_signature_verifier_if_not_configured_it_returns_native(self):
+        del self._config._config_data['signature_verifier']
+
+        self.assertEqual(
+            'native',
+            self._config.signature_verifier
+        )
+
+    def test_package_manager_hook_mode_it_returns_package_manager_hook_mode(self):
+        self.assertEqual(
+            self._config_data['package_manager_hook_mode'],
+            self._config.package_manager_hook_mode
+        )
+
+    def test_package_manager_hook_mode_if_not_configured_it_returns_sync(self):
+        del self._config._config_data['package_manager_hook_mode']
+
+        self.assertEqual(
+            'sync',
+            self._config.package_manager_hook_mode
+        )
+
+    def test_lock_timeout_it_returns_lock_timeout_as_int(self):
+        self.assertEqual(
+            30,
+            self._config.lock_timeout
+        )
+
+    def test_lock_timeout_if_empty_it_returns_none(self):
+        self._config._config_data['lock_timeout'] = ''
+
+        self.assertIsNone(
+            self._config.lock_timeout
+        )
+
     def test_bootloader_menu_editor_it_returns_bootloader_menu_editor(self):
         self.assertEqual(
             self._config_data['bootloader_menu_editor'],
@@ -166,6 +279,40 @@ class TestConfig(unittest.TestCase):
             self._config.security_token_name
         )
 
+    def test_security_token_signer_it_returns_security_token_signer(self):
+        self.assertEqual(
+            self._config_data['security_token_signer'],
+            self._config.security_token_signer
+        )
+
+    def test_security_token_signer_if_not_configured_it_returns_sbsign(self):
+        del self._config._config_data['security_token_signer']
+
+        self.assertEqual(
+            'sbsign',
+            self._config.security_token_signer
+        )
+
+    def test_security_token_pkcs11_uri_it_returns_security_token_pkcs11_uri(self):
+        self.assertEqual(
+            self._config_data['security_token_pkcs11_uri'],
+            self._config.security_token_pkcs11_uri
+        )
+
+    def test_security_token_pkcs11_uri_if_not_configured_it_returns_yubikey_slot_9c_uri(self):
+        del self._config._config_data['security_token_pkcs11_uri']
+
+        self.assertEqual(
+            'pkcs11:manufacturer=piv_II;id=%02',
+            self._config.security_token_pkcs11_uri
+        )
+
+    def test_security_token_pkcs11_module_it_returns_security_token_pkcs11_module(self):
+        self.assertEqual(
+            self._config_data['security_token_pkcs11_module'],
+            self._config.security_token_pkcs11_module
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -4,19 +4,25 @@ from unittest.mock import Mock
 from unittest.mock import patch
 
 from secbootctl.core import ControllerFactory
+from secbootctl.core import ServiceContainer
 
 
 class TestControllerFactory(unittest.TestCase):
     def setUp(self) -> None:
         self._config_mock: Mock = Mock()
+        self._services: ServiceContainer = ServiceContainer(self._config_mock)
         self._dispatcher_mock: Mock = Mock()
-        self._controller_factory: ControllerFactory = ControllerFactory(self._config_mock)
+        self._controller_factory: ControllerFactory = ControllerFactory(self._config_mock, self._services)
 
     def test_init_it_assigns_given_dependencies(self):
         self.assertIs(
             self._config_mock,
             self._controller_factory._config
         )
+        self.assertIs(
+            self._services,
+            self._controller_factory._services
+        )
 
     @patch('secbootctl.features.kernel.KernelController')
     def test_create_it_returns_instantiated_controller_for_given_name(self, kernel_controller_patch_mock: MagicMock):
@@ -30,8 +36,29 @@ class TestControllerFactory(unittest.TestCase):
             self._controller_factory.create(module_name, controller_name, self._dispatcher_mock)
         )
         kernel_controller_patch_mock.assert_called_once_with(
-            self._config_mock, self._dispatcher_mock
+            self._config_mock, self._dispatcher_mock, self._services
+        )
+
+    @patch('secbootctl.features.bootloader.BootloaderController')
+    @patch('secbootctl.features.kernel.KernelController')
+    def test_create_if_controller_already_created_it_returns_same_controller(
+            self, kernel_controller_patch_mock: MagicMock, bootloader_controller_patch_mock: MagicMock):
+        kernel_controller: Mock = self._controller_factory.create(
+            'secbootctl.features.kernel', 'KernelController', self._dispatcher_mock
+        )
+
+        self.assertIs(
+            kernel_controller,
+            self._controller_factory.create('secbootctl.features.kernel', 'KernelController', self._dispatcher_mock)
+        )
+        self.assertIsNot(
+            kernel_controller,
+            self._controller_factory.create(
+                'secbootctl.features.bootloader', 'BootloaderController', self._dispatcher_mock
+            )
         )
+        kernel_controller_patch_mock.assert_called_once()
+        bootloader_controller_patch_mock.assert_called_once()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock
+from unittest.mock import MagicMock, Mock
 
 from secbootctl.core import Dispatcher
 
@@ -15,8 +15,8 @@ class TestDispatcher(unittest.TestCase):
             self._dispatcher._controller_factory
         )
 
-    def test_dispatch_it_dispatches_given_route_data(self):
-        controller_mock: Mock = Mock()
+    def test_dispatch_it_dispatches_given_route_data_while_holding_lock_of_action(self):
+        controller_mock: MagicMock = MagicMock()
         module_name: str = 'secbootctl.features.kernel'
         controller_name: str = 'KernelController'
         params: dict = {'p1': 'pv1'}
@@ -36,6 +36,9 @@ class TestDispatcher(unittest.TestCase):
         controller_mock.install.assert_called_once_with(
             **params
         )
+        controller_mock.lock.assert_called_once_with('install')
+        controller_mock.lock.return_value.__enter__.assert_called_once()
+        controller_mock.lock.return_value.__exit__.assert_called_once()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,75 @@
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from secbootctl.core import ServiceContainer
+from secbootctl.env import Env
+
+
+class TestServiceContainer(unittest.TestCase):
+    def setUp(self) -> None:
+        self._config_mock: Mock = Mock()
+        self._config_mock.configure_mock(
+            sb_keys_path=Path('/etc/secbootctl/keys'), signature_verifier='native', security_token_signer='sbsign',
+            security_token_pkcs11_uri='pkcs11:id=%02', security_token_pkcs11_module='/usr/lib/libykcs11.so'
+        )
+        self._services: ServiceContainer = ServiceContainer(self._config_mock)
+
+    def test_init_it_has_no_requirements_checked(self):
+        self.assertFalse(self._services.requirements_checked)
+
+    def test_get_if_service_not_created_it_creates_service(self):
+        service: object = object()
+        create_service_mock: Mock = Mock(return_value=service)
+
+        self.assertIs(service, self._services.get('service', create_service_mock))
+
+        create_service_mock.assert_called_once_with()
+
+    def test_get_if_service_already_created_it_returns_same_service(self):
+        create_service_mock: Mock = Mock(side_effect=object)
+
+        service: object = self._services.get('service', create_service_mock)
+
+        self.assertIs(service, self._services.get('service', create_service_mock))
+        self.assertIsNot(service, self._services.get('other_service', create_service_mock))
+        self.assertEqual(2, create_service_mock.call_count)
+
+    @patch('secbootctl.core.FileTransactionHelper')
+    @patch('secbootctl.core.BuildCacheHelper')
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_helpers_it_creates_every_helper_once_on_first_use(
+            self, cli_print_helper_patch_mock: MagicMock, kernel_os_helper_patch_mock: MagicMock,
+            sb_helper_patch_mock: MagicMock, build_cache_helper_patch_mock: MagicMock,
+            file_transaction_helper_patch_mock: MagicMock):
+        helper_patch_mocks: dict = {
+            'cli_print_helper': cli_print_helper_patch_mock,
+            'kernel_os_helper': kernel_os_helper_patch_mock,
+            'sb_helper': sb_helper_patch_mock,
+            'build_cache_helper': build_cache_helper_patch_mock,
+            'file_transaction_helper': file_transaction_helper_patch_mock
+        }
+
+        self._services.kernel_os_helper
+
+        for helper_name, helper_patch_mock in helper_patch_mocks.items():
+            with self.subTest(helper_name=helper_name):
+                self.assertEqual(1 if helper_name == 'kernel_os_helper' else 0, helper_patch_mock.call_count)
+
+                self.assertIs(helper_patch_mock.return_value, getattr(self._services, helper_name))
+                self.assertIs(helper_patch_mock.return_value, getattr(self._services, helper_name))
+                helper_patch_mock.assert_called_once()
+
+        kernel_os_helper_patch_mock.assert_called_once_with(self._config_mock)
+        sb_helper_patch_mock.assert_called_once_with(
+            Path('/etc/secbootctl/keys'), 'native', 'sbsign', 'pkcs11:id=%02', '/usr/lib/libykcs11.so'
+        )
+        build_cache_helper_patch_mock.assert_called_once_with(Env.BUILD_MANIFEST_FILE_PATH)
+
+
+if __name__ == '__main__':
+    unittest.main()
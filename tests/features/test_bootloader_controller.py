@@ -2,7 +2,6 @@ import textwrap
 import unittest
 from pathlib import Path
 from unittest.mock import call
-from unittest.mock import mock_open
 from unittest.mock import Mock
 from unittest.mock import MagicMock
 from unittest.mock import patch
@@ -17,9 +16,8 @@ from tests import unittest_helper
 class TestKernelController(unittest_helper.ControllerTestCase):
     FEATURE_NAME: str = 'bootloader'
 
-    @patch('secbootctl.features.bootloader.open', new_callable=mock_open())
     @patch('secbootctl.features.bootloader.subprocess')
-    def test_install_it_installs_bootloader(self, subprocess_patch_mock: MagicMock, open_patch_mock: MagicMock):
+    def test_install_it_installs_bootloader(self, subprocess_patch_mock: MagicMock):
         process_result_mock: Mock = Mock()
         subprocess_patch_mock.run.return_value = process_result_mock
         process_result_mock.configure_mock(returncode=0)
@@ -41,8 +39,6 @@ class TestKernelController(unittest_helper.ControllerTestCase):
             editor {bootloader_menu_editor}
             timeout {bootloader_menu_timeout}
         ''')
-        file_mock: Mock = MagicMock()
-        open_patch_mock.return_value = file_mock
 
         self._controller.install()
 
@@ -62,8 +58,11 @@ class TestKernelController(unittest_helper.ControllerTestCase):
             call(default_boot_file_path),
             call(systemd_boot_file_path)
         ])
-        open_patch_mock.assert_called_once_with(config_file_path, 'w')
-        file_mock.__enter__.return_value.write.assert_called_once_with(config_content)
+        self._file_transaction_mock.stage.assert_has_calls([
+            call(default_boot_file_path, True),
+            call(systemd_boot_file_path, True)
+        ])
+        self._file_transaction_mock.write_text.assert_called_once_with(config_file_path, config_content)
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call('installing bootloader: systemd-boot', CliPrintHelper.Status.PENDING),
             call('installed bootloader: systemd-boot', CliPrintHelper.Status.SUCCESS),
@@ -152,6 +151,25 @@ class TestKernelController(unittest_helper.ControllerTestCase):
             call(f'valid signature: {systemd_boot_file_path}', CliPrintHelper.Status.SUCCESS)
         ])
 
+    @patch('secbootctl.features.bootloader.subprocess')
+    def test_update_if_signature_invalid_it_leaves_bootloader_files_unchanged(self, subprocess_patch_mock: MagicMock):
+        subprocess_patch_mock.run.return_value = Mock(returncode=0)
+        self._config_mock.configure_mock(esp_path=Path('/tmp/efi'))
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.side_effect = [True, False]
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.update()
+
+        self.assertEqual(
+            'signed bootloader files have invalid signatures, bootloader files left unchanged',
+            context_manager.exception.message
+        )
+        self.assertIs(
+            AppError,
+            self._file_transaction_helper_mock.begin.return_value.__exit__.call_args.args[0]
+        )
+
     @patch('secbootctl.features.bootloader.subprocess')
     def test_update_if_fails_it_raises_an_error(self, subprocess_patch_mock: MagicMock):
         process_result_mock: Mock = Mock()
@@ -255,9 +273,7 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         )
 
     @patch('secbootctl.features.bootloader.Path.is_file')
-    @patch('secbootctl.features.bootloader.open', new_callable=mock_open())
-    def test_update_menu_it_updates_default_menu_entry(self, open_patch_mock: MagicMock,
-                                                       path_is_file_path_mock: MagicMock):
+    def test_update_menu_it_updates_default_menu_entry(self, path_is_file_path_mock: MagicMock):
         default_kernel_name: str = 'linux-custom'
         default_unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
         self._kernel_os_helper_mock.get_default_kernel_name.return_value = default_kernel_name
@@ -273,8 +289,6 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         self._kernel_os_helper_mock.get_os_pretty_name.return_value = os_pretty_name
         self._kernel_os_helper_mock.get_kernel_version.return_value = kernel_version
         path_is_file_path_mock.return_value = True
-        file_mock: Mock = MagicMock()
-        open_patch_mock.return_value = file_mock
         entry_content: str = textwrap.dedent(f'''
             title {os_pretty_name}
             machine-id {machine_id}
@@ -292,8 +306,7 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         self._kernel_os_helper_mock.get_kernel_version.assert_called_once_with(
             default_kernel_name
         )
-        open_patch_mock.assert_called_once_with(default_entry_file_path, 'w')
-        file_mock.__enter__.return_value.write.assert_called_once_with(entry_content)
+        self._file_transaction_mock.write_text.assert_called_once_with(default_entry_file_path, entry_content)
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call(f'updating default bootloader entry: {default_entry_file_path}', CliPrintHelper.Status.PENDING),
             call(f'updated default bootloader entry: {default_entry_file_path}', CliPrintHelper.Status.SUCCESS)
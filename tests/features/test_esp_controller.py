@@ -0,0 +1,75 @@
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from tests import unittest_helper
+
+
+class TestEspController(unittest_helper.ControllerTestCase):
+    FEATURE_NAME: str = 'esp'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self._config_mock.configure_mock(esp_path=Path('/efi'))
+        self._kernel_os_helper_mock.get_kernel_names.return_value = ['linux', 'linux-lts']
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+        self._kernel_os_helper_mock.get_unified_kernel_image_input_paths.return_value = {}
+        self._kernel_os_helper_mock.get_unified_kernel_image_options.return_value = {}
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.return_value = 40 * 1024 * 1024
+        self._kernel_os_helper_mock.get_esp_usage.return_value = {
+            'total': 260 * 1024 * 1024, 'free': 100 * 1024 * 1024, 'block_size': 4096
+        }
+        self._build_cache_helper_mock.get_changes.side_effect = lambda image_path, input_records, options: [
+            {'subject': 'input', 'name': 'kernel', 'message': 'input "kernel" changed'}
+        ] if 'lts' not in str(image_path) else []
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_plan_if_no_kernel_name_given_it_lists_all_kernels(self, stdout_mock: MagicMock):
+        self._controller.plan()
+
+        self.assertEqual(f'''{"Kernel-Name":35} {"Status":12} {"Installed":>12} {"Predicted":>12}
+{"---":35} {"---":12} {"---":>12} {"---":>12}
+{"linux":35} {"rebuild":12} {"0 B":>12} {"40.0 MiB":>12}
+{"linux-lts":35} {"up to date":12} {"0 B":>12} {"-":>12}
+
+ESP "/efi": 260.0 MiB total, 100.0 MiB free, 40.0 MiB required''',
+            stdout_mock.getvalue().rstrip()
+        )
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.assert_called_once_with('linux')
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_plan_if_force_and_concurrent_it_requires_space_for_all_images(self, stdout_mock: MagicMock):
+        self._controller.plan(force=True)
+
+        self.assertIn('80.0 MiB required', stdout_mock.getvalue())
+        self._build_cache_helper_mock.get_changes.assert_not_called()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_plan_if_images_do_not_fit_it_raises_an_error(self, _: MagicMock):
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.return_value = 120 * 1024 * 1024
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.plan(['linux'])
+
+        self.assertEqual(
+            'not enough space on ESP "/efi": 120.0 MiB required, 100.0 MiB available',
+            context_manager.exception.message
+        )
+
+    def test_plan_if_invalid_number_of_jobs_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.plan(jobs=0)
+
+        self.assertEqual(
+            'invalid number of jobs: 0',
+            context_manager.exception.message
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
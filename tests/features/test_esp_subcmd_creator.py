@@ -0,0 +1,14 @@
+import unittest
+
+from tests import unittest_helper
+
+
+class TestEspSubcmdCreatorController(unittest_helper.SubCmdCreatorTestCase):
+    FEATURE_NAME: str = 'esp'
+    SUBCOMMAND_DATA: list = [
+        {'name': 'esp:plan', 'help_message': 'check if unified kernel images fit on ESP'},
+    ]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,14 @@
+import threading
 import unittest
 from io import StringIO
 from pathlib import Path
 from unittest.mock import MagicMock
+from unittest.mock import Mock
 from unittest.mock import call
 from unittest.mock import patch
 
 from secbootctl.core import AppError
+from secbootctl.env import Env
 from secbootctl.helpers.cli import CliPrintHelper
 from tests import unittest_helper
 
@@ -14,31 +17,21 @@ class TestFileController(unittest_helper.ControllerTestCase):
     FEATURE_NAME: str = 'file'
 
     @patch('sys.stdout', new_callable=StringIO)
-    @patch('secbootctl.features.file.Path.is_dir')
-    @patch('secbootctl.features.file.glob')
-    def test_list_if_not_all_it_lists_only_efi_files(self, glob_patch_mock: MagicMock, path_is_dir_patch_mock,
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_if_not_all_it_lists_only_efi_files(self, file_walker_helper_patch_mock: MagicMock,
                                                      stdout_mock: MagicMock):
         esp_path = Path('/boot/efi')
         self._config_mock.configure_mock(esp_path=esp_path)
-        glob_patch_mock.glob.side_effect = [
-            [
-                f'{esp_path}/EFI/Linux/test.efi',
-                f'{esp_path}/EFI/Linux/test2.efi',
-                f'{esp_path}/test3.efi'
-            ],
-            [
-                f'{esp_path}/EFI/BOOT/boot.EFI',
-            ]
-        ]
-        path_is_dir_patch_mock.return_value = False
+        file_walker_helper_patch_mock.return_value.walk.return_value = iter([
+            esp_path / 'EFI/BOOT/boot.EFI', esp_path / 'EFI/Linux/test.efi', esp_path / 'EFI/Linux/test2.efi',
+            esp_path / 'test3.efi'
+        ])
         self._sb_helper_mock.verify_file.side_effect = [True, False, True, True]
 
-        self._controller.list(False)
+        self._controller.list(False, True)
 
-        glob_patch_mock.glob.assert_has_calls([
-            call(str(esp_path / '**' / '*.efi'), recursive=True),
-            call(str(esp_path / '**' / '*.EFI'), recursive=True)
-        ])
+        file_walker_helper_patch_mock.assert_called_once_with(esp_path)
+        file_walker_helper_patch_mock.return_value.walk.assert_called_once_with(['.efi'])
 
         self.assertEqual(f'''{esp_path}/EFI/BOOT/boot.EFI
 {"Status":>10} \u2714 signed
@@ -47,32 +40,24 @@ class TestFileController(unittest_helper.ControllerTestCase):
 {esp_path}/EFI/Linux/test2.efi
 {"Status":>10} \u2714 signed
 {esp_path}/test3.efi
-{"Status":>10} \u2714 signed
-        '''.rstrip(),
+{"Status":>10} \u2714 signed''',
                          stdout_mock.getvalue().rstrip()
                          )
 
     @patch('sys.stdout', new_callable=StringIO)
-    @patch('secbootctl.features.file.Path.is_dir')
-    @patch('secbootctl.features.file.glob')
-    def test_list_if_all_it_lists_all_files(self, glob_patch_mock: MagicMock, path_is_dir_patch_mock,
-                                            stdout_mock: MagicMock):
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_if_all_it_lists_all_files(self, file_walker_helper_patch_mock: MagicMock, stdout_mock: MagicMock):
         esp_path = Path('/boot/efi')
         self._config_mock.configure_mock(esp_path=esp_path)
-        glob_patch_mock.glob.return_value = [
-            f'{esp_path}/EFI/Linux/test.efi',
-            f'{esp_path}/EFI/Linux/test2.efi',
-            f'{esp_path}/EFI/Linux/test4.txt',
-            f'{esp_path}/test3.efi'
-        ]
-        path_is_dir_patch_mock.return_value = False
+        file_walker_helper_patch_mock.return_value.walk.return_value = iter([
+            esp_path / 'EFI/Linux/test.efi', esp_path / 'EFI/Linux/test2.efi', esp_path / 'EFI/Linux/test4.txt',
+            esp_path / 'test3.efi'
+        ])
         self._sb_helper_mock.verify_file.side_effect = [True, False, False, True]
 
-        self._controller.list(True)
+        self._controller.list(True, True)
 
-        glob_patch_mock.glob.assert_called_once_with(
-            str(esp_path / '**' / '*'), recursive=True
-        )
+        file_walker_helper_patch_mock.return_value.walk.assert_called_once_with(None)
 
         self.assertEqual(f'''{esp_path}/EFI/Linux/test.efi
 {"Status":>10} \u2714 signed
@@ -81,17 +66,172 @@ class TestFileController(unittest_helper.ControllerTestCase):
 {esp_path}/EFI/Linux/test4.txt
 {"Status":>10} \u2717 not signed
 {esp_path}/test3.efi
+{"Status":>10} \u2714 signed''',
+                         stdout_mock.getvalue().rstrip()
+                         )
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.features.file.SignatureCacheHelper')
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_if_cache_used_it_verifies_files_with_signature_cache(
+        self, file_walker_helper_patch_mock: MagicMock, signature_cache_helper_patch_mock: MagicMock,
+        stdout_mock: MagicMock
+    ):
+        esp_path = Path('/boot/efi')
+        self._config_mock.configure_mock(esp_path=esp_path)
+        self._sb_helper_mock.configure_mock(db_cert_file_path=Path('/etc/secbootctl/keys/db.crt'))
+        file_walker_helper_patch_mock.return_value.walk.return_value = iter([
+            esp_path / 'EFI/Linux/test.efi', esp_path / 'test2.efi'
+        ])
+        signature_cache_helper_mock: Mock = signature_cache_helper_patch_mock.return_value
+        signature_cache_helper_mock.configure_mock(hits=1, misses=1)
+        signature_cache_helper_mock.verify_file.side_effect = [True, False]
+
+        self._controller.list(True)
+
+        signature_cache_helper_patch_mock.assert_called_once_with(
+            Env.SIGNATURE_CACHE_FILE_PATH, Path('/etc/secbootctl/keys/db.crt')
+        )
+        signature_cache_helper_mock.verify_file.assert_has_calls([
+            call(Path(f'{esp_path}/EFI/Linux/test.efi'), self._sb_helper_mock.verify_file),
+            call(Path(f'{esp_path}/test2.efi'), self._sb_helper_mock.verify_file)
+        ])
+        signature_cache_helper_mock.save.assert_called_once_with(True)
+        self._sb_helper_mock.verify_file.assert_not_called()
+        self.assertEqual(f'''{esp_path}/EFI/Linux/test.efi
 {"Status":>10} \u2714 signed
-        '''.rstrip(),
+{esp_path}/test2.efi
+{"Status":>10} \u2717 not signed
+
+Signature cache: 1 hits, 1 misses''',
                          stdout_mock.getvalue().rstrip()
                          )
 
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_if_verified_concurrently_it_prints_files_in_given_order(
+        self, file_walker_helper_patch_mock: MagicMock, stdout_mock: MagicMock
+    ):
+        esp_path = Path('/boot/efi')
+        file_paths: list = [esp_path / f'test{number}.efi' for number in range(6)]
+        self._config_mock.configure_mock(esp_path=esp_path)
+        file_walker_helper_patch_mock.return_value.walk.return_value = iter(file_paths)
+        verify_events: dict = {file_path: threading.Event() for file_path in file_paths}
+
+        def verify_file(file_path: Path) -> bool:
+            # the first file is verified last, all others in reverse order
+            if file_path == file_paths[0]:
+                verify_events[file_paths[1]].wait(5)
+            elif file_path != file_paths[-1]:
+                verify_events[file_paths[file_paths.index(file_path) + 1]].wait(5)
+
+            verify_events[file_path].set()
+
+            return file_path.name != 'test3.efi'
+
+        self._sb_helper_mock.verify_file.side_effect = verify_file
+
+        self._controller.list(False, True, 6)
+
+        self.assertEqual(
+            [str(file_path) for file_path in file_paths],
+            stdout_mock.getvalue().splitlines()[::2]
+        )
+        self.assertEqual(
+            ['\u2714 signed', '\u2714 signed', '\u2714 signed', '\u2717 not signed', '\u2714 signed', '\u2714 signed'],
+            [line.strip().split(' ', 1)[1] for line in stdout_mock.getvalue().splitlines()[1::2]]
+        )
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_it_prints_file_records(self, file_walker_helper_patch_mock: MagicMock, _: MagicMock):
+        file_path: Path = Path('/boot/efi/test.efi')
+        self._config_mock.configure_mock(esp_path=Path('/boot/efi'))
+        file_walker_helper_patch_mock.return_value.walk.return_value = iter([file_path])
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.list(False, True, 1)
+
+        record_type, record, text = self._cli_print_helper_mock.print_record.call_args.args
+
+        self.assertEqual('file', record_type)
+        self.assertEqual(
+            {'step': 'verifying signature', 'target': str(file_path), 'signed': True},
+            {key: value for key, value in record.items() if key != 'duration'}
+        )
+        self.assertGreaterEqual(record['duration'], 0)
+
+    @patch('secbootctl.features.file.FileWalkerHelper')
+    def test_list_if_jobs_invalid_it_raises_an_error(self, file_walker_helper_patch_mock: MagicMock):
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.list(False, True, 0)
+
+        self.assertEqual('invalid number of jobs: 0', context_manager.exception.message)
+        file_walker_helper_patch_mock.assert_not_called()
+
+    @patch('secbootctl.features.file.FileManifestHelper')
+    def test_baseline_it_saves_manifest_of_esp(self, file_manifest_helper_patch_mock: MagicMock):
+        self._config_mock.configure_mock(esp_path=Path('/boot/efi'))
+        file_manifest_helper_mock: Mock = file_manifest_helper_patch_mock.return_value
+        file_manifest_helper_mock.create.return_value = {'EFI/Linux/linux.efi': 'a' * 64}
+
+        self._controller.baseline(None, 2)
+
+        file_manifest_helper_mock.create.assert_called_once_with(Path('/boot/efi'), 2)
+        file_manifest_helper_mock.save.assert_called_once_with(
+            {'EFI/Linux/linux.efi': 'a' * 64}, Env.ESP_MANIFEST_FILE_PATH
+        )
+        self._cli_print_helper_mock.print_status.assert_has_calls([
+            call(f'recording ESP baseline: {Env.ESP_MANIFEST_FILE_PATH}', CliPrintHelper.Status.PENDING),
+            call(f'recorded ESP baseline: {Env.ESP_MANIFEST_FILE_PATH} (1 files)', CliPrintHelper.Status.SUCCESS)
+        ])
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.features.file.FileManifestHelper')
+    def test_audit_if_esp_differs_it_lists_changes_and_raises_an_error(self, file_manifest_helper_patch_mock: MagicMock,
+                                                                      stdout_mock: MagicMock):
+        self._config_mock.configure_mock(esp_path=Path('/boot/efi'))
+        file_manifest_helper_mock: Mock = file_manifest_helper_patch_mock.return_value
+        file_manifest_helper_mock.compare.return_value = [
+            ('EFI/BOOT/BOOTX64.EFI', 'modified'), ('EFI/evil.efi', 'added')
+        ]
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.audit('/tmp/other-host.sha256')
+
+        file_manifest_helper_mock.load.assert_called_once_with(Path('/tmp/other-host.sha256'))
+        file_manifest_helper_mock.compare.assert_called_once_with(
+            file_manifest_helper_mock.load.return_value, file_manifest_helper_mock.create.return_value
+        )
+        self.assertEqual(
+            f'{"modified":10} /boot/efi/EFI/BOOT/BOOTX64.EFI\n{"added":10} /boot/efi/EFI/evil.efi',
+            stdout_mock.getvalue().rstrip()
+        )
+        self.assertEqual(
+            'ESP differs from baseline "/tmp/other-host.sha256": 1 added, 0 removed, 1 modified',
+            context_manager.exception.message
+        )
+
+    @patch('secbootctl.features.file.FileManifestHelper')
+    def test_audit_if_esp_matches_it_prints_success(self, file_manifest_helper_patch_mock: MagicMock):
+        file_manifest_helper_mock: Mock = file_manifest_helper_patch_mock.return_value
+        file_manifest_helper_mock.load.return_value = {'EFI/Linux/linux.efi': 'a' * 64}
+        file_manifest_helper_mock.compare.return_value = []
+
+        self._controller.audit()
+
+        file_manifest_helper_mock.load.assert_called_once_with(Env.ESP_MANIFEST_FILE_PATH)
+        self._cli_print_helper_mock.print_status.assert_called_once_with(
+            f'ESP matches baseline: {Env.ESP_MANIFEST_FILE_PATH} (1 files)', CliPrintHelper.Status.SUCCESS
+        )
+
     def test_sign_it_signs_given_file(self):
         file_path: Path = Path('/tmp/file.efi')
         self._sb_helper_mock.sign_file.return_value = True
 
         self._controller.sign(str(file_path))
 
+        self._file_transaction_mock.stage.assert_called_once_with(file_path, True)
         self._sb_helper_mock.sign_file.assert_called_once_with(
             file_path, False
         )
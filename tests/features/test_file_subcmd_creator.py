@@ -7,6 +7,8 @@ class TestBootloaderSubcmdCreatorController(unittest_helper.SubCmdCreatorTestCas
     FEATURE_NAME: str = 'file'
     SUBCOMMAND_DATA: list = [
         {'name': 'file:list', 'help_message': 'list files on ESP with signing status'},
+        {'name': 'file:baseline', 'help_message': 'record integrity baseline of ESP'},
+        {'name': 'file:audit', 'help_message': 'compare ESP with integrity baseline'},
         {'name': 'file:sign', 'help_message': 'sign given file'},
         {'name': 'file:verify', 'help_message': 'verify signature of given file'},
     ]
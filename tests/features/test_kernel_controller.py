@@ -1,10 +1,13 @@
+import tempfile
 import unittest
 from pathlib import Path
+from unittest.mock import ANY
 from unittest.mock import call
 from unittest.mock import Mock
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+from secbootctl.core import AppError
 from secbootctl.helpers.cli import CliPrintHelper
 from tests import unittest_helper
 
@@ -13,6 +16,26 @@ from tests import unittest_helper
 class TestKernelController(unittest_helper.ControllerTestCase):
     FEATURE_NAME: str = 'kernel'
 
+    def setUp(self) -> None:
+        super().setUp()
+        self._input_file_paths: dict = {'kernel': Path('/boot/vmlinuz-linux'), 'stub': Path('/tmp/linuxx64.efi.stub')}
+        self._cert_file_path: Path = Path('/tmp/keys/db.crt')
+        self._options: dict = {'unified_kernel_image_builder': 'native'}
+        self._kernel_os_helper_mock.get_unified_kernel_image_input_paths.return_value = self._input_file_paths
+        self._kernel_os_helper_mock.get_unified_kernel_image_options.return_value = self._options
+        self._sb_helper_mock.configure_mock(db_cert_file_path=self._cert_file_path)
+        self._build_cache_helper_mock.get_changes.return_value = [
+            {'subject': 'input', 'name': 'kernel', 'message': 'input "kernel" changed: /boot/vmlinuz-linux'}
+        ]
+        self._kernel_os_helper_mock.build_unified_kernel_image.return_value = {
+            'duration': 1.234, 'bytes_written': 47 * 1024 * 1024, 'layout': 'computed', 'image_size': 48 * 1024 * 1024
+        }
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.return_value = 47 * 1024 * 1024
+        self._kernel_os_helper_mock.get_esp_usage.return_value = {
+            'total': 512 * 1024 * 1024, 'free': 256 * 1024 * 1024, 'block_size': 4096
+        }
+        self._config_mock.configure_mock(esp_path=Path('/efi'))
+
     def test_install_if_kernel_name_given_it_installs_unified_image(self):
         kernel_name: str = 'linux-custom'
         unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
@@ -20,7 +43,7 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         self._sb_helper_mock.sign_file.return_value = True
         self._sb_helper_mock.verify_file.return_value = True
 
-        self._controller.install(kernel_name)
+        self._controller.install([kernel_name])
 
         self._kernel_os_helper_mock.get_unified_kernel_image_path.assert_called_once_with(
             kernel_name
@@ -36,7 +59,8 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         )
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call(f'building unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
-            call(f'built unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS),
+            call(f'built unified kernel image: {unified_kernel_image_path} '
+                 f'(computed layout, image size 48.0 MiB, 1.23 s, 47.0 MiB written)', CliPrintHelper.Status.SUCCESS),
             call(f'signing: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
             call(f'signed: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS),
             call(f'verifying signature: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
@@ -68,13 +92,325 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         )
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call(f'building unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
-            call(f'built unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS),
+            call(f'built unified kernel image: {unified_kernel_image_path} '
+                 f'(computed layout, image size 48.0 MiB, 1.23 s, 47.0 MiB written)', CliPrintHelper.Status.SUCCESS),
             call(f'signing: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
             call(f'signed: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS),
             call(f'verifying signature: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
             call(f'valid signature: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS)
         ])
 
+    def test_install_it_records_inputs_in_build_manifest(self):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        input_records: dict = self._build_cache_helper_mock.get_input_records.return_value
+
+        self._controller.install([kernel_name])
+
+        self._build_cache_helper_mock.get_input_records.assert_called_once_with(
+            unified_kernel_image_path, {**self._input_file_paths, 'cert': self._cert_file_path}
+        )
+        self._build_cache_helper_mock.get_changes.assert_called_once_with(
+            unified_kernel_image_path, input_records, self._options
+        )
+        # the records taken before building are stored, not the inputs as they are after building
+        self._build_cache_helper_mock.update.assert_called_once_with(
+            unified_kernel_image_path, input_records, self._options
+        )
+
+    def test_install_if_up_to_date_it_skips_build(self):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._build_cache_helper_mock.get_changes.return_value = []
+
+        self._controller.install([kernel_name])
+
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_not_called()
+        self._sb_helper_mock.sign_file.assert_not_called()
+        self._build_cache_helper_mock.update.assert_not_called()
+        self._cli_print_helper_mock.print_status.assert_called_once_with(
+            f'unified kernel image is up to date: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS
+        )
+
+    def test_install_if_force_it_builds_without_checking_build_manifest(self):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install([kernel_name], force=True)
+
+        self._build_cache_helper_mock.get_changes.assert_not_called()
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_called_once_with(
+            kernel_name, unified_kernel_image_path
+        )
+
+    def test_install_if_explain_it_prints_reasons_for_rebuild(self):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install([kernel_name], explain=True)
+
+        self._cli_print_helper_mock.print_status.assert_has_calls([
+            call('rebuild required, input "kernel" changed: /boot/vmlinuz-linux', CliPrintHelper.Status.PENDING),
+            call(f'building unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING)
+        ])
+
+    def test_install_it_builds_and_signs_staged_unified_image(self):
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        staged_file_path: Path = Path('/tmp/EFI/Linux/.linux-custom.efi.secbootctl.tmp')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._file_transaction_mock.stage.side_effect = None
+        self._file_transaction_mock.stage.return_value = staged_file_path
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(['linux-custom'])
+
+        self._file_transaction_mock.stage.assert_called_once_with(unified_kernel_image_path)
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_called_once_with(
+            'linux-custom', staged_file_path
+        )
+        self._sb_helper_mock.sign_file.assert_called_once_with(staged_file_path, False)
+        self._sb_helper_mock.verify_file.assert_called_once_with(staged_file_path)
+        self._cli_print_helper_mock.print_status.assert_any_call(
+            f'signed: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS
+        )
+
+    def test_install_if_only_initramfs_changed_it_patches_initrd_of_installed_image(self):
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._kernel_os_helper_mock.patch_unified_kernel_image_initrd.return_value = {
+            'duration': 0.1, 'bytes_written': 1024
+        }
+        self._build_cache_helper_mock.get_changes.return_value = [
+            {'subject': 'input', 'name': 'initramfs', 'message': 'input "initramfs" changed: /boot/initramfs.img'},
+            {'subject': 'input', 'name': 'microcode', 'message': 'input "microcode" changed: /boot/ucode.img'}
+        ]
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(['linux-custom'])
+
+        self._kernel_os_helper_mock.patch_unified_kernel_image_initrd.assert_called_once_with(
+            'linux-custom', unified_kernel_image_path, unified_kernel_image_path
+        )
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_not_called()
+        self._cli_print_helper_mock.print_status.assert_any_call(
+            f'updated initrd of unified kernel image: {unified_kernel_image_path} (0.10 s, 1.0 KiB written)',
+            CliPrintHelper.Status.SUCCESS
+        )
+        self._sb_helper_mock.sign_file.assert_called_once_with(unified_kernel_image_path, False)
+        self._build_cache_helper_mock.update.assert_called_once()
+
+    def test_install_if_initrd_can_not_be_patched_it_builds_image(self):
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._kernel_os_helper_mock.patch_unified_kernel_image_initrd.return_value = None
+        self._build_cache_helper_mock.get_changes.return_value = [
+            {'subject': 'input', 'name': 'initramfs', 'message': 'input "initramfs" changed: /boot/initramfs.img'}
+        ]
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(['linux-custom'])
+
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_called_once_with(
+            'linux-custom', unified_kernel_image_path
+        )
+
+    def test_install_if_kernel_and_initramfs_changed_it_builds_image(self):
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._build_cache_helper_mock.get_changes.return_value = [
+            {'subject': 'input', 'name': 'kernel', 'message': 'input "kernel" changed: /boot/vmlinuz-linux'},
+            {'subject': 'input', 'name': 'initramfs', 'message': 'input "initramfs" changed: /boot/initramfs.img'}
+        ]
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(['linux-custom'])
+
+        self._kernel_os_helper_mock.patch_unified_kernel_image_initrd.assert_not_called()
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_called_once()
+
+    def test_install_if_verification_fails_it_rolls_back_and_raises_an_error(self):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = Path('/tmp/EFI/Linux/linux-custom.efi')
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = unified_kernel_image_path
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = False
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.install([kernel_name])
+
+        self.assertEqual(
+            f'unified kernel image has an invalid signature and was not installed: {unified_kernel_image_path}',
+            context_manager.exception.message
+        )
+        self.assertIs(
+            AppError,
+            self._file_transaction_helper_mock.begin.return_value.__exit__.call_args.args[0]
+        )
+        self._build_cache_helper_mock.update.assert_not_called()
+
+    def test_install_if_multiple_kernel_names_given_it_installs_all_of_them_grouped(self):
+        kernel_names: list = ['linux', 'linux-lts', 'linux']
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(kernel_names, jobs=2)
+
+        self.assertEqual(
+            [call('linux', Path('/tmp/EFI/Linux/linux.efi')), call('linux-lts', Path('/tmp/EFI/Linux/linux-lts.efi'))],
+            sorted(self._kernel_os_helper_mock.build_unified_kernel_image.call_args_list)
+        )
+        self.assertEqual(
+            [call('kernel: linux'), call('kernel: linux-lts')],
+            sorted(self._cli_print_helper_mock.group.call_args_list)
+        )
+        self.assertEqual(
+            2,
+            self._sb_helper_mock.sign_file.call_count
+        )
+
+    def test_install_if_all_kernels_it_installs_all_kernels_found(self):
+        self._kernel_os_helper_mock.get_kernel_names.return_value = ['linux', 'linux-lts']
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        self._controller.install(all_kernels=True)
+
+        self._kernel_os_helper_mock.get_default_kernel_name.assert_not_called()
+        self.assertEqual(
+            [call('linux', Path('/tmp/EFI/Linux/linux.efi')), call('linux-lts', Path('/tmp/EFI/Linux/linux-lts.efi'))],
+            sorted(self._kernel_os_helper_mock.build_unified_kernel_image.call_args_list)
+        )
+
+    def test_install_if_some_kernels_fail_it_installs_others_and_raises_an_error(self):
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+        self._sb_helper_mock.sign_file.side_effect = lambda file_path, use_security_token: 'lts' not in str(file_path)
+        self._sb_helper_mock.verify_file.return_value = True
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.install(['linux', 'linux-lts', 'linux-zen'])
+
+        self.assertEqual(
+            'failed to install kernels: linux-lts',
+            context_manager.exception.message
+        )
+        self._cli_print_helper_mock.print_status.assert_any_call(
+            'failed to sign: /tmp/EFI/Linux/linux-lts.efi', CliPrintHelper.Status.ERROR
+        )
+        self.assertEqual(
+            2,
+            self._build_cache_helper_mock.update.call_count
+        )
+
+    def test_install_if_kernel_fails_with_os_error_it_installs_others_and_raises_an_error(self):
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+
+        def build_unified_kernel_image(kernel_name: str, unified_kernel_image_path: Path) -> dict:
+            if kernel_name == 'linux-lts':
+                raise OSError(5, 'Input/output error', str(unified_kernel_image_path))
+
+            return {'duration': 1.0, 'bytes_written': 1024, 'layout': 'computed', 'image_size': 4096}
+
+        self._kernel_os_helper_mock.build_unified_kernel_image.side_effect = build_unified_kernel_image
+        self._sb_helper_mock.sign_file.return_value = True
+        self._sb_helper_mock.verify_file.return_value = True
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.install(['linux', 'linux-lts'])
+
+        self.assertEqual(
+            'failed to install kernels: linux-lts',
+            context_manager.exception.message
+        )
+        self._cli_print_helper_mock.print_status.assert_any_call(
+            "[Errno 5] Input/output error: '/tmp/EFI/Linux/linux-lts.efi'", CliPrintHelper.Status.ERROR
+        )
+        self._build_cache_helper_mock.update.assert_called_once_with(
+            Path('/tmp/EFI/Linux/linux.efi'), ANY, ANY
+        )
+
+    def test_install_if_images_do_not_fit_on_esp_it_stops_before_building(self):
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+            f'/tmp/EFI/Linux/{kernel_name}.efi'
+        )
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.return_value = 150 * 1024 * 1024
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.install(['linux', 'linux-lts'])
+
+        self.assertEqual(
+            'not enough space on ESP "/efi": 300.0 MiB required, 256.0 MiB available',
+            context_manager.exception.message
+        )
+        self._cli_print_helper_mock.print_status.assert_has_calls([
+            call('linux: 150.0 MiB required, replaces 0 B', CliPrintHelper.Status.ERROR),
+            call('linux-lts: 150.0 MiB required, replaces 0 B', CliPrintHelper.Status.ERROR)
+        ])
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_not_called()
+
+    def test_install_if_sequential_it_counts_space_of_replaced_images(self):
+        with tempfile.TemporaryDirectory() as temp_dir_path:
+            self._kernel_os_helper_mock.get_unified_kernel_image_path.side_effect = lambda kernel_name: Path(
+                temp_dir_path, f'{kernel_name}.efi'
+            )
+
+            for kernel_name in ['linux', 'linux-lts']:
+                with open(Path(temp_dir_path, f'{kernel_name}.efi'), 'wb') as file:
+                    file.truncate(140 * 1024 * 1024)
+
+            self._kernel_os_helper_mock.predict_unified_kernel_image_size.return_value = 150 * 1024 * 1024
+            self._sb_helper_mock.sign_file.return_value = True
+            self._sb_helper_mock.verify_file.return_value = True
+
+            self._controller.install(['linux', 'linux-lts'], jobs=1)
+
+        self.assertEqual(
+            2,
+            self._kernel_os_helper_mock.build_unified_kernel_image.call_count
+        )
+
+    def test_install_if_up_to_date_it_does_not_predict_image_size(self):
+        self._kernel_os_helper_mock.get_unified_kernel_image_path.return_value = Path('/tmp/EFI/Linux/linux.efi')
+        self._build_cache_helper_mock.get_changes.return_value = []
+
+        self._controller.install(['linux'])
+
+        self._kernel_os_helper_mock.predict_unified_kernel_image_size.assert_not_called()
+
+    def test_install_if_invalid_number_of_jobs_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.install(['linux', 'linux-lts'], jobs=0)
+
+        self.assertEqual(
+            'invalid number of jobs: 0',
+            context_manager.exception.message
+        )
+        self._kernel_os_helper_mock.build_unified_kernel_image.assert_not_called()
+
     @patch('secbootctl.features.kernel.Path')
     def test_remove_if_kernel_name_given_it_removes_unified_image(self, path_patch_mock: MagicMock):
         kernel_name: str = 'linux-custom'
@@ -91,6 +427,9 @@ class TestKernelController(unittest_helper.ControllerTestCase):
         path_mock.unlink.assert_called_once_with(
             missing_ok=True
         )
+        self._build_cache_helper_mock.remove.assert_called_once_with(
+            unified_kernel_image_path
+        )
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call(f'removing unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.PENDING),
             call(f'removed unified kernel image: {unified_kernel_image_path}', CliPrintHelper.Status.SUCCESS)
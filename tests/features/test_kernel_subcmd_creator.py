@@ -6,7 +6,7 @@ from tests import unittest_helper
 class TestBootloaderSubcmdCreatorController(unittest_helper.SubCmdCreatorTestCase):
     FEATURE_NAME: str = 'kernel'
     SUBCOMMAND_DATA: list = [
-        {'name': 'kernel:install', 'help_message': 'install given or default kernel'},
+        {'name': 'kernel:install', 'help_message': 'install given, all or default kernel'},
         {'name': 'kernel:remove', 'help_message': 'remove given or default kernel'},
     ]
 
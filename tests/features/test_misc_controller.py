@@ -0,0 +1,41 @@
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.env import Env
+from secbootctl.helpers.cli import CliPrintHelper
+from tests import unittest_helper
+
+
+class TestMiscController(unittest_helper.ControllerTestCase):
+    FEATURE_NAME: str = 'misc'
+
+    @patch('secbootctl.features.misc.SignAgentHelper')
+    def test_sign_agent_it_serves_with_digest_signer(self, sign_agent_helper_patch_mock: MagicMock):
+        self._config_mock.configure_mock(use_security_token=True)
+
+        self._controller.sign_agent(300)
+
+        self._sb_helper_mock.get_digest_signer.assert_called_once_with(True)
+        sign_agent_helper_patch_mock.assert_called_once_with(Env.SIGN_AGENT_SOCKET_PATH)
+        sign_agent_helper_patch_mock.return_value.serve.assert_called_once_with(
+            self._sb_helper_mock.get_digest_signer.return_value, 300
+        )
+        self._cli_print_helper_mock.print_status.assert_has_calls([
+            call(f'sign agent listening on: {Env.SIGN_AGENT_SOCKET_PATH}', CliPrintHelper.Status.PENDING),
+            call('sign agent stopped', CliPrintHelper.Status.SUCCESS)
+        ])
+
+    @patch('secbootctl.features.misc.SignAgentHelper')
+    def test_sign_agent_if_idle_timeout_invalid_it_raises_an_error(self, sign_agent_helper_patch_mock: MagicMock):
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.sign_agent(0)
+
+        self.assertEqual('invalid idle timeout: 0', context_manager.exception.message)
+        sign_agent_helper_patch_mock.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,14 @@
+import unittest
+
+from tests import unittest_helper
+
+
+class TestMiscSubcmdCreatorController(unittest_helper.SubCmdCreatorTestCase):
+    FEATURE_NAME: str = 'misc'
+    SUBCOMMAND_DATA: list = [
+        {'name': 'sign-agent', 'help_message': 'run agent holding the signing key'},
+    ]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from io import StringIO
 from pathlib import Path
@@ -7,6 +8,8 @@ from unittest.mock import patch
 
 from secbootctl.core import AppError
 from secbootctl.env import Env
+from secbootctl.features.pmi import PmiController
+from secbootctl.helpers.buildqueue import BuildQueueHelper
 from secbootctl.helpers.cli import CliPrintHelper
 from tests import unittest_helper
 
@@ -110,85 +113,30 @@ class TestPmiController(unittest_helper.ControllerTestCase):
         )
 
     @patch('sys.stdin', StringIO('linux'))
-    @patch('secbootctl.features.pmi.glob')
-    def test_hook_callback_pacman_update_if_no_systemd_update_it_signs_all_kernels(self, glob_patch_mock: MagicMock):
-        pm_name: str = 'pacman'
-        boot_path: Path = Path('/boot')
-        kernel_image_name_prefix: str = 'vmlinuz'
-        self._config_mock.configure_mock(
-            boot_path=boot_path, kernel_image_name_prefix=kernel_image_name_prefix, package_manager_name=pm_name
-        )
-        glob_patch_mock.glob.return_value = [
-            f'{boot_path}/{kernel_image_name_prefix}-linux',
-            f'{boot_path}/{kernel_image_name_prefix}-linux-lts',
-            f'{boot_path}/{kernel_image_name_prefix}-5.10.0.14-generic',
-        ]
+    def test_hook_callback_pacman_update_if_no_systemd_update_it_installs_all_kernels(self):
+        self._config_mock.configure_mock(package_manager_name='pacman')
 
         self._controller.hook_callback('update')
 
-        glob_patch_mock.glob.assert_called_once_with(
-            str(boot_path / (kernel_image_name_prefix + '-*'))
-        )
-        self._dispatcher_mock.dispatch.assert_has_calls([
-            call({
-                'module_name': 'secbootctl.features.kernel',
-                'controller_name': 'KernelController',
-                'action_name': 'install',
-                'params': {'kernel_name': 'linux'}
-            }),
-            call({
-                'module_name': 'secbootctl.features.kernel',
-                'controller_name': 'KernelController',
-                'action_name': 'install',
-                'params': {'kernel_name': 'linux-lts'}
-            }),
-            call({
-                'module_name': 'secbootctl.features.kernel',
-                'controller_name': 'KernelController',
-                'action_name': 'install',
-                'params': {'kernel_name': '5.10.0.14-generic'}
-            }),
-        ])
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.kernel',
+            'controller_name': 'KernelController',
+            'action_name': 'install',
+            'params': {'all_kernels': True}
+        })
 
     @patch('sys.stdin', StringIO('linux\nsystemd'))
-    @patch('secbootctl.features.pmi.glob')
-    def test_hook_callback_pacman_update_if_systemd_update_it_signs_all_kernels_and_updates_bootloader(self,
-                                                                                                       glob_patch_mock: MagicMock):
-        pm_name: str = 'pacman'
-        boot_path: Path = Path('/boot')
-        kernel_image_name_prefix: str = 'vmlinuz'
-        self._config_mock.configure_mock(
-            boot_path=boot_path, kernel_image_name_prefix=kernel_image_name_prefix, package_manager_name=pm_name
-        )
-        glob_patch_mock.glob.return_value = [
-            f'{boot_path}/{kernel_image_name_prefix}-linux',
-            f'{boot_path}/{kernel_image_name_prefix}-linux-lts',
-            f'{boot_path}/{kernel_image_name_prefix}-5.10.0.14-generic',
-        ]
+    def test_hook_callback_pacman_update_if_systemd_update_it_installs_all_kernels_and_updates_bootloader(self):
+        self._config_mock.configure_mock(package_manager_name='pacman')
 
         self._controller.hook_callback('update')
 
-        glob_patch_mock.glob.assert_called_once_with(
-            str(boot_path / (kernel_image_name_prefix + '-*'))
-        )
         self._dispatcher_mock.dispatch.assert_has_calls([
             call({
                 'module_name': 'secbootctl.features.kernel',
                 'controller_name': 'KernelController',
                 'action_name': 'install',
-                'params': {'kernel_name': 'linux'}
-            }),
-            call({
-                'module_name': 'secbootctl.features.kernel',
-                'controller_name': 'KernelController',
-                'action_name': 'install',
-                'params': {'kernel_name': 'linux-lts'}
-            }),
-            call({
-                'module_name': 'secbootctl.features.kernel',
-                'controller_name': 'KernelController',
-                'action_name': 'install',
-                'params': {'kernel_name': '5.10.0.14-generic'}
+                'params': {'all_kernels': True}
             }),
             call({
                 'module_name': 'secbootctl.features.bootloader',
@@ -198,6 +146,106 @@ class TestPmiController(unittest_helper.ControllerTestCase):
             })
         ])
 
+    @patch('sys.stdin', StringIO('usr/lib/modules/6.1.1-arch1-1/vmlinuz\nusr/lib/modules/6.1.1-arch1-1/vmlinuz\n'))
+    @patch('secbootctl.features.pmi.Path.read_text')
+    def test_hook_callback_pacman_update_if_kernel_updated_it_installs_only_this_kernel(
+        self, path_read_text_patch_mock: MagicMock
+    ):
+        self._config_mock.configure_mock(package_manager_name='pacman')
+        path_read_text_patch_mock.return_value = 'linux\n'
+
+        self._controller.hook_callback('update')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.kernel',
+            'controller_name': 'KernelController',
+            'action_name': 'install',
+            'params': {'kernel_names': ['linux']}
+        })
+
+    @patch('sys.stdin', StringIO('usr/lib/modules/6.1.1-arch1-1/vmlinuz\nsystemd\n'))
+    @patch('secbootctl.features.pmi.Path.read_text')
+    def test_hook_callback_pacman_update_if_deferred_it_queues_changes_and_starts_worker(
+        self, path_read_text_patch_mock: MagicMock
+    ):
+        self._create_build_queue('pacman')
+        self._config_mock.configure_mock(package_manager_hook_mode='deferred')
+        path_read_text_patch_mock.return_value = 'linux\n'
+
+        self._controller.hook_callback('update')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'background': True}
+        })
+        self.assertEqual(
+            {'kernel_names': ['linux'], 'all_kernels': False, 'bootloader': True},
+            BuildQueueHelper(self._build_queue_file_path).pop()[0]
+        )
+
+    @patch('sys.stdin', StringIO('usr/lib/modules/6.1.1-arch1-1/vmlinuz\n'))
+    @patch('secbootctl.features.pmi.Path.read_text')
+    def test_hook_callback_pacman_remove_if_deferred_it_removes_kernel_from_queue(
+        self, path_read_text_patch_mock: MagicMock
+    ):
+        self._create_build_queue('pacman')
+        self._config_mock.configure_mock(package_manager_hook_mode='deferred')
+        path_read_text_patch_mock.return_value = 'linux\n'
+        BuildQueueHelper(self._build_queue_file_path).add(['linux'])
+
+        self._controller.hook_callback('remove')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.kernel',
+            'controller_name': 'KernelController',
+            'action_name': 'remove',
+            'params': {'kernel_name': 'linux'}
+        })
+        self.assertEqual((None, 0.0), BuildQueueHelper(self._build_queue_file_path).pop())
+
+    @patch('sys.stdin', StringIO('usr/lib/modules/6.1.1-arch1-1/vmlinuz\nusr/lib/initcpio/install/base\n'))
+    @patch('secbootctl.features.pmi.Path.read_text')
+    def test_hook_callback_pacman_update_if_initcpio_updated_it_installs_all_kernels(
+        self, path_read_text_patch_mock: MagicMock
+    ):
+        self._config_mock.configure_mock(package_manager_name='pacman')
+        path_read_text_patch_mock.return_value = 'linux\n'
+
+        self._controller.hook_callback('update')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.kernel',
+            'controller_name': 'KernelController',
+            'action_name': 'install',
+            'params': {'all_kernels': True}
+        })
+
+    @patch('sys.stdin', StringIO('intel-ucode\n'))
+    def test_hook_callback_pacman_update_if_microcode_updated_it_installs_all_kernels(self):
+        self._config_mock.configure_mock(package_manager_name='pacman')
+
+        self._controller.hook_callback('update')
+
+        self.assertEqual(
+            {'all_kernels': True},
+            self._dispatcher_mock.dispatch.call_args.args[0]['params']
+        )
+
+    @patch('sys.stdin', StringIO('systemd\n'))
+    def test_hook_callback_pacman_update_if_only_systemd_updated_it_updates_only_bootloader(self):
+        self._config_mock.configure_mock(package_manager_name='pacman')
+
+        self._controller.hook_callback('update')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.bootloader',
+            'controller_name': 'BootloaderController',
+            'action_name': 'update',
+            'params': {}
+        })
+
     def test_hook_callback_pacman_update_if_not_supported_it_raises_an_error(self):
         pm_name: str = 'unknown'
         self._config_mock.configure_mock(package_manager_name=pm_name)
@@ -272,17 +320,20 @@ class TestPmiController(unittest_helper.ControllerTestCase):
         shutil_patch_mock.copy.assert_has_calls([
             call(hook_path / 'initramfs' / 'yy-secbootctl-update', Path('/etc/initramfs/post-update.d')),
             call(hook_path / 'kernel' / 'yy-secbootctl-update', Path('/etc/kernel/postinst.d')),
-            call(hook_path / 'kernel' / 'yy-secbootctl-remove', Path('/etc/kernel/postrm.d'))
+            call(hook_path / 'kernel' / 'yy-secbootctl-remove', Path('/etc/kernel/postrm.d')),
+            call(hook_path / 'apt.conf.d' / '99secbootctl', Path('/etc/apt/apt.conf.d'))
         ])
         shutil_patch_mock.chown.assert_has_calls([
             call(Path('/etc/initramfs/post-update.d') / 'yy-secbootctl-update', 'root', 'root'),
             call(Path('/etc/kernel/postinst.d') / 'yy-secbootctl-update', 'root', 'root'),
             call(Path('/etc/kernel/postrm.d') / 'yy-secbootctl-remove', 'root', 'root'),
+            call(Path('/etc/apt/apt.conf.d') / '99secbootctl', 'root', 'root')
         ])
         os_patch_mock.chmod.assert_has_calls([
             call(Path('/etc/initramfs/post-update.d') / 'yy-secbootctl-update', 0o700),
             call(Path('/etc/kernel/postinst.d') / 'yy-secbootctl-update', 0o700),
-            call(Path('/etc/kernel/postrm.d') / 'yy-secbootctl-remove', 0o700)
+            call(Path('/etc/kernel/postrm.d') / 'yy-secbootctl-remove', 0o700),
+            call(Path('/etc/apt/apt.conf.d') / '99secbootctl', 0o644)
         ])
         self._cli_print_helper_mock.print_status.assert_has_calls([
             call(f'installing hook files for package manager: {pm_name}', CliPrintHelper.Status.PENDING),
@@ -294,14 +345,15 @@ class TestPmiController(unittest_helper.ControllerTestCase):
         pm_name: str = 'apt'
         self._config_mock.configure_mock(package_manager_name=pm_name)
         path_mock: Mock = Mock()
-        path_patch_mock.side_effect = [path_mock, path_mock, path_mock]
+        path_patch_mock.side_effect = [path_mock, path_mock, path_mock, path_mock]
 
         self._controller.remove()
 
         path_patch_mock.assert_has_calls([
             call('/etc/initramfs/post-update.d/yy-secbootctl-update'),
             call('/etc/kernel/postinst.d/yy-secbootctl-update'),
-            call('/etc/kernel/postrm.d/yy-secbootctl-remove')
+            call('/etc/kernel/postrm.d/yy-secbootctl-remove'),
+            call('/etc/apt/apt.conf.d/99secbootctl')
         ])
         path_mock.unlink.assert_called_with(missing_ok=True)
 
@@ -310,24 +362,122 @@ class TestPmiController(unittest_helper.ControllerTestCase):
             call(f'removed hook files for package manager: {pm_name}', CliPrintHelper.Status.SUCCESS)
         ])
 
-    def test_hook_callback_apt_update_it_updates_given_kernel(self):
-        pm_name: str= 'apt'
+    def _create_build_queue(self, pm_name: str = 'apt') -> None:
         self._config_mock.configure_mock(package_manager_name=pm_name)
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self._build_queue_file_path: Path = Path(temp_dir.name) / 'build-queue.json'
+
+        for name, value in [('BUILD_QUEUE_FILE_PATH', self._build_queue_file_path),
+                            ('BUILD_QUEUE_LOG_FILE_PATH', Path(temp_dir.name) / 'secbootctl.log')]:
+            env_patcher = patch.object(Env, name, value)
+            env_patcher.start()
+            self.addCleanup(env_patcher.stop)
+
+    @patch.dict('secbootctl.features.pmi.os.environ', {'DPKG_FRONTEND_LOCKED': 'true'})
+    @patch('secbootctl.features.pmi.Path.is_file')
+    def test_hook_callback_apt_update_if_apt_transaction_it_queues_given_kernel_once(
+            self, path_is_file_patch_mock: MagicMock):
+        self._create_build_queue()
+        path_is_file_patch_mock.return_value = True
         kernel_name: str = '5.10.0.14-generic'
 
         self._controller.hook_callback('update', kernel_name)
+        self._controller.hook_callback('update', kernel_name)
+
+        self.assertEqual([kernel_name], BuildQueueHelper(self._build_queue_file_path).pop()[0]['kernel_names'])
+        self._dispatcher_mock.dispatch.assert_not_called()
+        self._cli_print_helper_mock.print_status.assert_called_with(
+            f'queued kernel: {kernel_name} (built at end of apt transaction)', CliPrintHelper.Status.SUCCESS
+        )
+
+    @patch.dict('secbootctl.features.pmi.os.environ', clear=True)
+    @patch('secbootctl.features.pmi.BuildQueueHelper.get_worker_pid')
+    def test_hook_callback_apt_update_if_no_apt_transaction_and_deferred_it_starts_one_delayed_worker(
+            self, get_worker_pid_patch_mock: MagicMock):
+        self._create_build_queue()
+        self._config_mock.configure_mock(package_manager_hook_mode='deferred')
+        # the worker started by the first call is running during the second one
+        get_worker_pid_patch_mock.side_effect = [None, 4242]
+
+        self._controller.hook_callback('update', '5.10.0.14-generic')
+        self._controller.hook_callback('update', '5.10.0.15-generic')
 
         self._dispatcher_mock.dispatch.assert_called_once_with({
-            'module_name': 'secbootctl.features.kernel',
-            'controller_name': 'KernelController',
-            'action_name': 'install',
-            'params': {'kernel_name': kernel_name}
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'delay': PmiController.APT_BUILD_DELAY, 'background': True}
+        })
+        self.assertEqual(['5.10.0.14-generic', '5.10.0.15-generic'],
+                         BuildQueueHelper(self._build_queue_file_path).pop()[0]['kernel_names'])
+
+    @patch.dict('secbootctl.features.pmi.os.environ', clear=True)
+    def test_hook_callback_apt_update_if_failed_jobs_queued_and_no_worker_running_it_starts_delayed_worker(self):
+        self._create_build_queue()
+        self._config_mock.configure_mock(package_manager_hook_mode='deferred')
+        BuildQueueHelper(self._build_queue_file_path).fail(
+            {'kernel_names': ['5.10.0.14-generic'], 'all_kernels': False, 'bootloader': False}, 'build failed'
+        )
+
+        self._controller.hook_callback('update', '5.10.0.15-generic')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'delay': PmiController.APT_BUILD_DELAY, 'background': True}
+        })
+        self.assertEqual(['5.10.0.14-generic', '5.10.0.15-generic'],
+                         BuildQueueHelper(self._build_queue_file_path).pop()[0]['kernel_names'])
+
+    @patch.dict('secbootctl.features.pmi.os.environ', clear=True)
+    @patch('secbootctl.features.pmi.BuildQueueHelper.get_worker_pid')
+    def test_hook_callback_apt_update_if_no_apt_transaction_it_builds_queued_kernels_in_foreground(
+            self, get_worker_pid_patch_mock: MagicMock):
+        self._create_build_queue()
+        kernel_name: str = '5.10.0.14-generic'
+
+        self._controller.hook_callback('update', kernel_name)
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'background': False}
+        })
+        get_worker_pid_patch_mock.assert_not_called()
+        self.assertEqual([kernel_name], BuildQueueHelper(self._build_queue_file_path).pop()[0]['kernel_names'])
+
+    def test_hook_callback_apt_flush_it_builds_queued_kernels(self):
+        self._create_build_queue()
+
+        self._controller.hook_callback('flush')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'background': False}
+        })
+
+    def test_hook_callback_apt_flush_if_deferred_it_builds_queued_kernels_in_background(self):
+        self._create_build_queue()
+        self._config_mock.configure_mock(package_manager_hook_mode='deferred')
+
+        self._controller.hook_callback('flush')
+
+        self._dispatcher_mock.dispatch.assert_called_once_with({
+            'module_name': 'secbootctl.features.queue',
+            'controller_name': 'QueueController',
+            'action_name': 'run',
+            'params': {'background': True}
         })
 
     def test_hook_callback_apt_remove_it_removes_given_kernel(self):
-        pm_name: str= 'apt'
-        self._config_mock.configure_mock(package_manager_name=pm_name)
+        self._create_build_queue()
         kernel_name: str = '5.10.0.14-generic'
+        BuildQueueHelper(self._build_queue_file_path).add([kernel_name])
 
         self._controller.hook_callback('remove', kernel_name)
 
@@ -337,6 +487,7 @@ class TestPmiController(unittest_helper.ControllerTestCase):
             'action_name': 'remove',
             'params': {'kernel_name': kernel_name}
         })
+        self.assertEqual((None, 0.0), BuildQueueHelper(self._build_queue_file_path).pop())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,210 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+from unittest.mock import ANY, MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.env import Env
+from secbootctl.helpers.buildqueue import BuildQueueHelper
+from secbootctl.helpers.cli import CliPrintHelper
+from tests import unittest_helper
+
+
+class TestQueueController(unittest_helper.ControllerTestCase):
+    FEATURE_NAME: str = 'queue'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._build_queue_file_path: Path = self._temp_path / 'build-queue.json'
+        self._env_patchers: list = [
+            patch.object(Env, 'BUILD_QUEUE_FILE_PATH', self._build_queue_file_path),
+            patch.object(Env, 'BUILD_QUEUE_LOG_FILE_PATH', self._temp_path / 'log' / 'secbootctl.log')
+        ]
+
+        for env_patcher in self._env_patchers:
+            env_patcher.start()
+
+        self._build_queue_helper: BuildQueueHelper = BuildQueueHelper(self._build_queue_file_path)
+
+    def tearDown(self) -> None:
+        for env_patcher in self._env_patchers:
+            env_patcher.stop()
+
+        self._temp_dir.cleanup()
+
+    def _get_forward_call(self, feature_name: str, action_name: str, params: dict) -> call:
+        return call({
+            'module_name': 'secbootctl.features.' + feature_name,
+            'controller_name': feature_name.capitalize() + 'Controller',
+            'action_name': action_name,
+            'params': params
+        })
+
+    def test_run_it_builds_queued_jobs_at_once(self):
+        self._build_queue_helper.add(['linux'])
+        self._build_queue_helper.add(['linux-lts', 'linux'], bootloader=True)
+
+        self._controller.run()
+
+        self.assertEqual([
+            self._get_forward_call('kernel', 'install', {'kernel_names': ['linux', 'linux-lts']}),
+            self._get_forward_call('bootloader', 'update', {})
+        ], self._dispatcher_mock.dispatch.call_args_list)
+        self.assertEqual((None, 0.0), self._build_queue_helper.pop())
+
+    def test_run_if_all_kernels_queued_it_installs_all_kernels(self):
+        self._build_queue_helper.add(['linux'], all_kernels=True)
+
+        self._controller.run()
+
+        self._dispatcher_mock.dispatch.assert_has_calls([
+            self._get_forward_call('kernel', 'install', {'all_kernels': True})
+        ])
+        self.assertEqual(1, self._dispatcher_mock.dispatch.call_count)
+
+    @patch('secbootctl.features.queue.time.sleep')
+    def test_run_if_recently_queued_it_waits_for_given_delay(self, sleep_patch_mock: MagicMock):
+        self._build_queue_helper.add(['linux'])
+        sleep_patch_mock.side_effect = self._backdate_build_queue
+
+        self._controller.run(2.0)
+
+        sleep_patch_mock.assert_called_once()
+        self.assertLessEqual(sleep_patch_mock.call_args.args[0], 2.0)
+        self._dispatcher_mock.dispatch.assert_called_once_with(
+            *self._get_forward_call('kernel', 'install', {'kernel_names': ['linux']}).args
+        )
+
+    def _backdate_build_queue(self, seconds: float) -> None:
+        build_queue: dict = json.loads(self._build_queue_file_path.read_text())
+        build_queue['updated'] -= seconds
+        self._build_queue_file_path.write_text(json.dumps(build_queue))
+
+    def test_run_if_build_fails_it_keeps_jobs_queued_and_records_error(self):
+        self._build_queue_helper.add(['linux'])
+        self._dispatcher_mock.dispatch.side_effect = AppError('signing failed')
+
+        with self.assertRaises(AppError):
+            self._controller.run()
+
+        build_queue: dict = self._build_queue_helper.get()
+        self.assertEqual((['linux'], 'signing failed'), (build_queue['kernel_names'], build_queue['error']))
+        self.assertIsNone(self._build_queue_helper.get_worker_pid())
+
+    def test_run_if_build_fails_with_other_error_or_interrupted_it_keeps_jobs_queued_and_records_error(self):
+        for error, error_message in [
+            (OSError(28, 'No space left on device'), '[Errno 28] No space left on device'),
+            (subprocess.CalledProcessError(1, 'sbsign'), "Command 'sbsign' returned non-zero exit status 1."),
+            (KeyboardInterrupt(), 'KeyboardInterrupt')
+        ]:
+            with self.subTest(error=error):
+                self._build_queue_helper.add(['linux'])
+                self._dispatcher_mock.dispatch.side_effect = error
+
+                with self.assertRaises(type(error)):
+                    self._controller.run()
+
+                build_queue: dict = self._build_queue_helper.get()
+                self.assertEqual((['linux'], error_message), (build_queue['kernel_names'], build_queue['error']))
+                self._build_queue_helper.pop()
+
+    @patch('secbootctl.features.queue.subprocess')
+    @patch('secbootctl.features.queue.shutil')
+    @patch('secbootctl.features.queue.Path.is_dir')
+    def test_run_if_background_and_systemd_running_it_starts_worker_via_systemd_run(
+            self, path_is_dir_patch_mock: MagicMock, shutil_patch_mock: MagicMock, subprocess_patch_mock: MagicMock):
+        path_is_dir_patch_mock.return_value = True
+        shutil_patch_mock.which.return_value = '/usr/bin/systemd-run'
+        subprocess_patch_mock.run.return_value.returncode = 0
+
+        self._controller.run(2.0, True)
+
+        subprocess_patch_mock.run.assert_called_once_with([
+            'systemd-run', '--quiet', '--collect', '--no-block', '--description=secbootctl build queue',
+            sys.executable, os.path.abspath(sys.argv[0]), 'queue:run', '--delay', '2.0'
+        ], capture_output=True)
+        subprocess_patch_mock.Popen.assert_not_called()
+        self._dispatcher_mock.dispatch.assert_not_called()
+        self._cli_print_helper_mock.print_status.assert_called_once_with(
+            'started build queue worker (see journal)', CliPrintHelper.Status.SUCCESS
+        )
+
+    @patch('secbootctl.features.queue.subprocess')
+    @patch('secbootctl.features.queue.Path.is_dir')
+    def test_run_if_background_and_no_systemd_it_starts_detached_worker(
+            self, path_is_dir_patch_mock: MagicMock, subprocess_patch_mock: MagicMock):
+        path_is_dir_patch_mock.return_value = False
+
+        self._controller.run(background=True)
+
+        subprocess_patch_mock.Popen.assert_called_once_with(
+            [sys.executable, os.path.abspath(sys.argv[0]), 'queue:run', '--delay', '0.0'],
+            stdin=subprocess_patch_mock.DEVNULL, stdout=ANY, stderr=subprocess_patch_mock.STDOUT,
+            start_new_session=True
+        )
+        subprocess_patch_mock.run.assert_not_called()
+
+    def test_run_if_delay_invalid_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.run(-1.0)
+
+        self.assertEqual('invalid delay: -1.0', context_manager.exception.message)
+
+    @patch.object(BuildQueueHelper, 'wait_for_worker')
+    def test_wait_it_waits_for_worker_and_builds_remaining_jobs(self, wait_for_worker_patch_mock: MagicMock):
+        wait_for_worker_patch_mock.return_value = True
+        self._build_queue_helper.add(['linux'])
+
+        self._controller.wait(60)
+
+        wait_for_worker_patch_mock.assert_called_once_with(60)
+        self._dispatcher_mock.dispatch.assert_called_once_with(
+            *self._get_forward_call('kernel', 'install', {'kernel_names': ['linux']}).args
+        )
+        self._cli_print_helper_mock.print_status.assert_has_calls([
+            call('waiting for build queue', CliPrintHelper.Status.PENDING),
+            call('build queue is empty', CliPrintHelper.Status.SUCCESS)
+        ])
+
+    @patch.object(BuildQueueHelper, 'wait_for_worker')
+    def test_wait_if_worker_still_running_after_timeout_it_raises_an_error(
+            self, wait_for_worker_patch_mock: MagicMock):
+        wait_for_worker_patch_mock.return_value = False
+
+        with self.assertRaises(AppError) as context_manager:
+            self._controller.wait(10)
+
+        self.assertEqual('build queue worker still running after 10 seconds', context_manager.exception.message)
+        self._dispatcher_mock.dispatch.assert_not_called()
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_status_it_prints_queued_jobs_and_last_error(self, stdout_mock: MagicMock):
+        self._build_queue_helper.fail({'kernel_names': ['linux'], 'all_kernels': False, 'bootloader': True},
+                                      'signing failed')
+
+        self._controller.status()
+
+        self._cli_print_helper_mock.print_record.assert_called_once_with('build_queue', {
+            'kernel_names': ['linux'], 'all_kernels': False, 'bootloader': True, 'worker_pid': None,
+            'error': 'signing failed'
+        }, ANY)
+        self.assertEqual(
+            'queued kernels:    linux\n'
+            'queued bootloader: yes\n'
+            'worker:            not running\n'
+            'last error:        signing failed\n',
+            stdout_mock.getvalue()
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from tests import unittest_helper
+
+
+class TestQueueSubcmdCreatorController(unittest_helper.SubCmdCreatorTestCase):
+    FEATURE_NAME: str = 'queue'
+    SUBCOMMAND_DATA: list = [
+        {'name': 'queue:status', 'help_message': 'show build queue'},
+        {'name': 'queue:wait', 'help_message': 'wait until build queue is empty'},
+        {'name': 'queue:run', 'help_message': 'build queued jobs'},
+    ]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,300 @@
+import hashlib
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.helpers.authenticode import AuthenticodeHelper, load_der_public_key
+from secbootctl.helpers.pe import PeHelper
+from tests.helpers.test_pe_helper import create_pe_image
+
+
+def der(tag: int, *contents: bytes) -> bytes:
+    content: bytes = b''.join(contents)
+
+    if len(content) < 0x80:
+        return bytes([tag, len(content)]) + content
+
+    length: bytes = len(content).to_bytes((len(content).bit_length() + 7) // 8, 'big')
+
+    return bytes([tag, 0x80 | len(length)]) + length + content
+
+
+def der_oid(oid: str) -> bytes:
+    components: list = [int(component) for component in oid.split('.')]
+    encoded: bytearray = bytearray([components[0] * 40 + components[1]])
+
+    for component in components[2:]:
+        encoded_component: list = [component & 0x7f]
+
+        while component > 0x7f:
+            component >>= 7
+            encoded_component.insert(0, 0x80 | (component & 0x7f))
+
+        encoded += bytes(encoded_component)
+
+    return der(0x06, bytes(encoded))
+
+
+def get_authenticode_digest(image: bytes) -> bytes:
+    """Returns the Authenticode digest of an unsigned image created with "create_pe_image()"."""
+    checksum_offset: int = 0x58 + 64
+    certificate_table_entry_offset: int = 0x58 + 112 + 8 * 4
+
+    return hashlib.sha256(image[:checksum_offset] + image[checksum_offset + 4:certificate_table_entry_offset] +
+                          image[certificate_table_entry_offset + 8:]).digest()
+
+
+class TestAuthenticodeHelper(unittest.TestCase):
+    """Verifies a corpus of PE images that is signed locally with throwaway keys created by openssl."""
+    @classmethod
+    def setUpClass(cls) -> None:
+        if shutil.which('openssl') is None:
+            raise unittest.SkipTest('openssl not available')
+
+        cls._temp_dir = tempfile.TemporaryDirectory()
+        cls._temp_path = Path(cls._temp_dir.name)
+
+        for name, key_options in [('db', ['-newkey', 'rsa:2048']), ('other', ['-newkey', 'rsa:2048']),
+                                  ('ec', ['-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1']),
+                                  ('ed25519', ['-newkey', 'ed25519'])]:
+            cls._openssl('req', '-x509', *key_options, '-nodes', '-keyout', f'{name}.key', '-out', f'{name}.crt',
+                         '-subj', f'/CN={name}', '-days', '1', *(['-sha256'] if name != 'ed25519' else []))
+
+        cls._openssl('req', '-newkey', 'rsa:2048', '-nodes', '-keyout', 'leaf.key', '-out', 'leaf.csr', '-subj',
+                     '/CN=leaf')
+        cls._openssl('x509', '-req', '-in', 'leaf.csr', '-CA', 'db.crt', '-CAkey', 'db.key', '-set_serial', '2',
+                     '-out', 'leaf.crt', '-days', '1', '-sha256')
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls._temp_dir.cleanup()
+
+    @classmethod
+    def _openssl(cls, *args: str, input_data: bytes = None) -> bytes:
+        return subprocess.run(['openssl', *args], cwd=cls._temp_path, input=input_data, capture_output=True,
+                              check=True).stdout
+
+    def setUp(self) -> None:
+        self._authenticode_helper: AuthenticodeHelper = AuthenticodeHelper()
+        self._image_file_path: Path = self._temp_path / 'image.efi'
+        self._image: bytes = create_pe_image(number_of_sections=2)
+
+    def _get_certificate(self, name: str) -> bytes:
+        return self._openssl('x509', '-in', f'{name}.crt', '-outform', 'DER')
+
+    def _sign_image(self, image: bytes, name: str, extra_certificate_names: tuple = (),
+                    authenticated_attributes: bool = True) -> bytes:
+        """Returns given image signed like sbsign does (PKCS#7 SignedData with SpcIndirectDataContent)."""
+        image += b'\0' * (-len(image) % 8)
+        sha256_algorithm: bytes = der(0x30, der_oid('2.16.840.1.101.3.4.2.1'), der(0x05))
+        spc_indirect_data_content: bytes = der(
+            0x30,
+            der(0x30, der_oid('1.3.6.1.4.1.311.2.1.15'), der(0x30, der(0x03, b'\0'), der(0xa0, der(0xa2, der(0x80))))),
+            der(0x30, sha256_algorithm, der(0x04, get_authenticode_digest(image)))
+        )
+        signed_data: bytes = spc_indirect_data_content[2:]
+        signer_certificate: dict = self._authenticode_helper._parse_certificate(self._get_certificate(name))
+        attributes: bytes = b''
+
+        if authenticated_attributes:
+            attributes = der(0x30, der_oid('1.2.840.113549.1.9.3'), der(0x31, der_oid('1.3.6.1.4.1.311.2.1.4')))
+            attributes += der(0x30, der_oid('1.2.840.113549.1.9.4'),
+                              der(0x31, der(0x04, hashlib.sha256(signed_data).digest())))
+            signed_data = der(0x31, attributes)
+            attributes = der(0xa0, attributes)
+
+        signature: bytes = self._openssl('dgst', '-sha256', '-sign', f'{name}.key', input_data=signed_data)
+        signer_info: bytes = der(
+            0x30, der(0x02, b'\x01'),
+            der(0x30, signer_certificate['issuer'], der(0x02, signer_certificate['serial_number'])),
+            sha256_algorithm, attributes, der(0x30, der_oid('1.2.840.113549.1.1.1'), der(0x05)), der(0x04, signature)
+        )
+        pkcs7: bytes = der(0x30, der_oid('1.2.840.113549.1.7.2'), der(0xa0, der(
+            0x30, der(0x02, b'\x01'), der(0x31, sha256_algorithm),
+            der(0x30, der_oid('1.3.6.1.4.1.311.2.1.4'), der(0xa0, spc_indirect_data_content)),
+            der(0xa0, *(self._get_certificate(certificate_name)
+                        for certificate_name in (name,) + extra_certificate_names)),
+            der(0x31, signer_info)
+        )))
+        win_certificate: bytes = struct.pack('<IHH', 8 + len(pkcs7), 0x0200, 0x0002) + pkcs7
+        win_certificate += b'\0' * (-len(win_certificate) % 8)
+        signed_image: bytearray = bytearray(image + win_certificate)
+        struct.pack_into('<II', signed_image, 0x58 + 112 + 8 * 4, len(image), len(win_certificate))
+
+        return bytes(signed_image)
+
+    def _verify(self, image: bytes, cert_name: str = 'db'):
+        self._image_file_path.write_bytes(image)
+
+        return self._authenticode_helper.verify_file(self._image_file_path, self._temp_path / f'{cert_name}.crt')
+
+    def _sign_digest(self, name: str, digest: bytes) -> bytes:
+        options: list = ['-pkeyopt', 'digest:sha256']
+
+        if name != 'ec':
+            options += ['-pkeyopt', 'rsa_padding_mode:pkcs1']
+
+        return self._openssl('pkeyutl', '-sign', '-inkey', f'{name}.key', *options, input_data=digest)
+
+    def _create_signed_image(self, name: str) -> bytes:
+        self._image_file_path.write_bytes(self._image)
+        pe_helper: PeHelper = PeHelper()
+        pe_helper.remove_certificates(self._image_file_path)
+        pe_helper.add_certificate(self._image_file_path, self._authenticode_helper.create_signature(
+            self._image_file_path, self._temp_path / f'{name}.crt', lambda digest: self._sign_digest(name, digest)
+        ))
+
+        return self._image_file_path.read_bytes()
+
+    def test_verify_file_if_signed_with_given_certificate_it_returns_true(self):
+        self.assertTrue(
+            self._verify(self._sign_image(self._image, 'db'))
+        )
+
+    @patch('secbootctl.helpers.authenticode.load_der_public_key', None)
+    def test_verify_file_if_no_crypto_library_it_verifies_rsa_signature_in_pure_python(self):
+        self.assertTrue(
+            self._verify(self._sign_image(self._image, 'db'))
+        )
+        self.assertFalse(
+            self._verify(self._sign_image(self._image, 'other'))
+        )
+
+    def test_verify_file_if_der_encoded_certificate_given_it_returns_true(self):
+        (self._temp_path / 'db.der').write_bytes(self._get_certificate('db'))
+        self._image_file_path.write_bytes(self._sign_image(self._image, 'db'))
+
+        self.assertTrue(
+            self._authenticode_helper.verify_file(self._image_file_path, self._temp_path / 'db.der')
+        )
+
+    def test_verify_file_if_no_authenticated_attributes_it_returns_true(self):
+        self.assertTrue(
+            self._verify(self._sign_image(self._image, 'db', authenticated_attributes=False))
+        )
+
+    def test_verify_file_if_signer_certificate_issued_by_given_certificate_it_returns_true(self):
+        self.assertTrue(
+            self._verify(self._sign_image(self._image, 'leaf'))
+        )
+
+    def test_verify_file_if_unsigned_it_returns_false(self):
+        self.assertFalse(
+            self._verify(self._image)
+        )
+
+    def test_verify_file_if_signed_with_other_certificate_it_returns_false(self):
+        self.assertFalse(
+            self._verify(self._sign_image(self._image, 'other'))
+        )
+
+    def test_verify_file_if_given_certificate_is_issued_by_signer_it_returns_false(self):
+        self.assertFalse(
+            self._verify(self._sign_image(self._image, 'db'), 'leaf')
+        )
+
+    def test_verify_file_if_image_modified_after_signing_it_returns_false(self):
+        signed_image: bytearray = bytearray(self._sign_image(self._image, 'db'))
+        signed_image[0x400] ^= 0xff
+
+        self.assertFalse(
+            self._verify(bytes(signed_image))
+        )
+
+    def test_verify_file_if_signature_value_corrupt_it_returns_false(self):
+        signed_image: bytearray = bytearray(self._sign_image(self._image, 'db'))
+        certificate_table_offset: int = struct.unpack_from('<I', signed_image, 0x58 + 112 + 8 * 4)[0]
+        # the signature value of the signer info is the last element of the PKCS#7 structure
+        signed_image[certificate_table_offset + struct.unpack_from('<I', signed_image, certificate_table_offset)[0]
+                     - 1] ^= 0xff
+
+        self.assertFalse(
+            self._verify(bytes(signed_image))
+        )
+
+    def test_verify_file_if_signature_not_parsable_it_returns_none(self):
+        signed_image: bytearray = bytearray(self._sign_image(self._image, 'db'))
+        signed_image[len(self._image) + 20:len(self._image) + 40] = b'\xff' * 20
+
+        self.assertIsNone(
+            self._verify(bytes(signed_image))
+        )
+
+    def test_verify_file_if_ber_encoded_signature_it_returns_none(self):
+        signed_image: bytes = self._sign_image(self._image, 'db')
+        certificate_table_offset: int = struct.unpack_from('<I', signed_image, 0x58 + 112 + 8 * 4)[0]
+        length: int = struct.unpack_from('<I', signed_image, certificate_table_offset)[0]
+        pkcs7: bytes = signed_image[certificate_table_offset + 8:certificate_table_offset + length]
+        # outer ContentInfo sequence with indefinite length (allowed by BER, not by DER)
+        ber_pkcs7: bytes = b'\x30\x80' + self._authenticode_helper._decode(pkcs7)[0][1] + b'\0\0'
+        win_certificate: bytes = struct.pack('<IHH', 8 + len(ber_pkcs7), 0x0200, 0x0002) + ber_pkcs7
+        win_certificate += b'\0' * (-len(win_certificate) % 8)
+        ber_signed_image: bytearray = bytearray(signed_image[:certificate_table_offset] + win_certificate)
+        struct.pack_into('<I', ber_signed_image, 0x58 + 112 + 8 * 4 + 4, len(win_certificate))
+
+        self.assertIsNone(
+            self._verify(bytes(ber_signed_image))
+        )
+
+    def test_verify_file_if_no_pe_image_it_returns_false(self):
+        self.assertFalse(
+            self._verify(b'\0' * 128)
+        )
+
+    @patch('secbootctl.helpers.authenticode.load_der_public_key', None)
+    def test_verify_file_if_ec_signature_and_no_crypto_library_it_returns_none(self):
+        self.assertIsNone(
+            self._verify(self._sign_image(self._image, 'ec'), 'ec')
+        )
+
+    def test_create_signature_it_creates_signature_that_verifies(self):
+        signed_image: bytes = self._create_signed_image('db')
+
+        self.assertEqual(
+            self._sign_image(self._image, 'db'),
+            signed_image
+        )
+        self.assertTrue(
+            self._verify(signed_image)
+        )
+
+    def test_create_signature_if_ec_key_it_creates_signature_that_verifies(self):
+        signed_image: bytes = self._create_signed_image('ec')
+
+        self.assertEqual(
+            b'\x06\x08\x2a\x86\x48\xce\x3d\x04\x03\x02',
+            AuthenticodeHelper()._encode_oid('1.2.840.10045.4.3.2')
+        )
+        self.assertIn(
+            AuthenticodeHelper()._encode_oid('1.2.840.10045.4.3.2'),
+            signed_image
+        )
+
+        if load_der_public_key is not None:
+            self.assertTrue(
+                self._verify(signed_image, 'ec')
+            )
+
+    def test_create_signature_if_public_key_algorithm_not_supported_it_raises_an_error(self):
+        self._image_file_path.write_bytes(self._image)
+        sign_digest_mock: Mock = Mock()
+
+        with self.assertRaises(AppError) as context_manager:
+            self._authenticode_helper.create_signature(self._image_file_path, self._temp_path / 'ed25519.crt',
+                                                       sign_digest_mock)
+
+        self.assertEqual(
+            f'public key algorithm of "{self._temp_path / "ed25519.crt"}" is not supported for signing',
+            context_manager.exception.message
+        )
+        sign_digest_mock.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from secbootctl.helpers.buildcache import BuildCacheHelper
+
+
+class TestBuildCacheHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._manifest_file_path: Path = self._temp_path / 'lib' / 'build-manifest.json'
+        self._image_path: Path = self._temp_path / 'linux.efi'
+        self._image_path.write_bytes(b'IMAGE')
+        self._input_file_paths: dict = {}
+
+        for input_name in ['kernel', 'initramfs']:
+            self._input_file_paths[input_name] = self._temp_path / input_name
+            self._input_file_paths[input_name].write_bytes(input_name.encode())
+
+        self._options: dict = {'unified_kernel_image_builder': 'native'}
+        self._build_cache_helper: BuildCacheHelper = BuildCacheHelper(self._manifest_file_path)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _update(self) -> None:
+        self._build_cache_helper.update(
+            self._image_path,
+            self._build_cache_helper.get_input_records(self._image_path, self._input_file_paths),
+            self._options
+        )
+
+    def _get_changes(self, build_cache_helper: BuildCacheHelper, options: dict) -> list:
+        return build_cache_helper.get_changes(
+            self._image_path, build_cache_helper.get_input_records(self._image_path, self._input_file_paths), options
+        )
+
+    def test_get_changes_if_no_manifest_entry_exists_it_returns_reason(self):
+        self.assertEqual(
+            [{'subject': 'manifest', 'name': None,
+              'message': f'no build manifest entry found for: {self._image_path}'}],
+            self._get_changes(self._build_cache_helper, self._options)
+        )
+
+    def test_get_changes_if_nothing_changed_it_returns_no_reasons(self):
+        self._update()
+
+        self.assertEqual(
+            [],
+            self._get_changes(BuildCacheHelper(self._manifest_file_path), self._options)
+        )
+
+    def test_get_changes_if_inputs_and_options_changed_it_returns_reasons(self):
+        self._update()
+        self._input_file_paths['initramfs'].write_bytes(b'new initramfs')
+        self._image_path.unlink()
+
+        self.assertEqual(
+            [
+                {'subject': 'input', 'name': 'initramfs',
+                 'message': f'input "initramfs" changed: {self._input_file_paths["initramfs"]}'},
+                {'subject': 'option', 'name': 'unified_kernel_image_builder',
+                 'message': 'option "unified_kernel_image_builder" changed: objcopy'},
+                {'subject': 'output', 'name': None,
+                 'message': f'unified kernel image changed or missing: {self._image_path}'}
+            ],
+            self._get_changes(self._build_cache_helper, {'unified_kernel_image_builder': 'objcopy'})
+        )
+
+    def test_get_input_records_if_stat_data_unchanged_it_does_not_hash_files_again(self):
+        self._update()
+
+        with patch('secbootctl.helpers.buildcache.hashlib') as hashlib_mock:
+            self.assertEqual(
+                [],
+                self._get_changes(self._build_cache_helper, self._options)
+            )
+
+        hashlib_mock.sha256.assert_not_called()
+
+    def test_get_changes_if_only_mtime_changed_it_compares_digests(self):
+        self._update()
+        os.utime(self._input_file_paths['kernel'], ns=(0, 0))
+
+        self.assertEqual(
+            [],
+            self._get_changes(self._build_cache_helper, self._options)
+        )
+
+    def test_get_input_records_if_input_missing_it_returns_record_without_digest(self):
+        self._input_file_paths['initramfs'].unlink()
+
+        self.assertEqual(
+            {'path': str(self._input_file_paths['initramfs']), 'size': None, 'mtime_ns': None, 'inode': None,
+             'digest': None},
+            self._build_cache_helper.get_input_records(self._image_path, self._input_file_paths)['initramfs']
+        )
+
+    def test_update_if_input_replaced_after_records_taken_it_records_digest_of_input_image_was_built_from(self):
+        input_records: dict = self._build_cache_helper.get_input_records(self._image_path, self._input_file_paths)
+        # initramfs replaced (e.g. by update-initramfs) while the image is built from the previous one
+        new_initramfs_file_path: Path = self._temp_path / 'initramfs.new'
+        new_initramfs_file_path.write_bytes(b'new initramfs')
+        os.replace(new_initramfs_file_path, self._input_file_paths['initramfs'])
+
+        self._build_cache_helper.update(self._image_path, input_records, self._options)
+
+        self.assertEqual(
+            [{'subject': 'input', 'name': 'initramfs',
+              'message': f'input "initramfs" changed: {self._input_file_paths["initramfs"]}'}],
+            self._get_changes(BuildCacheHelper(self._manifest_file_path), self._options)
+        )
+
+    def test_remove_it_removes_manifest_entry(self):
+        self._update()
+
+        self._build_cache_helper.remove(self._image_path)
+
+        self.assertEqual(
+            [{'subject': 'manifest', 'name': None,
+              'message': f'no build manifest entry found for: {self._image_path}'}],
+            self._get_changes(BuildCacheHelper(self._manifest_file_path), self._options)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
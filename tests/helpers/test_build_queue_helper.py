@@ -0,0 +1,111 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest.mock import ANY
+from unittest.mock import patch
+
+from secbootctl.helpers.buildqueue import BuildQueueHelper
+
+
+class TestBuildQueueHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._queue_file_path: Path = Path(self._temp_dir.name) / 'lib' / 'build-queue.json'
+        self._build_queue_helper: BuildQueueHelper = BuildQueueHelper(self._queue_file_path)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_add_it_merges_duplicate_jobs_and_reports_whether_queue_was_empty(self):
+        self.assertTrue(self._build_queue_helper.add(['linux']))
+        self.assertFalse(BuildQueueHelper(self._queue_file_path).add(['linux-lts', 'linux'], bootloader=True))
+        self.assertFalse(self._build_queue_helper.add(['linux']))
+
+        self.assertEqual(
+            {'kernel_names': ['linux', 'linux-lts'], 'all_kernels': False, 'bootloader': True},
+            self._build_queue_helper.pop()[0]
+        )
+
+    def test_pop_it_returns_and_clears_queued_jobs(self):
+        self._build_queue_helper.add(all_kernels=True)
+
+        self.assertEqual(
+            ({'kernel_names': [], 'all_kernels': True, 'bootloader': False}, 0.0), self._build_queue_helper.pop()
+        )
+        self.assertEqual(0, self._queue_file_path.stat().st_size)
+        self.assertEqual((None, 0.0), self._build_queue_helper.pop())
+        self.assertTrue(self._build_queue_helper.add(['linux']))
+
+    def test_pop_if_recently_updated_it_returns_time_to_wait(self):
+        self._build_queue_helper.add(['linux'])
+
+        jobs, wait_time = self._build_queue_helper.pop(60.0)
+
+        self.assertIsNone(jobs)
+        self.assertTrue(0 < wait_time <= 60.0)
+        self.assertEqual(['linux'], json.loads(self._queue_file_path.read_text())['kernel_names'])
+
+    def test_discard_it_removes_given_kernel(self):
+        self._build_queue_helper.add(['linux', 'linux-lts'])
+
+        self._build_queue_helper.discard('linux')
+        self._build_queue_helper.discard('linux-zen')
+
+        self.assertEqual(['linux-lts'], self._build_queue_helper.pop()[0]['kernel_names'])
+
+    def test_fail_it_requeues_jobs_and_records_error_until_next_pop(self):
+        self._build_queue_helper.add(['linux'])
+        jobs: dict = self._build_queue_helper.pop()[0]
+
+        self._build_queue_helper.fail(jobs, 'signing failed')
+
+        self.assertEqual('signing failed', self._build_queue_helper.get()['error'])
+        self.assertEqual(jobs, self._build_queue_helper.pop()[0])
+        self.assertIsNone(self._build_queue_helper.get()['error'])
+
+    def test_get_it_reads_queue_under_shared_lock_without_writing_it(self):
+        self._build_queue_helper.add(['linux'])
+        # formatted differently than the queue is saved, so any write would change the file
+        content: str = json.dumps(json.loads(self._queue_file_path.read_text()), indent=4)
+        self._queue_file_path.write_text(content)
+
+        with patch('secbootctl.helpers.buildqueue.fcntl.flock', wraps=fcntl.flock) as flock_patch_mock:
+            self.assertEqual(['linux'], self._build_queue_helper.get()['kernel_names'])
+
+        flock_patch_mock.assert_called_once_with(ANY, fcntl.LOCK_SH)
+        self.assertEqual(content, self._queue_file_path.read_text())
+
+    def test_get_if_queue_file_does_not_exist_it_returns_empty_queue_without_creating_it(self):
+        self.assertEqual([], self._build_queue_helper.get()['kernel_names'])
+        self.assertFalse(self._queue_file_path.parent.exists())
+
+    def test_pop_if_queue_file_is_invalid_it_returns_empty_queue(self):
+        self._queue_file_path.parent.mkdir()
+        self._queue_file_path.write_text('{"kernel_names": ')
+
+        self.assertEqual((None, 0.0), self._build_queue_helper.pop())
+
+    def test_get_worker_pid_it_returns_pid_while_worker_is_locked(self):
+        self.assertIsNone(self._build_queue_helper.get_worker_pid())
+
+        with self._build_queue_helper.lock_worker():
+            # flock() locks are per open file description, so the lock is checked from another thread
+            worker_pids: list = []
+            thread: threading.Thread = threading.Thread(
+                target=lambda: worker_pids.append(BuildQueueHelper(self._queue_file_path).get_worker_pid())
+            )
+            thread.start()
+            thread.join()
+
+            self.assertEqual([os.getpid()], worker_pids)
+
+        self.assertIsNone(self._build_queue_helper.get_worker_pid())
+        self.assertTrue(self._build_queue_helper.wait_for_worker(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import json
 import unittest
 from io import StringIO
 from unittest.mock import MagicMock
@@ -11,6 +12,12 @@ class TestCliPrintHelper(unittest.TestCase):
     def setUp(self) -> None:
         self._cli_print_helper: CliPrintHelper = CliPrintHelper()
 
+    def tearDown(self) -> None:
+        CliPrintHelper.set_output_format('text')
+
+    def _get_records(self, stdout_mock: StringIO) -> list:
+        return [json.loads(line) for line in stdout_mock.getvalue().splitlines()]
+
     @patch('sys.stdout', new_callable=StringIO)
     def test_print_status_it_prints_pending_status(self, stdout_mock: MagicMock):
         message: str = 'Message'
@@ -59,6 +66,94 @@ class TestCliPrintHelper(unittest.TestCase):
             stdout_mock.getvalue().rstrip()
         )
 
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_group_it_prints_output_of_group_as_one_block(self, stdout_mock: MagicMock):
+        self._cli_print_helper.print_status('before')
+
+        with self._cli_print_helper.group('kernel: linux'):
+            self._cli_print_helper.print_status('building')
+            self.assertEqual('  before\n', stdout_mock.getvalue())
+            self._cli_print_helper.print_status('built', CliPrintHelper.Status.SUCCESS)
+
+        self._cli_print_helper.print_status('after')
+
+        self.assertEqual(
+            '  before\n[kernel: linux]\n  building\n\u2713 done: built\n  after\n',
+            stdout_mock.getvalue()
+        )
+
+    @patch('sys.stdout', new_callable=StringIO)
+    @patch('secbootctl.helpers.cli.time')
+    def test_print_status_if_jsonl_it_prints_records_with_step_target_and_duration(self, time_patch_mock: MagicMock,
+                                                                                  stdout_mock: MagicMock):
+        time_patch_mock.monotonic.side_effect = [10.0, 10.5, 12.0]
+        CliPrintHelper.set_output_format('jsonl')
+
+        self._cli_print_helper.print_status('building unified kernel image: /efi/EFI/Linux/linux.efi')
+        self._cli_print_helper.print_status('built unified kernel image: /efi/EFI/Linux/linux.efi (1.20 s)',
+                                            CliPrintHelper.Status.SUCCESS)
+        self._cli_print_helper.print_status('sign agent stopped', CliPrintHelper.Status.SUCCESS)
+
+        self.assertEqual([
+            {'type': 'status', 'step': 'building unified kernel image', 'target': '/efi/EFI/Linux/linux.efi',
+             'ts': 10.0, 'duration': None, 'status': 'pending',
+             'message': 'building unified kernel image: /efi/EFI/Linux/linux.efi', 'details': None},
+            {'type': 'status', 'step': 'building unified kernel image', 'target': '/efi/EFI/Linux/linux.efi',
+             'ts': 10.5, 'duration': 0.5, 'status': 'success',
+             'message': 'built unified kernel image: /efi/EFI/Linux/linux.efi (1.20 s)', 'details': '1.20 s'},
+            {'type': 'status', 'step': 'sign agent stopped', 'target': None, 'ts': 12.0, 'duration': None,
+             'status': 'success', 'message': 'sign agent stopped', 'details': None}
+        ], self._get_records(stdout_mock))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_print_record_it_prints_text_or_record(self, stdout_mock: MagicMock):
+        self._cli_print_helper.print_text('Header')
+        self._cli_print_helper.print_record('config', {'step': 'config', 'name': 'esp_path'}, 'esp_path /efi')
+        CliPrintHelper.set_output_format('jsonl')
+        self._cli_print_helper.print_text('Header')
+        self._cli_print_helper.print_record('config', {'step': 'config', 'name': 'esp_path'}, 'esp_path /efi')
+
+        lines: list = stdout_mock.getvalue().splitlines()
+        record: dict = json.loads(lines[2])
+
+        self.assertEqual(['Header', 'esp_path /efi'], lines[:2])
+        self.assertEqual(3, len(lines))
+        self.assertEqual(
+            {'type': 'config', 'step': 'config', 'target': None, 'duration': None, 'name': 'esp_path'},
+            {key: value for key, value in record.items() if key != 'ts'}
+        )
+        self.assertIsInstance(record['ts'], float)
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_print_error_if_jsonl_it_prints_error_record(self, stdout_mock: MagicMock):
+        CliPrintHelper.set_output_format('jsonl')
+
+        self._cli_print_helper.print_error('Error-Message-1', 6)
+
+        record: dict = self._get_records(stdout_mock)[0]
+
+        self.assertEqual(('error', 'error', 'Error-Message-1', 6),
+                         (record['type'], record['step'], record['message'], record['code']))
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_group_if_jsonl_it_prints_records_right_away_with_group(self, stdout_mock: MagicMock):
+        CliPrintHelper.set_output_format('jsonl')
+
+        with self._cli_print_helper.group('kernel: linux'):
+            self._cli_print_helper.print_status('signing: /efi/EFI/Linux/linux.efi')
+
+            self.assertEqual('kernel: linux', self._get_records(stdout_mock)[0]['group'])
+
+        self._cli_print_helper.print_status('after')
+
+        self.assertNotIn('group', self._get_records(stdout_mock)[1])
+
+    def test_format_size_it_returns_human_readable_size(self):
+        self.assertEqual(
+            ['512 B', '1.5 KiB', '47.0 MiB', '2.0 GiB'],
+            [CliPrintHelper.format_size(size) for size in [512, 1536, 47 * 1024 ** 2, 2 * 1024 ** 3]]
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
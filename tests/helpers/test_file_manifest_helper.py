@@ -0,0 +1,77 @@
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from secbootctl.core import AppError
+from secbootctl.helpers.manifest import FileManifestHelper
+
+
+class TestFileManifestHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._root_path: Path = Path(self._temp_dir.name) / 'efi'
+        self._manifest_file_path: Path = Path(self._temp_dir.name) / 'manifest' / 'esp-manifest.sha256'
+        self._file_manifest_helper: FileManifestHelper = FileManifestHelper()
+        self._files: dict = {
+            'EFI/BOOT/BOOTX64.EFI': b'boot' * 1000, 'EFI/Linux/linux.efi': b'linux' * 1000, 'loader/.hidden': b'',
+            'loader/entries/back\\slash\nnewline.conf': b'entry'
+        }
+
+        for relative_path, content in self._files.items():
+            (self._root_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+            (self._root_path / relative_path).write_bytes(content)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_create_it_returns_digests_of_all_files(self):
+        self.assertEqual(
+            {relative_path: hashlib.sha256(content).hexdigest() for relative_path, content in self._files.items()},
+            self._file_manifest_helper.create(self._root_path, 2)
+        )
+
+    def test_save_and_load_it_stores_manifest_in_sha256sum_format(self):
+        manifest: dict = self._file_manifest_helper.create(self._root_path)
+
+        self._file_manifest_helper.save(manifest, self._manifest_file_path)
+
+        self.assertEqual(manifest, self._file_manifest_helper.load(self._manifest_file_path))
+        self.assertEqual(
+            f'{hashlib.sha256(b"boot" * 1000).hexdigest()}  EFI/BOOT/BOOTX64.EFI',
+            self._manifest_file_path.read_text().splitlines()[0]
+        )
+        self.assertEqual(0o700, self._manifest_file_path.parent.stat().st_mode & 0o777)
+
+    @unittest.skipIf(shutil.which('sha256sum') is None, 'sha256sum not available')
+    def test_save_it_stores_manifest_that_sha256sum_can_check(self):
+        self._file_manifest_helper.save(self._file_manifest_helper.create(self._root_path), self._manifest_file_path)
+
+        process_result = subprocess.run(['sha256sum', '--check', '--quiet', self._manifest_file_path],
+                                        cwd=self._root_path, capture_output=True)
+
+        self.assertEqual(0, process_result.returncode, process_result.stdout + process_result.stderr)
+
+    def test_load_if_manifest_invalid_it_raises_an_error(self):
+        self._manifest_file_path.parent.mkdir()
+        self._manifest_file_path.write_text('no digest\n')
+
+        with self.assertRaises(AppError) as context_manager:
+            self._file_manifest_helper.load(self._manifest_file_path)
+
+        self.assertEqual(f'invalid manifest "{self._manifest_file_path}" (line 1)', context_manager.exception.message)
+
+    def test_compare_it_returns_added_removed_and_modified_files(self):
+        self.assertEqual(
+            [('EFI/BOOT/BOOTX64.EFI', 'modified'), ('EFI/evil.efi', 'added'), ('EFI/old.efi', 'removed')],
+            self._file_manifest_helper.compare(
+                {'EFI/BOOT/BOOTX64.EFI': 'a' * 64, 'EFI/Linux/linux.efi': 'b' * 64, 'EFI/old.efi': 'c' * 64},
+                {'EFI/BOOT/BOOTX64.EFI': 'd' * 64, 'EFI/Linux/linux.efi': 'b' * 64, 'EFI/evil.efi': 'e' * 64}
+            )
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
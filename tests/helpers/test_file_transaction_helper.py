@@ -0,0 +1,93 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.helpers.transaction import FileTransactionHelper
+
+
+class TestFileTransactionHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._file_transaction_helper: FileTransactionHelper = FileTransactionHelper()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._file_path: Path = self._temp_path / 'linux.efi'
+        self._file_path.write_text('old')
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_begin_if_no_error_it_commits_staged_files(self):
+        config_file_path: Path = self._temp_path / 'loader.conf'
+
+        with self._file_transaction_helper.begin() as transaction:
+            staged_file_path: Path = transaction.stage(self._file_path)
+            staged_file_path.write_text('new')
+            transaction.write_text(config_file_path, 'timeout 5')
+
+            self.assertEqual(self._temp_path, staged_file_path.parent)
+            self.assertEqual('old', self._file_path.read_text())
+            self.assertFalse(config_file_path.exists())
+
+        self.assertEqual('new', self._file_path.read_text())
+        self.assertEqual('timeout 5', config_file_path.read_text())
+        self.assertEqual(
+            ['linux.efi', 'loader.conf'],
+            sorted(file_path.name for file_path in self._temp_path.iterdir())
+        )
+
+    def test_begin_if_error_it_rolls_back_staged_files(self):
+        with self.assertRaises(AppError):
+            with self._file_transaction_helper.begin() as transaction:
+                transaction.stage(self._file_path).write_text('new')
+
+                raise AppError('signing failed')
+
+        self.assertEqual('old', self._file_path.read_text())
+        self.assertEqual(
+            ['linux.efi'],
+            [file_path.name for file_path in self._temp_path.iterdir()]
+        )
+
+    def test_stage_if_copy_it_copies_current_content(self):
+        with self._file_transaction_helper.begin() as transaction:
+            staged_file_path: Path = transaction.stage(self._file_path, True)
+
+            self.assertEqual('old', staged_file_path.read_text())
+
+            staged_file_path.write_text('old+signature')
+
+        self.assertEqual('old+signature', self._file_path.read_text())
+
+    @patch('secbootctl.helpers.transaction.ctypes')
+    def test_commit_it_syncs_once_per_filesystem(self, ctypes_patch_mock: MagicMock):
+        syncfs_mock: MagicMock = ctypes_patch_mock.CDLL.return_value.syncfs
+        syncfs_mock.return_value = 0
+
+        with self._file_transaction_helper.begin() as transaction:
+            for file_name in ['a.efi', 'b.efi', 'c.efi']:
+                transaction.write_text(self._temp_path / file_name, file_name)
+
+        syncfs_mock.assert_called_once()
+
+    @patch('secbootctl.helpers.transaction.ctypes')
+    def test_commit_if_sync_fails_it_rolls_back_and_raises_an_error(self, ctypes_patch_mock: MagicMock):
+        ctypes_patch_mock.CDLL.return_value.syncfs.return_value = -1
+        ctypes_patch_mock.get_errno.return_value = 5
+
+        with self.assertRaises(AppError) as context_manager:
+            with self._file_transaction_helper.begin() as transaction:
+                transaction.write_text(self._file_path, 'new')
+
+        self.assertTrue(context_manager.exception.message.startswith('committing file changes failed: '))
+        self.assertEqual('old', self._file_path.read_text())
+        self.assertEqual(
+            ['linux.efi'],
+            [file_path.name for file_path in self._temp_path.iterdir()]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import glob
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from secbootctl.helpers.filewalker import FileWalkerHelper
+
+
+class TestFileWalkerHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._root_path: Path = Path(self._temp_dir.name)
+
+        for file_subpath in ['EFI/BOOT/BOOTX64.EFI', 'EFI/BOOT-old/bootx64.efi', 'EFI/BOOT.efi', 'EFI/Linux/linux.efi',
+                             'EFI/Linux/linux-lts.efi', 'EFI/Linux/readme.txt', 'EFI/systemd/systemd-bootx64.efi',
+                             'loader/loader.conf', '.hidden/test.efi', 'EFI/.test.efi', 'test.efi']:
+            (self._root_path / file_subpath).parent.mkdir(parents=True, exist_ok=True)
+            (self._root_path / file_subpath).write_bytes(b'')
+
+        (self._root_path / 'EFI/link.efi').symlink_to(self._root_path / 'test.efi')
+        (self._root_path / 'EFI/loop').symlink_to(self._root_path / 'EFI')
+        self._file_walker_helper: FileWalkerHelper = FileWalkerHelper(self._root_path)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _get_subpaths(self, file_paths) -> list:
+        return [str(file_path.relative_to(self._root_path)) for file_path in file_paths]
+
+    def test_walk_it_yields_all_files_in_sorted_order_without_following_directory_symlinks(self):
+        # glob follows the symlink "EFI/loop" (until the path gets too long)
+        self.assertEqual(
+            sorted(file_path for file_path in glob.glob(str(self._root_path / '**' / '*'), recursive=True)
+                   if os.path.isfile(file_path) and '/loop/' not in file_path),
+            [str(file_path) for file_path in self._file_walker_helper.walk()]
+        )
+
+    def test_walk_if_extensions_given_it_matches_them_case_insensitively(self):
+        self.assertEqual(
+            ['EFI/BOOT-old/bootx64.efi', 'EFI/BOOT.efi', 'EFI/BOOT/BOOTX64.EFI', 'EFI/Linux/linux-lts.efi',
+             'EFI/Linux/linux.efi', 'EFI/link.efi', 'EFI/systemd/systemd-bootx64.efi', 'test.efi'],
+            self._get_subpaths(self._file_walker_helper.walk(['.EFI']))
+        )
+
+    def test_walk_if_subpaths_given_it_walks_only_given_subtrees(self):
+        self.assertEqual(
+            ['EFI/Linux/linux-lts.efi', 'EFI/Linux/linux.efi', 'EFI/Linux/readme.txt', 'loader/loader.conf'],
+            self._get_subpaths(self._file_walker_helper.walk(subpaths=['loader', 'EFI/Linux', 'missing']))
+        )
+
+    def test_walk_if_excluded_subpaths_given_it_skips_given_subtrees(self):
+        self.assertEqual(
+            ['EFI/BOOT.efi', 'EFI/link.efi', 'test.efi'],
+            self._get_subpaths(self._file_walker_helper.walk(
+                ['.efi'], excluded_subpaths=['EFI/BOOT', 'EFI/BOOT-old', 'EFI/Linux/', 'EFI/systemd']
+            ))
+        )
+
+    def test_walk_if_include_hidden_it_yields_hidden_files(self):
+        self.assertEqual(
+            ['.hidden/test.efi', 'EFI/.test.efi'],
+            self._get_subpaths(file_path for file_path in self._file_walker_helper.walk(['.efi'], include_hidden=True)
+                               if '.test' in file_path.name or '.hidden' in file_path.parts)
+        )
+
+    def test_walk_it_is_lazy_and_does_not_stat_files(self):
+        with patch('os.stat') as stat_patch_mock, patch('os.lstat') as lstat_patch_mock:
+            file_paths = self._file_walker_helper.walk(['.efi'], ['EFI/Linux'])
+
+            self.assertEqual(self._root_path / 'EFI/Linux/linux-lts.efi', next(file_paths))
+
+        stat_patch_mock.assert_not_called()
+        lstat_patch_mock.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
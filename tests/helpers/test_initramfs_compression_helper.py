@@ -0,0 +1,192 @@
+import gzip
+import lzma
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.helpers.compression import InitramfsCompressionHelper
+
+
+def create_cpio_archive(files: dict, padding_size: int = 512) -> bytes:
+    """Returns a "newc" cpio archive with the given files (name => content) padded with zeros."""
+    archive: bytearray = bytearray()
+
+    for name, content in list(files.items()) + [('TRAILER!!!', b'')]:
+        encoded_name: bytes = name.encode() + b'\0'
+        archive += b'070701' + b''.join(
+            f'{value:08x}'.encode() for value in [0, 0o100644, 0, 0, 1, 0, len(content), 0, 0, 0, 0,
+                                                  len(encoded_name), 0]
+        )
+        archive += encoded_name + b'\0' * (-(110 + len(encoded_name)) % 4)
+        archive += content + b'\0' * (-len(content) % 4)
+
+    return bytes(archive) + b'\0' * (-len(archive) % padding_size)
+
+
+class TestInitramfsCompressionHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._cache_path: Path = self._temp_path / 'cache'
+        self._compression_helper: InitramfsCompressionHelper = InitramfsCompressionHelper(self._cache_path)
+        self._initramfs_file_path: Path = self._temp_path / 'initramfs-linux.img'
+        self._early_archive: bytes = create_cpio_archive({'kernel/x86/microcode/GenuineIntel.bin': b'M' * 100})
+        self._main_archive: bytes = create_cpio_archive({'init': b'#!/bin/sh\n' * 1000, 'etc/fstab': b'# fstab\n'})
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_compress_if_uncompressed_image_it_compresses_whole_image(self):
+        self._initramfs_file_path.write_bytes(self._early_archive + self._main_archive)
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+
+        self.assertEqual(self._cache_path / 'initramfs-linux.img', compressed_file_path.parent)
+        self.assertTrue(compressed_file_path.name.endswith('-gzip-9.img'))
+        self.assertEqual(
+            self._early_archive + self._main_archive,
+            gzip.decompress(compressed_file_path.read_bytes())
+        )
+
+    def test_compress_if_early_archive_it_keeps_it_and_recompresses_main_archive(self):
+        self._initramfs_file_path.write_bytes(self._early_archive + gzip.compress(self._main_archive))
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'xz', 3)
+        compressed_image: bytes = compressed_file_path.read_bytes()
+
+        self.assertEqual(self._early_archive, compressed_image[:len(self._early_archive)])
+        self.assertEqual(
+            self._main_archive,
+            lzma.decompress(compressed_image[len(self._early_archive):], lzma.FORMAT_XZ)
+        )
+        self.assertTrue(compressed_file_path.name.endswith('-xz-3.img'))
+
+    def test_compress_if_xz_it_uses_crc32_check(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'xz')
+
+        # stream flags of the xz header: check type 0x01 (CRC32)
+        self.assertEqual(b'\x00\x01', compressed_file_path.read_bytes()[6:8])
+
+    def test_compress_if_concatenated_streams_it_decompresses_all_of_them(self):
+        self._initramfs_file_path.write_bytes(
+            gzip.compress(self._main_archive[:1000]) + b'\0' * 16 + gzip.compress(self._main_archive[1000:])
+        )
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'xz')
+
+        self.assertEqual(
+            self._main_archive,
+            lzma.decompress(compressed_file_path.read_bytes())
+        )
+
+    def test_compress_if_already_compressed_with_algorithm_it_returns_given_image(self):
+        self._initramfs_file_path.write_bytes(self._early_archive + gzip.compress(self._main_archive))
+
+        self.assertEqual(
+            self._initramfs_file_path,
+            self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+        )
+        self.assertFalse(self._cache_path.exists())
+
+    def test_compress_if_unknown_compression_it_returns_given_image(self):
+        self._initramfs_file_path.write_bytes(b'\x02\x21\x4c\x18' + b'LZ4' * 100)
+
+        self.assertEqual(
+            self._initramfs_file_path,
+            self._compression_helper.compress(self._initramfs_file_path, 'xz')
+        )
+
+    def test_compress_if_cached_it_does_not_compress_again(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+
+        with patch.object(self._compression_helper, '_create_compressor') as create_compressor_patch_mock:
+            self.assertEqual(
+                compressed_file_path,
+                self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+            )
+
+        create_compressor_patch_mock.assert_not_called()
+
+    def test_compress_if_image_changed_it_removes_stale_cache_files(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+        stale_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+        self._initramfs_file_path.write_bytes(self._early_archive + self._main_archive)
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+
+        self.assertEqual(
+            [compressed_file_path],
+            list(compressed_file_path.parent.iterdir())
+        )
+        self.assertNotEqual(stale_file_path, compressed_file_path)
+
+    def test_get_cached_if_compressed_before_it_returns_cached_image(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'gzip')
+
+        self.assertEqual(
+            compressed_file_path,
+            self._compression_helper.get_cached(self._initramfs_file_path, 'gzip')
+        )
+
+    def test_get_cached_if_not_compressed_before_it_returns_none_and_writes_nothing(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+
+        self.assertIsNone(self._compression_helper.get_cached(self._initramfs_file_path, 'gzip', 6))
+        self.assertFalse(self._cache_path.exists())
+
+    def test_compress_if_invalid_level_it_raises_an_error(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+
+        with self.assertRaises(AppError) as context_manager:
+            self._compression_helper.compress(self._initramfs_file_path, 'gzip', 12)
+
+        self.assertEqual(
+            'invalid initramfs compression level for "gzip": 12',
+            context_manager.exception.message
+        )
+
+    @patch('secbootctl.helpers.compression.zstandard', None)
+    def test_compress_if_zstd_but_zstandard_not_installed_it_raises_an_error(self):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+
+        with self.assertRaises(AppError) as context_manager:
+            self._compression_helper.compress(self._initramfs_file_path, 'zstd')
+
+        self.assertEqual(
+            'initramfs compression "zstd" requires the Python module "zstandard"',
+            context_manager.exception.message
+        )
+
+    @patch('secbootctl.helpers.compression.zstandard')
+    def test_compress_if_zstd_it_compresses_with_given_number_of_workers(self, zstandard_patch_mock: MagicMock):
+        self._initramfs_file_path.write_bytes(self._main_archive)
+        compressor_mock: MagicMock = zstandard_patch_mock.ZstdCompressor.return_value.compressobj.return_value
+        compressor_mock.compress.return_value = b'Z'
+        compressor_mock.flush.return_value = b''
+
+        compressed_file_path: Path = self._compression_helper.compress(self._initramfs_file_path, 'zstd', 12, 4)
+
+        zstandard_patch_mock.ZstdCompressor.assert_called_once_with(level=12, threads=4)
+        self.assertEqual(b'Z', compressed_file_path.read_bytes())
+
+    def test_compress_if_corrupt_image_it_raises_an_error_and_leaves_no_cache_file(self):
+        self._initramfs_file_path.write_bytes(gzip.compress(self._main_archive)[:-100] + b'garbage')
+
+        with self.assertRaises(AppError) as context_manager:
+            self._compression_helper.compress(self._initramfs_file_path, 'xz')
+
+        self.assertTrue(context_manager.exception.message.startswith(
+            f'decompressing initramfs image "{self._initramfs_file_path}" failed'
+        ))
+        self.assertEqual([], list((self._cache_path / 'initramfs-linux.img').iterdir()))
+
+
+if __name__ == '__main__':
+    unittest.main()
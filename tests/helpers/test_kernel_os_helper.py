@@ -1,3 +1,4 @@
+import tempfile
 import unittest
 from pathlib import Path
 from unittest.mock import MagicMock
@@ -7,6 +8,7 @@ from unittest.mock import mock_open
 from unittest.mock import patch
 
 from secbootctl.core import AppError
+from secbootctl.core import UnsupportedPeImageError
 from secbootctl.env import Env
 from secbootctl.helpers.kernelos import KernelOsHelper
 
@@ -20,7 +22,18 @@ class TestKernelOsHelper(unittest.TestCase):
         Env.MACHINE_ID = self._machine_id
         self._boot_path = Path('/boot')
         self._esp_path = Path('/boot/efi')
-        self._config_mock.configure_mock(esp_path=self._esp_path)
+        self._config_mock.configure_mock(esp_path=self._esp_path, initramfs_compression='none')
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._unified_kernel_image_path: Path = Path(self._temp_dir.name) / 'image.efi'
+        self._unified_kernel_image_path.write_bytes(b'\0' * 1024)
+        self._pe_helper_mock: Mock = Mock()
+        self._pe_helper_mock.layout_sections.side_effect = lambda stub_file_path, sections: {
+            'sections': sections, 'image_base': 0, 'size_of_image': 0x3001000
+        }
+        self._kernel_os_helper._pe_helper = self._pe_helper_mock
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
 
     def test_init_it_assigns_key_file_paths(self):
         self.assertEqual(
@@ -86,7 +99,7 @@ class TestKernelOsHelper(unittest.TestCase):
         kernel_image_name_prefix: str = 'vmlinuz'
         initramfs_image_name_template: str = 'initramfs__kernel-name__.img'
         microcode_image_name: str = 'microcode.img'
-        unified_kernel_image_path: Path = Path('/tmp/image.efi')
+        unified_kernel_image_path: Path = self._unified_kernel_image_path
         kernel_cmdline_file_path: Path = Path('/tmp/cmdline')
         kernel_cmdline_file_path_mock = MagicMock()
         kernel_cmdline_file_path_mock.is_file.return_value = True
@@ -100,7 +113,8 @@ class TestKernelOsHelper(unittest.TestCase):
             kernel_image_name_prefix=kernel_image_name_prefix,
             initramfs_image_name_template=initramfs_image_name_template,
             microcode_image_name=microcode_image_name,
-            include_microcode=False
+            include_microcode=False,
+            unified_kernel_image_layout='fixed'
         )
         process_result_mock: Mock = Mock()
         subprocess_patch_mock.run.return_value = process_result_mock
@@ -121,7 +135,7 @@ class TestKernelOsHelper(unittest.TestCase):
                 '--change-section-vma=.initrd=0x3000000',
                 Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
                 unified_kernel_image_path
-            ], capture_output=True
+            ], capture_output=True, pass_fds=[]
         )
 
     @patch('secbootctl.helpers.kernelos.subprocess')
@@ -130,7 +144,7 @@ class TestKernelOsHelper(unittest.TestCase):
         kernel_image_name_prefix: str = 'vmlinuz'
         initramfs_image_name_template: str = 'initramfs__kernel-name__.img'
         microcode_image_name: str = 'microcode.img'
-        unified_kernel_image_path: Path = Path('/tmp/image.efi')
+        unified_kernel_image_path: Path = self._unified_kernel_image_path
         kernel_cmdline_file_path: Path = Path('/tmp/cmdline')
         kernel_cmdline_file_path_mock = MagicMock()
         kernel_cmdline_file_path_mock.is_file.return_value = True
@@ -144,7 +158,8 @@ class TestKernelOsHelper(unittest.TestCase):
             kernel_image_name_prefix=kernel_image_name_prefix,
             initramfs_image_name_template=initramfs_image_name_template,
             microcode_image_name=microcode_image_name,
-            include_microcode=False
+            include_microcode=False,
+            unified_kernel_image_layout='fixed'
         )
         process_result_mock: Mock = Mock()
         subprocess_patch_mock.run.return_value = process_result_mock
@@ -166,7 +181,7 @@ class TestKernelOsHelper(unittest.TestCase):
                 '--change-section-vma=.initrd=0x3000000',
                 Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
                 unified_kernel_image_path
-            ], capture_output=True
+            ], capture_output=True, pass_fds=[]
         )
         error: AppError = context_manager.exception
         self.assertEqual(
@@ -178,69 +193,376 @@ class TestKernelOsHelper(unittest.TestCase):
             1
         )
 
-    @patch('secbootctl.helpers.kernelos.shutil')
-    @patch('secbootctl.helpers.kernelos.open', new_callable=mock_open())
     @patch('secbootctl.helpers.kernelos.subprocess')
-    def test_build_unified_kernel_image_if_mc_and_no_error_it_builds_image(self, subprocess_patch_mock: MagicMock,
-                                                                           open_patch_mock: MagicMock,
-                                                                           shutil_patch_mock: MagicMock):
+    def test_build_unified_kernel_image_if_mc_and_no_error_it_builds_image_without_temp_file(
+        self, subprocess_patch_mock: MagicMock
+    ):
         kernel_name: str = 'linux-custom'
-        kernel_image_name_prefix: str = 'vmlinuz'
-        initramfs_image_name_template: str = 'initramfs__kernel-name__.img'
-        microcode_image_name: str = 'microcode.img'
-        unified_kernel_image_path: Path = Path('/tmp/image.efi')
-        kernel_cmdline_file_path: Path = Path('/tmp/cmdline')
+        boot_path: Path = Path(self._temp_dir.name)
+        unified_kernel_image_path: Path = self._unified_kernel_image_path
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        kernel_cmdline_file_path_mock.__str__.return_value = '/tmp/cmdline'
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        (boot_path / 'microcode.img').write_bytes(b'MICROCODE')
+        (boot_path / 'initramfs-linux-custom.img').write_bytes(b'INITRAMFS')
+        self._config_mock.configure_mock(
+            boot_path=boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=True,
+            unified_kernel_image_layout='fixed'
+        )
+        initrd_payloads: list = []
+
+        def run(objcopy_cmd_args: list, capture_output: bool, pass_fds: list) -> Mock:
+            self.assertEqual(1, len(pass_fds))
+            self.assertEqual(f'--add-section=.initrd=/proc/self/fd/{pass_fds[0]}', objcopy_cmd_args[7])
+            initrd_payloads.append(Path(f'/proc/self/fd/{pass_fds[0]}').read_bytes())
+
+            return Mock(returncode=0)
+
+        subprocess_patch_mock.run.side_effect = run
+
+        build_stats: dict = self._kernel_os_helper.build_unified_kernel_image(kernel_name, unified_kernel_image_path)
+
+        self.assertEqual(
+            [b'MICROCODEINITRAMFS'],
+            initrd_payloads
+        )
+        self.assertEqual(
+            ['image.efi', 'initramfs-linux-custom.img', 'microcode.img'],
+            sorted(file_path.name for file_path in boot_path.iterdir())
+        )
+        self.assertEqual(
+            1024,
+            build_stats['bytes_written']
+        )
+
+    @patch('secbootctl.helpers.kernelos.subprocess')
+    def test_build_unified_kernel_image_if_native_builder_it_builds_image_natively(self,
+                                                                                 subprocess_patch_mock: MagicMock):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = self._unified_kernel_image_path
         kernel_cmdline_file_path_mock = MagicMock()
         kernel_cmdline_file_path_mock.is_file.return_value = True
-        kernel_cmdline_file_path_mock.__str__.return_value = str(kernel_cmdline_file_path)
         Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
-        kernel_image_path: Path = self._boot_path / (kernel_image_name_prefix + '-' + kernel_name)
-        initramfs_image_path: Path = self._boot_path / initramfs_image_name_template.replace(
-            '__kernel-name__', kernel_name)
-        microcode_image_path: Path = self._boot_path / microcode_image_name
-        microcode_initramfs_unified_image_path: Path = self._boot_path / 'tmp-microcode-initramfs-unified.img'
-        objcopy_initrd_image_path = microcode_initramfs_unified_image_path
         self._config_mock.configure_mock(
             boot_path=self._boot_path,
-            kernel_image_name_prefix=kernel_image_name_prefix,
-            initramfs_image_name_template=initramfs_image_name_template,
-            microcode_image_name=microcode_image_name,
-            include_microcode=True
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=False,
+            unified_kernel_image_builder='native',
+            unified_kernel_image_layout='fixed'
+        )
+        pe_helper_mock: Mock = self._pe_helper_mock
+        pe_helper_mock.add_sections.return_value = 4096
+        self._kernel_os_helper._pe_helper = pe_helper_mock
+
+        build_stats: dict = self._kernel_os_helper.build_unified_kernel_image(kernel_name, unified_kernel_image_path)
+
+        self.assertEqual(
+            4096,
+            build_stats['bytes_written']
+        )
+
+        pe_helper_mock.add_sections.assert_called_once_with(
+            Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
+            [
+                {'name': '.osrel', 'file_paths': [Env.OS_RELEASE_FILE_PATH], 'virtual_address': 0x20000},
+                {'name': '.cmdline', 'file_paths': [kernel_cmdline_file_path_mock], 'virtual_address': 0x30000},
+                {
+                    'name': '.linux',
+                    'file_paths': [self._boot_path / 'vmlinuz-linux-custom'],
+                    'virtual_address': 0x2000000
+                },
+                {
+                    'name': '.initrd',
+                    'file_paths': [self._boot_path / 'initramfs-linux-custom.img'],
+                    'virtual_address': 0x3000000
+                }
+            ],
+            unified_kernel_image_path
+        )
+        subprocess_patch_mock.run.assert_not_called()
+
+    @patch('secbootctl.helpers.kernelos.subprocess')
+    def test_build_unified_kernel_image_if_stub_not_supported_by_native_builder_it_falls_back_to_objcopy(
+        self, subprocess_patch_mock: MagicMock
+    ):
+        kernel_name: str = 'linux-custom'
+        unified_kernel_image_path: Path = self._unified_kernel_image_path
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=False,
+            unified_kernel_image_builder='native',
+            unified_kernel_image_layout='fixed'
         )
+        pe_helper_mock: Mock = self._pe_helper_mock
+        pe_helper_mock.add_sections.side_effect = UnsupportedPeImageError('not enough space')
+        self._kernel_os_helper._pe_helper = pe_helper_mock
         process_result_mock: Mock = Mock()
-        subprocess_patch_mock.run.return_value = process_result_mock
         process_result_mock.configure_mock(returncode=0)
-        open_patch_mock.return_value = open_patch_mock
-        combined_image_mock = mock_open()
-        microcode_image_mock = mock_open()
-        initramfs_image_mock = mock_open()
-        open_patch_mock.__enter__.side_effect = [combined_image_mock, microcode_image_mock, initramfs_image_mock]
+        subprocess_patch_mock.run.return_value = process_result_mock
 
         self._kernel_os_helper.build_unified_kernel_image(kernel_name, unified_kernel_image_path)
 
-        # @todo test open calls - did not find a way to test it correctly for all three open calls
+        pe_helper_mock.add_sections.assert_called_once()
+        subprocess_patch_mock.run.assert_called_once()
+        self.assertEqual(
+            'objcopy',
+            subprocess_patch_mock.run.call_args.args[0][0]
+        )
 
-        shutil_patch_mock.copyfileobj.assert_has_calls([
-            call(microcode_image_mock, combined_image_mock),
-            call(initramfs_image_mock, combined_image_mock)
-        ])
+    @patch('secbootctl.helpers.kernelos.subprocess')
+    def test_build_unified_kernel_image_if_native_builder_fails_otherwise_it_raises_error_without_objcopy_fallback(
+        self, subprocess_patch_mock: MagicMock
+    ):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            include_microcode=False,
+            unified_kernel_image_builder='native',
+            unified_kernel_image_layout='fixed'
+        )
+        initramfs_file_path: Path = self._boot_path / 'initramfs-linux-custom.img'
 
-        subprocess_patch_mock.run.assert_called_once_with(
+        for error, error_message in [
+            (FileNotFoundError(2, 'No such file or directory', str(initramfs_file_path)),
+             f'building unified kernel image "{self._unified_kernel_image_path}" failed: '
+             f'No such file or directory: {initramfs_file_path}'),
+            (OSError(28, 'No space left on device'),
+             f'building unified kernel image "{self._unified_kernel_image_path}" failed: '
+             f'No space left on device: {self._unified_kernel_image_path}'),
+            (AppError(f'unexpected end of file "{initramfs_file_path}"'),
+             f'unexpected end of file "{initramfs_file_path}"')
+        ]:
+            with self.subTest(error=error):
+                self._pe_helper_mock.add_sections.side_effect = error
+
+                with self.assertRaises(AppError) as context_manager:
+                    self._kernel_os_helper.build_unified_kernel_image('linux-custom', self._unified_kernel_image_path)
+
+                self.assertEqual(error_message, context_manager.exception.message)
+
+        subprocess_patch_mock.run.assert_not_called()
+
+    @patch('secbootctl.helpers.kernelos.subprocess')
+    def test_build_unified_kernel_image_if_computed_layout_it_uses_computed_addresses(
+        self, subprocess_patch_mock: MagicMock
+    ):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        kernel_cmdline_file_path_mock.__str__.return_value = '/tmp/cmdline'
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            include_microcode=False,
+            unified_kernel_image_builder='objcopy',
+            unified_kernel_image_layout='computed'
+        )
+        self._pe_helper_mock.layout_sections.side_effect = lambda stub_file_path, sections: {
+            'sections': [
+                {**section, 'virtual_address': 0x6000 + index * 0x1000} for index, section in enumerate(sections)
+            ],
+            'image_base': 0x100000000,
+            'size_of_image': 0xa000
+        }
+        subprocess_patch_mock.run.return_value = Mock(returncode=0)
+
+        build_stats: dict = self._kernel_os_helper.build_unified_kernel_image(
+            'linux-custom', self._unified_kernel_image_path
+        )
+
+        self.assertEqual(
             [
-                'objcopy',
-                f'--add-section=.osrel={Env.OS_RELEASE_FILE_PATH}',
-                '--change-section-vma=.osrel=0x20000',
-                f'--add-section=.cmdline={kernel_cmdline_file_path}',
-                '--change-section-vma=.cmdline=0x30000',
-                f'--add-section=.linux={kernel_image_path}',
-                '--change-section-vma=.linux=0x2000000',
-                f'--add-section=.initrd={objcopy_initrd_image_path}',
-                '--change-section-vma=.initrd=0x3000000',
-                Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
-                unified_kernel_image_path
-            ], capture_output=True
+                {'name': '.osrel', 'file_paths': [Env.OS_RELEASE_FILE_PATH]},
+                {'name': '.cmdline', 'file_paths': [kernel_cmdline_file_path_mock]},
+                {'name': '.linux', 'file_paths': [self._boot_path / 'vmlinuz-linux-custom']},
+                {'name': '.initrd', 'file_paths': [self._boot_path / 'initramfs-linux-custom.img']}
+            ],
+            self._pe_helper_mock.layout_sections.call_args.args[1]
+        )
+        self.assertEqual(
+            ['--change-section-vma=.osrel=0x100006000', '--change-section-vma=.cmdline=0x100007000',
+             '--change-section-vma=.linux=0x100008000', '--change-section-vma=.initrd=0x100009000'],
+            subprocess_patch_mock.run.call_args.args[0][2:10:2]
+        )
+        self.assertEqual(
+            ('computed', 0xa000),
+            (build_stats['layout'], build_stats['image_size'])
+        )
+
+    def test_patch_unified_kernel_image_initrd_it_replaces_initrd_section(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=True
+        )
+        pe_helper_mock: Mock = self._pe_helper_mock
+        pe_helper_mock.replace_last_section.return_value = 2048
+        self._kernel_os_helper._pe_helper = pe_helper_mock
+        output_file_path: Path = Path('/tmp/staged.efi')
+
+        build_stats: dict = self._kernel_os_helper.patch_unified_kernel_image_initrd(
+            'linux-custom', self._unified_kernel_image_path, output_file_path
+        )
+
+        pe_helper_mock.replace_last_section.assert_called_once_with(
+            self._unified_kernel_image_path,
+            '.initrd',
+            [self._boot_path / 'microcode.img', self._boot_path / 'initramfs-linux-custom.img'],
+            output_file_path
+        )
+        self.assertEqual(
+            2048,
+            build_stats['bytes_written']
         )
 
+    def test_patch_unified_kernel_image_initrd_if_compression_configured_it_uses_compressed_initramfs(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=True,
+            initramfs_compression='zstd',
+            initramfs_compression_level=None,
+            initramfs_compression_workers=2
+        )
+        compressed_initramfs_file_path: Path = Path('/var/lib/secbootctl/initramfs-cache/abc-zstd-19.img')
+        compression_helper_mock: Mock = Mock()
+        compression_helper_mock.compress.return_value = compressed_initramfs_file_path
+        self._kernel_os_helper._compression_helper = compression_helper_mock
+        self._pe_helper_mock.replace_last_section.return_value = 2048
+        output_file_path: Path = Path('/tmp/staged.efi')
+
+        self._kernel_os_helper.patch_unified_kernel_image_initrd(
+            'linux-custom', self._unified_kernel_image_path, output_file_path
+        )
+
+        compression_helper_mock.compress.assert_called_once_with(
+            self._boot_path / 'initramfs-linux-custom.img', 'zstd', None, 2
+        )
+        self._pe_helper_mock.replace_last_section.assert_called_once_with(
+            self._unified_kernel_image_path,
+            '.initrd',
+            [self._boot_path / 'microcode.img', compressed_initramfs_file_path],
+            output_file_path
+        )
+
+    def test_patch_unified_kernel_image_initrd_if_not_patchable_it_returns_none(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            include_microcode=False
+        )
+        pe_helper_mock: Mock = self._pe_helper_mock
+        pe_helper_mock.replace_last_section.side_effect = AppError('section ".initrd" is not the last section')
+        self._kernel_os_helper._pe_helper = pe_helper_mock
+
+        self.assertIsNone(
+            self._kernel_os_helper.patch_unified_kernel_image_initrd(
+                'linux-custom', self._unified_kernel_image_path, Path('/tmp/staged.efi')
+            )
+        )
+
+    def test_predict_unified_kernel_image_size_it_adds_signature_reserve_to_image_file_size(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            include_microcode=False,
+            unified_kernel_image_layout='computed'
+        )
+        self._pe_helper_mock.get_image_file_size.return_value = 50 * 1024 * 1024
+
+        self.assertEqual(
+            50 * 1024 * 1024 + KernelOsHelper.SIGNATURE_SIZE_RESERVE,
+            self._kernel_os_helper.predict_unified_kernel_image_size('linux')
+        )
+        self.assertEqual(
+            ['.osrel', '.cmdline', '.linux', '.initrd'],
+            [section['name'] for section in self._pe_helper_mock.get_image_file_size.call_args.args[1]]
+        )
+
+    def test_predict_unified_kernel_image_size_if_compression_configured_it_does_not_compress(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = True
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            include_microcode=False,
+            unified_kernel_image_layout='computed',
+            initramfs_compression='zstd',
+            initramfs_compression_level=None
+        )
+        compressed_initramfs_file_path: Path = Path('/var/lib/secbootctl/initramfs-cache/abc-zstd-19.img')
+        compression_helper_mock: Mock = Mock()
+        self._kernel_os_helper._compression_helper = compression_helper_mock
+        self._pe_helper_mock.get_image_file_size.return_value = 50 * 1024 * 1024
+
+        # cached compressed image is used if there is one, otherwise the uncompressed image as upper bound
+        for cached_file_path, initrd_file_path in [
+            (compressed_initramfs_file_path, compressed_initramfs_file_path),
+            (None, self._boot_path / 'initramfs-linux.img')
+        ]:
+            with self.subTest(cached_file_path=cached_file_path):
+                compression_helper_mock.get_cached.return_value = cached_file_path
+
+                self._kernel_os_helper.predict_unified_kernel_image_size('linux')
+
+                compression_helper_mock.get_cached.assert_called_with(
+                    self._boot_path / 'initramfs-linux.img', 'zstd', None
+                )
+                self.assertEqual(
+                    [initrd_file_path],
+                    self._pe_helper_mock.get_image_file_size.call_args.args[1][3]['file_paths']
+                )
+
+        compression_helper_mock.compress.assert_not_called()
+
+    @patch('secbootctl.helpers.kernelos.os.statvfs')
+    def test_get_esp_usage_it_returns_total_and_free_space_of_esp(self, statvfs_patch_mock: MagicMock):
+        statvfs_patch_mock.return_value = Mock(f_blocks=1000, f_bavail=300, f_frsize=4096)
+
+        self.assertEqual(
+            {'total': 1000 * 4096, 'free': 300 * 4096, 'block_size': 4096},
+            self._kernel_os_helper.get_esp_usage()
+        )
+        statvfs_patch_mock.assert_called_once_with(self._esp_path)
+
     def test_get_default_kernel_name_if_not_latest_it_returns_configured_default_kernel_name(self):
         default_kernel_name: str = 'linux-custom'
         self._config_mock.configure_mock(default_kernel_name=default_kernel_name)
@@ -272,6 +594,22 @@ class TestKernelOsHelper(unittest.TestCase):
 
         glob_patch_mock.glob.assert_called_once_with(str(self._boot_path / (kernel_image_name_prefix + '-*')))
 
+    @patch('secbootctl.helpers.kernelos.glob')
+    def test_get_kernel_names_it_returns_sorted_names_of_all_kernels(self, glob_patch_mock: MagicMock):
+        self._config_mock.configure_mock(boot_path=self._boot_path, kernel_image_name_prefix='vmlinuz')
+        glob_patch_mock.glob.return_value = [
+            f'{self._boot_path}/vmlinuz-linux-lts',
+            f'{self._boot_path}/vmlinuz-5.10.0.14-generic',
+            f'{self._boot_path}/vmlinuz-linux'
+        ]
+
+        self.assertEqual(
+            ['5.10.0.14-generic', 'linux', 'linux-lts'],
+            self._kernel_os_helper.get_kernel_names()
+        )
+
+        glob_patch_mock.glob.assert_called_once_with(str(self._boot_path / 'vmlinuz-*'))
+
     @patch('secbootctl.helpers.kernelos.open', mock_open(read_data=f'ID=my-os-id'))
     def test_get_unified_kernel_image_path_it_returns_unified_kernel_image_path_for_given_kernel_name(self):
         kernel_name: str = 'linux-custom'
@@ -282,6 +620,30 @@ class TestKernelOsHelper(unittest.TestCase):
             self._kernel_os_helper.get_unified_kernel_image_path(kernel_name)
         )
 
+    def test_get_unified_kernel_image_input_paths_if_mc_it_returns_all_input_paths(self):
+        kernel_cmdline_file_path_mock = MagicMock()
+        kernel_cmdline_file_path_mock.is_file.return_value = False
+        Env.KERNEL_CMDLINE_ETC_FILE_PATH = kernel_cmdline_file_path_mock
+        self._config_mock.configure_mock(
+            boot_path=self._boot_path,
+            kernel_image_name_prefix='vmlinuz',
+            initramfs_image_name_template='initramfs-__kernel-name__.img',
+            microcode_image_name='microcode.img',
+            include_microcode=True
+        )
+
+        self.assertEqual(
+            {
+                'kernel': self._boot_path / 'vmlinuz-linux-custom',
+                'initramfs': self._boot_path / 'initramfs-linux-custom.img',
+                'cmdline': Env.KERNEL_CMDLINE_PROC_FILE_PATH,
+                'os-release': Env.OS_RELEASE_FILE_PATH,
+                'stub': Env.BOOTLOADER_SYSTEMD_BOOT_STUB_FILE_PATH,
+                'microcode': self._boot_path / 'microcode.img'
+            },
+            self._kernel_os_helper.get_unified_kernel_image_input_paths('linux-custom')
+        )
+
     def test_get_kernel_version_if_pm_is_not_pacman_it_returns_given_kernel_name(self):
         kernel_name: str = '5.10.0.80-generic'
         self._config_mock.configure_mock(package_manager_name='apt')
@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+
+from secbootctl.core import AppError
+from secbootctl.helpers.lock import LockHelper
+
+
+class TestLockHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._lock_file_path: Path = Path(self._temp_dir.name) / 'run' / 'secbootctl.lock'
+        self._lock_helper: LockHelper = LockHelper(self._lock_file_path)
+        self._processes: list = []
+
+    def tearDown(self) -> None:
+        for process in self._processes:
+            process.stdin.close()
+            process.stdout.close()
+            process.wait()
+
+        self._temp_dir.cleanup()
+
+    def _lock_in_other_process(self, exclusive: bool) -> subprocess.Popen:
+        """Returns a process that holds the lock until its STDIN is closed."""
+        process: subprocess.Popen = subprocess.Popen([sys.executable, '-c', textwrap.dedent(f'''
+            import sys
+            from pathlib import Path
+            from secbootctl.core import LockHelper
+
+            with LockHelper(Path({str(self._lock_file_path)!r})).lock({exclusive}):
+                print('locked', flush=True)
+                sys.stdin.read()
+        ''')], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+            cwd=Path(__file__).resolve().parents[2])
+        self._processes.append(process)
+        self.assertEqual('locked\n', process.stdout.readline())
+
+        return process
+
+    def test_lock_it_records_holder_while_locked(self):
+        with self._lock_helper.lock():
+            with LockHelper(self._lock_file_path).lock(False):
+                self.assertEqual([os.getpid()], [holder['pid'] for holder in self._lock_helper.get_holders()])
+
+            self.assertEqual('exclusive', self._lock_helper.get_holders()[0]['mode'])
+
+        self.assertEqual([], self._lock_helper.get_holders())
+
+    def test_lock_if_locked_exclusively_by_other_process_it_times_out(self):
+        process: subprocess.Popen = self._lock_in_other_process(True)
+        on_wait_mock: Mock = Mock()
+
+        with self.assertRaises(AppError) as context_manager:
+            with self._lock_helper.lock(False, 0.2, on_wait_mock):
+                pass
+
+        self.assertEqual(
+            f'lock "{self._lock_file_path}" still held after 0.2 seconds by: PID {process.pid}',
+            context_manager.exception.message
+        )
+        on_wait_mock.assert_called_once_with([{'pid': process.pid, 'mode': 'exclusive', 'command': ''}])
+        self.assertEqual({}, LockHelper._held_locks)
+
+    def test_lock_if_locked_shared_by_other_process_it_shares_lock_with_readers_only(self):
+        process: subprocess.Popen = self._lock_in_other_process(False)
+        on_wait_mock: Mock = Mock()
+
+        with self._lock_helper.lock(False, 0, on_wait_mock):
+            self.assertEqual(2, len(self._lock_helper.get_holders()))
+
+        with self.assertRaises(AppError):
+            with self._lock_helper.lock(True, 0, on_wait_mock):
+                pass
+
+        on_wait_mock.assert_called_once()
+        process.stdin.close()
+        process.wait()
+
+        with self._lock_helper.lock(True, 0):
+            pass
+
+    def test_get_holders_it_removes_holder_files_of_terminated_processes(self):
+        process: subprocess.Popen = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        holder_file_path: Path = self._lock_file_path.with_name('secbootctl.lock.d') / str(process.pid)
+        holder_file_path.parent.mkdir(parents=True)
+        holder_file_path.write_text('exclusive kernel:install\n')
+
+        self.assertEqual([], self._lock_helper.get_holders())
+        self.assertFalse(holder_file_path.exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+import hashlib
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.core import UnsupportedPeImageError
+from secbootctl.helpers.pe import PeHelper
+
+
+def create_pe_image(number_of_sections: int = 1, size_of_headers: int = 0x400, certificate: bytes = b'') -> bytes:
+    """Returns a minimal PE32+ image with the given number of ".text" sections (0x200 bytes each)."""
+    section_table_offset: int = 0x40 + 24 + 240
+    raw_data_end: int = size_of_headers + number_of_sections * 0x200
+    image: bytearray = bytearray(raw_data_end)
+    image[0:2] = b'MZ'
+    struct.pack_into('<I', image, 0x3c, 0x40)
+    image[0x40:0x44] = b'PE\0\0'
+    struct.pack_into('<HHIIIHH', image, 0x44, 0x8664, number_of_sections, 0, 0, 0, 240, 0x0206)
+    struct.pack_into('<H', image, 0x58, 0x20b)
+    struct.pack_into('<II', image, 0x58 + 32, 0x1000, 0x200)
+    struct.pack_into('<II', image, 0x58 + 56, 0x1000 * (number_of_sections + 1), size_of_headers)
+    struct.pack_into('<I', image, 0x58 + 64, 0x1234)
+    struct.pack_into('<I', image, 0x58 + 108, 16)
+
+    if certificate:
+        struct.pack_into('<II', image, 0x58 + 112 + 8 * 4, raw_data_end, len(certificate))
+
+    for index in range(number_of_sections):
+        struct.pack_into('<8sIIII', image, section_table_offset + index * 40, b'.text', 0x100, 0x1000 * (index + 1),
+                         0x200, size_of_headers + index * 0x200)
+        struct.pack_into('<I', image, section_table_offset + index * 40 + 36, 0x60000020)
+        image[size_of_headers + index * 0x200:size_of_headers + index * 0x200 + 4] = b'CODE'
+
+    return bytes(image) + certificate
+
+
+class TestPeHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._pe_helper: PeHelper = PeHelper()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._stub_file_path: Path = self._temp_path / 'stub.efi'
+        self._output_file_path: Path = self._temp_path / 'image.efi'
+        self._stub_file_path.write_bytes(create_pe_image())
+        self._sections: list = []
+
+        for name, payload, virtual_address in [('.osrel', b'ID=arch\n', 0x20000), ('.cmdline', b'quiet', 0x30000),
+                                               ('.linux', b'K' * 0x1234, 0x2000000),
+                                               ('.initrd', b'I' * 0x345, 0x3000000)]:
+            file_path: Path = self._temp_path / name.lstrip('.')
+            file_path.write_bytes(payload)
+            self._sections.append({'name': name, 'file_paths': [file_path], 'virtual_address': virtual_address})
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def test_read_header_it_returns_sections_and_alignments(self):
+        header: dict = self._pe_helper.read_header(self._stub_file_path)
+
+        self.assertEqual(
+            [{'name': '.text', 'virtual_size': 0x100, 'virtual_address': 0x1000, 'size_of_raw_data': 0x200,
+              'pointer_to_raw_data': 0x400, 'characteristics': 0x60000020}],
+            header['sections']
+        )
+        self.assertEqual(0x1000, header['section_alignment'])
+        self.assertEqual(0x200, header['file_alignment'])
+        self.assertEqual(0x600, header['raw_data_end'])
+
+    def test_read_header_if_no_pe_image_it_raises_an_error(self):
+        self._stub_file_path.write_bytes(b'\0' * 128)
+
+        with self.assertRaises(UnsupportedPeImageError) as context_manager:
+            self._pe_helper.read_header(self._stub_file_path)
+
+        self.assertEqual(
+            f'"{self._stub_file_path}" is not a PE image',
+            context_manager.exception.message
+        )
+
+    def test_layout_sections_it_packs_sections_behind_stub_sections(self):
+        sections: list = [{'name': section['name'], 'file_paths': section['file_paths']} for section in self._sections]
+
+        layout: dict = self._pe_helper.layout_sections(self._stub_file_path, sections)
+
+        self.assertEqual(
+            [0x2000, 0x3000, 0x4000, 0x6000],
+            [section['virtual_address'] for section in layout['sections']]
+        )
+        self.assertEqual(0x7000, layout['size_of_image'])
+        self.assertEqual(0, layout['image_base'])
+
+    def test_layout_sections_if_virtual_address_given_it_keeps_it(self):
+        layout: dict = self._pe_helper.layout_sections(self._stub_file_path, self._sections)
+
+        self.assertEqual(
+            [0x20000, 0x30000, 0x2000000, 0x3000000],
+            [section['virtual_address'] for section in layout['sections']]
+        )
+        self.assertEqual(0x3001000, layout['size_of_image'])
+
+    def test_layout_sections_if_fixed_addresses_too_close_it_raises_an_error(self):
+        self._sections[2]['file_paths'][0].write_bytes(b'K' * 0x1000001)
+
+        with self.assertRaises(AppError) as context_manager:
+            self._pe_helper.layout_sections(self._stub_file_path, self._sections)
+
+        self.assertEqual(
+            'section ".linux" overlaps section ".initrd"',
+            context_manager.exception.message
+        )
+
+    def test_get_image_file_size_it_returns_size_of_image_add_sections_writes(self):
+        image_file_size: int = self._pe_helper.get_image_file_size(self._stub_file_path, self._sections)
+
+        self.assertEqual(
+            self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path),
+            image_file_size
+        )
+
+    def test_add_sections_it_appends_sections_with_payloads(self):
+        bytes_written: int = self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+
+        header: dict = self._pe_helper.read_header(self._output_file_path)
+        image: bytes = self._output_file_path.read_bytes()
+
+        self.assertEqual(
+            ['.text', '.osrel', '.cmdline', '.linux', '.initrd'],
+            [section['name'] for section in header['sections']]
+        )
+        self.assertEqual(b'CODE', image[0x400:0x404])
+
+        for section, new_section in zip(self._sections, header['sections'][1:]):
+            payload: bytes = section['file_paths'][0].read_bytes()
+
+            self.assertEqual(section['virtual_address'], new_section['virtual_address'])
+            self.assertEqual(len(payload), new_section['virtual_size'])
+            self.assertEqual(0, new_section['pointer_to_raw_data'] % 0x200)
+            self.assertEqual(0, new_section['size_of_raw_data'] % 0x200)
+            self.assertEqual(
+                payload,
+                image[new_section['pointer_to_raw_data']:new_section['pointer_to_raw_data'] + len(payload)]
+            )
+
+        self.assertEqual(0x3001000, header['size_of_image'])
+        self.assertEqual(len(image), header['raw_data_end'])
+        self.assertEqual(len(image), bytes_written)
+
+    def test_add_sections_if_multiple_files_given_it_concatenates_payloads(self):
+        microcode_file_path: Path = self._temp_path / 'microcode'
+        microcode_file_path.write_bytes(b'M' * 0x123)
+        self._sections[3]['file_paths'].insert(0, microcode_file_path)
+
+        self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+
+        initrd_section: dict = self._pe_helper.read_header(self._output_file_path)['sections'][-1]
+        image: bytes = self._output_file_path.read_bytes()
+
+        self.assertEqual(0x123 + 0x345, initrd_section['virtual_size'])
+        self.assertEqual(
+            b'M' * 0x123 + b'I' * 0x345,
+            image[initrd_section['pointer_to_raw_data']:initrd_section['pointer_to_raw_data'] + 0x123 + 0x345]
+        )
+
+    def test_add_sections_it_drops_certificate_table_and_checksum(self):
+        self._stub_file_path.write_bytes(create_pe_image(certificate=b'SIGNATURE'))
+
+        self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+
+        image: bytes = self._output_file_path.read_bytes()
+        self.assertNotIn(b'SIGNATURE', image)
+        self.assertEqual((0, 0), struct.unpack_from('<II', image, 0x58 + 112 + 8 * 4))
+        self.assertEqual(0, struct.unpack_from('<I', image, 0x58 + 64)[0])
+
+    def test_add_sections_if_no_space_for_section_headers_it_raises_an_error(self):
+        self._stub_file_path.write_bytes(create_pe_image(size_of_headers=0x200))
+
+        with self.assertRaises(UnsupportedPeImageError) as context_manager:
+            self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+
+        self.assertEqual(
+            f'not enough space for additional section headers in "{self._stub_file_path}"',
+            context_manager.exception.message
+        )
+
+    def test_add_sections_if_sections_overlap_it_raises_an_error(self):
+        self._sections[2]['file_paths'][0].write_bytes(b'K' * 0x1000001)
+
+        with self.assertRaises(AppError) as context_manager:
+            self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+
+        self.assertEqual(
+            'section ".linux" overlaps section ".initrd"',
+            context_manager.exception.message
+        )
+
+    def test_get_certificates_it_returns_pkcs7_signatures_of_certificate_table(self):
+        win_certificates: bytes = struct.pack('<IHH', 8 + 5, 0x0200, 0x0002) + b'PKCS7' + b'\0' * 3
+        win_certificates += struct.pack('<IHH', 8 + 3, 0x0200, 0x0001) + b'X50' + b'\0' * 5
+        win_certificates += struct.pack('<IHH', 8 + 8, 0x0200, 0x0002) + b'PKCS7-II'
+        self._stub_file_path.write_bytes(create_pe_image(certificate=win_certificates))
+
+        self.assertEqual(
+            [b'PKCS7', b'PKCS7-II'],
+            self._pe_helper.get_certificates(self._stub_file_path)
+        )
+
+    def test_get_certificates_if_unsigned_it_returns_empty_list(self):
+        self.assertEqual(
+            [],
+            self._pe_helper.get_certificates(self._stub_file_path)
+        )
+
+    def test_remove_certificates_it_removes_certificate_table_and_pads_image(self):
+        win_certificate: bytes = struct.pack('<IHH', 8 + 8, 0x0200, 0x0002) + b'PKCS7-II'
+        self._stub_file_path.write_bytes(create_pe_image(certificate=win_certificate))
+
+        self._pe_helper.remove_certificates(self._stub_file_path)
+
+        self.assertEqual(
+            create_pe_image(),
+            self._stub_file_path.read_bytes()
+        )
+
+    def test_add_certificate_it_appends_aligned_certificate_and_keeps_authenticode_digest(self):
+        self._stub_file_path.write_bytes(create_pe_image() + b'TRAILER')
+        self._pe_helper.remove_certificates(self._stub_file_path)
+        digest: bytes = self._pe_helper.get_authenticode_digest(self._stub_file_path)
+
+        self._pe_helper.add_certificate(self._stub_file_path, b'PKCS7')
+        self._pe_helper.add_certificate(self._stub_file_path, b'PKCS7-II')
+
+        self.assertEqual(
+            b'TRAILER\0' + struct.pack('<IHH', 8 + 5, 0x0200, 0x0002) + b'PKCS7\0\0\0' +
+            struct.pack('<IHH', 8 + 8, 0x0200, 0x0002) + b'PKCS7-II',
+            self._stub_file_path.read_bytes()[len(create_pe_image()):]
+        )
+        self.assertEqual(
+            (len(create_pe_image()) + 8, 16 + 16),
+            struct.unpack_from('<II', self._stub_file_path.read_bytes(), 0x58 + 112 + 8 * 4)
+        )
+        self.assertEqual(
+            [b'PKCS7', b'PKCS7-II'],
+            self._pe_helper.get_certificates(self._stub_file_path)
+        )
+        self.assertEqual(
+            digest,
+            self._pe_helper.get_authenticode_digest(self._stub_file_path)
+        )
+
+    def test_get_authenticode_digest_it_skips_checksum_certificate_table_entry_and_certificates(self):
+        image: bytes = create_pe_image(number_of_sections=2)
+        checksum_offset: int = 0x58 + 64
+        certificate_table_entry_offset: int = 0x58 + 112 + 8 * 4
+        expected_digest: bytes = hashlib.sha256(
+            image[:checksum_offset] + image[checksum_offset + 4:certificate_table_entry_offset] +
+            image[certificate_table_entry_offset + 8:]
+        ).digest()
+        self._stub_file_path.write_bytes(create_pe_image(number_of_sections=2, certificate=b'SIGNATURE'))
+
+        self.assertEqual(
+            expected_digest,
+            self._pe_helper.get_authenticode_digest(self._stub_file_path)
+        )
+
+    def test_replace_last_section_it_writes_same_image_as_full_build(self):
+        self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+        signed_image_file_path: Path = self._temp_path / 'signed.efi'
+        signed_image_file_path.write_bytes(self._output_file_path.read_bytes() + b'SIGNATURE')
+        self._sections[3]['file_paths'][0].write_bytes(b'N' * 0x2345)
+        self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+        patched_image_file_path: Path = self._temp_path / 'patched.efi'
+
+        bytes_written: int = self._pe_helper.replace_last_section(
+            signed_image_file_path, '.initrd', self._sections[3]['file_paths'], patched_image_file_path
+        )
+
+        self.assertEqual(
+            self._output_file_path.read_bytes(),
+            patched_image_file_path.read_bytes()
+        )
+        self.assertEqual(patched_image_file_path.stat().st_size, bytes_written)
+
+    @patch('secbootctl.helpers.pe.os.copy_file_range', side_effect=OSError(18, 'Invalid cross-device link'))
+    def test_replace_last_section_if_copy_file_range_fails_it_copies_buffered(self, _: MagicMock):
+        self._pe_helper.add_sections(self._stub_file_path, self._sections, self._output_file_path)
+        patched_image_file_path: Path = self._temp_path / 'patched.efi'
+
+        self._pe_helper.replace_last_section(
+            self._output_file_path, '.initrd', self._sections[3]['file_paths'], patched_image_file_path
+        )
+
+        self.assertEqual(
+            self._output_file_path.read_bytes(),
+            patched_image_file_path.read_bytes()
+        )
+
+    def test_replace_last_section_if_section_is_not_last_it_raises_an_error(self):
+        self._pe_helper.add_sections(self._stub_file_path, self._sections[:3], self._output_file_path)
+
+        with self.assertRaises(AppError) as context_manager:
+            self._pe_helper.replace_last_section(
+                self._output_file_path, '.initrd', self._sections[3]['file_paths'], self._temp_path / 'patched.efi'
+            )
+
+        self.assertEqual(
+            f'section ".initrd" is not the last section of "{self._output_file_path}"',
+            context_manager.exception.message
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
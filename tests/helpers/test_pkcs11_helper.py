@@ -0,0 +1,208 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from unittest.mock import call
+from unittest.mock import patch
+
+from secbootctl.core import AppError
+from secbootctl.helpers.authenticode import AuthenticodeHelper
+from secbootctl.helpers.pkcs11 import Pkcs11Helper, PyKCS11
+from secbootctl.helpers.secureboot import SecureBootHelper
+from tests.helpers.test_pe_helper import create_pe_image
+
+SOFTHSM_MODULE_PATHS: list = [
+    '/usr/lib/softhsm/libsofthsm2.so', '/usr/lib/x86_64-linux-gnu/softhsm/libsofthsm2.so',
+    '/usr/lib64/pkcs11/libsofthsm2.so', '/usr/lib/pkcs11/libsofthsm2.so'
+]
+
+
+class PyKCS11Error(Exception):
+    pass
+
+
+def create_pykcs11_mock() -> MagicMock:
+    """Returns a mock of the PyKCS11 module with the constants used by "Pkcs11Helper"."""
+    pykcs11_mock: MagicMock = MagicMock()
+    pykcs11_mock.configure_mock(
+        PyKCS11Error=PyKCS11Error, CKF_SERIAL_SESSION=0x4, CKF_LOGIN_REQUIRED=0x4,
+        CKF_PROTECTED_AUTHENTICATION_PATH=0x100, CKU_CONTEXT_SPECIFIC=2, CKO_PRIVATE_KEY=3, CKA_CLASS=0x0,
+        CKA_LABEL=0x3, CKA_ID=0x102, CKA_KEY_TYPE=0x100, CKA_ALWAYS_AUTHENTICATE=0x202, CKK_RSA=0x0, CKK_EC=0x3,
+        CKM_RSA_PKCS=0x1, CKM_ECDSA=0x1041
+    )
+
+    return pykcs11_mock
+
+
+class TestPkcs11Helper(unittest.TestCase):
+    def setUp(self) -> None:
+        Pkcs11Helper._sessions.clear()
+        self._pykcs11_patcher = patch('secbootctl.helpers.pkcs11.PyKCS11', create_pykcs11_mock())
+        self._pykcs11_mock: MagicMock = self._pykcs11_patcher.start()
+        self._library_mock: MagicMock = self._pykcs11_mock.PyKCS11Lib.return_value
+        self._library_mock.getSlotList.return_value = [0, 1]
+        self._library_mock.getTokenInfo.side_effect = lambda slot: SimpleNamespace(
+            label=f'token{slot}'.ljust(32), manufacturerID='piv_II'.ljust(32), serialNumber=f'{slot}'.ljust(16),
+            model='PKCS#15'.ljust(16), flags=0x4
+        )
+        self._session_mock: MagicMock = self._library_mock.openSession.return_value
+        self._session_mock.findObjects.return_value = ['KEY']
+        self._session_mock.getAttributeValue.return_value = [0x0, False]
+        self._session_mock.sign.return_value = [0x01, 0x02]
+        self._digest: bytes = bytes(32)
+
+    def tearDown(self) -> None:
+        self._pykcs11_patcher.stop()
+        Pkcs11Helper._sessions.clear()
+
+    def test_sign_digest_if_rsa_key_it_signs_digest_info_and_reuses_session(self):
+        pkcs11_helper: Pkcs11Helper = Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:token=token1;id=%02?pin-value=1234')
+
+        self.assertEqual(b'\x01\x02', pkcs11_helper.sign_digest(self._digest))
+        self.assertEqual(b'\x01\x02', Pkcs11Helper('opensc-pkcs11.so', pkcs11_helper._uri).sign_digest(self._digest))
+
+        self._library_mock.load.assert_called_once_with('opensc-pkcs11.so')
+        self._library_mock.openSession.assert_called_once_with(1, 0x4)
+        self._session_mock.login.assert_called_once_with('1234')
+        self._session_mock.findObjects.assert_called_once_with([(0x0, 3), (0x102, (2,))])
+        self._pykcs11_mock.Mechanism.assert_called_with(0x1, None)
+        self._session_mock.sign.assert_called_with(
+            'KEY', Pkcs11Helper.DIGEST_INFO_PREFIXES['sha256'] + self._digest, self._pykcs11_mock.Mechanism.return_value
+        )
+        self.assertEqual(2, self._session_mock.sign.call_count)
+
+    @patch('secbootctl.helpers.pkcs11.getpass')
+    def test_sign_digest_if_key_always_requires_login_it_asks_for_pin_once(self, getpass_patch_mock: MagicMock):
+        getpass_patch_mock.getpass.return_value = '4321'
+        self._session_mock.getAttributeValue.return_value = [0x0, True]
+        pkcs11_helper: Pkcs11Helper = Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:manufacturer=piv_II;object=db')
+
+        pkcs11_helper.sign_digest(self._digest)
+        pkcs11_helper.sign_digest(self._digest)
+
+        getpass_patch_mock.getpass.assert_called_once_with('PIN for security token "token0": ')
+        self._session_mock.login.assert_has_calls([call('4321'), call('4321', 2), call('4321', 2)])
+        self._session_mock.findObjects.assert_called_once_with([(0x0, 3), (0x3, 'db')])
+
+    def test_sign_digest_if_ec_key_it_returns_der_encoded_signature(self):
+        self._session_mock.getAttributeValue.return_value = [0x3, False]
+        self._session_mock.sign.return_value = list(b'\x00\x81' + b'\x01' * 30 + b'\x00\x00' + b'\x7f' * 30)
+
+        self.assertEqual(
+            b'\x30\x42\x02\x20\x00\x81' + b'\x01' * 30 + b'\x02\x1e' + b'\x7f' * 30,
+            Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:id=%02?pin-value=1234').sign_digest(self._digest)
+        )
+        self._session_mock.sign.assert_called_once_with('KEY', self._digest, self._pykcs11_mock.Mechanism.return_value)
+        self._pykcs11_mock.Mechanism.assert_called_once_with(0x1041, None)
+
+    def test_sign_digest_if_module_path_in_uri_it_loads_given_module(self):
+        Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:id=%02?pin-value=1234&module-path=/usr/lib/libykcs11.so') \
+            .sign_digest(self._digest)
+
+        self._library_mock.load.assert_called_once_with('/usr/lib/libykcs11.so')
+
+    def test_sign_digest_if_no_key_found_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:token=token2?pin-value=1234').sign_digest(self._digest)
+
+        self.assertEqual(
+            'no security token key found for: pkcs11:token=token2?pin-value=1234',
+            context_manager.exception.message
+        )
+        self._library_mock.openSession.assert_not_called()
+
+    def test_sign_digest_if_signing_fails_it_raises_an_error(self):
+        self._session_mock.sign.side_effect = PyKCS11Error('CKR_DEVICE_REMOVED')
+
+        with self.assertRaises(AppError) as context_manager:
+            Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:id=%02?pin-value=1234').sign_digest(self._digest)
+
+        self.assertEqual(
+            'signing with security token failed: CKR_DEVICE_REMOVED',
+            context_manager.exception.message
+        )
+
+    def test_sign_digest_if_pykcs11_not_installed_it_raises_an_error(self):
+        with patch('secbootctl.helpers.pkcs11.PyKCS11', None), self.assertRaises(AppError) as context_manager:
+            Pkcs11Helper('opensc-pkcs11.so', 'pkcs11:id=%02').sign_digest(self._digest)
+
+        self.assertEqual(
+            'security token signer "pkcs11" requires the Python module "PyKCS11"',
+            context_manager.exception.message
+        )
+
+
+@unittest.skipIf(PyKCS11 is None, 'PyKCS11 not installed')
+@unittest.skipIf(shutil.which('openssl') is None, 'openssl not available')
+@unittest.skipIf(not any(os.path.exists(path) for path in SOFTHSM_MODULE_PATHS), 'SoftHSM not installed')
+class TestPkcs11HelperWithSoftHsm(unittest.TestCase):
+    """Signs images with a key stored on a SoftHSM token, SoftHSM being a local stand-in for a security token."""
+    def setUp(self) -> None:
+        Pkcs11Helper._sessions.clear()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._module_path: str = next(path for path in SOFTHSM_MODULE_PATHS if os.path.exists(path))
+        (self._temp_path / 'tokens').mkdir()
+        (self._temp_path / 'softhsm2.conf').write_text(f'directories.tokendir = {self._temp_path / "tokens"}\n')
+        self._environ_patcher = patch.dict(os.environ, {'SOFTHSM2_CONF': str(self._temp_path / 'softhsm2.conf')})
+        self._environ_patcher.start()
+        self._openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', 'db.key', '-out', 'db.crt', '-subj',
+                      '/CN=db', '-days', '1', '-sha256')
+        self._import_key()
+
+    def tearDown(self) -> None:
+        Pkcs11Helper._close_sessions()
+        self._environ_patcher.stop()
+        self._temp_dir.cleanup()
+
+    def _openssl(self, *args: str) -> bytes:
+        return subprocess.run(['openssl', *args], cwd=self._temp_path, capture_output=True, check=True).stdout
+
+    def _import_key(self) -> None:
+        """Initializes a token "secbootctl" (user PIN "1234") and stores the key "db.key" on it."""
+        authenticode_helper: AuthenticodeHelper = AuthenticodeHelper()
+        key_fields: list = [field[1] for field in authenticode_helper._decode(authenticode_helper._decode(
+            self._openssl('rsa', '-in', 'db.key', '-outform', 'DER', '-traditional')
+        )[0][1])]
+        library = PyKCS11.PyKCS11Lib()
+        library.load(self._module_path)
+        slot = library.getSlotList()[0]
+        library.initToken(slot, '0000', 'secbootctl')
+        slot = next(slot for slot in library.getSlotList(tokenPresent=True)
+                    if library.getTokenInfo(slot).label.strip() == 'secbootctl')
+        session = library.openSession(slot, PyKCS11.CKF_SERIAL_SESSION | PyKCS11.CKF_RW_SESSION)
+        session.login('0000', PyKCS11.CKU_SO)
+        session.initPin('1234')
+        session.logout()
+        session.login('1234')
+        session.createObject([
+            (PyKCS11.CKA_CLASS, PyKCS11.CKO_PRIVATE_KEY), (PyKCS11.CKA_KEY_TYPE, PyKCS11.CKK_RSA),
+            (PyKCS11.CKA_TOKEN, PyKCS11.CK_TRUE), (PyKCS11.CKA_PRIVATE, PyKCS11.CK_TRUE),
+            (PyKCS11.CKA_SIGN, PyKCS11.CK_TRUE), (PyKCS11.CKA_LABEL, 'db'), (PyKCS11.CKA_ID, (0x02,)),
+            *zip([PyKCS11.CKA_MODULUS, PyKCS11.CKA_PUBLIC_EXPONENT, PyKCS11.CKA_PRIVATE_EXPONENT,
+                  PyKCS11.CKA_PRIME_1, PyKCS11.CKA_PRIME_2, PyKCS11.CKA_EXPONENT_1, PyKCS11.CKA_EXPONENT_2,
+                  PyKCS11.CKA_COEFFICIENT], [tuple(field.lstrip(b'\0')) for field in key_fields[1:9]])
+        ])
+        session.logout()
+        session.closeSession()
+
+    def test_sign_file_it_signs_files_with_one_session(self):
+        sb_helper: SecureBootHelper = SecureBootHelper(
+            self._temp_path, 'native', 'pkcs11', 'pkcs11:token=secbootctl;id=%02?pin-value=1234', self._module_path
+        )
+
+        for name in ['first.efi', 'second.efi']:
+            (self._temp_path / name).write_bytes(create_pe_image(number_of_sections=2))
+
+            self.assertTrue(sb_helper.sign_file(self._temp_path / name, True))
+            self.assertTrue(sb_helper.verify_file(self._temp_path / name))
+
+        self.assertEqual(1, len(Pkcs11Helper._sessions))
+
+
+if __name__ == '__main__':
+    unittest.main()
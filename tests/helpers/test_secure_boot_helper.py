@@ -4,6 +4,7 @@ from unittest.mock import MagicMock
 from unittest.mock import Mock
 from unittest.mock import patch
 
+from secbootctl.core import AppError
 from secbootctl.env import Env
 from secbootctl.helpers.secureboot import SecureBootHelper
 
@@ -15,6 +16,10 @@ class TestSecureBootHelper(unittest.TestCase):
         self._key_path: Path = Path('/tmp/keys')
         self._db_key_file_path = self._key_path / (Env.SB_KEY_NAME_DB + '.key')
         self._db_cert_file_path = self._key_path / (Env.SB_KEY_NAME_DB + '.crt')
+        # a sign agent running on the test host must not be used
+        self._sign_agent_socket_patcher = patch.object(Env, 'SIGN_AGENT_SOCKET_PATH', Path('/nonexistent/agent.sock'))
+        self._sign_agent_socket_patcher.start()
+        self.addCleanup(self._sign_agent_socket_patcher.stop)
         self._sb_helper: SecureBootHelper = SecureBootHelper(self._key_path)
 
     def test_init_it_assigns_key_file_paths(self):
@@ -66,6 +71,89 @@ class TestSecureBootHelper(unittest.TestCase):
             ], capture_output=True
         )
 
+    @patch('secbootctl.helpers.secureboot.subprocess')
+    def test_sign_file_if_use_token_it_uses_configured_pkcs11_uri(self, subprocess_patch_mock: MagicMock):
+        subprocess_patch_mock.run.return_value = self._process_result_mock
+        self._process_result_mock.configure_mock(returncode=0)
+        self._sb_helper = SecureBootHelper(self._key_path, 'native', 'sbsign', 'pkcs11:token=test;object=db')
+
+        self._sb_helper.sign_file(self._file_path, True)
+
+        self.assertEqual(
+            '--key=pkcs11:token=test;object=db',
+            subprocess_patch_mock.run.call_args.args[0][2]
+        )
+
+    @patch('secbootctl.helpers.secureboot.subprocess')
+    def test_sign_file_if_use_token_and_pkcs11_signer_it_signs_in_process(self, subprocess_patch_mock: MagicMock):
+        self._sb_helper = SecureBootHelper(self._key_path, 'native', 'pkcs11')
+        self._sb_helper._pe_helper = Mock()
+        self._sb_helper._authenticode_helper = Mock()
+        self._sb_helper._authenticode_helper.create_signature.return_value = b'PKCS7'
+        self._sb_helper._pkcs11_helper = Mock()
+
+        self.assertTrue(
+            self._sb_helper.sign_file(self._file_path, True)
+        )
+
+        self._sb_helper._pe_helper.remove_certificates.assert_called_once_with(self._file_path)
+        self._sb_helper._authenticode_helper.create_signature.assert_called_once_with(
+            self._file_path, self._db_cert_file_path, self._sb_helper._pkcs11_helper.sign_digest
+        )
+        self._sb_helper._pe_helper.add_certificate.assert_called_once_with(self._file_path, b'PKCS7')
+        subprocess_patch_mock.run.assert_not_called()
+
+    def test_sign_file_if_use_token_and_pkcs11_signer_fails_it_raises_an_error(self):
+        self._sb_helper = SecureBootHelper(self._key_path, 'native', 'pkcs11')
+        self._sb_helper._pe_helper = Mock()
+        self._sb_helper._authenticode_helper = Mock()
+        self._sb_helper._authenticode_helper.create_signature.side_effect = AppError(
+            'signing with security token failed: CKR_PIN_INCORRECT'
+        )
+
+        with self.assertRaises(AppError):
+            self._sb_helper.sign_file(self._file_path, True)
+
+        self._sb_helper._pe_helper.add_certificate.assert_not_called()
+
+    @patch('secbootctl.helpers.secureboot.subprocess')
+    def test_sign_file_if_sign_agent_is_running_it_signs_with_agent(self, subprocess_patch_mock: MagicMock):
+        self._sb_helper._pe_helper = Mock()
+        self._sb_helper._authenticode_helper = Mock()
+        self._sb_helper._authenticode_helper.create_signature.return_value = b'PKCS7'
+        self._sb_helper._sign_agent_helper = Mock()
+        self._sb_helper._sign_agent_helper.is_running.return_value = True
+
+        self.assertTrue(
+            self._sb_helper.sign_file(self._file_path, True)
+        )
+
+        self._sb_helper._authenticode_helper.create_signature.assert_called_once_with(
+            self._file_path, self._db_cert_file_path, self._sb_helper._sign_agent_helper.sign_digest
+        )
+        self._sb_helper._pe_helper.add_certificate.assert_called_once_with(self._file_path, b'PKCS7')
+        subprocess_patch_mock.run.assert_not_called()
+
+    def test_get_digest_signer_if_use_token_it_opens_token_session(self):
+        self._sb_helper._pkcs11_helper = Mock()
+
+        self.assertIs(
+            self._sb_helper._pkcs11_helper.sign_digest,
+            self._sb_helper.get_digest_signer(True)
+        )
+
+        self._sb_helper._pkcs11_helper.open_session.assert_called_once()
+
+    @patch('secbootctl.helpers.secureboot.load_pem_private_key', None)
+    def test_get_digest_signer_if_cryptography_not_installed_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            self._sb_helper.get_digest_signer(False)
+
+        self.assertEqual(
+            'signing with key files requires the Python module "cryptography"',
+            context_manager.exception.message
+        )
+
     @patch('secbootctl.helpers.secureboot.subprocess')
     def test_sign_file_if_signing_fails_it_returns_false(self, subprocess_patch_mock: MagicMock):
         subprocess_patch_mock.run.return_value = self._process_result_mock
@@ -110,6 +198,8 @@ class TestSecureBootHelper(unittest.TestCase):
         subprocess_patch_mock.run.return_value = self._process_result_mock
         self._process_result_mock.configure_mock(returncode=0)
 
+        self._sb_helper = SecureBootHelper(self._key_path, 'sbverify')
+
         self.assertTrue(
             self._sb_helper.verify_file(self._file_path)
         )
@@ -127,6 +217,8 @@ class TestSecureBootHelper(unittest.TestCase):
         subprocess_patch_mock.run.return_value = self._process_result_mock
         self._process_result_mock.configure_mock(returncode=1)
 
+        self._sb_helper = SecureBootHelper(self._key_path, 'sbverify')
+
         self.assertFalse(
             self._sb_helper.verify_file(self._file_path)
         )
@@ -139,6 +231,40 @@ class TestSecureBootHelper(unittest.TestCase):
             ], capture_output=True
         )
 
+    def test_verify_file_if_native_verifier_it_verifies_in_process(self):
+        authenticode_helper_mock: Mock = Mock()
+        authenticode_helper_mock.verify_file.return_value = True
+        self._sb_helper._authenticode_helper = authenticode_helper_mock
+
+        with patch('secbootctl.helpers.secureboot.subprocess') as subprocess_patch_mock:
+            self.assertTrue(
+                self._sb_helper.verify_file(self._file_path)
+            )
+
+        authenticode_helper_mock.verify_file.assert_called_once_with(self._file_path, self._db_cert_file_path)
+        subprocess_patch_mock.run.assert_not_called()
+
+    @patch('secbootctl.helpers.secureboot.subprocess')
+    def test_verify_file_if_native_verifier_can_not_verify_it_falls_back_to_sbverify(
+            self, subprocess_patch_mock: MagicMock):
+        authenticode_helper_mock: Mock = Mock()
+        authenticode_helper_mock.verify_file.return_value = None
+        self._sb_helper._authenticode_helper = authenticode_helper_mock
+        subprocess_patch_mock.run.return_value = self._process_result_mock
+        self._process_result_mock.configure_mock(returncode=0)
+
+        self.assertTrue(
+            self._sb_helper.verify_file(self._file_path)
+        )
+
+        subprocess_patch_mock.run.assert_called_once_with(
+            [
+                'sbverify',
+                f'--cert={self._db_cert_file_path}',
+                self._file_path
+            ], capture_output=True
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from secbootctl.core import AppError
+from secbootctl.helpers.signagent import SignAgentHelper
+
+
+class TestSignAgentHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._socket_path: Path = Path(self._temp_dir.name) / 'agent' / 'sign-agent.sock'
+        self._sign_agent_helper: SignAgentHelper = SignAgentHelper(self._socket_path)
+        self._signed_digests: list = []
+
+    def tearDown(self) -> None:
+        self._sign_agent_helper.stop()
+        self._temp_dir.cleanup()
+
+    def _sign_digest(self, digest: bytes, hash_name: str) -> bytes:
+        if digest == b'fail':
+            raise AppError('signing with security token failed: CKR_DEVICE_REMOVED')
+
+        self._signed_digests.append((digest, threading.current_thread().name))
+
+        return hash_name.encode() + digest
+
+    def _start_agent(self, idle_timeout: float = None) -> threading.Thread:
+        agent_thread: threading.Thread = threading.Thread(
+            target=self._sign_agent_helper.serve, args=(self._sign_digest, idle_timeout), daemon=True
+        )
+        agent_thread.start()
+
+        for _ in range(100):
+            if self._sign_agent_helper.is_running():
+                break
+
+            time.sleep(0.01)
+
+        return agent_thread
+
+    def test_serve_it_signs_requested_digests(self):
+        self._start_agent()
+
+        self.assertEqual(b'sha256\x01\x02', self._sign_agent_helper.sign_digest(b'\x01\x02'))
+        self.assertEqual(
+            [b'sha384\x03', b'sha384\x04'],
+            SignAgentHelper(self._socket_path).sign_digests([b'\x03', b'\x04'], 'sha384')
+        )
+        self.assertEqual(0o600, self._socket_path.stat().st_mode & 0o777)
+        self.assertEqual(0o700, self._socket_path.parent.stat().st_mode & 0o777)
+
+    def test_serve_if_concurrent_requests_it_signs_them_in_one_thread(self):
+        self._start_agent()
+        signatures: dict = {}
+
+        def sign(number: int) -> None:
+            signatures[number] = SignAgentHelper(self._socket_path).sign_digest(bytes([number]))
+
+        client_threads: list = [threading.Thread(target=sign, args=(number,)) for number in range(8)]
+
+        for client_thread in client_threads:
+            client_thread.start()
+
+        for client_thread in client_threads:
+            client_thread.join()
+
+        self.assertEqual({number: b'sha256' + bytes([number]) for number in range(8)}, signatures)
+        self.assertEqual(1, len({thread_name for _, thread_name in self._signed_digests}))
+
+    def test_serve_if_signing_fails_it_returns_error_to_client(self):
+        self._start_agent()
+
+        with self.assertRaises(AppError) as context_manager:
+            self._sign_agent_helper.sign_digest(b'fail')
+
+        self.assertEqual(
+            'sign agent failed: signing with security token failed: CKR_DEVICE_REMOVED',
+            context_manager.exception.message
+        )
+
+    def test_serve_if_idle_timeout_reached_it_stops_and_removes_socket(self):
+        agent_thread: threading.Thread = self._start_agent(0.2)
+        agent_thread.join(5)
+
+        self.assertFalse(agent_thread.is_alive())
+        self.assertFalse(self._socket_path.exists())
+
+    def test_serve_if_agent_already_running_it_raises_an_error(self):
+        self._start_agent()
+
+        with self.assertRaises(AppError) as context_manager:
+            SignAgentHelper(self._socket_path).serve(self._sign_digest)
+
+        self.assertEqual(f'sign agent is already running: {self._socket_path}', context_manager.exception.message)
+
+    def test_is_running_if_socket_is_stale_it_returns_false(self):
+        self.assertFalse(self._sign_agent_helper.is_running())
+
+        os.makedirs(self._socket_path.parent)
+        self._socket_path.touch()
+
+        self.assertFalse(self._sign_agent_helper.is_running())
+
+    def test_sign_digest_if_agent_not_running_it_raises_an_error(self):
+        with self.assertRaises(AppError) as context_manager:
+            self._sign_agent_helper.sign_digest(b'\x01')
+
+        self.assertTrue(context_manager.exception.message.startswith(
+            f'connection to sign agent "{self._socket_path}" failed: '
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import Mock
+
+from secbootctl.helpers.signaturecache import SignatureCacheHelper
+
+
+class TestSignatureCacheHelper(unittest.TestCase):
+    def setUp(self) -> None:
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._temp_path: Path = Path(self._temp_dir.name)
+        self._cache_file_path: Path = self._temp_path / 'lib' / 'signature-cache.bin'
+        self._cert_file_path: Path = self._temp_path / 'db.crt'
+        self._cert_file_path.write_bytes(b'CERT')
+        self._file_path: Path = self._temp_path / 'test.efi'
+        self._file_path.write_bytes(b'EFI')
+        self._verify_file_mock: Mock = Mock(return_value=True)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+
+    def _set_mtime(self, file_path: Path, mtime_ns: int = 1_000_000_000_000_000_000) -> None:
+        os.utime(file_path, ns=(mtime_ns, mtime_ns))
+
+    def _create_signature_cache_helper(self) -> SignatureCacheHelper:
+        return SignatureCacheHelper(self._cache_file_path, self._cert_file_path)
+
+    def test_verify_file_if_not_cached_it_verifies_file(self):
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+
+        self.assertTrue(signature_cache_helper.verify_file(self._file_path, self._verify_file_mock))
+        self._verify_file_mock.assert_called_once_with(self._file_path)
+        self.assertEqual((0, 1), (signature_cache_helper.hits, signature_cache_helper.misses))
+
+    def test_verify_file_if_cached_and_unchanged_it_does_not_verify_file(self):
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, Mock(return_value=False))
+        signature_cache_helper.save()
+        signature_cache_helper = self._create_signature_cache_helper()
+
+        self.assertFalse(signature_cache_helper.verify_file(self._file_path, self._verify_file_mock))
+        self._verify_file_mock.assert_not_called()
+        self.assertEqual((1, 0), (signature_cache_helper.hits, signature_cache_helper.misses))
+
+    def test_verify_file_if_cache_saved_it_is_loaded_from_cache_file(self):
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.save()
+        self._verify_file_mock.reset_mock()
+
+        signature_cache_helper = self._create_signature_cache_helper()
+
+        self.assertTrue(signature_cache_helper.verify_file(self._file_path, self._verify_file_mock))
+        self._verify_file_mock.assert_not_called()
+        self.assertEqual(
+            signature_cache_helper.HEADER_STRUCT.size + signature_cache_helper.RECORD_STRUCT.size,
+            self._cache_file_path.stat().st_size
+        )
+
+    def test_verify_file_if_file_changed_it_verifies_file_again(self):
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.save()
+        self._file_path.write_bytes(b'CHANGED')
+
+        self._create_signature_cache_helper().verify_file(self._file_path, self._verify_file_mock)
+
+        self.assertEqual(2, self._verify_file_mock.call_count)
+
+    def test_verify_file_if_content_swapped_and_mtime_restored_it_verifies_file_again(self):
+        self._set_mtime(self._file_path)
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.save()
+        # same size, same mtime: only the content tells the files apart
+        self._file_path.write_bytes(b'EFX')
+        self._set_mtime(self._file_path)
+        self._verify_file_mock.return_value = False
+
+        self.assertFalse(
+            self._create_signature_cache_helper().verify_file(self._file_path, self._verify_file_mock)
+        )
+        self.assertEqual(2, self._verify_file_mock.call_count)
+
+    def test_verify_file_if_cert_changed_it_verifies_file_again(self):
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.save()
+        self._cert_file_path.write_bytes(b'NEW CERT')
+
+        signature_cache_helper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+
+        self.assertEqual(2, self._verify_file_mock.call_count)
+        self.assertEqual((0, 1), (signature_cache_helper.hits, signature_cache_helper.misses))
+
+    def test_verify_file_if_identical_content_it_verifies_only_once(self):
+        file_path2: Path = self._temp_path / 'test2.efi'
+        file_path2.write_bytes(b'EFI')
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.verify_file(file_path2, self._verify_file_mock)
+
+        self._verify_file_mock.assert_called_once_with(self._file_path)
+        self.assertEqual((1, 1), (signature_cache_helper.hits, signature_cache_helper.misses))
+
+    def test_verify_file_if_cache_file_corrupt_it_verifies_file(self):
+        self._cache_file_path.parent.mkdir()
+        self._cache_file_path.write_bytes(b'garbage')
+
+        self._create_signature_cache_helper().verify_file(self._file_path, self._verify_file_mock)
+
+        self._verify_file_mock.assert_called_once_with(self._file_path)
+
+    def test_save_if_prune_it_removes_records_of_files_not_verified(self):
+        file_path2: Path = self._temp_path / 'test2.efi'
+        file_path2.write_bytes(b'EFI2')
+        signature_cache_helper: SignatureCacheHelper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.verify_file(file_path2, self._verify_file_mock)
+        signature_cache_helper.save()
+
+        signature_cache_helper = self._create_signature_cache_helper()
+        signature_cache_helper.verify_file(self._file_path, self._verify_file_mock)
+        signature_cache_helper.save(True)
+
+        self.assertEqual(
+            signature_cache_helper.HEADER_STRUCT.size + signature_cache_helper.RECORD_STRUCT.size,
+            self._cache_file_path.stat().st_size
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
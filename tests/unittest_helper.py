@@ -7,6 +7,7 @@ from unittest.mock import Mock
 from unittest.mock import call
 from unittest.mock import patch
 
+import secbootctl.features
 from secbootctl.core import AppController, AppError, BaseSubcmdCreator
 from secbootctl.helpers.cli import CliPrintHelper, CliCmdUsageHelpFormatter
 
@@ -14,20 +15,30 @@ from secbootctl.helpers.cli import CliPrintHelper, CliCmdUsageHelpFormatter
 class ControllerTestCase(unittest.TestCase):
     FEATURE_NAME: str = ''
 
+    @patch('secbootctl.core.BuildCacheHelper')
     @patch('secbootctl.core.SecureBootHelper')
     @patch('secbootctl.core.KernelOsHelper')
     @patch('secbootctl.core.CliPrintHelper')
     def setUp(self, cli_print_helper_patch_mock: MagicMock, kernel_os_helper_patch_mock: MagicMock,
-              sb_helper_patch_mock: MagicMock) -> None:
+              sb_helper_patch_mock: MagicMock, build_cache_helper_patch_mock: MagicMock) -> None:
         self._config_mock: Mock = Mock()
-        self._config_mock.configure_mock(use_security_token=False)
+        self._config_mock.configure_mock(
+            use_security_token=False, unified_kernel_image_builder='native', unified_kernel_image_layout='computed',
+            initramfs_compression='none', signature_verifier='native', security_token_signer='sbsign',
+            package_manager_hook_mode='sync'
+        )
         self._dispatcher_mock: Mock = Mock()
-        self._cli_print_helper_mock: Mock = Mock()
+        self._cli_print_helper_mock: MagicMock = MagicMock()
+        # text output of listings is printed, so the listed output can be asserted
+        self._cli_print_helper_mock.print_text.side_effect = print
+        self._cli_print_helper_mock.print_record.side_effect = lambda record_type, record, text: print(text)
         cli_print_helper_patch_mock.return_value = self._cli_print_helper_mock
         self._kernel_os_helper_mock: Mock = Mock()
         kernel_os_helper_patch_mock.return_value = self._kernel_os_helper_mock
         self._sb_helper_mock: Mock = Mock()
         sb_helper_patch_mock.return_value = self._sb_helper_mock
+        self._build_cache_helper_mock: Mock = Mock()
+        build_cache_helper_patch_mock.return_value = self._build_cache_helper_mock
 
         if self.FEATURE_NAME == 'app':
             self._controller = AppController(self._config_mock, self._dispatcher_mock)
@@ -42,6 +53,15 @@ class ControllerTestCase(unittest.TestCase):
         self._controller._cli_print_helper = self._cli_print_helper_mock
         self._controller._kernel_os_helper = self._kernel_os_helper_mock
         self._controller._sb_helper = self._sb_helper_mock
+        self._controller._build_cache_helper = self._build_cache_helper_mock
+        # staged files are mapped to their targets, so assertions can use the target file paths
+        self._file_transaction_mock: Mock = Mock()
+        self._file_transaction_mock.stage.side_effect = lambda file_path, copy=False: file_path
+        self._file_transaction_helper_mock: Mock = Mock()
+        self._file_transaction_helper_mock.begin.return_value = MagicMock()
+        self._file_transaction_helper_mock.begin.return_value.__enter__.return_value = self._file_transaction_mock
+        self._file_transaction_helper_mock.begin.return_value.__exit__.return_value = False
+        self._controller._file_transaction_helper = self._file_transaction_helper_mock
 
     def test_init_it_assigns_given_dependencies(self):
         self.assertIs(
@@ -53,8 +73,28 @@ class ControllerTestCase(unittest.TestCase):
             self._controller._dispatcher
         )
 
-    def test_init_it_checks_requirements(self):
+    def test_init_it_checks_requirements_and_marks_them_as_checked(self):
         self._kernel_os_helper_mock.check_requirements.assert_called_once()
+        self.assertTrue(self._controller._services.requirements_checked)
+
+    def test_init_if_requirements_already_checked_it_does_not_check_them_again(self):
+        services_mock: Mock = Mock(requirements_checked=True)
+        # a config the checks would reject
+        self._config_mock.configure_mock(use_security_token=True, security_token_name='xyz-token')
+
+        if self.FEATURE_NAME == 'app':
+            controller: AppController = AppController(self._config_mock, self._dispatcher_mock, services_mock)
+        else:
+            feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+            controller = getattr(
+                feature_module,
+                self.FEATURE_NAME.capitalize() + 'Controller'
+            )(self._config_mock, self._dispatcher_mock, services_mock)
+
+        services_mock.kernel_os_helper.check_requirements.assert_not_called()
+        self.assertIs(services_mock.kernel_os_helper, controller._kernel_os_helper)
+        self.assertIs(services_mock.sb_helper, controller._sb_helper)
 
     @patch('secbootctl.core.SecureBootHelper')
     @patch('secbootctl.core.KernelOsHelper')
@@ -111,6 +151,205 @@ class ControllerTestCase(unittest.TestCase):
             1
         )
 
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_security_token_signer_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        signer_name: str = 'xyz-signer'
+        self._config_mock.configure_mock(use_security_token=True, security_token_name='yubikey',
+                                         security_token_signer=signer_name)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured security token signer "{signer_name}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_unified_kernel_image_builder_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        builder_name: str = 'xyz-builder'
+        self._config_mock.configure_mock(unified_kernel_image_builder=builder_name)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured unified kernel image builder "{builder_name}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_unified_kernel_image_layout_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        layout_name: str = 'xyz-layout'
+        self._config_mock.configure_mock(unified_kernel_image_layout=layout_name)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured unified kernel image layout "{layout_name}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_initramfs_compression_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        compression_name: str = 'lz4'
+        self._config_mock.configure_mock(initramfs_compression=compression_name)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured initramfs compression "{compression_name}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_signature_verifier_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        verifier_name: str = 'xyz-verifier'
+        self._config_mock.configure_mock(signature_verifier=verifier_name)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured signature verifier "{verifier_name}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
+    @patch('secbootctl.core.SecureBootHelper')
+    @patch('secbootctl.core.KernelOsHelper')
+    @patch('secbootctl.core.CliPrintHelper')
+    def test_init_it_checks_package_manager_hook_mode_and_raises_error_if_not_supported(
+        self,
+        cli_print_helper_patch_mock: MagicMock,
+        kernel_os_helper_patch_mock: MagicMock,
+        sb_helper_patch_mock: MagicMock
+    ):
+        hook_mode: str = 'xyz-mode'
+        self._config_mock.configure_mock(package_manager_hook_mode=hook_mode)
+
+        with self.assertRaises(AppError) as context_manager:
+            if self.FEATURE_NAME == 'app':
+                AppController(self._config_mock, self._dispatcher_mock)
+            else:
+                feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+                getattr(
+                    feature_module,
+                    self.FEATURE_NAME.capitalize() + 'Controller'
+                )(self._config_mock, self._dispatcher_mock)
+
+        error: AppError = context_manager.exception
+        self.assertEqual(
+            error.message,
+            f'configured package manager hook mode "{hook_mode}" is not supported'
+        )
+        self.assertEqual(
+            error.code,
+            1
+        )
+
     def test_forward_if_no_params_given_it_forwards_given_controller_action_with_no_params(self):
         feature_name: str = 'bootloader'
         action_name: str = 'install'
@@ -259,4 +498,22 @@ class SubCmdCreatorTestCase(unittest.TestCase):
                 )
             ])
 
+    def test_create_it_creates_subcommands_registered_for_feature(self):
+        cli_subparsers_mock: Mock = Mock()
+        feature_module: ModuleType = importlib.import_module('secbootctl.features.' + self.FEATURE_NAME)
+
+        getattr(feature_module, self.FEATURE_NAME.capitalize() + 'SubcmdCreator')(Path('/tmp/efi')).create(
+            cli_subparsers_mock
+        )
 
+        self.assertEqual(
+            [
+                (command_name, help_message)
+                for command_name, (feature_name, help_message) in secbootctl.features.COMMANDS.items()
+                if feature_name == self.FEATURE_NAME
+            ],
+            [
+                (add_parser_call.args[0], add_parser_call.kwargs['help'])
+                for add_parser_call in cli_subparsers_mock.add_parser.call_args_list
+            ]
+        )